@@ -26,14 +26,17 @@
 Convert single amber crd into Trajectory object
 """
 
-import re
+import re, os
 import numpy.oldnumeric as N
-import sys
+import numpy
+import itertools, sys
 
 import tools as T
 from Trajectory import Trajectory
+from TrajFile import TrajFile
 from PDBModel import PDBModel
 from LogFile import StdLog
+from LocalPath import LocalPath
 
 def _use():
 
@@ -60,8 +63,24 @@ class ParseError( Exception ):
 class AmberCrdParser:
     """
     Convert an Amber-generated crd file into a Trajectory object.
+
+    Frames are read in blocks of L{BLOCKSIZE} frames. The numbers of each
+    block are cut out of their fixed 8-character columns and converted by
+    numpy in one go. Frames can be selected by range and stride and are
+    either returned block by block (L{frameBlocks}), copied into an
+    existing array (L{readFrames}) or written directly into a
+    memory-mapped L{Biskit.TrajFile} (L{crd2traj} with fout)::
+
+      p = AmberCrdParser( 'sim.crd', 'ref.pdb', box=1 )
+      t = p.crd2traj( start=100, step=10, fout='traj.bin' )
     """
 
+    #: number of frames parsed at a time
+    BLOCKSIZE = 100
+
+    #: column width of one number in the crd file (format 10F8.3)
+    WIDTH = 8
+
     def __init__( self, fcrd, fref, box=0, rnAmber=0, pdbCode=None,
                   log=StdLog(), verbose=0 ):
         """
@@ -106,6 +125,12 @@ class AmberCrdParser:
         if self.n % 10 != 0:  self.lines_per_frame += 1
         if self.box:          self.lines_per_frame += 1
 
+        ## numbers per frame (including box info)
+        self.values_per_frame = self.n * 3 + 3 * self.box
+
+        ## (size, modification time) of crd file and its number of frames
+        self.__n_frames = None
+
         ## mark chains (the TER position might get lost when deleting atoms)
         ## should not be necessary any longer
 ##        if not self.ref.getAtoms()[0].get('chain_id',''):
@@ -140,6 +165,50 @@ class AmberCrdParser:
         return self.line2numbers( l )
 
 
+    def __parse( self, lines ):
+        """
+        Convert the lines of complete frames into coordinates. The numbers
+        are cut out of their fixed-width columns; lines that don't follow
+        this format are converted with L{line2numbers}.
+
+        @param lines: lines of one or more complete frames
+        @type  lines: [str]
+
+        @return: coordinate frames (frames x atoms x 3)
+        @rtype: array of float32
+
+        @raise ParseError: if the lines don't contain the expected numbers
+        """
+        n_frames = len( lines ) / self.lines_per_frame
+        n_values = n_frames * self.values_per_frame
+
+        s = ''.join( lines ).replace( '\n', '' ).replace( '\r', '' )
+        x = None
+
+        if len( s ) == n_values * self.WIDTH:
+            try:
+                x = numpy.frombuffer( s, 'S%i' % self.WIDTH )
+                x = x.astype( numpy.float32 )
+            except ValueError:
+                x = None
+
+        if x is None:
+            x = [ v for l in lines for v in self.line2numbers( l ) ]
+            x = numpy.array( x, numpy.float32 )
+
+            if len( x ) != n_values:
+                raise ParseError( 'Expected %i numbers per frame%s.' % \
+                      (self.values_per_frame, ' (with box info)'*self.box ) )
+
+        x = x.reshape( n_frames, self.values_per_frame )
+
+        ## skip box info
+        if self.box:
+            x = x[:, :-3]
+
+        return numpy.reshape( x, ( n_frames, self.n, 3 ) )
+
+
     def nextFrame( self ):
         """
         Collect next complete coordinate frame
@@ -147,59 +216,269 @@ class AmberCrdParser:
         @return: coordinate frame
         @rtype: array
         """
+        ## readline like nextLine -- Python 2 files don't allow mixing
+        ## readline and iteration
+        lines = [ self.crd.readline() for i in range( self.lines_per_frame ) ]
 
-        i = 0
-        xyz = []
-        while i != self.lines_per_frame:
+        if not lines[-1]:
+            raise EOFError('EOF')
+
+        return self.__parse( lines )[0]
 
-            if self.box and i+1 == self.lines_per_frame:
 
-                ## skip box info
-                if len( self.nextLine() ) != 3:
-                    raise ParseError( "BoxInfo must consist of 3 numbers." )
+    def __open( self ):
+        """
+        @return: crd file opened behind the title line
+        @rtype: file
+        """
+        f = T.gzopen( self.fcrd )
+        f.readline()
+        return f
 
-            else:
-                xyz += self.nextLine()
 
-            i += 1
+    def __frameBytes( self ):
+        """
+        @return: length of one frame record in the regular 10F8.3 format
+        @rtype: int
+        """
+        n = self.n * 3
+        r = n * self.WIDTH + self.lines_per_frame
 
-        return N.reshape( xyz, ( len(xyz) / 3, 3 ) ).astype(N.Float32)
+        if self.box:
+            r += 3 * self.WIDTH
 
+        return r
 
-    def crd2traj( self ):
+
+    def __sizeFrames( self ):
         """
-        Convert coordinates into a Trajectory object.
+        Number of frames of an uncompressed crd file calculated from its
+        size, if the file has the regular format.
 
-        @return: trajectory object
-        @rtype: Trajectory
+        @return: number of frames OR None, if it cannot be calculated
+        @rtype: int
         """
-        ## skip first empty line
-        self.crd.readline()
+        if self.fcrd[-2:] == 'gz':
+            return None
 
-        xyz = []
-        i = 0
+        record = self.__frameBytes()
 
-        if self.verbose: self.log.write( "Reading frames .." )
+        f = open( self.fcrd )
+        try:
+            size = os.fstat( f.fileno() ).st_size - len( f.readline() )
+            first = f.read( record )
+        finally:
+            f.close()
+
+        if size % record or \
+           ( size and first.count( '\n' ) != self.lines_per_frame ) or \
+           ( size and first[-1] != '\n' ):
+            return None
+
+        return size / record
+
+
+    def lenFrames( self ):
+        """
+        Count the complete frames in the crd file. The count is calculated
+        from the size of regular, uncompressed files, otherwise the
+        file is read through (without parsing). The result is kept until
+        the file changes.
+
+        @return: number of frames
+        @rtype: int
+        """
+        stat = os.stat( self.fcrd )
+        key = ( stat.st_size, stat.st_mtime )
+
+        if self.__n_frames is None or self.__n_frames[0] != key:
+
+            n = self.__sizeFrames()
+            if n is None:
+                n = self.__countFrames()
+
+            self.__n_frames = ( key, n )
+
+        return self.__n_frames[1]
+
+
+    def __countFrames( self ):
+        """
+        Count the complete frames in the crd file by reading through it.
+
+        @return: number of frames
+        @rtype: int
+        """
+        f = T.gzopen( self.fcrd )
+        n, last = 0, '\n'
 
         try:
-            while 1==1:
+            for chunk in iter( lambda: f.read( 2**20 ), '' ):
+                n += chunk.count( '\n' )
+                last = chunk[-1]
+        finally:
+            f.close()
+
+        if last != '\n':
+            n += 1
 
-                xyz += [ self.nextFrame() ]
-                i += 1
+        return max( 0, n - 1 ) / self.lines_per_frame
 
-                if i % 100 == 0 and self.verbose:
-                    self.log.write( '#' )
 
-        except EOFError:
-            if self.verbose: self.log.add("Read %i frames." % i)
+    def frameBlocks( self, start=0, stop=None, step=1, blocksize=None ):
+        """
+        Read frames block by block. Frames before start and the frames
+        between strides are skipped without being parsed::
+          for i, block in p.frameBlocks( step=10 ):
+             ...
+
+        @param start: first frame to read (default: 0)
+        @type  start: int
+        @param stop: read frames up to (excluding) this one (default: all)
+        @type  stop: int
+        @param step: read only every step'th frame (default: 1)
+        @type  step: int
+        @param blocksize: max. number of frames per block (default: BLOCKSIZE)
+        @type  blocksize: int
+
+        @return: position of the block among the selected frames, block of
+                 coordinate frames (frames x atoms x 3, float32)
+        @rtype: iterator over (int, array)
+        """
+        blocksize = blocksize or self.BLOCKSIZE
+        lpf = self.lines_per_frame
 
+        f = self.__open()
+        try:
+            ## skip frames before start
+            for l in itertools.islice( f, start * lpf ):
+                pass
+
+            i, pos = start, 0
+
+            while stop is None or i < stop:
+
+                n = blocksize * step
+                if stop is not None:
+                    n = min( n, stop - i )
+
+                lines = list( itertools.islice( f, n * lpf ) )
+                n_read = len( lines ) / lpf
+
+                if n_read == 0:
+                    break
+
+                if step > 1:
+                    lines = [ l for k in range( 0, n_read, step )
+                              for l in lines[ k*lpf : (k+1)*lpf ] ]
+                else:
+                    lines = lines[ : n_read * lpf ]
+
+                block = self.__parse( lines )
+
+                yield pos, block
+
+                pos += len( block )
+                i += n_read
+
+                if n_read < n:
+                    break
+        finally:
+            f.close()
+
+
+    def readFrames( self, out=None, start=0, stop=None, step=1,
+                    blocksize=None ):
+        """
+        Read selected frames into a new or given array.
+
+        @param out: array (or memmap) receiving the frames, e.g. from
+                    L{Biskit.TrajFile.create} (default: new array)
+        @type  out: array
+        @param start: first frame to read (default: 0)
+        @type  start: int
+        @param stop: read frames up to (excluding) this one (default: all)
+        @type  stop: int
+        @param step: read only every step'th frame (default: 1)
+        @type  step: int
+        @param blocksize: number of frames parsed at a time [BLOCKSIZE]
+        @type  blocksize: int
+
+        @return: out (or a new array) filled with the frames read
+                 (frames x atoms x 3)
+        @rtype: array
+
+        @raise ParseError: if out is too small
+        """
+        if out is None:
+            n = len( xrange( start, self.__stop( stop ), step ) )
+            out = numpy.zeros( ( n, self.n, 3 ), numpy.float32 )
+
+        n = 0
+        if self.verbose: self.log.write( "Reading frames .." )
+
+        for pos, block in self.frameBlocks( start, stop, step, blocksize ):
+
+            n = pos + len( block )
+            if n > len( out ):
+                raise ParseError( 'More than %i frames in %s.' \
+                                  % ( len( out ), self.fcrd ) )
+
+            out[ pos : n ] = block
+
+            if self.verbose: self.log.write( '#' )
+
+        if self.verbose: self.log.add("Read %i frames." % n)
+
+        return out[ : n ]
+
+
+    def __stop( self, stop ):
+        """last frame (exclusive) that is actually in the file"""
+        n = self.lenFrames()
+        if stop is None:
+            return n
+        return min( stop, n )
+
+
+    def crd2traj( self, start=0, stop=None, step=1, fout=None ):
+        """
+        Convert coordinates into a Trajectory object.
+
+        @param start: first frame to read (default: 0)
+        @type  start: int
+        @param stop: read frames up to (excluding) this one (default: all)
+        @type  stop: int
+        @param step: read only every step'th frame (default: 1)
+        @type  step: int
+        @param fout: write frames directly into this L{Biskit.TrajFile}
+                     instead of keeping them in memory (default: None)
+        @type  fout: str
+
+        @return: trajectory object (with memory-mapped frames if fout
+                 is given)
+        @rtype: Trajectory
+        """
         t = Trajectory( refpdb=self.ref )
 
-        t.frames = N.array( xyz ).astype(N.Float32)
+        if fout:
+            f = TrajFile( fout )
+            n = len( xrange( start, self.__stop( stop ), step ) )
+
+            t.frames = f.create( n, self.n )
+            self.readFrames( t.frames, start, stop, step )
+            t.frames.flush()
+
+            t.framesFile = LocalPath( f.fname )
+        else:
+            t.frames = self.readFrames( start=start, stop=stop, step=step )
 
         t.setRef( self.ref )
         t.ref.disconnect()
 
+        if fout:
+            f.writeMeta( t )
+
         return t
 
 import Biskit.test as BT
@@ -216,6 +495,9 @@ class Test( BT.BiskitTest ):
 
     def cleanUp(self):
         T.tryRemove( self.fout )
+        T.tryRemove( self.fout + '.bin' )
+        T.tryRemove( self.fout + '.bin' + TrajFile.META )
+        T.tryRemove( self.fout + '.crd' )
         
 
     def test_AmberCrdParser(self):
@@ -240,6 +522,56 @@ class Test( BT.BiskitTest ):
         self.assertEqual( len(self.t), 10 )
         self.assertEqual( self.t.lenAtoms(), 440 )
 
+    def test_frameSelection(self):
+        """AmberCrdParser stride/range/TrajFile test"""
+        from Biskit.TrajFile import isMapped
+
+        self.p = AmberCrdParser( self.finp, self.fref, box=True,
+                                 log=self.log, verbose=self.local )
+
+        self.assertEqual( self.p.lenFrames(), 10 )
+
+        ## line-by-line reference
+        self.p.crd.readline()
+        ref = N.array( [ self.p.nextFrame() for i in range( 10 ) ] )
+        self.assertRaises( EOFError, self.p.nextFrame )
+        self.assertRaises( EOFError, self.p.nextLine )
+
+        f = self.p.readFrames( blocksize=3 )
+        self.assert_( N.all( f == ref ) )
+
+        ## regular expression parsing of the last frame
+        lines = T.gzopen( self.finp ).readlines()[ -self.p.lines_per_frame:-1 ]
+        x = [ v for l in lines for v in self.p.line2numbers( l ) ]
+        self.assert_( N.all( f[-1] == N.reshape( x, (-1,3) ).astype(N.Float32) ) )
+
+        f = self.p.readFrames( start=1, stop=8, step=3, blocksize=2 )
+        self.assert_( N.all( f == ref[1:8:3] ) )
+
+        out = N.zeros( (20, self.p.n, 3), N.Float32 )
+        self.assert_( N.all( self.p.readFrames( out, step=2 ) == ref[::2] ) )
+
+        self.t = self.p.crd2traj( start=2, fout=self.fout + '.bin' )
+        self.assert_( isMapped( self.t.frames ) )
+        self.assert_( N.all( self.t.frames == ref[2:] ) )
+
+        self.t = TrajFile( self.fout + '.bin' ).read()
+        self.assertEqual( self.t.lenFrames(), 8 )
+        self.assert_( N.all( self.t.frames == ref[2:] ) )
+
+        ## frame count from the size of an uncompressed file
+        lines = T.gzopen( self.finp ).readlines()
+        open( self.fout + '.crd', 'w' ).writelines( lines )
+
+        p = AmberCrdParser( self.fout + '.crd', self.fref, box=True )
+        self.assertEqual( p._AmberCrdParser__sizeFrames(), 10 )
+        self.assert_( N.all( p.readFrames( start=4 ) == ref[4:] ) )
+
+        ## ... but not of an incomplete one
+        open( self.fout + '.crd', 'w' ).writelines( lines[:-5] )
+        self.assertEqual( p._AmberCrdParser__sizeFrames(), None )
+        self.assertEqual( p.lenFrames(), 9 )
+
 if __name__ == '__main__':
 
     BT.localTest()
@@ -0,0 +1,570 @@
+##
+## Biskit, a toolkit for the manipulation of macromolecular structures
+## Copyright (C) 2004-2012 Raik Gruenberg & Johan Leckner
+##
+## This program is free software; you can redistribute it and/or
+## modify it under the terms of the GNU General Public License as
+## published by the Free Software Foundation; either version 3 of the
+## License, or any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+## General Public License for more details.
+##
+## You find a copy of the GNU General Public License in the file
+## license.txt along with this program; if not, write to the Free
+## Software Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+##
+##
+## last $Author$
+## last $Date$
+## $Revision$
+"""
+Atom selection expressions for PDBModel.
+"""
+
+import re, fnmatch
+import numpy as N
+
+from Biskit.Errors import BiskitError
+from Biskit.SpatialIndex import SpatialIndex
+
+
+class AtomSelectionError( BiskitError ):
+    pass
+
+
+#: selection keywords and the atom profiles they test
+KEYWORDS = { 'name'     : 'name',
+             'resname'  : 'residue_name',
+             'resid'    : 'residue_number',
+             'resnum'   : 'residue_number',
+             'icode'    : 'insertion_code',
+             'chain'    : 'chain_id',
+             'segid'    : 'segment_id',
+             'element'  : 'element',
+             'altloc'   : 'alternate',
+             'serial'   : 'serial_number',
+             'type'     : 'type',
+             'occupancy': 'occupancy',
+             'beta'     : 'temperature_factor',
+             'bfactor'  : 'temperature_factor',
+             ## not a profile -- atom index, residue index, coordinates
+             'index'    : 'index',
+             'residue'  : 'residue',
+             'x' : 'x', 'y' : 'y', 'z' : 'z' }
+
+#: selection words for the short-cut masks of PDBModel
+SHORTCUTS = { 'protein'  : 'maskProtein',
+              'backbone' : 'maskBB',
+              'heavy'    : 'maskHeavy',
+              'hydrogen' : 'maskH',
+              'water'    : 'maskH2O',
+              'solvent'  : 'maskSolvent',
+              'hetero'   : 'maskHetatm',
+              'nucleic'  : 'maskNA',
+              'dna'      : 'maskDNA',
+              'rna'      : 'maskRNA' }
+
+#: words that end the value list of a keyword
+RESERVED = [ 'and', 'or', 'not', 'within', 'of', 'byres', '(', ')' ]
+
+OPERATORS = { '<' : N.less, '<=': N.less_equal,
+              '>' : N.greater, '>=': N.greater_equal,
+              '==': N.equal, '!=': N.not_equal }
+
+_TOKEN = re.compile( r'\s*(?:(<=|>=|==|!=|<|>|\(|\))|'
+                     r'"([^"]*)"|\'([^\']*)\'|([^\s()<>=!"\']+))' )
+
+_RANGE = re.compile( r'^(-?\d+(?:\.\d*)?)(?::|-)(-?\d+(?:\.\d*)?)$' )
+
+
+def _profile( model, key ):
+    """atom profile or coordinate/index column tested by a selection"""
+    if key == 'index':
+        return N.arange( model.lenAtoms() )
+    if key == 'residue':
+        return N.asarray( model.resMap() )
+    if key in ( 'x', 'y', 'z' ):
+        return model.getXyz()[ :, 'xyz'.index( key ) ]
+
+    if not key in model.atoms:
+        raise AtomSelectionError, 'unknown atom profile: %r' % key
+
+    r = model.atoms[ key ]
+    if not isinstance( r, N.ndarray ):
+        r = N.array( r, 'O' )
+    return r
+
+
+def _isNumeric( a ):
+    return a.dtype.char not in 'OSUV'
+
+
+class _All:
+    def __init__( self, value ):
+        self.value = value
+
+    def mask( self, model ):
+        if self.value:
+            return N.ones( model.lenAtoms(), bool )
+        return N.zeros( model.lenAtoms(), bool )
+
+class _Shortcut:
+    def __init__( self, method ):
+        self.method = method
+
+    def mask( self, model ):
+        return N.asarray( getattr( model, self.method )(), bool )
+
+class _Not:
+    def __init__( self, child ):
+        self.child = child
+
+    def mask( self, model ):
+        return N.logical_not( self.child.mask( model ) )
+
+class _And:
+    def __init__( self, children ):
+        self.children = children
+
+    def mask( self, model ):
+        r = self.children[0].mask( model )
+        for c in self.children[1:]:
+            r = r & c.mask( model )
+        return r
+
+class _Or( _And ):
+    def mask( self, model ):
+        r = self.children[0].mask( model )
+        for c in self.children[1:]:
+            r = r | c.mask( model )
+        return r
+
+
+class _Values:
+    """key value1 value2 lo-hi 'C*' ..."""
+
+    def __init__( self, key, values ):
+        self.key = key
+        self.words = []      ## plain values
+        self.patterns = []   ## unquoted values with wildcards
+        self.ranges = []     ## unquoted lo-hi or lo:hi
+
+        for quoted, v in values:
+            if not quoted and _RANGE.match( v ):
+                self.ranges.append( v )
+            elif not quoted and [ c for c in '*?[' if c in v ]:
+                self.patterns.append( v )
+            else:
+                self.words.append( v )
+
+    def __number( self, v ):
+        try:
+            return float( v )
+        except ValueError:
+            raise AtomSelectionError, \
+                  'profile %r is numeric, %r is not a number' % (self.key, v)
+
+    def mask( self, model ):
+        prof = _profile( model, self.key )
+
+        if _isNumeric( prof ):
+            if self.patterns:
+                raise AtomSelectionError, 'wildcards only work on text ' +\
+                      'profiles: %r' % self.patterns
+            r = N.in1d( prof, [ self.__number( v ) for v in self.words ] )
+
+            for v in self.ranges:
+                lo, hi = map( float, _RANGE.match( v ).groups() )
+                r |= ( prof >= lo ) & ( prof <= hi )
+
+            return r
+
+        ## test each distinct value only once
+        values, inverse = N.unique( prof, return_inverse=True )
+
+        words = set( self.words + self.ranges )
+        hits = [ v in words or
+                 any( [ fnmatch.fnmatchcase( str(v), p )
+                        for p in self.patterns ] )
+                 for v in values ]
+
+        return N.array( hits, bool )[ inverse ]
+
+
+class _Compare:
+    """key < value, key != value, ..."""
+
+    def __init__( self, key, op, value ):
+        self.key = key
+        self.op = op
+        self.value = value
+
+    def mask( self, model ):
+        prof = _profile( model, self.key )
+        v = self.value
+
+        if _isNumeric( prof ):
+            try:
+                v = float( v )
+            except ValueError:
+                raise AtomSelectionError, \
+                      'profile %r is numeric, %r is not a number' % \
+                      ( self.key, v )
+
+        return N.asarray( OPERATORS[ self.op ]( prof, v ), bool )
+
+
+class _Within:
+    """within cutoff of selection"""
+
+    def __init__( self, cutoff, child ):
+        self.cutoff = cutoff
+        self.child = child
+
+    def mask( self, model ):
+        center = self.child.mask( model )
+        if not N.any( center ):
+            return center
+
+        xyz = model.getXyz()
+        index = SpatialIndex( xyz[ center ], cellsize=self.cutoff )
+
+        return index.countWithin( xyz, self.cutoff ) > 0
+
+
+class _ByRes:
+    """complete residues of all atoms in selection"""
+
+    def __init__( self, child ):
+        self.child = child
+
+    def mask( self, model ):
+        resmap = N.asarray( model.resMap() )
+
+        r = N.zeros( model.lenResidues(), bool )
+        r[ resmap[ self.child.mask( model ) ] ] = True
+
+        return r[ resmap ]
+
+
+class AtomSelection:
+    """
+    Atom selection expression compiled into numpy operations on the atom
+    profiles of a L{Biskit.PDBModel}::
+
+      sel = AtomSelection( 'name CA and resname ALA and chain A' )
+      mask = sel.mask( model )
+
+    PDBModel.mask() and PDBModel.indices() accept such expressions
+    directly and keep the compiled selections of a model in a cache.
+
+    An expression combines tests with 'and', 'or', 'not' and parentheses.
+    A test is either a keyword followed by one or more values::
+
+      name CA CB           chain A B           resid 10-20 25 30:35
+      resname 'C1*'        element H*          index 0 1 2
+
+    or a keyword compared with a single value::
+
+      beta > 30            resid <= 100        x < 0.0
+
+    The keywords are listed in L{KEYWORDS}; any other atom profile can be
+    used by its full name (e.g. 'relAS < 20' after PDBDope). 'index'
+    and 'residue' are 0-based atom and residue positions, resid is the PDB
+    residue number. Ranges lo-hi (or lo:hi) include both ends. Unquoted
+    values with *, ? or [..] are wildcard patterns; quoted values are taken
+    literally. The words listed in L{SHORTCUTS} (protein, backbone, heavy,
+    hydrogen, water, ...) select the same atoms as the corresponding
+    PDBModel.maskXX() methods, 'all' and 'none' select all or no atom.
+
+    Two operators work on whole selections:
+      - 'within 5 of resid 10-20' -- atoms closer than 5 A to any
+        selected atom (including these atoms)
+      - 'byres within 5 of chain B' -- complete residues of all
+        selected atoms
+    Both bind to the single test (or parenthesized expression) that
+    follows them, 'within 5 of name CA and chain A' is therefore
+    '(within 5 of name CA) and chain A'.
+
+    Each test is evaluated on the whole profile at once. Text profiles are
+    compared value by value only for their distinct values, the result is
+    then mapped back onto the atoms.
+    """
+
+    def __init__( self, expression ):
+        """
+        @param expression: selection expression
+        @type  expression: str
+
+        @raise AtomSelectionError: if the expression cannot be parsed
+        """
+        self.expression = expression
+
+        self.__tokens = self.__tokenize( expression )
+        self.__pos = 0
+
+        self.root = self.__parseOr()
+
+        if self.__peek() is not None:
+            self.__error( 'unexpected %r' % self.__peek()[1] )
+
+        del self.__tokens
+
+
+    def __str__( self ):
+        return self.expression
+
+    def __repr__( self ):
+        return 'AtomSelection( %r )' % self.expression
+
+
+    def __tokenize( self, s ):
+        """-> [ (kind, text) ], kind is 'op', 'quoted' or 'word'"""
+        r = []
+        pos = 0
+        s = s.rstrip()
+
+        while pos < len( s ):
+            m = _TOKEN.match( s, pos )
+            if not m:
+                raise AtomSelectionError, \
+                      'invalid character at position %i of %r' % ( pos, s )
+
+            op, q1, q2, word = m.groups()
+            if op is not None:
+                r.append( ( 'op', op ) )
+            elif word is not None:
+                r.append( ( 'word', word ) )
+            else:
+                r.append( ( 'quoted', q1 if q1 is not None else q2 ) )
+
+            pos = m.end()
+
+        return r
+
+
+    def __error( self, msg ):
+        raise AtomSelectionError, '%s in selection %r' % (msg, self.expression)
+
+    def __peek( self ):
+        if self.__pos < len( self.__tokens ):
+            return self.__tokens[ self.__pos ]
+        return None
+
+    def __next( self ):
+        t = self.__peek()
+        if t is None:
+            self.__error( 'unexpected end' )
+        self.__pos += 1
+        return t
+
+    def __accept( self, word ):
+        """consume next token if it is the (unquoted) given word"""
+        t = self.__peek()
+        if t is not None and t[0] != 'quoted' and t[1] == word:
+            self.__pos += 1
+            return True
+        return False
+
+
+    def __parseOr( self ):
+        r = [ self.__parseAnd() ]
+        while self.__accept( 'or' ):
+            r.append( self.__parseAnd() )
+
+        return r[0] if len( r ) == 1 else _Or( r )
+
+    def __parseAnd( self ):
+        r = [ self.__parseNot() ]
+        while self.__accept( 'and' ):
+            r.append( self.__parseNot() )
+
+        return r[0] if len( r ) == 1 else _And( r )
+
+    def __parseNot( self ):
+        if self.__accept( 'not' ):
+            return _Not( self.__parseNot() )
+
+        if self.__accept( 'byres' ):
+            return _ByRes( self.__parseNot() )
+
+        if self.__accept( 'within' ):
+            try:
+                cutoff = float( self.__next()[1] )
+            except ValueError:
+                self.__error( 'within needs a distance' )
+            if cutoff <= 0:
+                self.__error( 'within needs a distance > 0' )
+            if not self.__accept( 'of' ):
+                self.__error( "missing 'of' after within" )
+
+            return _Within( cutoff, self.__parseNot() )
+
+        return self.__parseTest()
+
+    def __parseTest( self ):
+        kind, word = self.__next()
+
+        if kind == 'op' and word == '(':
+            r = self.__parseOr()
+            if not self.__accept( ')' ):
+                self.__error( "missing ')'" )
+            return r
+
+        if kind != 'word' or word in RESERVED:
+            self.__error( 'unexpected %r' % word )
+
+        if word in ( 'all', 'none' ):
+            return _All( word == 'all' )
+
+        if word in SHORTCUTS:
+            return _Shortcut( SHORTCUTS[ word ] )
+
+        key = KEYWORDS.get( word, word )
+
+        t = self.__peek()
+        if t is not None and t[0] == 'op' and t[1] in OPERATORS:
+            self.__pos += 1
+            return _Compare( key, t[1], self.__value( word ) )
+
+        values = []
+        while self.__peek() is not None and self.__peek()[1] not in RESERVED\
+              and self.__peek()[0] != 'op':
+            kind, v = self.__next()
+            values.append( ( kind == 'quoted', v ) )
+
+        if not values:
+            self.__error( 'missing value after %r' % word )
+
+        return _Values( key, values )
+
+    def __value( self, word ):
+        kind, v = self.__next()
+        if kind == 'op':
+            self.__error( 'missing value after %r' % word )
+        return v
+
+
+    def mask( self, model ):
+        """
+        @param model: structure
+        @type  model: PDBModel
+
+        @return: atom mask
+        @rtype: N.array of bool
+
+        @raise AtomSelectionError: if a profile is missing or a value does
+                                   not fit the type of its profile
+        """
+        return N.asarray( self.root.mask( model ), bool )
+
+    def indices( self, model ):
+        """
+        @param model: structure
+        @type  model: PDBModel
+
+        @return: indices of selected atoms
+        @rtype: N.array of int
+        """
+        return N.flatnonzero( self.mask( model ) )
+
+
+#############
+##  TESTING
+#############
+import Biskit.test as BT
+
+class Test(BT.BiskitTest):
+    """AtomSelection test"""
+
+    def prepare( self ):
+        import Biskit.tools as T
+        from Biskit import PDBModel
+
+        self.m = PDBModel( T.testRoot() + '/com/1BGS_original.pdb' )
+
+    def test_values( self ):
+        """AtomSelection keyword, value and boolean test"""
+        m = self.m
+
+        r = AtomSelection( 'name CA and resname ALA' ).mask( m )
+        self.assert_( N.all( r == m.maskCA() * m.maskFrom( 'residue_name',
+                                                             'ALA' ) ) )
+
+        r = AtomSelection( 'chain A and (resid 10-20 or resid 30:31)' )
+        ref = m.maskF( lambda a: a['chain_id'] == 'A' and
+                       ( 10 <= a['residue_number'] <= 20 or
+                         a['residue_number'] in ( 30, 31 ) ) )
+        self.assert_( N.all( r.mask( m ) == ref ) )
+
+        r = AtomSelection( 'not (name N* or name "O")' ).mask( m )
+        self.assert_( N.all( r == m.maskF( lambda a: a['name'][0] != 'N'
+                                           and a['name'] != 'O' ) ) )
+
+        r = AtomSelection( 'name C? and not name CA' ).mask( m )
+        self.assert_( N.all( r == m.maskF( lambda a: len( a['name'] ) == 2
+                                     and a['name'][0] == 'C'
+                                     and a['name'] != 'CA' ) ) )
+
+        self.assert_( N.all( AtomSelection( 'backbone' ).mask( m ) ==
+                             m.maskBB() ) )
+        self.assert_( N.all( AtomSelection( 'index 0 5' ).indices( m ) ==
+                             [ 0, 5 ] ) )
+
+        r = AtomSelection( 'beta > 30 and residue < 10' ).mask( m )
+        ref = ( m['temperature_factor'] > 30 ) * ( m.resMap() < 10 )
+        self.assert_( N.all( r == ref ) )
+
+    def test_within( self ):
+        """AtomSelection within / byres test"""
+        m = self.m
+        r = AtomSelection( 'within 5 of resid 10 and chain A' ).mask( m )
+
+        ## within binds to 'resid 10' only
+        center = m.xyz[ N.flatnonzero( m.maskFrom( 'residue_number', 10 ) ) ]
+        d = N.sqrt( N.sum( ( m.xyz[:,N.newaxis] - center )**2, 2 ) )
+        ref = N.any( d < 5, 1 ) * m.maskFrom( 'chain_id', 'A' )
+
+        self.assert_( N.all( r == ref ) )
+
+        r = AtomSelection( 'byres (name CA and resid 5 and chain B)' )
+        ref = m.maskFrom( 'residue_number', 5 ) * m.maskFrom( 'chain_id', 'B')
+        self.assert_( N.sum( ref ) > 1 and N.all( r.mask( m ) == ref ) )
+
+    def test_errors( self ):
+        """AtomSelection syntax error test"""
+        for s in [ 'name', 'name CA and', '(name CA', 'resid 5 )',
+                   'within x of name CA', 'name CA or or chain A' ]:
+            self.assertRaises( AtomSelectionError, AtomSelection, s )
+
+        self.assertRaises( AtomSelectionError,
+                           AtomSelection( 'resid A' ).mask, self.m )
+        self.assertRaises( AtomSelectionError,
+                           AtomSelection( 'nosuchprofile 1' ).mask, self.m )
+
+    def test_speed( self ):
+        """AtomSelection vs maskF speed test"""
+        import time
+
+        m = self.m
+        t0 = time.time()
+        r1 = m.maskF( lambda a: a['name'] == 'CA' and
+                      a['residue_name'] in ['ALA','GLY'] and
+                      a['chain_id'] == 'A' )
+        t1 = time.time()
+        r2 = AtomSelection( 'name CA and resname ALA GLY and chain A'
+                            ).mask( m )
+        t2 = time.time()
+
+        if self.local:
+            print '\nmaskF: %.4f s, AtomSelection: %.4f s' % (t1-t0, t2-t1)
+
+        self.assert_( N.all( r1 == r2 ) )
+
+
+if __name__ == '__main__':
+
+    BT.localTest()
@@ -34,6 +34,7 @@ import Biskit.tools as t
 import ColorSpectrum as C
 from Biskit import EHandler
 from Errors import BiskitError
+from ColumnCache import ColumnCache, MISSING
 
 try:
     import biggles
@@ -83,8 +84,16 @@ class BisList:
          -> the __xxx__ methods have to be implemented, too.
 
     See L{DictList} for an example of strategy 1.
+
+    Queries (valuesOf, filter, argsort, argmax, getIndex, etc.) can be
+    sped up with a columnar cache of item values (see L{useColumns}).
+    Implementations must call L{updateColumns} whenever items are added,
+    removed or replaced.
     """
 
+    #: L{Biskit.ColumnCache} of item values or None (no caching)
+    column_cache = None
+
     def __init__(self): 
         """
         Override but call.
@@ -99,6 +108,55 @@ class BisList:
         return 'BisList $Revision$'
 
 
+    def useColumns( self, on=1 ):
+        """
+        Switch the columnar cache of item values on or off. With the
+        cache, the values of a key are collected only once into arrays
+        and a hash index which then serve all queries on this key. The
+        cache is emptied whenever items are added, removed or replaced but
+        it does not notice changes to the items themselves. Call
+        L{updateColumns} after modifying item values in place.
+
+        @param on: use cache (default: 1)
+        @type  on: 1|0
+        """
+        self.column_cache = ColumnCache() if on else None
+
+
+    def updateColumns( self ):
+        """
+        Empty the columnar cache (if any), e.g. after item values have
+        been modified in place.
+        """
+        if self.column_cache is not None:
+            self.column_cache.clear()
+
+
+    def _query( self, key, method, *args ):
+        """
+        Answer a query from the columnar cache.
+
+        @param key: attribute key
+        @type  key: any
+        @param method: name of L{Biskit.ColumnCache.Column} method
+        @type  method: str
+        @param args: arguments for the method
+        @type  args: any
+
+        @return: result or None if there is no cache or the query cannot
+                 be answered from it
+        @rtype: any
+        """
+        if self.column_cache is None:
+            return None
+
+        c = self.column_cache.get(
+            key, lambda k: [ self.getValue( i, k, MISSING )
+                             for i in range( len( self ) ) ] )
+
+        return getattr( c, method )( *args )
+
+
     def getValue( self, i, key, default=None ): # abstract
         """
         Get the value of a dictionary entry of a list item.
@@ -213,6 +271,10 @@ class BisList:
         @return: indices after sorting (the collection itself is not sorted)
         @rtype: [ int ]
         """
+        r = self._query( sortKey, 'argsort' ) if cmpfunc is cmp else None
+        if r is not None:
+            return r
+
         pairs = [(self.getValue(i,sortKey),i) for i in range(0, len(self))]
         pairs.sort( cmpfunc )
         return [ x[1] for x in pairs ]
@@ -284,6 +346,9 @@ class BisList:
         @return: list of values
         @rtype: list
         """
+        if indices is None and not unique and self.column_cache is not None:
+            return self._query( key, 'values', default )
+
         l = self
         if indices != None:
             l = self.take( indices )
@@ -312,6 +377,10 @@ class BisList:
         @return: array of int
         @rtype: array
         """
+        r = self._query( key, 'range', vLow, vHigh )
+        if r is not None:
+            return r
+
         vLst = self.valuesOf( key )
 
         maskL = N.greater_equal( vLst, vLow )
@@ -332,6 +401,10 @@ class BisList:
         @return: array of int
         @rtype: array
         """
+        r = self._query( key, 'equal', lst )
+        if r is not None:
+            return r
+
         mask = [ self.getValue( i,key) in lst for i in range( len(self)) ]
         return N.nonzero( mask )
 
@@ -398,6 +471,10 @@ class BisList:
         @return: index of item with highest item[key] value
         @rtype: int
         """
+        r = self._query( key, 'argmax' )
+        if r is not None:
+            return r
+
         vLst = self.valuesOf( key )
         return N.argmax( vLst )
 
@@ -421,6 +498,10 @@ class BisList:
         @return: index of item with lowest item[infokey] value
         @rtype: int
         """
+        r = self._query( key, 'argmin' )
+        if r is not None:
+            return r
+
         vLst = self.valuesOf( key )
         return N.argmin( vLst )
 
@@ -0,0 +1,270 @@
+##
+## Biskit, a toolkit for the manipulation of macromolecular structures
+## Copyright (C) 2004-2012 Raik Gruenberg & Johan Leckner
+##
+## This program is free software; you can redistribute it and/or
+## modify it under the terms of the GNU General Public License as
+## published by the Free Software Foundation; either version 3 of the
+## License, or any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+## General Public License for more details.
+##
+## You find a copy of the GNU General Public License in the file
+## license.txt along with this program; if not, write to the Free
+## Software Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+##
+##
+## last $Author$
+## last $Date$
+## $Revision$
+"""
+Columnar cache of item values for fast queries on BisList and ComplexList.
+"""
+
+import numpy as N
+import types
+
+#: placeholder for values missing from an item
+MISSING = object()
+
+#: number types that can be put into a numeric array
+NUMBERS = ( bool, int, long, float, N.bool_, N.integer, N.floating )
+
+#: value types that compare equal exactly when they hash equal
+PLAIN = ( types.NoneType, str, unicode ) + NUMBERS
+
+
+class Column:
+    """
+    Values of one key over all items of a list. Missing values are stored
+    as None (the default of all list queries). Numeric values are also
+    kept as a numpy array (L{numbers}) and a hash index (value -> sorted
+    positions) is built on demand for equality queries. Queries return
+    None if they cannot give exactly the result of the equivalent
+    comparisons in python (e.g. for mixed or unhashable values) -- the
+    caller then falls back to the python implementation.
+    """
+
+    def __init__( self, values ):
+        """
+        @param values: value of each item, MISSING if the item has none
+        @type  values: [any]
+        """
+        self.present = N.array( [ v is not MISSING for v in values ], bool )
+
+        self.objects = [ None if v is MISSING else v for v in values ]
+
+        self.numbers = None
+        if N.all( self.present ):
+            self.numbers = self.__numeric( values )
+
+        self.__index = None
+
+
+    def __numeric( self, values ):
+        """array of python numbers, None for anything else"""
+        for v in values:
+            if not isinstance( v, NUMBERS ):
+                return None
+
+        try:
+            r = N.array( values )
+        except OverflowError:
+            return None
+
+        if r.dtype.char not in '?bhilqBHILQfd' or N.any( r != r ):
+            return None                ## longs as objects or NaN values
+
+        return r
+
+
+    def values( self, default=None ):
+        """
+        @param default: value for items without this key
+        @type  default: any
+
+        @return: value of each item
+        @rtype: [any]
+        """
+        r = list( self.objects )
+
+        if default is not None:
+            for i in N.flatnonzero( ~self.present ):
+                r[i] = default
+
+        return r
+
+
+    def index( self ):
+        """
+        @return: { value : positions } or None if there are values of other
+                 than L{PLAIN} types
+        @rtype: { any : array of int }
+        """
+        if self.__index is None:
+
+            d = {}
+            for i, v in enumerate( self.objects ):
+                if not isinstance( v, PLAIN ):
+                    return None
+                d.setdefault( v, [] ).append( i )
+
+            self.__index = dict( [ (k, N.array( v, int ))
+                                   for k, v in d.items() ] )
+
+        return self.__index
+
+
+    def equal( self, lst ):
+        """
+        @param lst: allowed values
+        @type  lst: [any]
+
+        @return: sorted positions of items with any of the given values
+        @rtype: array of int OR None
+        """
+        for v in lst:
+            if not isinstance( v, PLAIN ):
+                return None
+
+        index = self.index()
+        if index is None:
+            return None
+
+        r = [ index[v] for v in lst if v in index ]
+
+        if not r:
+            return N.zeros( 0, int )
+
+        return N.unique( N.concatenate( r ) )
+
+
+    def range( self, vLow, vHigh ):
+        """
+        @param vLow: lower bound
+        @type  vLow: number
+        @param vHigh: upper bound
+        @type  vHigh: number
+
+        @return: sorted positions of items with vLow <= value <= vHigh
+        @rtype: array of int OR None
+        """
+        if self.numbers is None or not isinstance( vLow, NUMBERS ) \
+           or not isinstance( vHigh, NUMBERS ):
+            return None
+
+        return N.flatnonzero( (self.numbers >= vLow) * (self.numbers <= vHigh))
+
+
+    def argsort( self ):
+        """
+        @return: positions sorted by value (stable)
+        @rtype: [int] OR None
+        """
+        if self.numbers is None:
+            return None
+
+        return N.argsort( self.numbers, kind='mergesort' ).tolist()
+
+
+    def argmax( self ):
+        """
+        @return: position of the first highest value
+        @rtype: int OR None
+        """
+        if self.numbers is None:
+            return None
+
+        return N.argmax( self.numbers )
+
+
+    def argmin( self ):
+        """
+        @return: position of the first lowest value
+        @rtype: int OR None
+        """
+        if self.numbers is None:
+            return None
+
+        return N.argmin( self.numbers )
+
+
+class ColumnCache:
+    """
+    Cache of L{Column}s by key. The cache itself doesn't know when the
+    items of a list change -- the list has to L{clear} it whenever items
+    are added, removed or replaced. Cached columns are not pickled.
+    """
+
+    def __init__( self ):
+        self.columns = {}
+
+
+    def __getstate__( self ):
+        return {}
+
+
+    def __setstate__( self, state ):
+        self.columns = {}
+
+
+    def clear( self ):
+        """
+        Forget all cached columns.
+        """
+        self.columns = {}
+
+
+    def get( self, key, fetch ):
+        """
+        @param key: item key
+        @type  key: any
+        @param fetch: function returning the values of a key over all items
+                      (MISSING for items without the key), called only if
+                      the key is not yet cached
+        @type  fetch: function
+
+        @return: column of values
+        @rtype: Column
+        """
+        try:
+            return self.columns[ key ]
+        except KeyError:
+            c = self.columns[ key ] = Column( fetch( key ) )
+            return c
+        except TypeError:
+            return Column( fetch( key ) )       ## unhashable key
+
+
+#############
+##  TESTING
+#############
+import Biskit.test as BT
+
+class Test(BT.BiskitTest):
+    """ColumnCache test"""
+
+    def test_Column( self ):
+        """ColumnCache.Column queries test"""
+        self.c = Column( [ 3, 1., MISSING, 'a', 1 ] )
+
+        self.assertEqual( self.c.values(), [ 3, 1., None, 'a', 1 ] )
+        self.assertEqual( self.c.values( 0 ), [ 3, 1., 0, 'a', 1 ] )
+        self.assertEqual( list( self.c.equal( [ 1, None ] ) ), [ 1, 2, 4 ] )
+        self.assertEqual( self.c.argsort(), None )
+
+        self.c = Column( [ 3, 1., 2, True, 1 ] )
+
+        self.assertEqual( self.c.argsort(), [ 1, 3, 4, 2, 0 ] )
+        self.assertEqual( list( self.c.range( 1, 2 ) ), [ 1, 2, 3, 4 ] )
+        self.assertEqual( ( self.c.argmax(), self.c.argmin() ), ( 0, 1 ) )
+
+        self.assertEqual( Column( [ [1], 2 ] ).equal( [ 2 ] ), None )
+
+
+if __name__ == '__main__':
+
+    BT.localTest()
@@ -195,6 +195,63 @@ class DictList( BisList, list ):
         """
         v = self._processNewItem( v, i )
         list.__setitem__( self, i, v)
+        self.updateColumns()
+
+
+    def __setslice__( self, i, j, lst ):
+        """lst[i:j] = other"""
+        list.__setslice__( self, i, j, lst )
+        self.updateColumns()
+
+
+    def __delitem__( self, i ):
+        """del lst[i]"""
+        list.__delitem__( self, i )
+        self.updateColumns()
+
+
+    def __delslice__( self, i, j ):
+        """del lst[i:j]"""
+        list.__delslice__( self, i, j )
+        self.updateColumns()
+
+
+    def insert( self, i, v ):
+        """Insert item before position i."""
+        list.insert( self, i, self._processNewItem( v, i ) )
+        self.updateColumns()
+
+
+    def pop( self, i=-1 ):
+        """Remove and return item at position i (default: last)."""
+        r = list.pop( self, i )
+        self.updateColumns()
+        return r
+
+
+    def remove( self, v ):
+        """Remove first occurence of item v."""
+        list.remove( self, v )
+        self.updateColumns()
+
+
+    def reverse( self ):
+        """Reverse list in place."""
+        list.reverse( self )
+        self.updateColumns()
+
+
+    def sort( self, *args, **kw ):
+        """Sort list in place (see list.sort)."""
+        list.sort( self, *args, **kw )
+        self.updateColumns()
+
+
+    def __imul__( self, n ):
+        """lst *= n"""
+        list.__imul__( self, n )
+        self.updateColumns()
+        return self
 
 
     def __getslice__( self, i, j ):
@@ -225,6 +282,7 @@ class DictList( BisList, list ):
         """
         lst = self._processNewItems( lst )
         list.extend( self, lst )
+        self.updateColumns()
 
 
     def append( self, v ):
@@ -237,8 +295,9 @@ class DictList( BisList, list ):
         @param v: value
         @type  v: any
         """
-        v = self._processItem( v, len( self ) )
+        v = self._processNewItem( v, len( self ) )
         list.append( self, v )
+        self.updateColumns()
 
 
     def take( self, indices ):
@@ -303,6 +362,20 @@ class Test(BT.BiskitTest):
         self.assertEqual( len(self.l1), 10, '%r != 10' % len(self.l1) )
 
 
+    def test_columns( self ):
+        """DictList columnar cache test"""
+        self.l3 = DictList( [ {'a':1}, {'a':2} ] )
+        self.l3.useColumns()
+        self.assertEqual( self.l3.valuesOf( 'a' ), [1, 2] )
+
+        self.l3 *= 2
+        self.assert_( isinstance( self.l3, DictList ) )
+        self.assertEqual( self.l3.valuesOf( 'a' ), [1, 2, 1, 2] )
+
+        self.l3 += [ {'a':3} ]
+        self.assertEqual( self.l3.getIndex( 'a', 3 ), 4 )
+
+
     def test_plotArray( self ):
         """BisList.plotArray test"""
 
@@ -26,8 +26,11 @@ collect and manage information about a docking result
 """
 
 from Biskit import PCRModel, PDBModel, PDBDope, molUtils, mathUtils, StdLog, EHandler
+import Biskit.rmsFit as rmsFit
 ## from Biskit import ProsaII
 from Biskit.Prosa2003 import Prosa2003
+from Biskit.SpatialIndex import SpatialIndex
+from Biskit.Dock.ContactMatrix import ContactMatrix
 
 import Biskit.tools as t
 
@@ -234,6 +237,23 @@ class Complex:
         return lig
 
 
+    def ligXyz( self ):
+        """
+        Ligand coordinates in docked position. In contrast to L{lig}, no
+        transformed ligand model is created (or cached). A ligand model
+        already cached by lig() is used, though.
+
+        @return: transformed ligand coordinates (N_atoms_lig x 3)
+        @rtype: array
+        """
+        lig = getattr( self, 'lig_transformed', None )
+        if lig is not None:
+            return lig.getXyz()
+
+        r, t = self.ligMatrix()
+        return N.dot( self.lig_model.getXyz(), N.transpose( r ) ) + t
+
+
     def model(self):
         """
         Model with both receptor and ligand.
@@ -341,11 +361,10 @@ class Complex:
 
         ## compress contact matrix array
         if self.contacts != None and \
+               not isinstance( self.contacts['result'], ContactMatrix ) and \
                len(N.shape( self.contacts['result'] ) )==2:
             m = self.contacts['result']
-            self.contacts['shape'] = N.shape( m )
-
-            self.contacts['result'] = N.nonzero( N.ravel( m ) ).astype(N.Int32)
+            self.contacts['result'] = ContactMatrix.fromDense( m )
 
 
     def contactsOverlap(self, ref, cutoff=None):
@@ -362,12 +381,10 @@ class Complex:
                  (normalized to number of all contacts)
         @rtype: float
         """
-        equal = N.logical_and(self.resContacts( cutoff=cutoff ),
-                            ref.resContacts( cutoff=cutoff ) )
-        total = N.logical_or( self.resContacts(cutoff),
-                              ref.resContacts(cutoff) )
+        this = self.resContacts( cutoff=cutoff, sparse=1 )
+        other = ref.resContacts( cutoff=cutoff, sparse=1 )
 
-        return N.sum(N.sum( equal )) * 1.0 / N.sum(N.sum( total ))
+        return this.overlap( other ) * 1.0 / ( this | other ).sum()
 
 
     def contactsShared(self, reference, cutoff=None):
@@ -384,9 +401,8 @@ class Complex:
                    abs( N.sum( N.sum( contactMatrix_a - contactMatrix_b )))
         @rtype: int
         """
-        equality = N.logical_and(self.resContacts( cutoff=cutoff ),
-                               reference.resContacts( cutoff=cutoff ) )
-        return abs(N.sum(N.sum( equality )))
+        this = self.resContacts( cutoff=cutoff, sparse=1 )
+        return this.overlap( reference.resContacts( cutoff=cutoff, sparse=1 ) )
 
 
     def contactsDiff(self, ref, cutoff=None):
@@ -402,8 +418,9 @@ class Complex:
         @return: number of contacts different in this and refererence complex.
         @rtype: int
         """
-        both = N.logical_or( self.resContacts(cutoff), ref.resContacts(cutoff))
-        return N.sum(N.sum(both)) - self.contactsShared( ref, cutoff )
+        both = self.resContacts( cutoff, sparse=1 ) | \
+               ref.resContacts( cutoff, sparse=1 )
+        return both.sum() - self.contactsShared( ref, cutoff )
 
 
     def fractionNativeContacts(self, ref, cutoff=None ):
@@ -418,11 +435,10 @@ class Complex:
         @return: fraction of native contacts
         @rtype: float
         """
-        cont     = self.resContacts( cutoff, refComplex=ref )
-        ref_cont = ref.resContacts( cutoff )
+        cont     = self.resContacts( cutoff, refComplex=ref, sparse=1 )
+        ref_cont = ref.resContacts( cutoff, sparse=1 )
 
-        result = N.sum(N.sum( ref_cont * cont ))*1.0
-        return result / N.sum( N.sum( ref_cont ))
+        return cont.overlap( ref_cont ) * 1.0 / ref_cont.sum()
 
 
     def fractionNativeSurface(self, cont, contRef ):
@@ -431,18 +447,21 @@ class Complex:
         in both complexes.
 
         @param cont: contact matrix
-        @type  cont: matrix
+        @type  cont: matrix OR ContactMatrix
         @param contRef: reference contact matrix
-        @type  contRef: matrix
+        @type  contRef: matrix OR ContactMatrix
         
         @return: (fractRec, fractLig), fraction of atoms/residues that
                   are involved in any contacts in both complexes
         @rtype: (float, float)
            
         """
-        lig, ligRef = N.clip( N.sum(cont),0,1),  N.clip( N.sum(contRef), 0,1)
-        rec    = N.clip( N.sum(cont, 1),0,1)
-        recRef = N.clip( N.sum(contRef, 1), 0,1)
+        cont = ContactMatrix.fromPacked( cont )
+        contRef = ContactMatrix.fromPacked( contRef )
+
+        lig, ligRef = N.clip( cont.colSum(),0,1), N.clip( contRef.colSum(),0,1)
+        rec    = N.clip( cont.rowSum(),0,1)
+        recRef = N.clip( contRef.rowSum(), 0,1)
 
         fLig = N.sum( N.logical_and( lig, ligRef )) *1./ N.sum( ligRef )
         fRec = N.sum( N.logical_and( rec, recRef )) *1./ N.sum( recRef )
@@ -450,20 +469,55 @@ class Complex:
         return (fRec, fLig)
 
 
-    def rmsLig( self, ref ):
+    def rmsLig( self, ref, mask=None ):
         """
         Rms of ligand from reference ligand after superimposing the two
-        receptors.
+        receptors. The receptors are only superimposed if their
+        coordinates differ. No ligand models are created.
         
         @param ref: reference complex, must have identical atoms
         @type  ref: Complex
+        @param mask: ligand atoms to consider, atom mask or selection
+                     expression (default: all)
+        @type  mask: [1|0] OR str
         
         @return: ligand rmsd
         @rtype: float
+        """
+        if isinstance( mask, str ):
+            mask = self.lig_model.mask( mask )
+
+        x, y = ref.ligXyz(), self.ligXyz()
 
-        @note: not implemented
+        r, t = self.recTransformation( ref )
+        if r is not None:
+            y = N.dot( y, N.transpose( r ) ) + t
+
+        if mask is not None:
+            x, y = N.compress( mask, x, 0 ), N.compress( mask, y, 0 )
+
+        return N.sqrt( N.average( N.sum( (x - y)**2, 1 ) ) )
+
+
+    def recTransformation( self, ref ):
+        """
+        Superposition of this receptor onto the receptor of a reference
+        complex.
+
+        @param ref: reference complex, must have identical receptor atoms
+        @type  ref: Complex
+
+        @return: rotation matrix and translation vector or (None, None) if
+                 the two receptors are already in the same position
+        @rtype: array, array
         """
-        pass
+        x, y = ref.rec_model.getXyz(), self.rec_model.getXyz()
+
+        if ref.rec_model is self.rec_model or \
+           ( N.shape( x ) == N.shape( y ) and N.all( x == y ) ):
+            return None, None
+
+        return rmsFit.findTransformation( x, y )
 
 
     def rmsInterface( self, ref, cutoff=4.5, fit=1 ):
@@ -493,21 +547,28 @@ class Complex:
             ref  = ref.compress( m_rec_ref, m_lig_ref )
 
         ## determine interface
-        contacts = ref.resContacts( cutoff )
+        contacts = ref.resContacts( cutoff, sparse=1 )
 
-        if_rec = ref.rec_model.res2atomMask( N.sum( contacts, 1 ) )
-        if_lig = ref.lig_model.res2atomMask( N.sum( contacts, 0 ) )
+        if_rec = ref.rec_model.res2atomMask( contacts.rowSum() )
+        if_lig = ref.lig_model.res2atomMask( contacts.colSum() )
 
         mask_interface = N.concatenate( (if_rec, if_lig) )
         mask_heavy = N.concatenate( (ref.rec().maskHeavy(),
                                    ref.lig_model.maskHeavy()) )
         mask_interface = mask_interface * mask_heavy
 
-        ## rms
-        ref_model = ref.model()
-        this_model= this.model()
+        ## rms, without creating complex models
+        x = N.concatenate( (ref.rec_model.getXyz(), ref.ligXyz()) )
+        y = N.concatenate( (this.rec_model.getXyz(), this.ligXyz()) )
 
-        return ref_model.rms( this_model, mask_interface, fit=fit)
+        x = N.compress( mask_interface, x, 0 )
+        y = N.compress( mask_interface, y, 0 )
+
+        if fit:
+            r, t = rmsFit.match( x, y )[0]
+            y = N.dot( y, N.transpose( r ) ) + t
+
+        return N.sqrt( N.average( N.sum( (x - y)**2, 1 ) ) )
 
 
     def contactResPairs(self, cm=None ):
@@ -515,29 +576,21 @@ class Complex:
         Get list of residue names paired up in contacts.
         
         @param cm: pre-calculated contact matrix (default: None)
-        @type  cm: matrix
+        @type  cm: matrix OR ContactMatrix
         
         @return: list of tuples [('N','G'), ('P','C')..]
         @rtype: [(str.str)..]
         """
-        if cm == None:
-            cm = self.resContacts()
-
-        seq_lig = self.lig().sequence()
-        seq_rec = self.rec().sequence()
-
-        result = []
+        if cm is None:
+            cm = self.resContacts( sparse=1 )
 
-        for i in range( 0, len(seq_rec) ):
-            recRes = seq_rec[i]
+        cm = ContactMatrix.fromPacked( cm )
 
-            for j in range( 0, len(seq_lig)):
-                ligRes = seq_lig[j]
-
-                if cm[i,j]:
-                    result += [(recRes, ligRes)]
+        seq_lig = self.lig_model.sequence()
+        seq_rec = self.rec().sequence()
 
-        return result
+        return [ (seq_rec[i], seq_lig[j])
+                 for i, j in zip( cm.rows(), cm.cols() ) ]
 
 
     def contactResDistribution( self, cm=None ):
@@ -545,21 +598,23 @@ class Complex:
         Count occurrence of residues in protein-protein interface.
         
         @param cm: pre-calculated contact matrix (default: None)
-        @type  cm: matrix
+        @type  cm: matrix OR ContactMatrix
         
         @return: dict {'A':3, 'C':1, .. } (20 standard amino acids)
         @rtype: dict
         """
-        if cm == None:
-            cm = self.resContacts()
+        if cm is None:
+            cm = self.resContacts( sparse=1 )
+
+        cm = ContactMatrix.fromPacked( cm )
 
         ## get mask for residues involved in contacts
-        maskLig = N.sum( cm )
-        maskRec = N.sum( N.transpose( cm ))
+        maskLig = cm.colSum()
+        maskRec = cm.rowSum()
 
         ## get sequence of contact residues only
-        seqLig = N.compress( maskLig, self.lig().sequence() )
-        seqRec = N.compress( maskRec, self.rec().sequence() )
+        seqLig = N.compress( maskLig, list( self.lig_model.sequence() ) )
+        seqRec = N.compress( maskRec, list( self.rec().sequence() ) )
         seq    = ''.join( seqLig ) + ''.join(seqRec) ## convert back to string
 
         ## count occurrence of letters
@@ -602,7 +657,7 @@ class Complex:
         in the given contacts.
         
         @param cm: pre-calculated contact matrix  (default: None)
-        @type  cm: matrix 
+        @type  cm: matrix OR ContactMatrix
         
         @return: dict {'AA':3,'AC':0, .. 'WW':2, 'WY':0 }
         @rtype: dict
@@ -630,7 +685,8 @@ class Complex:
 
     def loadResContacts( self ):
         """
-        Uncompress residue contact matrix if necessary.
+        Convert cached residue contact matrix of older versions (dense or
+        list of indices into raveled array) into a L{ContactMatrix}.
         
         @return: dict with contact matrix and parameters OR None
         @rtype: dict OR None
@@ -639,40 +695,48 @@ class Complex:
         if self.contacts != None and type( self.contacts ) == str:
             self.contacts = t.load( self.contacts )
             EHandler.warning("loading old-style pickled contacts.") 
+
+        if self.contacts is None or \
+           isinstance( self.contacts['result'], ContactMatrix ):
             return self.contacts
 
-        ## New, uncompression from list of indices into raveled array
-        if self.contacts != None and \
-           len( N.shape( self.contacts['result'])) == 1:
+        ## from list of indices into raveled array
+        if len( N.shape( self.contacts['result'])) == 1:
 
             try:
                 lenRec, lenLig = self.contacts['shape']
-            except:
+            except KeyError:
                 EHandler.warning("uncompressing contacts without shape")
                 lenRec = self.rec().lenResidues()
-                lenLig = self.lig().lenResidues()
+                lenLig = self.lig_model.lenResidues()
 
-            m = N.zeros( lenRec * lenLig )
-            N.put( m, self.contacts['result'], 1 )
+            self.contacts['result'] = ContactMatrix( (lenRec, lenLig),
+                                                     self.contacts['result'] )
+            self.contacts.pop( 'shape', None )
 
-            self.contacts['result'] = N.reshape( m, (lenRec, lenLig) )
+        else:
+            self.contacts['result'] = ContactMatrix.fromDense(
+                self.contacts['result'] )
 
         return self.contacts
 
 
     def resContacts(self, cutoff=4.5, maskRec=None, maskLig=None,
-                    refComplex=None, force=0, cache=1, cache_pw=0 ):
+                    refComplex=None, force=0, cache=1, cache_pw=0, sparse=0,
+                    registry=None ):
         """
         Matrix of all residue - residue contacts between receptor and
-        ligand. Result is cached.
+        ligand. Result is cached (as L{ContactMatrix}).
         
         @param cutoff: float/int, cutoff in \AA for atom-atom contact to be
                        counted ( default 4.5; if None, last one used or 4.5)
         @type  cutoff: float
-        @param maskRec: atom mask, receptor atoms to consider
-        @type  maskRec: [1|0]
-        @param maskLig: atom mask, ligand atoms to consider
-        @type  maskLig: [1|0]
+        @param maskRec: atom mask or selection expression, receptor atoms
+                        to consider (default: all heavy)
+        @type  maskRec: [1|0] OR str
+        @param maskLig: atom mask or selection expression, ligand atoms
+                        to consider (default: all heavy)
+        @type  maskLig: [1|0] OR str
         @param force: re-calculate even if cached matrix is available
                       (default: 0)
         @type  force: 0|1
@@ -687,10 +751,17 @@ class Complex:
                            with slight sequence variations from the docked
                            receptor and ligand.
         @type  refComplex: Complex
+        @param sparse: return L{ContactMatrix} instead of full matrix
+                       (default: 0)
+        @type  sparse: 0|1
+        @param registry: re-use the spatial index of the receptor kept in
+                         this registry, e.g. ComplexList.models
+                         (default: None)
+        @type  registry: ComplexModelRegistry
 
         @return: residue contact matrix,
                  2-D array(residues_receptor x residues_ligand) of 0 or 1
-        @rtype: array
+        @rtype: array OR ContactMatrix
         """
         if cutoff == None:
             if self.contacts != None:
@@ -706,7 +777,8 @@ class Complex:
             result = self.contacts['result']
 
         else:
-            result = self.__resContacts( cutoff, maskRec, maskLig, cache_pw )
+            result = self.__resContacts( cutoff, maskRec, maskLig, cache_pw,
+                                         registry )
 
         if cache:
             self.contacts = {}
@@ -717,15 +789,40 @@ class Complex:
 
         # delete/insert rows or columns to match sequence of reference complex
         if refComplex != None:
-            result = self.__alignMatrixDimension(result,
-                                                 self.rec_model.sequence(),
-                                                 refComplex.rec_model.sequence() )
-            result = self.__alignMatrixDimension(result,
-                                                 self.lig_model.sequence(),
-                                                 refComplex.lig_model.sequence(),
-                                                 1)
+            recMap, lenRec = self.__alignIndex( self.rec_model.sequence(),
+                                            refComplex.rec_model.sequence() )
+            ligMap, lenLig = self.__alignIndex( self.lig_model.sequence(),
+                                            refComplex.lig_model.sequence() )
+
+            result = result.remap( recMap, ligMap, (lenRec, lenLig) )
+
+        if sparse:
+            return result
+
+        return result.toDense( N.Int )
 
-        return result
+
+    def __alignIndex( self, thisSeq, castSeq ):
+        """
+        New position of each residue after the insertions and deletions of
+        L{__alignMatrixDimension}.
+
+        @param thisSeq: AA sequence of this dimension of the contactMatrix
+        @type  thisSeq: string
+        @param castSeq: AA sequence of this dimension in the other contact
+        @type  castSeq: string
+
+        @return: new position (or -1 if deleted) of each residue, new length
+        @rtype: array of int, int
+        """
+        pos = N.array( [ N.arange( 1, len( thisSeq ) + 1 ) ] )
+        pos = self.__alignMatrixDimension( pos, thisSeq, castSeq, 1 )[0]
+
+        r = -N.ones( len( thisSeq ), N.Int )
+        new = N.flatnonzero( pos )
+        N.put( r, N.take( pos, new ) - 1, new )
+
+        return r, len( pos )
 
 
     def __alignMatrixDimension(self, cm, thisSeq, castSeq, axis=0):
@@ -821,7 +918,8 @@ class Complex:
         return N.resize( r, (l_rec, l_lig))
 
 
-    def __atomContacts(self, cutoff, rec_mask, lig_mask, cache):
+    def __atomContacts(self, cutoff, rec_mask, lig_mask, cache, sparse=0,
+                       registry=None ):
         """
         Intermolecular distances below cutoff after applying the two masks.
         
@@ -831,64 +929,114 @@ class Complex:
         @type  rec_mask: [1|0]
         @param lig_mask: atom mask
         @type  lig_mask: [1|0]
-        @param cache: cache pairwise atom distance matrix
+        @param cache: calculate and cache the full pairwise atom distance
+                      matrix, otherwise only close pairs are searched
+                      (see L{Biskit.SpatialIndex})
         @type  cache: 1|0
+        @param sparse: return L{ContactMatrix} (default: 0)
+        @type  sparse: 1|0
+        @param registry: take spatial index of receptor from here
+                         (default: None, build new index)
+        @type  registry: ComplexModelRegistry
         
         @return: atom contact matrix, array sum_rec_mask x sum_lig_mask
-        @rtype: array
+        @rtype: array OR ContactMatrix
         """
-        ## get atom coordinats as array 3 x all_atoms
-        rec_xyz = self.rec().getXyz()
-        lig_xyz = self.lig().getXyz()
+        lig_xyz = N.compress( lig_mask, self.ligXyz(), 0 )
+        shape = ( N.sum( N.not_equal( rec_mask, 0 ) ), len( lig_xyz ) )
 
-        ## get pair-wise distances -> atoms_rec x atoms_lig
         dist = getattr( self, 'pw_dist', None )
-        if dist is None or \
-               N.shape( dist ) != ( N.sum(rec_mask), N.sum(lig_mask) ):
-            dist = self.__pairwiseDistances(N.compress( rec_mask, rec_xyz, 0),
-                                            N.compress( lig_mask, lig_xyz, 0) )
+        if dist is not None and N.shape( dist ) != shape:
+            dist = None
+
+        ## only pairs within cutoff, unless the dense matrix is wanted
+        if dist is None and not cache:
+
+            if registry is not None:
+                index = registry.recIndex( self.rec_model, rec_mask, cutoff )
+            else:
+                rec_xyz = N.compress( rec_mask, self.rec().getXyz(), 0 )
+                index = SpatialIndex( rec_xyz, cutoff )
+
+            i, j, d = index.pairs( lig_xyz, cutoff, sort=False )
+
+            contacts = ContactMatrix.fromPairs( i, j, shape )
+
+            if sparse:
+                return contacts
+            return contacts.toDense( bool )
+
+        ## get pair-wise distances -> atoms_rec x atoms_lig
+        if dist is None:
+            rec_xyz = N.compress( rec_mask, self.rec().getXyz(), 0 )
+            dist = self.__pairwiseDistances( rec_xyz, lig_xyz )
         if cache:
             self.pw_dist = dist
 
         ## reduce to 1 (distance < cutoff) or 0 -> n_atoms_rec x n_atoms_lig
+        if sparse:
+            return ContactMatrix.fromDense( N.less( dist, cutoff ) )
+
         return N.less( dist, cutoff )
 
 
     def atomContacts( self, cutoff=4.5, rec_mask=None, lig_mask=None, cache=0,
-                      map_back=1 ):
+                      map_back=1, sparse=0, registry=None ):
         """
         Find all inter-molecular B{atom-atom} contacts between rec and lig
         
         @param cutoff: cutoff for atom - atom contact in \AA
         @type  cutoff: float
-        @param rec_mask: atom mask (default: all heavy)
-        @type  rec_mask: [1|0]
-        @param lig_mask: atom mask (default: all heavy)
-        @type  lig_mask: [1|0]
+        @param rec_mask: atom mask or selection expression, e.g.
+                         'heavy and within 10 of resid 20-30'
+                         (default: all heavy)
+        @type  rec_mask: [1|0] OR str
+        @param lig_mask: atom mask or selection expression
+                         (default: all heavy)
+        @type  lig_mask: [1|0] OR str
         @param cache: cache pairwise atom distance matrix (default: 0)
         @type  cache: 1|0
         @param map_back: map masked matrix back to matrix for all atoms
         @type  map_back: 1|0
+        @param sparse: return L{ContactMatrix} instead of full matrix
+                       (default: 0)
+        @type  sparse: 1|0
+        @param registry: re-use the spatial index of the receptor kept in
+                         this registry, e.g. ComplexList.models
+                         (default: None)
+        @type  registry: ComplexModelRegistry
         
         @return: atom contact matrix, Numpy array N(atoms_lig) x N(atoms_rec)
-        @rtype: array
+        @rtype: array OR ContactMatrix
         """
         if lig_mask == None:
-            lig_mask = self.lig().maskHeavy()
+            lig_mask = self.lig_model.maskHeavy()
 
         if rec_mask == None:
             rec_mask = self.rec().maskHeavy()
 
-        contacts = self.__atomContacts( cutoff, rec_mask, lig_mask, cache )
+        if isinstance( rec_mask, str ):
+            rec_mask = self.rec().mask( rec_mask )
+        if isinstance( lig_mask, str ):
+            lig_mask = self.lig_model.mask( lig_mask )
+
+        contacts = self.__atomContacts( cutoff, rec_mask, lig_mask, cache,
+                                        sparse, registry )
 
         if not map_back:
             ## contact matrix after masking rec and lig
             return contacts
 
+        if sparse:
+            return contacts.remap( N.flatnonzero( rec_mask ),
+                                   N.flatnonzero( lig_mask ),
+                                   ( len(self.rec_model), len(self.lig_model) ))
+
         return self.__unmaskedMatrix( contacts, rec_mask, lig_mask )
 
 
-    def __resContacts(self, cutoff, maskRec=None, maskLig=None, cache=0 ):
+    def __resContacts(self, cutoff, maskRec=None, maskLig=None, cache=0,
+                      registry=None ):
         """
         Find all inter-molecule B{residue-residue} contacts between receptor
         and ligand. A contact between A and B is set if any heavy atom of
@@ -896,21 +1044,23 @@ class Complex:
         
         @param cutoff: distance cutoff in \AA
         @type  cutoff: float
-        @param maskRec: atom mask (default: all heavy)
-        @type  maskRec: [1|0]
-        @param maskLig: atom mask (default: all heavy)
-        @type  maskLig: [1|0]
+        @param maskRec: atom mask or selection (default: all heavy)
+        @type  maskRec: [1|0] OR str
+        @param maskLig: atom mask or selection (default: all heavy)
+        @type  maskLig: [1|0] OR str
         @param cache: cache pairwise atom distance matrix to pw_dist
                       (default:0)
         @type  cache: 1|0
+        @param registry: source of receptor spatial index (default: None)
+        @type  registry: ComplexModelRegistry
         
-        @return: residue contact matrix, 2-D Numpy
-                 N.array(residues_receptor x residues_ligand) where
-                 1-contact, 0-no contact
-        @rtype: array
+        @return: residue contact matrix (residues_receptor x
+                 residues_ligand)
+        @rtype: ContactMatrix
         """
         ## get contact matrix atoms_rec x atoms_lig
-        c = self.atomContacts( cutoff, maskRec, maskLig, cache )
+        c = self.atomContacts( cutoff, maskRec, maskLig, cache, sparse=1,
+                               registry=registry )
 
         ## convert atoms x atoms to residues x residues matrix
         return self.__atom2residueMatrix( c )
@@ -920,32 +1070,16 @@ class Complex:
         """
         Reduce binary matrix of n x k atoms to binary matrix of i x j residues.
         
-        @param m: atom contact matrix,
-                  array n x k with 1(contact) or 0(no contact)
-        @type  m: array
+        @param m: atom contact matrix n x k
+        @type  m: ContactMatrix
         
-        @return: residue contact matrix,
-                 2-D numpy array(residues_receptor x residues_ligand)
-        @rtype: array
+        @return: residue contact matrix (residues_receptor x residues_ligand)
+        @rtype: ContactMatrix
         """
-        recInd = N.concatenate((self.rec().resIndex(),
-                              [ self.rec().lenAtoms()] ))
-        ligInd = N.concatenate((self.lig_model.resIndex(),
-                              [ self.lig_model.lenAtoms() ] ))
-
-        residueMatrix = N.zeros(( len(recInd)-1, len(ligInd)-1 ), N.Int)
-
-        for r in range( len(recInd)-1 ):
+        rec, lig = self.rec(), self.lig_model
 
-            for l in range( len(ligInd)-1 ):
-
-                res2res = m[ int(recInd[r]):int(recInd[r+1]),
-                             int(ligInd[l]):int(ligInd[l+1]) ]
-
-                if N.any( res2res ):
-                    residueMatrix[r, l] = 1
-
-        return residueMatrix
+        return m.remap( rec.resMap(), lig.resMap(),
+                        ( rec.lenResidues(), lig.lenResidues() ) )
 
 
     def equalAtoms( self, ref ):
@@ -1024,14 +1158,19 @@ class Complex:
         """
         Compress complex using a rec and lig mask.
         
-        @param rec_mask: atom mask 
-        @type  rec_mask: [1|0]
-        @param lig_mask: atom mask 
-        @type  lig_mask: [1|0]
+        @param rec_mask: atom mask or selection expression
+        @type  rec_mask: [1|0] OR str
+        @param lig_mask: atom mask or selection expression
+        @type  lig_mask: [1|0] OR str
 
         @return: compressed complex
         @rtype: Complex
         """
+        if isinstance( rec_mask, str ):
+            rec_mask = self.rec().mask( rec_mask )
+        if isinstance( lig_mask, str ):
+            lig_mask = self.lig_model.mask( lig_mask )
+
         return self.take( N.nonzero( rec_mask ), N.nonzero( lig_mask ) )
 
 
@@ -1048,8 +1187,8 @@ class Complex:
         @rtype: float
         """
         score = 0
-        cm = self.resContacts(cutoff,self.rec().maskCB(), self.lig().maskCB(),
-                              cache=0 )
+        cm = self.resContacts( cutoff, self.rec().maskCB(),
+                               self.lig_model.maskCB(), cache=0, sparse=1 )
 
         pairFreq = self.resPairCounts(cm)
 
@@ -1203,7 +1342,7 @@ class Complex:
 
 
     def conservationScore( self, cons_type='cons_ent', ranNr=150,
-                           log=StdLog(), verbose=1 ):
+                           log=StdLog(), verbose=1, seed=None ):
         """
         Score of conserved residue pairs in the interaction surface.
         Optionally, normalized by radom surface contacts.
@@ -1217,6 +1356,9 @@ class Complex:
         @type  log: Biskit.LogFile
         @param verbose: give progress report [1]
         @type  verbose: bool | int
+        @param seed: seed for the random contact matrices, None for a
+                     different result on every call (default: None)
+        @type  seed: int
 
         @return: conservation score
         @rtype: float
@@ -1262,7 +1404,8 @@ class Complex:
         if ranNr != 0:
             if self.verbose:
                 self.log.write('.')
-            ranMat =  mathUtils.random2DArray( cont, ranNr, mask=surfMask )
+            ranMat =  mathUtils.random2DArray( cont, ranNr, mask=surfMask,
+                                               seed=seed )
             random_score = N.sum(N.sum( ranMat * consMat ))/( ranNr*1.0 )
             return N.sum(N.sum(score))/random_score
 
@@ -1472,6 +1615,24 @@ class Test(BT.BiskitTest):
 
         self.assertEqual( N.sum(contProfile_lig) + N.sum(contProfile_rec),
                           2462 )
+
+        ## sparse contacts give the same atom and residue contacts
+        sparse = c.atomContacts( 6.0, sparse=1 )
+        self.assert_( N.all( sparse.toDense() == cont ) )
+
+        res = c.resContacts( 6.0, cache=0 )
+        self.assert_( N.all( c.resContacts( 6.0, sparse=1 ).toDense() == res ))
+        self.assertEqual( c.contactsShared( c, 6.0 ), N.sum( N.ravel(res) ) )
+
+        ## packed contacts pickled without their shape
+        c.contacts = { 'result': N.flatnonzero( N.ravel( res ) ) }
+        self.assert_( N.all( c.loadResContacts()['result'].toDense() == res ))
+        self.failIf( 'shape' in c.contacts )
+
+        ## selection expressions instead of masks
+        self.assert_( N.all( c.atomContacts( 6.0, 'heavy', 'heavy' ) == cont ))
+        c2 = c.compress( 'within 6 of resid 35-40', 'all' )
+        self.assert_( 0 < len( c2.rec_model ) < len( c.rec_model ) )
    
 
 if __name__ == '__main__':
@@ -34,8 +34,10 @@ import types
 import random
 
 import Biskit.tools as t
+import Biskit.rmsFit as rmsFit
 from Biskit import PDBError, EHandler
 from Biskit.Errors import BiskitError
+from Biskit.ColumnCache import ColumnCache, MISSING
 
 from Biskit.Dock.Complex import Complex
 from Biskit.Dock.ComplexModelRegistry import ComplexModelRegistry
@@ -78,10 +80,17 @@ class ComplexList( list ):
     more than the file name is transmitted). By contrast, unsaved ones will
     severly slow down the job distribution.
 
+    Queries on info records (valuesOf, filter, argsort, argmax, getIndex,
+    etc.) can be sped up with a columnar cache (see L{useColumns}), which
+    is worth it for repeated queries on long lists.
+
     @todo: Removing items with pop(), del, remove() etc. will not remove
            unused PDBModels from rec_models or lig_models. 
     """
 
+    #: L{Biskit.ColumnCache} of info values or None (no caching)
+    column_cache = None
+
     def __init__(self, lst=[] ):
         """
         @param lst: list of Complexes
@@ -126,6 +135,54 @@ class ComplexList( list ):
             del self.lig_models
 
 
+    def useColumns( self, on=1 ):
+        """
+        Switch the columnar cache of info values on or off. With the cache,
+        the values of an info key are collected only once into arrays and a
+        hash index which then serve all queries on this key. The cache is
+        emptied whenever Complexes are added, removed or replaced but it
+        does not notice changes to the info dictionaries themselves. Call
+        L{updateColumns} after modifying info records in place.
+
+        @param on: use cache (default: 1)
+        @type  on: 1|0
+        """
+        self.column_cache = ColumnCache() if on else None
+
+
+    def updateColumns( self ):
+        """
+        Empty the columnar cache (if any), e.g. after info records have
+        been modified in place.
+        """
+        if self.column_cache is not None:
+            self.column_cache.clear()
+
+
+    def __query( self, infoKey, method, *args ):
+        """
+        Answer a query from the columnar cache.
+
+        @param infoKey: key for info dict
+        @type  infoKey: str
+        @param method: name of L{Biskit.ColumnCache.Column} method
+        @type  method: str
+        @param args: arguments for the method
+        @type  args: any
+
+        @return: result or None if there is no cache or the query cannot
+                 be answered from it
+        @rtype: any
+        """
+        if self.column_cache is None:
+            return None
+
+        c = self.column_cache.get(
+            infoKey, lambda k: [ x.info.get( k, MISSING ) for x in self ] )
+
+        return getattr( c, method )( *args )
+
+
     def checkType( self, v ):
         """
         Make sure v is a Complex.
@@ -168,6 +225,58 @@ class ComplexList( list ):
         self.models.addComplex( v )
 
         list.__setitem__( self, i, v)
+        self.updateColumns()
+
+
+    def __setslice__( self, i, j, lst ):
+        """lst[i:j] = other"""
+        list.__setslice__( self, i, j, lst )
+        self.updateColumns()
+
+
+    def __delitem__( self, i ):
+        """del lst[i]"""
+        list.__delitem__( self, i )
+        self.updateColumns()
+
+
+    def __delslice__( self, i, j ):
+        """del lst[i:j]"""
+        list.__delslice__( self, i, j )
+        self.updateColumns()
+
+
+    def insert( self, i, v ):
+        """Insert Complex before position i."""
+        self.checkType( v )
+        self.models.addComplex( v )
+        list.insert( self, i, v )
+        self.updateColumns()
+
+
+    def pop( self, i=-1 ):
+        """Remove and return Complex at position i (default: last)."""
+        r = list.pop( self, i )
+        self.updateColumns()
+        return r
+
+
+    def remove( self, v ):
+        """Remove first occurence of Complex v."""
+        list.remove( self, v )
+        self.updateColumns()
+
+
+    def reverse( self ):
+        """Reverse list in place."""
+        list.reverse( self )
+        self.updateColumns()
+
+
+    def sort( self, *args, **kw ):
+        """Sort list in place (see list.sort)."""
+        list.sort( self, *args, **kw )
+        self.updateColumns()
 
 
     def __add__( self, lst ):
@@ -193,6 +302,18 @@ class ComplexList( list ):
         return self
 
 
+    def __imul__( self, n ):
+        """
+        This ComplexList repeated n times.
+
+        @return: this instance
+        @rtype: ComplexList
+        """
+        list.__imul__( self, n )
+        self.updateColumns()
+        return self
+
+
     def ligModels( self ):
         """
         Get all shared ligand PDBModels. Stray models (changed or unpickled)
@@ -266,6 +387,8 @@ class ComplexList( list ):
         for v in lst:
             self.models.addComplex( v )
 
+        self.updateColumns()
+
 
     def append( self, v ):
         """
@@ -274,6 +397,7 @@ class ComplexList( list ):
         self.checkType( v )
         self.models.addComplex( v )
         list.append( self, v )
+        self.updateColumns()
 
 
     def __getslice__( self, i, j ):
@@ -316,6 +440,10 @@ class ComplexList( list ):
         @return: indices after sorting
         @rtype: [int]
         """
+        r = self.__query( sortKey, 'argsort' )
+        if r is not None:
+            return r
+
         pairs = [(self[i].info.get(sortKey), i) for i in range(0, len(self))]
         pairs.sort()
         return [ x[1] for x in pairs ]
@@ -352,6 +480,9 @@ class ComplexList( list ):
         @return: list of values
         @rtype: [any]
         """
+        if indices is None and not unique and self.column_cache is not None:
+            return self.__query( infoKey, 'values', default )
+
         l = self
         if indices != None:
             l = N.take( N.array(l,'O'), indices )
@@ -383,6 +514,10 @@ class ComplexList( list ):
         @return: array of int
         @rtype: [int]
         """
+        r = self.__query( infoKey, 'range', vLow, vHigh )
+        if r is not None:
+            return r
+
         vLst = self.valuesOf( infoKey )
 
         maskL = N.greater_equal( vLst, vLow )
@@ -406,6 +541,10 @@ class ComplexList( list ):
         @return: array of int
         @rtype: [int]
         """
+        r = self.__query( infoKey, 'equal', lst )
+        if r is not None:
+            return r
+
         mask = [ c.info.get( infoKey ) in lst for c in self ]
         return N.nonzero( mask )
 
@@ -478,6 +617,10 @@ class ComplexList( list ):
         @return: index of complex c with highest c.infos[infokey] value
         @rtype: int
         """
+        r = self.__query( infoKey, 'argmax' )
+        if r is not None:
+            return r
+
         vLst = self.valuesOf( infoKey )
         return N.argmax( vLst )
 
@@ -505,6 +648,10 @@ class ComplexList( list ):
         @return: index of complex c with lowest c.infos[infokey] value
         @rtype: int
         """
+        r = self.__query( infoKey, 'argmin' )
+        if r is not None:
+            return r
+
         vLst = self.valuesOf( infoKey )
         return N.argmin( vLst )
 
@@ -612,6 +759,123 @@ class ComplexList( list ):
         return list( self )
 
 
+    def __groupBy( self, attr, indices ):
+        """
+        Group list positions by the (identical) rec_model or lig_model of
+        their complexes.
+
+        @param attr: 'rec_model' or 'lig_model'
+        @type  attr: str
+        @param indices: list positions
+        @type  indices: [int]
+
+        @return: [ (model, [positions into indices]) ]
+        @rtype: [ (PDBModel, [int]) ]
+        """
+        groups = {}
+        for pos, i in enumerate( indices ):
+            m = getattr( self[i], attr )
+            groups.setdefault( id( m ), ( m, [] ) )[1].append( pos )
+
+        return groups.values()
+
+
+    def ligMatrices( self, indices=None ):
+        """
+        Ligand transformation matrices of all or some complexes.
+
+        @param indices: list positions (default: all)
+        @type  indices: [int]
+
+        @return: stacked 4 x 4 matrices (N_complexes x 4 x 4)
+        @rtype: array
+        """
+        if indices is None:
+            indices = range( len( self ) )
+
+        return N.array( [ self[i].ligandMatrix for i in indices ], N.Float )
+
+
+    def ligXyz( self, indices=None ):
+        """
+        Docked ligand coordinates of all or some complexes, calculated at
+        once from the (shared) ligand models and the ligand matrices.
+        No transformed ligand models are created (see L{Complex.ligXyz}).
+
+        @param indices: list positions (default: all)
+        @type  indices: [int]
+
+        @return: ligand coordinates (N_complexes x N_atoms_lig x 3)
+        @rtype: array
+
+        @raise ComplexListError: if ligands have different numbers of atoms
+        """
+        if indices is None:
+            indices = range( len( self ) )
+
+        m = self.ligMatrices( indices )
+        result = None
+
+        for lig, pos in self.__groupBy( 'lig_model', indices ):
+
+            xyz = lig.getXyz()
+
+            if result is None:
+                result = N.zeros( ( len( indices ), len( xyz ), 3 ), N.Float )
+
+            if len( xyz ) != result.shape[1]:
+                raise ComplexListError, 'ligands differ in number of atoms'
+
+            mp = N.take( m, pos, 0 )
+            result[ pos ] = rmsFit.transformCoordinates( xyz, mp[:,:3,:3],
+                                                         mp[:,:3,3] )
+
+        if result is None:
+            return N.zeros( (0, 0, 3), N.Float )
+
+        return result
+
+
+    def rmsLig( self, ref, indices=None, mask=None ):
+        """
+        Ligand rmsd of all or some complexes from the ligand of a reference
+        complex (after superposition of the receptors, see
+        L{Complex.rmsLig}). Calculated for all complexes at once without
+        creating any ligand models.
+
+        @param ref: reference complex, with identical receptor and ligand
+                    atoms
+        @type  ref: Complex
+        @param indices: list positions (default: all)
+        @type  indices: [int]
+        @param mask: ligand atoms to consider (default: all)
+        @type  mask: [1|0]
+
+        @return: ligand rmsd of each complex
+        @rtype: array of float
+        """
+        if indices is None:
+            indices = range( len( self ) )
+
+        y = self.ligXyz( indices )
+
+        ## one receptor superposition per receptor model
+        for rec, pos in self.__groupBy( 'rec_model', indices ):
+
+            r, t = self[ indices[ pos[0] ] ].recTransformation( ref )
+
+            if r is not None:
+                y[ pos ] = rmsFit.transformFrames( N.take( y, pos, 0 ), r, t )
+
+        x = ref.ligXyz()
+
+        if mask is not None:
+            x = N.compress( mask, x, 0 )
+            y = N.compress( mask, y, 1 )
+
+        return N.sqrt( N.average( N.sum( (y - x)**2, 2 ), 1 ) )
+
+
     def __maskNone( self, l1, l2 ):
         """
         Take out positions from l1 and l2 that are None in either of them.
@@ -743,6 +1007,79 @@ class Test(BT.BiskitTest):
 
         self.assertEqual( len( self.hex_clst ), 36)
 
+    def test_ligXyz(self):
+        """Dock.ComplexList.ligXyz/rmsLig test"""
+        self.cl = t.load( t.testRoot() + "/dock/hex/complexes.cl" )
+        self.cl = self.cl.take( range( 50 ) )
+
+        ref = self.cl[0]
+        xyz = self.cl.ligXyz()
+
+        for i in [ 0, 17, 49 ]:
+            self.assert_( N.allclose( xyz[i], self.cl[i].lig().getXyz(),
+                                      atol=1e-4 ) )
+            self.cl[i].lig_transformed = None
+
+        mask = ref.lig_model.maskCA()
+        rms = [ ref.lig().rms( c.lig(), mask, fit=0 ) for c in self.cl ]
+
+        self.assert_( N.allclose( self.cl.rmsLig( ref, mask=mask ), rms,
+                                  atol=1e-4 ) )
+        self.assertAlmostEqual( self.cl[7].rmsLig( ref, mask=mask ), rms[7], 4 )
+
+    def test_columns(self):
+        """Dock.ComplexList columnar cache test"""
+        self.cl = t.load( t.testRoot() + "/dock/hex/complexes.cl" )
+        self.cl[3].info['hex_clst'] = None
+        del self.cl[5].info['rms']
+
+        self.cached = self.cl.take( range( len( self.cl ) ) )
+        self.cached.useColumns()
+
+        for l in [ self.cl, self.cached ]:
+            l.r = [ l.argsort( 'rms' ), l.argsort( 'date' ),
+                    l.valuesOf( 'rms', default=-1 ),
+                    list( l.filterRange( 'hex_etotal', -600, -500 ) ),
+                    list( l.filterRange( 'rms', 10, 20 ) ),
+                    list( l.filterEqual( 'hex_clst', [ 1, 2, None ] ) ),
+                    l.argmax( 'hex_etotal' ), l.argmin( 'soln' ),
+                    l.getIndex( 'soln', 10 ),
+                    l.filter( 'model1', 1 ).valuesOf( 'soln' ) ]
+
+        self.assertEqual( self.cached.r, self.cl.r )
+
+        ## mutation empties the cache
+        self.cached.append( self.cached[10] )
+        self.assertEqual( len( self.cached.filterEqual( 'soln', [11] ) ), 2 )
+
+        del self.cached[0]
+        self.assertEqual( self.cached.getIndex( 'soln', 3 ), 1 )
+
+        ## in-place changes of info records need updateColumns()
+        self.cached[1].info['soln'] = -1
+        self.assertEqual( self.cached.argmin( 'soln' ), 0 )
+        self.cached.updateColumns()
+        self.assertEqual( self.cached.argmin( 'soln' ), 1 )
+
+        n = len( self.cached )
+        self.cached *= 2
+        self.assert_( isinstance( self.cached, ComplexList ) )
+        self.assertEqual( len( self.cached.valuesOf( 'soln' ) ), 2 * n )
+
+        if self.local:
+            import time
+            self.cl = self.cl.take( range( len( self.cl ) ) * 100 )
+
+            for on in [ 0, 1 ]:
+                self.cl.useColumns( on )
+                t0 = time.time()
+                for i in range( 10 ):
+                    self.cl.filterRange( 'rms', 10, 20 )
+                    self.cl.argsort( 'hex_etotal' )
+                    self.cl.filterEqual( 'hex_clst', [ i ] )
+                print '%i complexes, 10 x 3 queries, columns=%i: %.2f s' %\
+                      ( len( self.cl ), on, time.time() - t0 )
+
 if __name__ == '__main__':
 
     BT.localTest()
@@ -28,12 +28,31 @@ This is a helper class for ComplexList.
 from Biskit.Dock import Complex
 from Biskit.Errors import BiskitError
 from Biskit import LocalPath, PDBModel
+from Biskit.SpatialIndex import SpatialIndex
 
 import Biskit.tools as T
+import numpy.oldnumeric as N
+import weakref, hashlib
 
 class RegistryError( BiskitError ):
     pass
 
+class _IndexDropper:
+    """
+    Weakref callback removing the spatial indices of a deleted model
+    (without referencing the registry itself).
+    """
+
+    def __init__( self, rec_index, key ):
+        self.rec_index = rec_index
+        self.key = key
+
+    def __call__( self, ref ):
+        entry = self.rec_index.get( self.key, None )
+        if entry is not None and entry[1] is ref:
+            del self.rec_index[ self.key ]
+
+
 class ComplexModelRegistry:
     """
     This is a helper class for ComplexList.
@@ -41,6 +60,11 @@ class ComplexModelRegistry:
     Keep unique copies of the rec and lig models from many Complexes.
     Make sure that 2 Complexes with the same rec_model (same by file
     name and unchanged) always point to the same PDBModel instance.
+
+    The registry also keeps a L{Biskit.SpatialIndex} of each receptor
+    (see L{recIndex}), so that the contacts of many docking solutions
+    only need a search with the transformed ligand atoms::
+      c.atomContacts( 4.5, registry=clst.models )
     """
 
     def __init__( self ):
@@ -51,9 +75,29 @@ class ComplexModelRegistry:
         self.rec_f2com = {}
         self.lig_f2com = {}
 
+        ## spatial indices of receptor models, not pickled
+        self.rec_index = {}
+
         self.initVersion = self.version()
 
 
+    def __getstate__( self ):
+        """
+        Called before pickling. Spatial indices are not pickled.
+        """
+        state = self.__dict__.copy()
+        state['rec_index'] = {}
+        return state
+
+
+    def __setstate__( self, state ):
+        """
+        Called for unpickling the object.
+        """
+        self.__dict__ = state
+        self.rec_index = getattr( self, 'rec_index', {} )
+
+
     def version( self ):
         """
         Version of class.
@@ -122,6 +166,7 @@ class ComplexModelRegistry:
         if len( coms ) == 0:
             del f2com[ f ]
             del f2model[ f ]
+            self.rec_index.pop( f, None )
 
 
 ##     def update( self, otherReg ):
@@ -205,6 +250,70 @@ class ComplexModelRegistry:
         return self.lig_f2model[ source ]
 
 
+    def recIndex( self, model, mask=None, cellsize=4.5 ):
+        """
+        Spatial index of (selected) receptor atoms. The index is built once
+        and then re-used for all complexes with this receptor. Unchanged
+        models are recognized by their source file, so the index is shared
+        even by separately unpickled copies of the same model. Indices of
+        changed models (see PDBModel.xyzIsChanged) are only re-used for the
+        same model instance with the same coordinates (compared by a hash,
+        so that also changes in place are detected). They are only weakly
+        tied to the model and are dropped together with it.
+
+        @param model: receptor model
+        @type  model: PDBModel
+        @param mask: atoms to index (default: all)
+        @type  mask: [1|0]
+        @param cellsize: cell size of the index, ideally the contact cutoff
+                         (default: 4.5)
+        @type  cellsize: float
+
+        @return: index of the masked receptor coordinates
+        @rtype: SpatialIndex
+        """
+        if isinstance( model.source, LocalPath ) and \
+           not model.xyzIsChanged():
+            key, check = model.source, None
+        else:
+            key, check = id( model ), self.__xyzHash( model.getXyz() )
+
+        entry = self.rec_index.get( key, None )
+
+        ## the model has new coordinates
+        if entry is None or entry[0] != check:
+            ref = None
+            if check is not None:
+                ref = weakref.ref( model, _IndexDropper( self.rec_index, key ))
+
+            entry = self.rec_index[ key ] = ( check, ref, {} )
+
+        if mask is None:
+            mask_key = ( None, cellsize )
+        else:
+            mask = N.not_equal( mask, 0 )
+            mask_key = ( mask.tostring(), cellsize )
+
+        index = entry[2].get( mask_key, None )
+
+        if index is None:
+            rec_xyz = model.getXyz()
+            if mask is not None:
+                rec_xyz = N.compress( mask, rec_xyz, 0 )
+
+            index = entry[2][ mask_key ] = SpatialIndex( rec_xyz, cellsize )
+
+        return index
+
+
+    def __xyzHash( self, xyz ):
+        """
+        @return: hash of the coordinates
+        @rtype: str
+        """
+        return hashlib.sha1( xyz.tostring() ).digest() + str( xyz.shape )
+
+
     def recModels( self ):
         """
         Get a list with all receptor models.
@@ -380,6 +489,43 @@ class Test(BT.BiskitTest):
         check = self.r.getLigComplexes( self.r.ligModels()[0] )
 
         self.assertEqual( len(check), 500 )
+
+    def test_recIndex(self):
+        """Dock.ComplexModelRegistry.recIndex test"""
+        self.cl = T.load( T.testRoot() +'/dock/hex/complexes.cl' )
+        self.r = self.cl.models
+
+        c = self.cl[0]
+        mask = c.rec_model.maskHeavy()
+
+        self.index = self.r.recIndex( c.rec_model, mask )
+        self.assert_( self.r.recIndex( self.cl[5].rec_model, mask )
+                      is self.index )
+
+        for c in self.cl[:20]:
+            self.assertEqual( c.atomContacts( 4.5, sparse=1 ),
+                              c.atomContacts( 4.5, sparse=1, registry=self.r ))
+
+        ## new coordinates invalidate the index
+        m = c.rec_model.clone()
+        m.setXyz( m.xyz + 1. )
+        self.assert_( self.r.recIndex( m, mask ) is not self.index )
+        self.assert_( N.all( self.r.recIndex( m, mask ).xyz ==
+                             N.compress( mask, m.xyz, 0 ) ) )
+
+        ## changes in place are detected, too
+        index = self.r.recIndex( m, mask )
+        m.xyz += 1.
+        self.assert_( self.r.recIndex( m, mask ) is not index )
+        self.assert_( N.all( self.r.recIndex( m, mask ).xyz ==
+                             N.compress( mask, m.xyz, 0 ) ) )
+
+        ## the indices of a changed model are dropped with the model
+        import gc
+        n = len( self.r.rec_index )
+        del m
+        gc.collect()              ## PDBModel contains reference cycles
+        self.assertEqual( len( self.r.rec_index ), n - 1 )
     
 
 if __name__ == '__main__':
@@ -306,9 +306,11 @@ class ComplexTraj( EnsembleTraj ):
                  (thinned) traj.
         @rtype: matrix
         """
-        r = [ self.atomContacts( i, cutoff=cutoff ) 
-             for i in range(0, len(self), step ) ]
-        return N.sum( N.array( r ) ) / ( 1. * len(r) )
+        r, n = 0, 0
+        for i in range( 0, len(self), step ):
+            r = r + self.atomContacts( i, cutoff=cutoff )
+            n += 1
+        return r / ( 1. * n )
 
 
     def plotContactDensity( self, step=1, cutoff=4.5 ):
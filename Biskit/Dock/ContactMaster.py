@@ -58,7 +58,8 @@ class ContactMaster(TrackingJobMaster):
     def __init__(self, complexLst, chunks=5, hosts=cpus_all, refComplex=None,
                  updateOnly=0, niceness = nice_dic, force = [],
                  outFile = 'complexes_cont.cl', com_version=-1,
-                 show_output = 0, add_hosts=0, verbose=1, log=StdLog() ):
+                 show_output = 0, add_hosts=0, verbose=1, log=StdLog(),
+                 backend=None, ncpu=None ):
         """
         @param complexLst: input list
         @type  complexLst: ComplexList
@@ -86,6 +87,12 @@ class ContactMaster(TrackingJobMaster):
         @type  force: [str]
         @param verbose: print progress infos (default: 1)
         @type  verbose: 0|1
+        @param backend: distribute jobs over PVM ('pvm') or local
+                        processes ('pool') (default: JobMaster.BACKEND)
+        @type  backend: str
+        @param ncpu: number of local processes for the 'pool' backend
+                     (default: all CPUs)
+        @type  ncpu: int
 
         @raise BiskitError: if attempting to extract version from list
                             that is not of type ComplexEvolvingList.
@@ -167,7 +174,8 @@ class ContactMaster(TrackingJobMaster):
 
         TrackingJobMaster.__init__( self, complexDic, chunks,
                                     hosts, niceness, slave_path, show_output=show_output,
-                                    add_hosts=add_hosts, verbose=verbose )
+                                    add_hosts=add_hosts, verbose=verbose,
+                                    backend=backend, ncpu=ncpu )
 
         if verbose: print "JobMaster initialized."
 
@@ -294,17 +302,17 @@ class ContactMaster(TrackingJobMaster):
         self.mask_lig = m_lig * NC.lig_model.maskHeavy()
 
         ## reference residue contacts
-        cont_4_5 = RC.resContacts( cutoff=4.5, refComplex = NC, cache_pw=1 )
+        cont_4_5 = RC.resContacts( cutoff=4.5, refComplex = NC )
         self.c_ref_res_4_5 = MU.packBinaryMatrix( cont_4_5 )
 
-        cont_10 = RC.resContacts( cutoff=10., refComplex= NC, cache_pw=1 )
+        cont_10 = RC.resContacts( cutoff=10., refComplex= NC )
 
         ## reference atom contacts
-        m = RC.atomContacts( 4.5, cache=1, map_back=0)
-        self.c_ref_atom_4_5 = MU.packBinaryMatrix( m )
+        m = RC.atomContacts( 4.5, map_back=0, sparse=1 )
+        self.c_ref_atom_4_5 = m.pack()
 
-        m = RC.atomContacts( 10., cache=1, map_back=0)
-        self.c_ref_atom_10  = MU.packBinaryMatrix( m )
+        m = RC.atomContacts( 10., map_back=0, sparse=1 )
+        self.c_ref_atom_10  = m.pack()
 
         ## reference structure of contacting residues all atoms, cutoff 4.5
         x, y = self.__ref_interface( RC, NC, cont_4_5,
@@ -381,8 +389,8 @@ class ContactMaster(TrackingJobMaster):
         """
         if self.verbose: self.log.write("get reduced reference contacts...")
 
-        c = self.reduced_refCom.atomContacts( 10, cache=1, map_back=0)
-        self.c_ref_ratom_10 = MU.packBinaryMatrix( c )
+        c = self.reduced_refCom.atomContacts( 10, map_back=0, sparse=1 )
+        self.c_ref_ratom_10 = c.pack()
 
         if self.verbose: self.log.write(' done\n')
 
@@ -669,6 +677,32 @@ class Test(BT.BiskitTest):
                                    0.50811038550663579, 5 )
 
 
+class TestPool(Test):
+    """Test case for the process pool backend (no PVM needed)"""
+
+    TAGS = [ BT.LONG ]
+
+    def test_ContactMaster(self):
+        """Dock.ContactMaster with local process pool test"""
+        lst = t.load( t.testRoot() + "/dock/hex/complexes.cl")
+        lst = lst[:9]
+
+        refcom = t.load( t.testRoot() + "/com/ref.complex")
+
+        self.master = ContactMaster( lst, chunks = 3, backend='pool', ncpu=2,
+                                     niceness = {'default': 0},
+                                     show_output = self.local,
+                                     verbose = self.local, log=self.log,
+                                     refComplex = refcom,
+                                     outFile = self.cl_out )
+
+        self.cl_cont = self.master.calculateResult()
+
+        self.assertEqual( len( self.cl_cont ), 9 )
+        self.assertAlmostEqual(N.sum(self.cl_cont.valuesOf('fnac_10')),
+                               0.50811038550663579, 5 )
+
+
 if __name__ == '__main__':
 
     BT.localTest()
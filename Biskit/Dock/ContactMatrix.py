@@ -0,0 +1,297 @@
+##
+## Biskit, a toolkit for the manipulation of macromolecular structures
+## Copyright (C) 2004-2012 Raik Gruenberg & Johan Leckner
+##
+## This program is free software; you can redistribute it and/or
+## modify it under the terms of the GNU General Public License as
+## published by the Free Software Foundation; either version 3 of the
+## License, or any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+## General Public License for more details.
+##
+## You find a copy of the GNU General Public License in the file
+## license.txt along with this program; if not, write to the Free
+## Software Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+##
+##
+## last $Author$
+## last $Date$
+## $Revision$
+"""
+Sparse binary contact matrix.
+"""
+
+import numpy as N
+
+from Biskit.Errors import BiskitError
+
+
+class ContactMatrixError( BiskitError ):
+    pass
+
+
+class ContactMatrix:
+    """
+    Sparse binary matrix (typically receptor x ligand atom or residue
+    contacts). Only the sorted positions of the 1-entries in the raveled
+    matrix are stored -- the same layout as the dictionaries of
+    L{Biskit.mathUtils.packBinaryMatrix}, which can be converted back and
+    forth with L{fromPacked} and L{pack}. Row and column indices (COO
+    pairs) are available from L{rows} and L{cols}.
+
+    Set-like operations between matrices of equal shape::
+      shared = a & b            ## contacts in both
+      total  = a | b            ## contacts in either
+      n = shared.sum()          ## number of contacts
+    """
+
+    def __init__( self, shape, nonzero=[] ):
+        """
+        @param shape: (rows, columns) of the full matrix
+        @type  shape: (int, int)
+        @param nonzero: positions of 1-entries in the raveled matrix
+        @type  nonzero: [int]
+        """
+        self.shape = tuple( [ int( s ) for s in shape ] )
+        self.nonzero = N.unique( N.array( nonzero, N.int64 ).ravel() )
+
+
+    @staticmethod
+    def fromPairs( rows, cols, shape ):
+        """
+        @param rows: row index of each contact
+        @type  rows: [int]
+        @param cols: column index of each contact (same length as rows)
+        @type  cols: [int]
+        @param shape: (rows, columns) of the full matrix
+        @type  shape: (int, int)
+
+        @return: contact matrix (duplicate pairs are merged)
+        @rtype: ContactMatrix
+        """
+        rows = N.array( rows, N.int64 )
+        cols = N.array( cols, N.int64 )
+
+        return ContactMatrix( shape, rows * shape[1] + cols )
+
+
+    @staticmethod
+    def fromDense( m ):
+        """
+        @param m: 2-D array, any non-zero value counts as contact
+        @type  m: array
+
+        @return: contact matrix
+        @rtype: ContactMatrix
+        """
+        return ContactMatrix( N.shape( m ), N.flatnonzero( m ) )
+
+
+    @staticmethod
+    def fromPacked( pcm ):
+        """
+        @param pcm: {'shape':(X,Y), 'nonzero':[int]}, see
+                    L{Biskit.mathUtils.packBinaryMatrix}; dense arrays and
+                    ContactMatrix instances are also accepted
+        @type  pcm: dict OR array OR ContactMatrix
+
+        @return: contact matrix
+        @rtype: ContactMatrix
+        """
+        if isinstance( pcm, ContactMatrix ):
+            return pcm
+
+        if type( pcm ) == dict:
+            return ContactMatrix( pcm['shape'], pcm['nonzero'] )
+
+        return ContactMatrix.fromDense( pcm )
+
+
+    def pack( self ):
+        """
+        @return: {'shape':(X,Y), 'nonzero':[int] }, see
+                 L{Biskit.mathUtils.packBinaryMatrix}
+        @rtype: dict
+        """
+        return { 'shape': self.shape, 'nonzero': self.nonzero.tolist() }
+
+
+    def toDense( self, dtype=int ):
+        """
+        @param dtype: type of the dense matrix (default: int)
+        @type  dtype: type
+
+        @return: full matrix with 1 for contacts and 0 everywhere else
+        @rtype: array
+        """
+        r = N.zeros( self.shape[0] * self.shape[1], dtype )
+        r[ self.nonzero ] = 1
+
+        return r.reshape( self.shape )
+
+
+    def __repr__( self ):
+        return '[ContactMatrix %i x %i, %i contacts]' % \
+               ( self.shape + ( len( self.nonzero ), ) )
+
+
+    def __eq__( self, other ):
+        return isinstance( other, ContactMatrix ) and \
+               self.shape == other.shape and \
+               N.all( self.nonzero == other.nonzero )
+
+
+    def __ne__( self, other ):
+        return not self == other
+
+
+    def rows( self ):
+        """
+        @return: row index of each contact
+        @rtype: array of int
+        """
+        return self.nonzero // self.shape[1]
+
+
+    def cols( self ):
+        """
+        @return: column index of each contact
+        @rtype: array of int
+        """
+        return self.nonzero % self.shape[1]
+
+
+    def sum( self ):
+        """
+        @return: number of contacts
+        @rtype: int
+        """
+        return len( self.nonzero )
+
+
+    def rowSum( self ):
+        """
+        @return: number of contacts in each row, like N.sum( m, 1 )
+        @rtype: array of int
+        """
+        return N.bincount( self.rows(), minlength=self.shape[0] )
+
+
+    def colSum( self ):
+        """
+        @return: number of contacts in each column, like N.sum( m, 0 )
+        @rtype: array of int
+        """
+        return N.bincount( self.cols(), minlength=self.shape[1] )
+
+
+    def __check( self, other ):
+        if self.shape != other.shape:
+            raise ContactMatrixError, 'shape mismatch: %r != %r' % \
+                  ( self.shape, other.shape )
+
+
+    def __and__( self, other ):
+        """contacts present in both matrices"""
+        self.__check( other )
+        return ContactMatrix( self.shape,
+                              N.intersect1d( self.nonzero, other.nonzero ) )
+
+
+    def __or__( self, other ):
+        """contacts present in any of the two matrices"""
+        self.__check( other )
+        return ContactMatrix( self.shape,
+                              N.union1d( self.nonzero, other.nonzero ) )
+
+
+    def overlap( self, other ):
+        """
+        @param other: matrix of same shape
+        @type  other: ContactMatrix
+
+        @return: number of contacts present in both matrices
+        @rtype: int
+        """
+        self.__check( other )
+        return int( N.sum( N.in1d( self.nonzero, other.nonzero,
+                                   assume_unique=True ) ) )
+
+
+    def remap( self, rowMap, colMap, shape ):
+        """
+        Move rows and columns to new positions. Contacts of rows or columns
+        mapped to -1 are dropped, several rows (columns) mapped to the same
+        position are merged. E.g. atom contacts can be reduced to residue
+        contacts with the atom-to-residue map of each axis.
+
+        @param rowMap: new position of each row (or -1)
+        @type  rowMap: [int]
+        @param colMap: new position of each column (or -1)
+        @type  colMap: [int]
+        @param shape: shape of the new matrix
+        @type  shape: (int, int)
+
+        @return: new contact matrix
+        @rtype: ContactMatrix
+        """
+        rows = N.take( rowMap, self.rows() )
+        cols = N.take( colMap, self.cols() )
+
+        keep = (rows >= 0) * (cols >= 0)
+
+        return ContactMatrix.fromPairs( rows[keep], cols[keep], shape )
+
+
+    def transpose( self ):
+        """
+        @return: transposed contact matrix
+        @rtype: ContactMatrix
+        """
+        return ContactMatrix.fromPairs( self.cols(), self.rows(),
+                                        self.shape[::-1] )
+
+
+#############
+##  TESTING
+#############
+import Biskit.test as BT
+
+class Test(BT.BiskitTest):
+    """ContactMatrix test"""
+
+    def test_ContactMatrix( self ):
+        """Dock.ContactMatrix test"""
+        import Biskit.mathUtils as MU
+
+        a = N.random.RandomState( 1 ).rand( 40, 30 ) > 0.8
+        b = N.random.RandomState( 2 ).rand( 40, 30 ) > 0.8
+
+        self.a, self.b = ContactMatrix.fromDense(a), ContactMatrix.fromDense(b)
+
+        self.assert_( N.all( self.a.toDense() == a ) )
+        self.assertEqual( (self.a & self.b).sum(), N.sum( a * b ) )
+        self.assertEqual( (self.a | self.b).sum(), N.sum( a + b ) )
+        self.assertEqual( self.a.overlap( self.b ), N.sum( a * b ) )
+
+        self.assert_( N.all( self.a.rowSum() == N.sum( a, 1 ) ) )
+        self.assert_( N.all( self.a.colSum() == N.sum( a, 0 ) ) )
+        self.assert_( N.all( self.a.transpose().toDense() == a.T ) )
+
+        self.assertEqual( ContactMatrix.fromPacked( MU.packBinaryMatrix(a) ),
+                          self.a )
+        self.assertEqual( self.a.pack(), MU.packBinaryMatrix( a ) )
+
+        ## reduce rows and columns to blocks of 4 and 3
+        r = self.a.remap( N.arange( 40 ) / 4, N.arange( 30 ) / 3, (10, 10) )
+        dense = N.array( [ [ N.any( a[i*4:i*4+4, j*3:j*3+3] )
+                             for j in range(10) ] for i in range(10) ] )
+        self.assert_( N.all( r.toDense() == dense ) )
+
+
+if __name__ == '__main__':
+
+    BT.localTest()
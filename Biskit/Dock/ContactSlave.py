@@ -33,6 +33,8 @@ from Biskit import mathUtils as MU
 from Biskit.LogFile import StdLog, LogFile
 import numpy.oldnumeric as N
 from Complex import Complex
+from ContactMatrix import ContactMatrix
+from ComplexModelRegistry import ComplexModelRegistry
 import os.path
 import time
 
@@ -80,11 +82,12 @@ class ContactSlave(JobSlave):
 
         ## reference residue / atom contact matrices
         if params.get( 'c_ref_res_4_5', None):
-            self.c_ref_res_4_5= MU.unpackBinaryMatrix(params['c_ref_res_4_5'])
+            self.c_ref_res_4_5= ContactMatrix.fromPacked(
+                params['c_ref_res_4_5'])
 
-            self.c_ref_atom_4_5 = MU.unpackBinaryMatrix(
+            self.c_ref_atom_4_5 = ContactMatrix.fromPacked(
                 params['c_ref_atom_4_5'])
-            self.c_ref_atom_10 = MU.unpackBinaryMatrix(
+            self.c_ref_atom_10 = ContactMatrix.fromPacked(
                 params['c_ref_atom_10'])
 
         ## atom masks for casting
@@ -107,12 +110,15 @@ class ContactSlave(JobSlave):
         self.reduced_ligs = params['reduced_ligs']
 
         if params.get( 'c_ref_ratom_10', None):
-            self.c_ref_ratom_10= MU.unpackBinaryMatrix(
+            self.c_ref_ratom_10= ContactMatrix.fromPacked(
                 params['c_ref_ratom_10'])
 
         ## only calculate certain values
         self.force = params.get('force', [] )
 
+        ## spatial indices of receptors, re-used for all complexes
+        self.models = ComplexModelRegistry()
+
 
     def reportError(self, msg, soln ):
         """
@@ -209,38 +215,39 @@ class ContactSlave(JobSlave):
         @type  c: Complex
         """
         try:
-            if self.requested(c, 'fnac_4.5') and self.c_ref_atom_4_5 != None:
-                ## cache pairwise atom distances for following calculations
+            if self.requested(c, 'fnac_4.5') and \
+                   self.c_ref_atom_4_5 is not None:
+
                 contacts = c.atomContacts( 4.5, self.mask_rec, self.mask_lig,
-                                           cache=1, map_back=0 )
-                ref = N.ravel( self.c_ref_atom_4_5 )
+                                           map_back=0, sparse=1,
+                                           registry=self.models )
+                ref = self.c_ref_atom_4_5
 
-                c['fnac_4.5'] = N.sum( N.ravel(contacts) * ref )\
-                 / float( N.sum(ref))
+                c['fnac_4.5'] = contacts.overlap( ref ) / float( ref.sum() )
 
-            if self.requested(c, 'fnac_10') and self.c_ref_atom_10 != None:
+            if self.requested(c, 'fnac_10') and self.c_ref_atom_10 is not None:
 
                 contacts = c.atomContacts( 10., self.mask_rec, self.mask_lig,
-                                           cache=1, map_back=0 )
+                                           map_back=0, sparse=1,
+                                           registry=self.models )
+                ref = self.c_ref_atom_10
 
-                ref = N.ravel( self.c_ref_atom_10 )
-                c['fnac_10'] = N.sum( N.ravel(contacts) * ref ) \
-                 / float( N.sum(ref))
+                c['fnac_10'] = contacts.overlap( ref ) / float( ref.sum() )
 
             if self.requested(c, 'c_res_4.5') \
-               or ( self.c_ref_res_4_5 != None \
+               or ( self.c_ref_res_4_5 is not None \
                     and (self.requested(c,'fnrc_4.5','fnSurf_rec'))):
 
-                res_cont = c.resContacts( 4.5,
-                                          cache=self.requested(c, 'c_res_4.5'))
+                res_cont = c.resContacts( 4.5, sparse=1,
+                                          cache=self.requested(c, 'c_res_4.5'),
+                                          registry=self.models )
 
-                if self.c_ref_res_4_5 != None \
+                if self.c_ref_res_4_5 is not None \
                    and self.requested(c, 'fnrc_4.5' ):
-                    ref = N.ravel( self.c_ref_res_4_5 )
-                    c['fnrc_4.5'] = N.sum(N.ravel(res_cont)*ref) \
-                     /float(N.sum(ref))
+                    ref = self.c_ref_res_4_5
+                    c['fnrc_4.5'] = res_cont.overlap( ref ) / float(ref.sum())
 
-                if self.c_ref_res_4_5 != None \
+                if self.c_ref_res_4_5 is not None \
                    and self.requested(c, 'fnSurf_rec'):
                     r, l = c.fractionNativeSurface(res_cont,
                                                    self.c_ref_res_4_5 )
@@ -281,15 +288,15 @@ class ContactSlave(JobSlave):
             red_lig = self.reduced_ligs[ c.lig_model.source ]
             red_com = Complex( red_rec, red_lig, c.ligandMatrix )
 
-            contacts = red_com.atomContacts( 10.0, cache=1 )
+            contacts = red_com.atomContacts( 10.0, sparse=1,
+                                             registry=self.models )
 
             if self.requested(c, 'c_ratom_10'):
-                c['c_ratom_10'] = MU.packBinaryMatrix(contacts)
+                c['c_ratom_10'] = contacts.pack()
 
             if self.c_ref_ratom_10 is not None:
-                ref = N.ravel( self.c_ref_ratom_10 )
-                c['fnarc_10'] = N.sum( N.ravel(contacts) * ref )\
-                 / float( N.sum(ref))
+                ref = self.c_ref_ratom_10
+                c['fnarc_10'] = contacts.overlap( ref ) / float( ref.sum() )
 
         except:
             self.reportError('reduced contacts error', soln)
@@ -503,7 +510,7 @@ class Test(BT.BiskitTest):
 
         jobs = self.master.data
 
-        self.slave = ContactSlave()
+        self.slave = ContactSlave( local=1 )
         self.slave.initialize( self.master.getInitParameters(1) )
 
         if self.local or self.VERBOSITY > 2:
@@ -10,6 +10,8 @@
 import random
 import numpy as N
 
+from Biskit.SpatialIndex import SpatialIndex
+
 class PatchGenerator:
     """
     Generate chunks / patches from a given PDBModel. To generate surface
@@ -18,6 +20,13 @@ class PatchGenerator:
 
     def __init__( self, model ):
         self.model = model
+        self.index = None
+
+    def __nearest( self, atom, n ):
+        """nearest( int_atom, int_n ) -> indices of n atoms closest to atom"""
+        if self.index is None:
+            self.index = SpatialIndex( self.model.xyz )
+        return self.index.nearest( self.model.xyz[atom], n )
 
     def __distances( self, atom ):
         """distances( int_atom ) -> distances of all atoms to given atom"""
@@ -30,11 +39,8 @@ class PatchGenerator:
         patchAround( int_atom, int_nAtoms ) -> mask for self.model
         Create single patch of given size around given atom
         """
-        dist = self.__distances( atom )
-        order = N.argsort( dist )
-
         r = N.zeros( len( self.model ), 'i' )
-        N.put( r, order[:size], 1 )
+        N.put( r, self.__nearest( atom, size ), 1 )
 
         return r
 
@@ -50,15 +56,13 @@ class PatchGenerator:
         xyz = self.model.xyz
 
         atoms = [ first or random.randint(0, self.model.lenAtoms()-1) ]
-        dist = []
 
-        for i in range(1, n):
-
-            dist += [ self.__distances( atoms[-1] ) ]
+        ## distance of each atom to the closest selected atom
+        mindist = self.__distances( atoms[-1] )
 
-            mindist = [ min( N.array(dist)[:,i] )
-                        for i in range(len(self.model) ) ]
+        for i in range(1, n):
 
+            mindist = N.minimum( mindist, self.__distances( atoms[-1] ) )
             atoms += [ N.argmax( mindist ) ]
 
         return atoms
@@ -10,6 +10,8 @@
 import numpy.random as ra
 import numpy.oldnumeric as N
 
+from Biskit.SpatialIndex import SpatialIndex
+
 class PatchGeneratorFromOrbit:
     """
     Generate chunks / patches from a given PDBModel. To generate
@@ -41,6 +43,18 @@ class PatchGeneratorFromOrbit:
         self.model   = model
         self.orbit   = orbit ## or max( model.getXyz() - model.center() )
         self.center  = center or model.center()
+        self.index   = None
+
+
+    def __nearest( self, point, n ):
+        """
+        point - 3 x 1 array of float; point of origin
+        n     - int, number of atoms
+        -> indices of the n model atoms closest to point
+        """
+        if self.index is None:
+            self.index = SpatialIndex( self.model.getXyz() )
+        return self.index.nearest( point, n )
 
 
     def __distances( self, point, xyz=None ):
@@ -79,11 +93,8 @@ class PatchGeneratorFromOrbit:
         patchAround( float_center, int_nAtoms ) -> mask for self.model
         Create single patch of nAtoms atoms that are closest to center.
         """
-        dist = self.__distances( center )
-        order = N.argsort( dist )
-
         r = N.zeros( len( self.model ), 'i' )
-        N.put( r, order[:nAtoms], 1 )
+        N.put( r, self.__nearest( center, nAtoms ), 1 )
 
         return self.centerPatch( r )
 
@@ -94,10 +105,9 @@ class PatchGeneratorFromOrbit:
         -> [ 1|0 ], mask of patch around geometric center of first patch
         """
         c    = self.model.center( patch_mask )
-        dist = self.__distances( c )
 
         n_atoms= len( N.nonzero( patch_mask ) )
-        i_dist = N.argsort( dist )[:n_atoms]
+        i_dist = self.__nearest( c, n_atoms )
 
         result = N.zeros( len( patch_mask ) )
         N.put( result, i_dist, 1 )
@@ -18,31 +18,29 @@
 """
 Protein-protein docking related modules
 """
-from Biskit import EHandler
+import Biskit.LazyModule as LazyModule
 
-try:
-    from Complex import Complex
-    from ComplexEvolving import ComplexEvolving
-    from ComplexEvolvingList import ComplexEvolvingList
-    from ComplexList import ComplexList
-    from ComplexTraj import ComplexTraj
-    from ComplexModelRegistry import ComplexModelRegistry
-    from ComplexRandomizer import ComplexRandomizer
-    from Docker import Docker
-    from FixedList import FixedList
-    from HexParser import HexParser
-    from delphiBindingEnergy import DelphiBindingEnergy
-##     from Intervor import Intervor
-##     from PatchGenerator import PatchGenerator
-##     from PatchGeneratorFromOrbit import PatchGeneratorFromOrbit
-
-except IOError, why:
-    EHandler.warning("Couldn't import all Biskit.Dock modules.\n" + str(why))
+## public classes and the modules defining them, imported on first access
+__exports = [
+    ('Complex', 'Complex'),
+    ('ComplexEvolving', 'ComplexEvolving'),
+    ('ComplexEvolvingList', 'ComplexEvolvingList'),
+    ('ComplexList', 'ComplexList'),
+    ('ComplexTraj', 'ComplexTraj'),
+    ('ContactMatrix', 'ContactMatrix ContactMatrixError'),
+    ('ComplexModelRegistry', 'ComplexModelRegistry'),
+    ('ComplexRandomizer', 'ComplexRandomizer'),
+    ('Docker', 'Docker'),
+    ('FixedList', 'FixedList'),
+    ('HexParser', 'HexParser'),
+    ('delphiBindingEnergy', 'DelphiBindingEnergy'),
+##     ('Intervor', 'Intervor'),
+##     ('PatchGenerator', 'PatchGenerator'),
+##     ('PatchGeneratorFromOrbit', 'PatchGeneratorFromOrbit'),
 
 ## PVM-dependent modules
-try:
-    from ContactMaster import ContactMaster
-    from ContactSlave import ContactSlave
-except Exception, why:
-    EHandler.warning("Couldn't import PVM-dependent modules of Biskit.Dock.\n"+\
-                     str( why ) )
+    ('ContactMaster', 'ContactMaster'),
+    ('ContactSlave', 'ContactSlave'),
+    ]
+
+LazyModule.install( __name__, LazyModule.exports( __exports ) )
@@ -40,8 +40,8 @@ is not found, settings.py uses the default value from
 C{biskit/Biskit/data/defaults/settings_Dock.cfg}.
 
 If missing, the user configuration file C{~/.biskit/settings_Dock.cfg} is
-created automatically during the startup of Biskit (i.e. for any
-import). The auto-generated file only contains parameters for which
+created automatically when the settings are first used. The
+auto-generated file only contains parameters for which
 the default values don't seem to work (invalid paths or binaries).
 
 See L{Biskit.SettingsManager}
@@ -60,23 +60,13 @@ Summary for all
 ---------------
   !Dont't touch C{settings.py}!
 """
-import Biskit as B
 import Biskit.tools as T
 import Biskit.SettingsManager as M
 
-import user, sys
+import os.path, sys
 
 __CFG_DEFAULT = T.dataRoot() + '/defaults/settings_Dock.cfg'
-__CFG_USER    = user.home + '/.biskit/settings_Dock.cfg'
-
-try:
-    m = M.SettingsManager(__CFG_DEFAULT, __CFG_USER, createmissing=True  )
-
-    m.updateNamespace( locals() )
-
-except Exception, why:
-    B.EHandler.fatal( 'Error importing Biskit.Dock settings')
-
+__CFG_USER    = os.path.expanduser( '~' ) + '/.biskit/settings_Dock.cfg'
 
 ##############################
 ## Check environment variables
@@ -91,12 +81,6 @@ prosaII_env = {'PROSA_BASE':'/home/Bis/shared/rh73/prosa/prosabase/'}
 env.update(hex_env)
 env.update(prosaII_env)
 
-######################
-## clean up name space
-
-del B, T, M, user, sys
-del __CFG_DEFAULT, __CFG_USER, m
-
 ################
 ## empty test ##
 import Biskit.test as BT
@@ -104,3 +88,10 @@ import Biskit.test as BT
 class Test(BT.BiskitTest):
     """Mock test, settings is always executed anyway."""
     pass
+
+##################################################################
+## replace this module by one that reads the configuration files
+## only when a parameter is first used; imported modules are dropped
+
+M.install( __name__, __CFG_DEFAULT, __CFG_USER,
+           error='Error importing Biskit.Dock settings' )
@@ -29,9 +29,11 @@ Multi-copy trajectory
 """
 
 from Trajectory import Trajectory, TrajError
+from PDBModel import PDBModel
 from Biskit import EHandler
 
 import Biskit.mathUtils as M
+import Biskit.rmsFit as rmsFit
 
 import types
 import numpy.oldnumeric as N
@@ -533,24 +535,44 @@ class EnsembleTraj( Trajectory ):
         @param profInfos: description key-value pairs for profile
         @type  profInfos: key=value
         """
-        ml = self.memberList()
+        if not self.frames.flags.writeable:
+            raise EnsembleTrajError, \
+                  'Cannot fit read-only (memory-mapped) frames.'
+
+        if mask is None:
+            mask = N.ones( self.lenAtoms(), N.int32 )
+
+        rms = N.zeros( self.lenFrames(), N.Float )
+        considered = N.zeros( self.lenFrames(), N.Float )
+
+        ## fit member frames in place, one member at a time
+        for m in range( self.n_members ):
+
+            indices = self.memberIndices( m )
 
-        for m in ml:
             if refIndex == None:
                 if refModel==None:
-                    ref = None
+                    refxyz = self._avgFrame( indices )
                 else:
-                    ref = refModel
+                    refxyz = refModel.getXyz()
             else:
-                ref = m[ refIndex ]
+                refxyz = self.frames[ indices[ refIndex ] ]
+
+            refxyz = N.compress( mask, refxyz, 0 )
 
-            m.fit( ref=ref, mask=mask, n_it=n_it, prof=prof,
-                   verbose=verbose, **profInfos )
+            r, c = self._fitFrames( refxyz, indices, mask=mask, n_it=n_it,
+                                    verbose=verbose )
 
-        ## ToDo for memory efficiency: replace frame chunks on the fly
+            N.put( rms, indices, r )
+            if c:
+                N.put( considered, indices, c )
 
-        self.replaceContent( ml[0].concat( *ml[1:] ) )
-        self.sortFrames()
+        self.setProfile( prof, rms, n_iterations=n_it, **profInfos )
+
+        if n_it != 1:
+            self.setProfile( prof+'_considered', considered,
+                             n_iterations=n_it,
+                             comment='fraction of atoms considered for iterative fit' )
 
 
     def blockFit( self, ref=None, mask=None ):
@@ -567,17 +589,17 @@ class EnsembleTraj( Trajectory ):
 
         for m in range( self.n_members ):
 
-            indices = self.memberIndices( m )
+            indices = N.array( self.memberIndices( m ) )
 
-            ## get a copy of this member's Trajectory
-            traj = self.takeFrames( indices )
-            m_avg = traj.avgModel()
+            m_avg = PDBModel( self.getRef(), noxyz=1 )
+            m_avg.setXyz( self._avgFrame( indices ) )
 
             r, t = m_avg.transformation( ref, mask )
-            traj.transform( r, t )
 
-            ## replace original frames of this member
-            N.put( self.frames, indices, traj.frames )
+            ## transform member frames block by block
+            for start, frames in self.frameBlocks( indices ):
+                i = indices[ start : start+len(frames) ]
+                self.frames[ i ] = rmsFit.transformFrames( frames, r, t )
 
 
 
@@ -26,7 +26,7 @@ Collect settings for an external program from a configuration file.
 """
 
 import ConfigParser
-import user, os.path
+import os.path
 
 from Biskit.Errors import BiskitError
 from Biskit import EHandler
@@ -114,7 +114,7 @@ class ExeConfig( object ):
     """
 
     ## static fields
-    PATH_CONF   = user.home + '/.biskit'
+    PATH_CONF   = os.path.expanduser( '~' ) + '/.biskit'
     PATH_CONF_DEFAULT = os.path.join( T.dataRoot(), 'defaults' )
     SECTION_BIN = 'BINARY'
     SECTION_ENV = 'ENVIRONMENT'
@@ -366,6 +366,7 @@ class Executor:
         self.pid = None     #: process ID
 
         self.result = None  #: set by self.finish()
+        self.failed = None  #: set by self.run() from self.isFailed()
 
         self.initVersion = self.version()
 
@@ -434,12 +435,15 @@ class Executor:
         @raise RunError: if OSError occurs during Popen or Popen.communicate
         """
         try:
+            ## don't inherit the pipes of jobs started at the same time
+            ## in other threads (see L{Biskit.ExecutorPool})
             p = subprocess.Popen( cmd.split(),
                                   bufsize=bufsize, executable=executable,
                                   stdin=stdin, stdout=stdout, stderr=stderr,
                                   shell=shell or self.exe.shell,
                                   env=env or self.environment(), 
-                                  cwd=cwd or self.cwd )
+                                  cwd=cwd or self.cwd,
+                                  close_fds=(os.name == 'posix') )
 
             self.pid = p.pid
 
@@ -554,7 +558,8 @@ class Executor:
             raise RunError, why
 
         try:
-            if self.isFailed():
+            self.failed = self.isFailed()
+            if self.failed:
                 self.fail()
             else:
                 self.finish()
@@ -639,11 +644,12 @@ class Executor:
         if self.f_err and not self.debug:
             t.tryRemove( self.f_err )
         
-        if not self.keep_tempdir and not self.debug and self.verbose:
-            if os.listdir( self.tempdir ):  
-                self.log.add('Warning: Removing non-empty temporary folder %s'%\
-                             self.tempdir )
-            self.log.writeln( 'Removing temporary folder %s' % self.tempdir )
+        if not self.keep_tempdir and not self.debug:
+            if self.verbose:
+                if os.listdir( self.tempdir ):
+                    self.log.add('Warning: Removing non-empty temporary '+\
+                                 'folder %s' % self.tempdir )
+                self.log.writeln( 'Removing temporary folder %s' % self.tempdir)
             t.tryRemove( self.tempdir, tree=True )
 
 
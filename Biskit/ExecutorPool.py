@@ -0,0 +1,385 @@
+##
+## Biskit, a toolkit for the manipulation of macromolecular structures
+## Copyright (C) 2004-2012 Raik Gruenberg & Johan Leckner
+##
+## This program is free software; you can redistribute it and/or
+## modify it under the terms of the GNU General Public License as
+## published by the Free Software Foundation; either version 3 of the
+## License, or any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+## General Public License for more details.
+##
+## You find a copy of the GNU General Public License in the file
+## license.txt along with this program; if not, write to the Free
+## Software Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+##
+##
+## last $Author$
+## last $Date$
+## $Revision$
+"""
+Run many Executor instances concurrently.
+"""
+
+import multiprocessing, threading, Queue
+import tempfile, os
+
+import Biskit.tools as T
+from Biskit.LogFile import StdLog
+from Biskit.Errors import BiskitError
+from Biskit.Executor import Executor
+
+
+class ExecutorPoolError( BiskitError ):
+    pass
+
+
+class ExecutorPool:
+    """
+    Run a batch of L{Executor}s (e.g. one Delphi, DSSP or Reduce
+    calculation per model) with a bounded number of external programs
+    running at the same time::
+
+      pool = ExecutorPool( ncpu=4 )
+      for m in models:
+          pool.add( Dssp( m ) )
+
+      for x in pool.finished():        ## in order of completion
+          if not pool.isFailed( x ):
+              print x.result
+
+    Each job is run with the unchanged Executor.run() in a worker thread.
+    The python side of a job is short and the threads spend their time
+    waiting for the external process, so several programs really run in
+    parallel. Failures are detected by the Executors themselves: a job has
+    failed if its isFailed() returned true (after which run() called the
+    job's fail()) or if run() raised an exception (e.g. from a fail() that
+    raises its own error). The exception of a job never stops the other
+    jobs but is recorded and can be retrieved with L{error}.
+
+    External programs often write fixed-name files into their working
+    directory. With isolate=True, jobs that would run in the same folder
+    as another job, in the shared temporary folder or in the current
+    working directory (cwd=None) are moved into a private working folder
+    for the time of their run. Relative paths given in the program
+    arguments are then resolved from that folder -- use absolute paths
+    or isolate=False for such jobs.
+    """
+
+    def __init__( self, ncpu=None, isolate=True, log=None, verbose=0 ):
+        """
+        @param ncpu: max. number of programs running at the same time
+                     (default: all CPUs)
+        @type  ncpu: int
+        @param isolate: run jobs without a working folder of their own
+                        in a private temporary folder (default: True)
+        @type  isolate: bool
+        @param log: log for progress messages (None->STDOUT) (default: None)
+        @type  log: Biskit.LogFile
+        @param verbose: report each finished job (default: 0)
+        @type  verbose: 0|1
+        """
+        self.ncpu = ncpu or multiprocessing.cpu_count()
+        self.isolate = isolate
+        self.log = log or StdLog()
+        self.verbose = verbose
+
+        self.jobs = []        #: Executors in order of submission
+        self.errors = {}      #: Executor -> error message
+        self.running = False
+
+
+    def __len__( self ):
+        return len( self.jobs )
+
+
+    def add( self, x ):
+        """
+        Add a job to the pool.
+
+        @param x: job
+        @type  x: Executor
+
+        @return: number of the job
+        @rtype: int
+
+        @raise ExecutorPoolError: if x is not an Executor or the pool is
+                                  running
+        """
+        if not isinstance( x, Executor ):
+            raise ExecutorPoolError, 'not an Executor: %r' % x
+
+        if self.running:
+            raise ExecutorPoolError, 'cannot add jobs to a running pool'
+
+        self.jobs.append( x )
+        return len( self.jobs ) - 1
+
+
+    def extend( self, lst ):
+        """
+        Add several jobs to the pool.
+
+        @param lst: jobs
+        @type  lst: [Executor]
+        """
+        for x in lst:
+            self.add( x )
+
+
+    def isFailed( self, x ):
+        """
+        @param x: finished job
+        @type  x: Executor
+
+        @return: whether the job failed
+        @rtype: bool
+        """
+        return x in self.errors
+
+
+    def error( self, x ):
+        """
+        @param x: finished job
+        @type  x: Executor
+
+        @return: error message of a failed job, None if the job succeeded
+        @rtype: str
+        """
+        return self.errors.get( x )
+
+
+    def failed( self ):
+        """
+        @return: failed jobs in order of submission
+        @rtype: [Executor]
+        """
+        return [ x for x in self.jobs if x in self.errors ]
+
+
+    def sharedFolders( self ):
+        """
+        @return: working folders that must not be used by a job directly
+        @rtype: set of str
+        """
+        r = set( [ T.absfile( T.tempDir() ), T.absfile( os.getcwd() ) ] )
+
+        seen = set()
+        for x in self.jobs:
+            cwd = T.absfile( x.cwd or os.getcwd() )
+            if cwd in seen:
+                r.add( cwd )
+            seen.add( cwd )
+
+        return r
+
+
+    def __runJob( self, x, shared ):
+        """
+        Run a single job (in a worker thread).
+
+        @return: error message or None
+        @rtype: str
+        """
+        cwd = x.cwd
+        folder = None
+
+        try:
+            try:
+                if self.isolate and T.absfile( cwd or os.getcwd() ) in shared:
+                    folder = tempfile.mkdtemp( '',
+                                        x.__class__.__name__.lower() + '_',
+                                        T.tempDir() )
+                    x.cwd = folder
+
+                x.run()
+
+                if x.failed:
+                    return '%s.isFailed() reported an error' % \
+                           x.__class__.__name__
+
+            except Exception:
+                x.failed = True
+                try:
+                    x.cleanup()
+                except:
+                    pass
+                return T.lastError() + '\n' + T.lastErrorTrace()
+
+        finally:
+            x.cwd = cwd
+            if folder and not x.debug:
+                T.tryRemove( folder, tree=True )
+
+        return None
+
+
+    def __worker( self, inbox, outbox, shared ):
+        """main loop of a worker thread"""
+        while True:
+            try:
+                x = inbox.get_nowait()
+            except Queue.Empty:
+                return
+
+            outbox.put( ( x, self.__runJob( x, shared ) ) )
+
+
+    def finished( self ):
+        """
+        Run all jobs and yield each one as soon as it has finished
+        (successfully or not). Results are available from the jobs
+        themselves (x.result, x.output, ...).
+
+        @return: iterator over finished jobs in order of completion
+        @rtype: iterator of Executor
+
+        @raise ExecutorPoolError: if the pool is already running
+        """
+        if self.running:
+            raise ExecutorPoolError, 'pool is already running'
+
+        self.running = True
+        self.errors = {}
+
+        try:
+            inbox, outbox = Queue.Queue(), Queue.Queue()
+            for x in self.jobs:
+                inbox.put( x )
+
+            shared = self.sharedFolders()
+
+            for i in range( min( self.ncpu, len( self.jobs ) ) ):
+                w = threading.Thread( target=self.__worker,
+                                      args=( inbox, outbox, shared ) )
+                w.setDaemon( True )
+                w.start()
+
+            for i in range( len( self.jobs ) ):
+
+                ## a timeout keeps the main thread responsive to Ctrl-C
+                while True:
+                    try:
+                        x, error = outbox.get( True, 1 )
+                        break
+                    except Queue.Empty:
+                        pass
+
+                if error:
+                    self.errors[ x ] = error
+
+                if self.verbose:
+                    self.log.add( 'job %i of %i finished (%s)%s' % \
+                                  ( i+1, len( self.jobs ), x.exe.name,
+                                    ', FAILED: ' + error if error else '' ) )
+
+                yield x
+
+        finally:
+            self.running = False
+
+
+    def run( self ):
+        """
+        Run all jobs and wait for them to finish.
+
+        @return: Executor.run() result of each job (None for failed jobs)
+                 in order of submission
+        @rtype: [any]
+        """
+        for x in self.finished():
+            pass
+
+        return [ None if x in self.errors else x.result for x in self.jobs ]
+
+
+#############
+##  TESTING
+#############
+import Biskit.test as BT
+
+class FailingExecutor( Executor ):
+    """Executor that always fails, the second job also raises an error"""
+
+    def isFailed( self ):
+        return 1
+
+    def fail( self ):
+        if self.args == '2':
+            raise ExecutorPoolError, 'job failed'
+
+
+class PwdExecutor( Executor ):
+    """Report the working folder of the program"""
+
+    def __init__( self, **kw ):
+        Executor.__init__( self, 'pwd', strict=0, verbose=0, **kw )
+
+    def finish( self ):
+        self.result = open( self.f_out ).read().strip()
+
+
+class Test(BT.BiskitTest):
+    """ExecutorPool test"""
+
+    def test_concurrency( self ):
+        """ExecutorPool concurrent jobs test"""
+        import time
+
+        self.pool = ExecutorPool( ncpu=4, verbose=self.local )
+        for i in range( 4 ):
+            self.pool.add( Executor( 'sleep', args='0.5', strict=0,
+                                     verbose=0 ) )
+
+        t0 = time.time()
+        self.r = self.pool.run()
+        t = time.time() - t0
+
+        if self.local:
+            print '4 x 0.5 s of sleep took %.2f s' % t
+
+        self.assert_( t < 1.5, 'jobs did not run in parallel' )
+        self.assertEqual( [ r[2] for r in self.r ], [ 0 ] * 4 )
+        self.assertEqual( self.pool.failed(), [] )
+
+    def test_isolation( self ):
+        """ExecutorPool private working folders test"""
+        self.pool = ExecutorPool( ncpu=2 )
+        self.jobs = [ PwdExecutor() for i in range( 3 ) ]
+        self.jobs.append( PwdExecutor( cwd=T.absfile( '~' ) ) )
+        self.pool.extend( self.jobs )
+
+        self.r = self.pool.run()
+
+        self.assertEqual( len( set( self.r ) ), 4 )
+        self.assertEqual( self.r[3], T.absfile( '~' ) )
+
+        for f in self.r[:3]:
+            self.assert_( f.startswith( T.absfile( T.tempDir() ) ) )
+            self.assert_( not os.path.exists( f ) )
+
+        self.assertEqual( [ x.cwd for x in self.jobs[:3] ], [ None ] * 3 )
+
+    def test_failures( self ):
+        """ExecutorPool failure propagation test"""
+        self.pool = ExecutorPool( ncpu=2, verbose=self.local )
+        self.jobs = [ FailingExecutor( 'true', args=str(i), strict=0,
+                                       verbose=0 ) for i in range( 3 ) ]
+        self.jobs.append( Executor( 'true', strict=0, verbose=0 ) )
+        self.pool.extend( self.jobs )
+
+        self.done = list( self.pool.finished() )
+
+        self.assertEqual( len( self.done ), 4 )
+        self.assertEqual( self.pool.failed(), self.jobs[:3] )
+        self.assert_( 'job failed' in self.pool.error( self.jobs[2] ) )
+        self.assert_( self.pool.error( self.jobs[3] ) is None )
+        self.assertRaises( ExecutorPoolError, self.pool.add, 'true' )
+
+
+if __name__ == '__main__':
+
+    BT.localTest()
@@ -0,0 +1,234 @@
+##
+## Biskit, a toolkit for the manipulation of macromolecular structures
+## Copyright (C) 2004-2012 Raik Gruenberg & Johan Leckner
+##
+## This program is free software; you can redistribute it and/or
+## modify it under the terms of the GNU General Public License as
+## published by the Free Software Foundation; either version 3 of the
+## License, or any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+## General Public License for more details.
+##
+## You find a copy of the GNU General Public License in the file
+## license.txt along with this program; if not, write to the Free
+## Software Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+##
+##
+## last $Author$
+## last $Date$
+## $Revision$
+"""
+Packages that import their public classes only on first access.
+"""
+
+import sys, types
+
+
+class LazyModule( types.ModuleType ):
+    """
+    Replacement for a package module that exports names from its
+    sub-modules without importing them in advance. The sub-module of a name
+    is only imported when the name is first accessed, either as attribute
+    (C{Biskit.PDBModel}) or with C{from Biskit import PDBModel}. The
+    result is then stored in the package like a normal import.
+
+    Python also stores every imported sub-module as attribute of its
+    package. Where the sub-module has the same name as the class it
+    exports (PDBModel.PDBModel), this module attribute is replaced by the
+    class on access.
+
+    Use L{install} at the end of the package's __init__.py.
+    """
+
+    def __init__( self, name, exports, original ):
+        """
+        @param name: package name
+        @type  name: str
+        @param exports: { public name : name of sub-module defining it }
+        @type  exports: { str : str }
+        @param original: original package module (is kept alive because
+                         its functions still use its namespace)
+        @type  original: module
+        """
+        types.ModuleType.__init__( self, name )
+
+        self.__dict__.update( original.__dict__ )
+        self._lazy_exports = exports
+        self._lazy_original = original
+
+        self.__all__ = [ n for n, v in self.__dict__.items()
+                         if not n.startswith('_') and
+                         type( v ) is not types.ModuleType ]
+        self.__all__ += [ n for n in exports if n not in self.__all__ ]
+
+
+    def __load( self, name ):
+        """import name from its sub-module and store it in the package"""
+        module = self._lazy_exports[ name ]
+
+        __import__( self.__name__ + '.' + module )
+        m = sys.modules[ self.__name__ + '.' + module ]
+
+        r = getattr( m, name )
+        self.__dict__[ name ] = r
+
+        return r
+
+
+    def __getattr__( self, name ):
+        if name in self._lazy_exports:
+            return self.__load( name )
+
+        raise AttributeError, "'module' object %s has no attribute '%s'" \
+              % ( self.__name__, name )
+
+
+    def __getattribute__( self, name ):
+        r = types.ModuleType.__getattribute__( self, name )
+
+        if type( r ) is types.ModuleType and not name.startswith( '_' ) \
+           and name in self._lazy_exports:
+            return self.__load( name )
+
+        return r
+
+
+    def __dir__( self ):
+        return sorted( set( self.__dict__.keys() + self.__all__ ) )
+
+
+def install( name, exports ):
+    """
+    Replace a package module by a L{LazyModule}. Call from the end of
+    the package's __init__.py::
+
+      LazyModule.install( __name__, { 'PDBModel':'PDBModel', ... } )
+
+    @param name: package name (__name__)
+    @type  name: str
+    @param exports: { public name : name of sub-module defining it }
+    @type  exports: { str : str }
+
+    @return: new package module
+    @rtype: LazyModule
+    """
+    m = LazyModule( name, exports, sys.modules[ name ] )
+    sys.modules[ name ] = m
+
+    return m
+
+
+def exports( table ):
+    """
+    Convert a list of sub-modules and the names they export into the
+    dictionary needed by L{install}.
+
+    @param table: [ ( 'sub-module', 'Name1 Name2 ...' ) ]
+    @type  table: [ (str, str) ]
+
+    @return: { public name : sub-module }
+    @rtype: { str : str }
+    """
+    r = {}
+    for module, names in table:
+        for n in names.split():
+            r[ n ] = module
+
+    return r
+
+
+#############
+##  TESTING
+#############
+import Biskit.test as BT
+
+def _runPython( code ):
+    """run code in a new interpreter, return its (last) printed line"""
+    import subprocess, os
+    import Biskit.tools as T
+
+    env = dict( os.environ )
+    env['PYTHONPATH'] = T.projectRoot() + os.pathsep + \
+                        env.get( 'PYTHONPATH', '' )
+
+    p = subprocess.Popen( [ sys.executable, '-c', code ], env=env,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE )
+    out, err = p.communicate()
+
+    return eval( out.strip().split('\n')[-1] )
+
+
+class Test(BT.BiskitTest):
+    """LazyModule test"""
+
+    def test_importModules( self ):
+        """LazyModule modules loaded by import Biskit test"""
+        modules = _runPython(
+            'import sys, Biskit\n'
+            'print repr( [ m for m in sys.modules if sys.modules[m] ] )' )
+
+        self.assert_( 'user' not in modules )
+        self.assert_( 'Biskit.PDBModel' not in modules )
+        self.assert_( 'Biskit.settings' not in modules )
+
+    def test_lazyExports( self ):
+        """LazyModule exports test"""
+        r = _runPython(
+            'import sys, Biskit.SpatialIndex\n'
+            'from Biskit import PDBModel\n'
+            'import Biskit, Biskit.settings as S\n'
+            'print repr( ( PDBModel.__name__, \n'
+            '              Biskit.SpatialIndex.__name__, \n'
+            '              S._settings_loaded, "user" in sys.modules ) )' )
+
+        self.assertEqual( r, ( 'PDBModel', 'SpatialIndex', False, False ) )
+
+        import Biskit
+        self.assert_( 'Trajectory' in dir( Biskit ) )
+        self.assertRaises( AttributeError, getattr, Biskit, 'NoSuchClass' )
+
+
+class TestBenchmark(BT.BiskitTest):
+    """Benchmark the time of import Biskit"""
+
+    TAGS = [ BT.LONG ]
+
+    #: max. fraction of the time for importing all exports eagerly that
+    #: 'import Biskit' may take on top of 'import numpy' (lazy: ~0.03 s,
+    #: eager: ~0.2 s); both are measured in the same run
+    BUDGET = 0.5
+
+    #: python code timing 'import Biskit' (and the import of all its
+    #: exports if EAGER is true) on top of 'import numpy'
+    CODE = 'import time\n' \
+           't = time.time()\n' \
+           'import numpy\n' \
+           't_numpy = time.time() - t\n' \
+           'import Biskit\n' \
+           'if EAGER:\n' \
+           '    for n in Biskit._lazy_exports:\n' \
+           '        try: getattr( Biskit, n )\n' \
+           '        except Exception: pass\n' \
+           't = time.time() - t\n' \
+           'print repr( t - t_numpy )'
+
+    def test_importTime( self ):
+        """LazyModule import time budget benchmark"""
+        t_lazy  = _runPython( 'EAGER = 0\n' + self.CODE )
+        t_eager = _runPython( 'EAGER = 1\n' + self.CODE )
+
+        if self.local:
+            print '\nimport Biskit: %.3f s, with all exports: %.3f s' % \
+                  ( t_lazy, t_eager )
+
+        self.assert_( t_lazy < t_eager * self.BUDGET,
+                      'import Biskit took %.2f s, with all exports %.2f s' \
+                      % ( t_lazy, t_eager ) )
+
+
+if __name__ == '__main__':
+
+    BT.localTest()
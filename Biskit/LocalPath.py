@@ -516,7 +516,11 @@ class LocalPath( object ):
         @return: [ (variable name, value) ] sorted by length of value
         @rtype: [ (str,str) ]
         """
-        return self.__path_vars( S.__dict__, minLen=minLen, vars=vars,
+        S.load()
+        d = dict( [ (k,v) for k,v in S.__dict__.items()
+                    if not k.startswith('_') ] )
+
+        return self.__path_vars( d, minLen=minLen, vars=vars,
                                  exclude=(exclude + self.exclude_vars ) )
 
         
@@ -35,20 +35,41 @@ from Biskit.DSSP import Dssp
 from Biskit.Fold_X import Fold_X
 from Biskit.SurfaceRacer import SurfaceRacer
 from Biskit.delphi import Delphi, DelphiError
+from Biskit.SpatialIndex import SpatialIndex
+from Biskit.ResultCache import ResultCache
 
 
 class PDBDope:
     """
     Decorate a PDBModel with calculated properties (profiles)
+
+    Results of external programs can be kept in a L{ResultCache}. A model
+    with the same atoms and coordinates is then annotated from the cache
+    without running the program again::
+
+      d = PDBDope( model, cache=True )
+      d.addSurfaceRacer()              ## runs SurfaceRacer once
     """
 
-    def __init__( self, model ):
+    #: Executor options that don't change the result of a program,
+    #: left out of cache keys
+    NOKEY = [ 'log', 'verbose', 'debug', 'tempdir', 'cwd', 'node', 'nice' ]
+
+    def __init__( self, model, cache=None ):
         """
         @param model: model to dope
         @type  model: PDBModel
+        @param cache: cache for program results, True for the default
+                      cache (see L{ResultCache}), None to always run the
+                      programs (default: None)
+        @type  cache: ResultCache | True | None
         """
         self.m = model
 
+        self.cache = cache
+        if cache is True:
+            self.cache = ResultCache()
+
     def version( self ):
         """
         @return: version of class
@@ -64,6 +85,26 @@ class PDBDope:
         return self.m
 
 
+    def cached( self, name, f, *params ):
+        """
+        Run a calculation on the model or take its result from the cache.
+
+        @param name: name of program
+        @type  name: str
+        @param f: function without arguments running the program
+        @type  f: function
+        @param params: parameters of the calculation (for the cache key)
+        @type  params: any
+
+        @return: result of f()
+        @rtype: any
+        """
+        if self.cache is None:
+            return f()
+
+        return self.cache.call( name, f, self.m, *params )
+
+
     def addASA( self ):
         """
         Add profiles of Accessible Surface Area: 'relASA', 'ASA_total',
@@ -78,9 +119,8 @@ class PDBDope:
                              Usually that means, WhatIf didn't recognize some
                              residue name
         """
-        w = WhatIf( self.m )
-
-        atomRelAcc, resASA, resMask = w.run()
+        atomRelAcc, resASA, resMask = self.cached( 'whatif',
+                                            lambda: WhatIf( self.m ).run() )
 
 ##         normalAtoms = N.logical_not( N.logical_or(self.m.maskHetatm(),
 ##                                                   self.m.maskSolvent() ) )
@@ -138,8 +178,7 @@ class PDBDope:
 
         @raise ExeConfigError: if external application is missing
         """
-        dssp = Dssp( self.m )
-        ss = dssp.run()
+        ss = self.cached( 'dssp', lambda: Dssp( self.m ).run() )
 
         self.m.residues.set( 'secondary',  ss,
                              comment='secondary structure from DSSP',
@@ -179,22 +218,30 @@ class PDBDope:
         if not N.alltrue( mask ):
             m = self.m.compress( mask )
 
-        h = Hmmer( verbose=verbose, log=log )
-        h.checkHmmdbIndex()
+        def hmmer():
+            h = Hmmer( verbose=verbose, log=log )
+            h.checkHmmdbIndex()
+
+            r = [ h.scoreAbsSum( m, hmmNames=pfamEntries ) ]
+            r += [ h.scoreMaxAll( m, hmmNames=r[0][1] ) ]
+            r += [ h.scoreEntropy( m, hmmNames=r[1][1] ) ]
+            return r
 
-        p, hmmHits = h.scoreAbsSum( m, hmmNames=pfamEntries )
+        scores = self.cached( 'hmmer', hmmer, pfamEntries )
+
+        p, hmmHits = scores[0]
 
         self.m.residues.set( 'cons_abs', p, hmmHits=hmmHits, mask=resmask,
                              comment="absolute sum of all 20 hmm scores per position",
                              version= T.dateString() + ' ' + self.version() )
 
-        p, hmmHits = h.scoreMaxAll( m, hmmNames=hmmHits )
+        p, hmmHits = scores[1]
 
         self.m.residues.set( 'cons_max', p, hmmHits=hmmHits, mask=resmask,
                              comment="max of 20 hmm scores (-average / SD) per position",
                              version= T.dateString() + ' ' + self.version() )
 
-        p,  hmmHits = h.scoreEntropy( m, hmmNames=hmmHits )
+        p, hmmHits = scores[2]
 
         self.m.residues.set( 'cons_ent', p, hmmHits=hmmHits, mask=resmask,
                              comment="relative entropy (Kullback-Leibler distance) between "\
@@ -226,13 +273,12 @@ class PDBDope:
         else:
             mSurf = N.ones( self.m.lenAtoms() )
 
-        ## loop over all surface atoms
+        ## count heavy atoms around all surface atoms (minus the atom itself)
         surf_pos = N.nonzero( mSurf )
-        contacts = []
+        index = SpatialIndex( xyz, radius )
 
-        for i in surf_pos:
-            dist = N.sum(( xyz - self.m.xyz[i])**2, 1)
-            contacts += [ N.sum( N.less(dist, radius**2 )) -1]
+        contacts = index.countWithin( N.take( self.m.xyz, surf_pos ), radius )
+        contacts = contacts - 1
 
         self.m.atoms.set( profName, contacts, mSurf, default=-1,
                           comment='atom density radius %3.1fA' % radius,
@@ -244,8 +290,8 @@ class PDBDope:
         See L{Biskit.Fold_X}
         @raise ExeConfigError: if external application is missing
         """
-        x = Fold_X( self.m )
-        self.m.info['foldX'] = x.run()
+        self.m.info['foldX'] = self.cached( 'foldx',
+                                            lambda: Fold_X( self.m ).run() )
 
 
     def addSurfaceRacer( self, probe=1.4, vdw_set=1, probe_suffix=0, mask=None ):
@@ -282,8 +328,11 @@ class PDBDope:
         mask = mask if mask is not None else \
             self.m.maskHeavy() * N.logical_not( self.m.maskSolvent() )
         
-        fs = SurfaceRacer( self.m, probe, vdw_set=vdw_set, mask=mask )
-        fs_dic = fs.run()
+        fs_dic = self.cached( 'surfaceracer',
+                              lambda: SurfaceRacer( self.m, probe,
+                                                    vdw_set=vdw_set,
+                                                    mask=mask ).run(),
+                              probe, vdw_set, N.array( mask ) )
 
         fs_info= fs_dic['surfaceRacerInfo']
 
@@ -358,7 +407,10 @@ class PDBDope:
             'erxnt' :  -21048.13  # total reaction field energy
             'eself' :  -20383.39 }  # self reaction field energy
             
-        The same dictionary is also returned by this method.
+        The same dictionary is also returned by this method. Results are
+        only taken from the cache if no potential map (f_map) is requested.
+        With addcharge=False, the 'partial_charge' profile of the model is
+        part of the cache key.
         
         @param f_map   : output file name for potential map [None= discard]
         @type  f_map   : str
@@ -389,9 +441,19 @@ class PDBDope:
         @return: dict with delphi results
         @rtype: {str: float}
         """
-        d = Delphi( self.m, **kw )
-        r = d.run()
-        
+        f = lambda: Delphi( self.m, **kw ).run()
+
+        key = dict( [ (k, v) for k, v in kw.items() if k not in self.NOKEY ] )
+
+        if kw.get( 'f_map' ):
+            r = f()
+        elif kw.get( 'addcharge', True ):
+            r = self.cached( 'delphi', f, key )
+        else:
+            ## Delphi takes the charges from the model itself
+            r = self.cached( 'delphi', f, key,
+                             N.array( self.m['partial_charge'], N.float64 ) )
+
         self.m.info['delphi'] = r
         return r
 
@@ -533,6 +595,64 @@ class LongTest( BT.BiskitTest ):
         
         
 
+class CacheTest( BT.BiskitTest ):
+    """PDBDope result cache test (without external programs)"""
+
+    def prepare(self):
+        import tempfile
+        from Biskit import PDBModel
+
+        self.folder = tempfile.mktemp( '_pdbdope_cache' )
+        self.M = PDBModel( T.testRoot() + '/lig/1A19.pdb' )
+
+    def cleanUp(self):
+        T.tryRemove( self.folder, tree=True )
+
+    def test_cache(self):
+        """PDBDope.addSecondaryStructure from cache test"""
+        self.c = ResultCache( self.folder, maxsize=1 )
+
+        ss = [ 'E' ] * self.M.lenResidues()
+        self.c[ self.c.key( 'dssp', self.M ) ] = ss
+
+        self.d = PDBDope( self.M, cache=self.c )
+        self.d.addSecondaryStructure()  ## would fail without dssp binary
+
+        self.assertEqual( list( self.M['secondary'] ), ss )
+        self.assertEqual( self.c.stats()['hits'], 1 )
+
+        calls = []
+        for i in range( 3 ):
+            self.d.cached( 'test', lambda: calls.append( i ), i % 2 )
+
+        self.assertEqual( len( calls ), 2 )
+        self.assertEqual( self.c.stats()['misses'], 2 )
+
+    def test_cacheDelphiCharges(self):
+        """PDBDope.addDelphi with model charges from cache test"""
+        self.c = ResultCache( self.folder, maxsize=1 )
+        self.d = PDBDope( self.M, cache=self.c )
+
+        kw = { 'addcharge':False }
+        q1 = N.zeros( len( self.M ), N.float64 )
+        q2 = q1 + 0.5
+
+        self.c[ self.c.key( 'delphi', self.M, kw, q1 ) ] = { 'scharge':0. }
+        self.c[ self.c.key( 'delphi', self.M, kw, q2 ) ] = { 'scharge':1. }
+
+        self.M['partial_charge'] = q1
+        self.assertEqual( self.d.addDelphi( **kw )['scharge'], 0. )
+
+        self.M['partial_charge'] = q2
+        self.assertEqual( self.d.addDelphi( **kw )['scharge'], 1. )
+
+        ## logging options don't change the key
+        from Biskit.LogFile import LogFile
+        r = self.d.addDelphi( log=LogFile( self.folder + '/log' ),
+                              verbose=1, debug=1, **kw )
+        self.assertEqual( r['scharge'], 1. )
+
+
 class OldTest( BT.BiskitTest ):
 
     TAGS = [ BT.EXE, BT.OLD ]
@@ -33,13 +33,15 @@ import rmsFit
 from LocalPath import LocalPath
 from Errors import BiskitError
 from Biskit import EHandler
-from ProfileCollection import ProfileCollection, ProfileError
+from ProfileCollection import ProfileCollection, ProfileError, objectArray
+from AtomSelection import AtomSelection
 from PDBParserFactory import PDBParserFactory
 from PDBParseFile import PDBParseFile
 import Biskit as B
 
 import numpy.oldnumeric as N
 import numpy.oldnumeric.mlab as MLab
+import numpy as npy
 import os, sys
 import copy
 import time
@@ -145,12 +147,22 @@ class PDBModel:
        * prevent repeated loading of test PDB for each test
     """
 
+    #: residue functions for atom2resProfile that have a ufunc equivalent
+    __REDUCERS = { sum : N.add, max : N.maximum, min : N.minimum,
+                   N.sum : N.add, npy.sum : N.add,
+                   npy.amax : N.maximum, npy.amin : N.minimum }
+
     #: keys of all atom profiles that are read directly from the PDB file
     PDB_KEYS = ['name', 'residue_number', 'insertion_code', 'alternate',
                 'name_original', 'chain_id', 'occupancy', 'element',
                 'segment_id', 'charge', 'residue_name', 'after_ter',
                 'serial_number', 'type', 'temperature_factor']
 
+    #: backbone torsions as (atom name, residue offset) of the four atoms
+    BACKBONE_TORSIONS = { 'phi':  [ ('C',-1), ('N',0), ('CA',0), ('C',0) ],
+                          'psi':  [ ('N',0), ('CA',0), ('C',0), ('N',1) ],
+                          'omega':[ ('CA',0), ('C',0), ('N',1), ('CA',1) ] }
+
     def __init__( self, source=None, pdbCode=None, noxyz=0, skipRes=None,
                   headPatterns=[] ):
         """
@@ -194,6 +206,8 @@ class PDBModel:
         self.__maskHeavy = None
         #: cache position of chain breaks (clear when xyz changes)
         self.__chainBreaks = None
+        #: compiled atom selection expressions, see L{selection}
+        self.__selections = {}
 
         #: starting positions of each residue
         self._resIndex = None
@@ -511,6 +525,8 @@ class PDBModel:
         self.__maskCA = getattr( self, '__maskCA', None )
         self.__maskBB = getattr( self, '__maskBB', None )
         self.__maskHeavy = getattr( self, '__maskHeavy', None )
+        self.__selections = getattr( self, '_PDBModel__selections', {} )
+        self.__chainBreaks = getattr( self, '_PDBModel__chainBreaks', None )
 
         ## test cases of biskit < 2.3 still contain Numeric arrays
         if self.xyz is not None and type( self.xyz ) is not N.ndarray:
@@ -786,7 +802,7 @@ class PDBModel:
             else:
 
                 if type( self.residues[ key ] ) is N.arraytype:
-                    self.residues.set( key, self.residues[key].tolist() )
+                    self.residues.set( key, self.residues[key] )
 
         for key in self.atoms:
 
@@ -796,7 +812,7 @@ class PDBModel:
             else:
 
                 if type( self.atoms[ key ] ) is N.arraytype:
-                    self.atoms.set( key, self.atoms[key].tolist() )
+                    self.atoms.set( key, self.atoms[key] )
 
 
     def slim( self ):
@@ -820,6 +836,7 @@ class PDBModel:
             self.__slimProfiles()
 
         self.__maskCA = self.__maskBB = self.__maskHeavy = None
+        self.__selections = {}
         self.__validSource = 0
 
 
@@ -1233,6 +1250,10 @@ class PDBModel:
 
           r = m.maskFrom( 'name', 'CA' ) * m.maskFrom('residue_name', 'ALA')
 
+        or a selection expression (see L{mask} and L{selection}):
+
+          r = m.mask( 'name CA and resname ALA' )
+
         @param atomFunction: function( dict_from_aProfiles.toDict() ),
                              true || false (Condition)
         @type  atomFunction: 1||0
@@ -1289,14 +1310,19 @@ class PDBModel:
         if type( cond ) is types.FunctionType:
             return N.array( map( cond, self.atoms[ key ] ) )
 
+        prof = self.atoms[ key ]
+        if type( prof ) is list:
+            prof = N.array( prof, 'O' )
+
         ## several allowed values given
-        elif type( cond ) in [ list, tuple ]:
-            return N.array( [ x in cond for x in self.atoms[key] ] )
+        if type( cond ) in [ list, tuple ]:
+            r = N.zeros( len( prof ), bool )
+            for c in cond:
+                r |= prof == c
+            return r
 
         ## one allowed value given
-        ## Numeric splits lists of str into 2-D char arrays, 'O' prevents that
-        else:
-            return N.array( self.atoms[key] ) == cond
+        return prof == cond
 
 
     def maskCA( self, force=0 ):
@@ -1353,7 +1379,7 @@ class PDBModel:
         @rtype: array
         """
         if self.__maskHeavy == None or force:
-            self.__maskHeavy = self.maskFrom( 'element', lambda a: a != 'H' )
+            self.__maskHeavy = N.logical_not( self.maskFrom( 'element', 'H' ) )
 
         return self.__maskHeavy
 
@@ -1498,18 +1524,25 @@ class PDBModel:
         L{PDBModel.take}. 
 
         @param what: Selection::
+             - str, selection expression, e.g. 'name CA and chain A'
+               (see L{Biskit.AtomSelection})
              - function applied to each atom entry,
                 e.g. lambda a: a['residue_name']=='GLY'
              - list of str, allowed atom names
              - list of int, allowed atom indices OR mask with only 1 and 0
              - int, single allowed atom index
-        @type  what: function OR list of str or int OR int
+        @type  what: str OR function OR list of str or int OR int
 
         @return: N_atoms x 1 (0||1 )
         @rtype: Numeric array
 
         @raise PDBError: if what is neither of above
+        @raise AtomSelectionError: if a selection expression is invalid
         """
+        ## selection expression
+        if isinstance( what, basestring ):
+            return self.selection( what ).indices( self )
+
         ## lambda funcion
         if type( what ) is types.FunctionType:
             return N.nonzero( self.maskF( what) )
@@ -1543,19 +1576,27 @@ class PDBModel:
         functions) to a mask as it is e.g. required by L{PDBModel.compress}.
 
         @param what: Selection::
+                     - str, selection expression, e.g.
+                       'name CA and resname ALA and within 5 of resid 10-20'
+                       (see L{Biskit.AtomSelection})
                      - function applied to each atom entry,
                         e.g. lambda a: a['residue_name']=='GLY'
                      - list of str, allowed atom names
                      - list of int, allowed atom indices OR mask with
                        only 1 and 0
                      - int, single allowed atom index
-        @type  what: function OR list of str or int OR int
+        @type  what: str OR function OR list of str or int OR int
 
         @return: N_atoms x 1 (0||1 )
         @rtype: Numeric array
 
         @raise PDBError: if what is neither of above
+        @raise AtomSelectionError: if a selection expression is invalid
         """
+        ## selection expression
+        if isinstance( what, basestring ):
+            return self.selection( what ).mask( self )
+
         ## lambda funcion
         if type( what ) == types.FunctionType:
             return self.maskF( what )
@@ -1584,6 +1625,29 @@ class PDBModel:
         raise PDBError, "PDBModel.mask(): Could not interpret condition "
 
 
+    def selection( self, expression ):
+        """
+        Compiled atom selection for an expression like
+        'name CA and chain A and within 5 of resid 10-20'. Selections are
+        compiled only once per model and expression. Use L{mask} or
+        L{indices} to apply them.
+
+        @param expression: selection expression (see L{Biskit.AtomSelection})
+        @type  expression: str
+
+        @return: compiled selection
+        @rtype: AtomSelection
+
+        @raise AtomSelectionError: if the expression cannot be parsed
+        """
+        r = self.__selections.get( expression )
+
+        if r is None:
+            r = self.__selections[ expression ] = AtomSelection( expression )
+
+        return r
+
+
     def index2map( self, index, len_i ):
         """
         Create a map of len_i length, giving the residue(/chain) numer of
@@ -1868,16 +1932,13 @@ class PDBModel:
         if type( p ) is str:
             p = self.residues.get( p )
 
-        isArray = isinstance( p, N.arraytype )
-
-        resMap = self.resMap()
-
-        r = [ p[ resMap[a] ] for a in range( len(resMap) ) ]
+        ## number of atoms in each residue
+        n = N.diff( N.concatenate( (self.resIndex(), [self.lenAtoms()]) ) )
 
-        if isArray:
-            r = N.array( r )
+        if isinstance( p, N.arraytype ):
+            return N.repeat( p, n, axis=0 )
 
-        return r
+        return N.repeat( objectArray( p ), n ).tolist()
 
 
     def atom2resProfile( self, p, f=None ):
@@ -1890,6 +1951,9 @@ class PDBModel:
         @param f: function to calculate single residue from many atom values 
                   f( [atom_value1, atom_value2,...] ) -> res_value
                   (default None, simply take value of first atom in each res.)
+                  A numpy ufunc (e.g. numpy.add, numpy.maximum) or
+                  sum, max and min are applied to all residues at once
+                  with ufunc.reduceat.
         @type  f: func
 
         @return: [ any ] OR array, residue profile
@@ -1900,8 +1964,18 @@ class PDBModel:
 
         isArray = isinstance( p, N.arraytype )
 
+        f = self.__REDUCERS.get( f, f )
+        a = N.asarray( p )
+
         if not f:
-            r = N.take( p, self.resIndex() )
+            r = N.take( p, self.resIndex(), 0 )
+
+        elif isinstance( f, N.ufunc ) and len( a ) \
+                 and a.dtype.char not in 'OSU':
+            if a.dtype.char == '?' and f is N.add:
+                a = a.astype( int )          ## count, like sum() would
+            r = f.reduceat( a, self.resIndex(), 0 )
+
         else:
             r = [ f( values ) for values in self.profile2resList( p ) ]
             r = N.array( r )
@@ -1966,10 +2040,13 @@ class PDBModel:
             p = self.atoms.get( p )
 
         rI = self.resIndex()       # starting atom of each residue
-        rE = self.resEndIndex()    # ending atom of each residue
 
-        r = [ p[ rI[res] : rE[res]+1 ] for res in range( self.lenResidues() ) ]
-        return r
+        if isinstance( p, N.arraytype ):
+            return N.split( p, rI[1:] )
+
+        rE = N.concatenate( (rI[1:], [ len(p) ]) )
+
+        return [ p[ a : e ] for a, e in zip( rI, rE ) ]
 
     def mergeChains( self, c1, id='', segid='', rmOxt=True,
                      renumberAtoms=False, renumberResidues=True):
@@ -2656,47 +2733,42 @@ class PDBModel:
         return N.compress( mask, self.atoms['residue_number'] )
 
 
+    def __changes( self, keys ):
+        """
+        Mark atoms where any of the given atom profiles has a different
+        value than at the previous atom. The first atom is always marked.
+
+        @param keys: atom profile names
+        @type  keys: [ str ]
+
+        @return: mask 1 x N_atoms
+        @rtype: N.array of bool
+        """
+        r = N.zeros( self.lenAtoms(), bool )
+        r[:1] = True
+
+        for k in keys:
+            p = N.asarray( self.atoms[k] )
+            r[1:] |= p[1:] != p[:-1]
+
+        return r
+
+
     def __inferResIndex( self ):
         """
-        Determine residue borders.
+        Determine residue borders. A new residue starts wherever residue
+        number, residue name, segment id or insertion code change.
 
         @return: starting position of each residue
-        @rtype:  list of int
+        @rtype:  N.array of int
         """
-        result = []
-
         if self.lenAtoms() == 0:
-            return N.array( result, N.Int )
-
-        lastResNumber = -100
-        lastResName   = ''
-        index = -1
-        lastAlt = 'x'
-        lastSegid = -1
-
-        res_nrs = self.atoms['residue_number']
-        res_nam = self.atoms['residue_name']
-        ins_cod = self.atoms['insertion_code']
-        seg_id  = self.atoms['segment_id']
-
-        ## create residue numbering for selected atoms
-        for i in range( self.lenAtoms() ):
-
-            if res_nrs[i] != lastResNumber or \
-               res_nam[i] != lastResName   or \
-               seg_id[i]  != lastSegid or \
-               ins_cod[i] != lastAlt:
-
-                ## start of new residue
-                lastResNumber = res_nrs[i]
-                lastResName   = res_nam[i]
-                lastAlt       = ins_cod[i]
-                lastSegid     = seg_id[i]
-                index += 1
+            return N.zeros( 0, N.Int )
 
-                result.append( i )
+        r = self.__changes( ['residue_number', 'residue_name',
+                             'segment_id', 'insertion_code'] )
 
-        return N.array(result, N.Int)        
+        return N.flatnonzero( r ).astype( N.Int )
 
 
     def resIndex( self, mask=None, force=0, cache=1 ):
@@ -2761,35 +2833,26 @@ class PDBModel:
         return N.concatenate( (r[1:], [self.lenAtoms()]) ) - 1 
 
     def __inferChainIndex( self ):
+        """
+        Determine chain borders. A new chain starts wherever chain id or
+        segment id change, the residue numbering jumps back or a TER record
+        was found.
 
-        result = []
-
+        @return: starting position of each chain
+        @rtype:  N.array of int
+        """
         if self.lenAtoms() == 0:
-            return N.array( result, N.Int )
+            return N.zeros( 0, N.Int )
 
-        lastResidue = -100
-        lastChainID = None
-        lastSegID = None
+        r = self.__changes( ['chain_id', 'segment_id'] )
 
-        chn_ids = self.atoms['chain_id']
-        seg_ids = self.atoms['segment_id']
-        res_nrs = self.atoms['residue_number']
-        ter_atm = self.atoms['after_ter']
+        res_nrs = N.asarray( self.atoms['residue_number'] )
+        r[1:] |= res_nrs[1:] < res_nrs[:-1]
 
-        for i in self.atomRange():
-
-            if chn_ids[i] != lastChainID or \
-               seg_ids[i] != lastSegID   or \
-               res_nrs[i] <  lastResidue or \
-               ter_atm[i]:
-
-                result.append( i )
+        ## old pickled models may have None instead of 0
+        r |= N.asarray( self.atoms['after_ter'] ).astype( bool )
 
-            lastResidue = res_nrs[i]
-            lastChainID = chn_ids[i]
-            lastSegID   = seg_ids[i]
-
-        return N.array( result, N.Int )
+        return N.flatnonzero( r ).astype( N.Int )
 
 
     def __filterSingleResChains( self, chainindex, ignore_resnumbers=0 ):
@@ -2869,8 +2932,7 @@ class PDBModel:
             break_pos = self.chainBreaks( breaks_only=1, maxDist=maxDist,
                                           solvent=solvent, force=force )
             break_pos = break_pos + 1  ## chainBreaks reports last atom of each chain
-            r = mathUtils.union( break_pos, r )
-            r.sort()
+            r = N.union1d( break_pos, r )
 
         ## filter out chains consisting only of a single residue
         if not singleRes:
@@ -2972,24 +3034,17 @@ class PDBModel:
                 r = N.nonzero( N.greater( dist, cutoff ) )
 
             if len(r) > 0:
-                
-                ## can probably be simplified with self.resEndIndex()
-                ri = self.resIndex()
-                ri_to_e = {}
-                for i in range( len(ri)-1 ):
-                    ri_to_e[ ri[i] ] = ri[ i+1 ]-1
-    
-                ## map back to the original atom indices
-                r = [ ri_to_e[ i_bb[ bb_ri[i] ] ] for i in r ]
 
-                ## this replacement didn't work out (fails PDBCleaner testcase):
-                #re = self.resEndIndex()
-                #r = [ re[i] for i in r ]
+                ## map back to the last atom of the residue (in the whole
+                ## model) of the first backbone atom of each residue
+                i_res = N.take( self.resMap(), N.take( i_bb, N.take(bb_ri, r)))
+                r = N.take( self.resEndIndex(), i_res )
 
+            r = N.array( r, int )
 
             if breaks_only:
                 ri = self.chainIndex( breaks=0, solvent=solvent )
-                r = [ x for x in r if not x+1 in ri ]
+                r = r[ N.logical_not( N.in1d( r + 1, ri ) ) ]
 
                 if maxDist is None and not solvent and z==6.:
                     self.__chainBreaks = r
@@ -3310,6 +3365,128 @@ class PDBModel:
         return N.sum( self.masses() )
 
 
+    def __resAtomIndex( self, name ):
+        """
+        @return: index of the first atom with this name in each residue,
+                 -1 for residues without such atom
+        @rtype: array of int
+        """
+        i = N.flatnonzero( N.array( self.atoms['name'] ) == name )[::-1]
+
+        r = -N.ones( self.lenResidues(), N.Int )
+        r[ N.take( self.resMap(), i ) ] = i
+
+        return r
+
+
+    def dihedralAtoms( self, name ):
+        """
+        Indices of the four atoms defining a backbone or side chain torsion
+        of each residue::
+          phi   - C(i-1), N, CA, C
+          psi   - N, CA, C, N(i+1)
+          omega - CA, C, N(i+1), CA(i+1)
+          chi1 .. chi5 - side chain torsions (see L{molUtils.chiAtoms})
+
+        Torsions are undefined (all four indices -1) at chain ends and
+        chain breaks (see L{chainIndex}), for missing atoms and for residues
+        without this side chain torsion.
+
+        @param name: torsion name (phi, psi, omega, chi1 .. chi5)
+        @type  name: str
+
+        @return: atom indices (N_residues x 4)
+        @rtype: array of int
+
+        @raise PDBError: if the torsion name is unknown
+        """
+        n_res = self.lenResidues()
+        found = {}
+
+        def atomIndex( a ):
+            if not a in found:
+                found[ a ] = self.__resAtomIndex( a )
+            return found[ a ]
+
+        if name in self.BACKBONE_TORSIONS:
+
+            ## residues starting a chain (and 'residue' n_res)
+            first = N.zeros( n_res + 1, bool )
+            first[ N.take( self.resMap(), self.chainIndex( breaks=1 ) ) ] = 1
+            first[ n_res ] = 1
+
+            r = []
+            for a, shift in self.BACKBONE_TORSIONS[ name ]:
+                i = atomIndex( a )
+
+                if shift == -1:
+                    i = N.concatenate( ( [-1], i[:-1] ) )
+                    i[ first[:-1] ] = -1
+
+                if shift == 1:
+                    i = N.concatenate( ( i[1:], [-1] ) )
+                    i[ first[1:] ] = -1
+
+                r += [ i ]
+
+            r = N.transpose( r )
+
+        elif name in [ 'chi%i' % i for i in range( 1, 6 ) ]:
+            k = int( name[3:] ) - 1
+
+            ## standard residue name of each residue (HIE -> HIS etc.)
+            resnames = N.take( self.atoms['residue_name'], self.resIndex() )
+            names, inverse = npy.unique( resnames, return_inverse=True )
+            names = [ molUtils.nonStandardAA.get( n, n ) for n in names ]
+            resnames = N.take( N.array( names, 'O' ), inverse )
+
+            r = -N.ones( ( n_res, 4 ), N.Int )
+
+            for res, chis in molUtils.chiAtoms.items():
+                mask = resnames == res
+                if len( chis ) <= k or not N.any( mask ):
+                    continue
+
+                for j in range( 4 ):
+                    r[:,j] = N.where( mask, atomIndex( chis[k][j] ), r[:,j] )
+
+        else:
+            raise PDBError, 'Unknown torsion: %r' % name
+
+        r[ N.any( N.less( r, 0 ), 1 ) ] = -1
+
+        return r
+
+
+    def dihedrals( self, name, xyz=None ):
+        """
+        Backbone or side chain torsion angle of each residue in one
+        array operation (see L{dihedralAtoms})::
+          m.dihedrals( 'phi' ) -> array( N_residues )
+
+        @param name: torsion name (phi, psi, omega, chi1 .. chi5)
+        @type  name: str
+        @param xyz: other coordinates (N_atoms x 3) for the atoms of this
+                    model (default: None, use model coordinates)
+        @type  xyz: array
+
+        @return: angle in degrees (-180 to 180), NaN where undefined
+        @rtype: array of float
+
+        @raise PDBError: if the torsion name is unknown
+        """
+        if xyz is None:
+            xyz = self.getXyz()
+
+        i = self.dihedralAtoms( name )
+        x = N.take( xyz, N.maximum( i, 0 ), 0 )
+
+        r = mathUtils.dihedral( x[:,0], x[:,1], x[:,2], x[:,3] )
+        r[ N.less( i[:,0], 0 ) ] = N.nan
+
+        return r
+
+
     def residusMaximus( self, atomValues, mask=None ):
         """
         Take list of value per atom, return list where all atoms of any
@@ -3450,7 +3627,7 @@ class PDBModel:
         else:
             j = self.resIndex()[stop+1]
 
-        return self.atoms['name'][i:j]
+        return list( self.atoms['name'][i:j] )
 
 
     def __testDict_and( self, dic, condition ):
@@ -3793,8 +3970,7 @@ class PDBModel:
         anames = self.atoms['name'] ## cache for faster access
         
         for i in range(len(rindex)-1):
-            a = anames[rindex[i]:rindex[i+1]]
-            a.sort()
+            a = sorted( anames[rindex[i]:rindex[i+1]] )
             a = ''.join(a)
             r = r + a
             
@@ -3914,6 +4090,14 @@ class Test(BT.BiskitTest):
         breaks = self.m6.chainBreaks()
         self.assertEqual( len(breaks), 1 )
 
+    def test_oldPickle(self):
+        """PDBModel chain index of pickle with after_ter=None test"""
+        self.m5 = T.load( T.testRoot() + '/lig/1A19_dry.model' )
+
+        self.assert_( None in list( self.m5.atoms['after_ter'] ) )
+        self.assertEqual( list( self.m5.chainIndex( force=1 ) ), [0] )
+        self.assertEqual( list( self.m5.chainBreaks() ), [] )
+
     def test_chainSingleResidues( self ):
         """PDBModel single residue chain test"""
         self.m5 = B.PDBModel( T.testRoot() + '/amber/1HPT_0.pdb' )
@@ -3924,16 +4108,16 @@ class Test(BT.BiskitTest):
         """PDBModel renameAmberRes tests"""
         self.m3 = B.PDBModel( T.testRoot()+'/amber/1HPT_0dry.pdb')
 
-        n_cyx = self.m3.atoms['residue_name'].count('CYX')
-        n_hid = self.m3.atoms['residue_name'].count('HID')
-        n_hip = self.m3.atoms['residue_name'].count('HIP')
-        n_hie = self.m3.atoms['residue_name'].count('HIE')
+        n_cyx = N.sum( self.m3.atoms['residue_name'] == 'CYX' )
+        n_hid = N.sum( self.m3.atoms['residue_name'] == 'HID' )
+        n_hip = N.sum( self.m3.atoms['residue_name'] == 'HIP' )
+        n_hie = N.sum( self.m3.atoms['residue_name'] == 'HIE' )
         n_hix = n_hid + n_hie + n_hip
 
         self.m3.renameAmberRes()
 
-        self.assertEqual(n_cyx, self.m3.atoms['residue_name'].count('CYS'))
-        self.assertEqual(n_hix, self.m3.atoms['residue_name'].count('HIS'))
+        self.assertEqual(n_cyx, N.sum(self.m3.atoms['residue_name'] == 'CYS'))
+        self.assertEqual(n_hix, N.sum(self.m3.atoms['residue_name'] == 'HIS'))
 
     def test_xplor2amber(self):
         """PDBModel xplor2amber test"""
@@ -3963,14 +4147,14 @@ class Test(BT.BiskitTest):
         ## _m2 uses _m1 as source
         self._m2 = B.PDBModel( self._m )
         l1 = self._m2.atoms['name']
-        self.assertEqual( l1, anames )
+        self.assertEqual( list( l1 ), list( anames ) )
 
         ## remove unchanged profiles and coordinates
         self._m2.slim()
 
         ## fetch them again from source (of source)
         l2 = self._m2.atoms['name']
-        self.assertEqual( l2, anames )
+        self.assertEqual( list( l2 ), list( anames ) )
 
         ## disconnect _m from PDB file source
         self._m.saveAs( self.fout2 )
@@ -3979,7 +4163,7 @@ class Test(BT.BiskitTest):
         self._m.slim()
 
         ## this should now trigger the reloading of fout2
-        self.assertEqual( self._m2.atoms['name'], anames )
+        self.assertEqual( list( self._m2.atoms['name'] ), list( anames ) )
         self.assert_( N.all( self._m2.getXyz()[0] == xyz0) )
 
         ## after disconnection, slim() should not have any effect
@@ -4052,6 +4236,66 @@ class Test(BT.BiskitTest):
         self.m['index'] = range( len( self.m) )
         self.assert_( self.m['index'][-1] == len( self.m ) - 1 )
 
+    def test_resProfiles(self):
+        """PDBModel atom2resProfile/res2atomProfile test"""
+        m = self.m
+        ri = m.resIndex()
+        bfac = m['temperature_factor']
+
+        ## reference: python loop over residues
+        ref = [ bfac[ a : e ] for a, e in
+                zip( ri, list( ri[1:] ) + [ len( m ) ] ) ]
+
+        r = m.profile2resList( 'temperature_factor' )
+        self.assert_( N.all( map( N.all, map( N.equal, r, ref ) ) ) )
+
+        self.assert_( N.all( m.atom2resProfile( bfac, max ) ==
+                             [ max( x ) for x in ref ] ) )
+        self.assert_( N.all( m.atom2resProfile( bfac, N.sum ) ==
+                             [ N.sum( x ) for x in ref ] ) )
+        self.assert_( N.all( m.atom2resProfile( m.maskCA(), sum ) ==
+                             N.ones( m.lenResidues() ) - m.maskFrom(
+                                 'residue_name', ['TIP3'] )[ ri ] ) )
+
+        names = m.atom2resProfile( 'residue_name' )
+        self.assertEqual( list( m.res2atomProfile( names ) ),
+                          list( m['residue_name'] ) )
+        self.assertEqual( m.res2atomProfile( list( names ) ),
+                          list( m['residue_name'] ) )
+
+    def test_dihedrals(self):
+        """PDBModel.dihedrals test"""
+        m = B.PDBModel( T.testRoot() + '/com/1BGS_original.pdb' )
+        m = m.compress( m.maskProtein() )
+
+        phi, psi = m.dihedrals( 'phi' ), m.dihedrals( 'psi' )
+        chi1 = m.dihedrals( 'chi1' )
+
+        ## undefined at the start (phi) and end (psi) of each chain
+        first = N.take( m.resMap(), m.chainIndex( breaks=1 ) )
+        last = N.take( m.resMap(), m.chainEndIndex( breaks=1 ) )
+        self.assert_( N.all( N.isnan( N.take( phi, first ) ) ) )
+        self.assert_( N.all( N.isnan( N.take( psi, last ) ) ) )
+        self.assertEqual( N.sum( N.isnan( phi ) ), len( first ) )
+
+        ## reference: one residue at a time
+        i = m.resIndex()[10]
+        res = m.takeResidues( [9, 10, 11] )
+        x = dict( zip( [ '%s%i' % ( n, r ) for n, r in
+                         zip( res['name'], res.resMap() ) ], res.xyz ) )
+
+        self.assertAlmostEqual( phi[10], mathUtils.dihedral(
+            x['C0'], x['N1'], x['CA1'], x['C1'] ), 3 )
+        self.assertAlmostEqual( psi[10], mathUtils.dihedral(
+            x['N1'], x['CA1'], x['C1'], x['N2'] ), 3 )
+
+        ## chi1 is defined for all residues but GLY and ALA
+        names = m.atom2resProfile( 'residue_name' )
+        self.assert_( N.all( N.isnan( chi1 ) ==
+                             [ n in ['GLY','ALA'] for n in names ] ) )
+
+        self.assertRaises( PDBError, m.dihedrals, 'chi6' )
+
     def test_slice(self):
         """PDBModel.__slice__ test"""
         self.assert_( len( self.m[0:100:20]  ) == 5 )
@@ -4097,6 +4341,90 @@ class TestExe( BT.Test ):
                       'superposition failed: %r' % diff)
 
 
+class TestBenchmark(BT.BiskitTest):
+    """Benchmark residue/chain index inference on a 100k atom model"""
+
+    TAGS = [ BT.LONG ]
+
+    def prepare( self ):
+        m = B.PDBModel( T.testRoot() + '/com/1BGS.pdb' )
+        self.m = m.concat( *[ m ] * 12 )       ## 99177 atoms
+
+    def inferResIndexLoop( self, m ):
+        """atom-by-atom residue borders, as formerly in __inferResIndex"""
+        result = []
+        last = None
+        for i in range( m.lenAtoms() ):
+            v = ( m.atoms['residue_number'][i], m.atoms['residue_name'][i],
+                  m.atoms['segment_id'][i], m.atoms['insertion_code'][i] )
+            if v != last:
+                result.append( i )
+            last = v
+        return N.array( result, N.Int )
+
+    def inferChainIndexLoop( self, m ):
+        """atom-by-atom chain borders, as formerly in __inferChainIndex"""
+        result = []
+        lastResidue, lastChainID, lastSegID = -100, None, None
+        chn_ids, seg_ids = m.atoms['chain_id'], m.atoms['segment_id']
+        res_nrs, ter_atm = m.atoms['residue_number'], m.atoms['after_ter']
+
+        for i in range( m.lenAtoms() ):
+            if chn_ids[i] != lastChainID or seg_ids[i] != lastSegID or \
+               res_nrs[i] < lastResidue or ter_atm[i]:
+                result.append( i )
+            lastResidue, lastChainID, lastSegID = \
+                         res_nrs[i], chn_ids[i], seg_ids[i]
+        return N.array( result, N.Int )
+
+    def res2atomLoop( self, m, p ):
+        resMap = m.resMap()
+        return N.array( [ p[ resMap[a] ] for a in range( len(resMap) ) ] )
+
+    def atom2resLoop( self, m, p, f ):
+        rI, rE = m.resIndex(), m.resEndIndex()
+        return N.array( [ f( p[ rI[res] : rE[res]+1 ] )
+                          for res in range( m.lenResidues() ) ] )
+
+    def test_benchmark( self ):
+        """PDBModel residue/chain index benchmark (100k atoms)"""
+        m = self.m
+        bfac = m['temperature_factor']
+        resnames = m.atom2resProfile( 'residue_name' )
+
+        cases = [
+            ( 'resIndex', lambda: self.inferResIndexLoop( m ),
+                          lambda: m._PDBModel__inferResIndex() ),
+            ( 'chainIndex', lambda: self.inferChainIndexLoop( m ),
+                            lambda: m._PDBModel__inferChainIndex() ),
+            ( 'res2atomProfile', lambda: self.res2atomLoop( m, resnames ),
+                                 lambda: m.res2atomProfile( resnames ) ),
+            ( 'atom2resProfile(max)', lambda: self.atom2resLoop( m, bfac, max ),
+                                      lambda: m.atom2resProfile( bfac, max ) ),
+            ]
+
+        self.result = {}
+        for name, old, new in cases:
+            t0 = time.time()
+            r_old = old()
+            t1 = time.time()
+            r_new = new()
+            t2 = time.time()
+
+            self.assert_( N.all( r_old == r_new ), name )
+            self.result[ name ] = ( t1 - t0, t2 - t1 )
+
+        t0 = time.time()
+        m.chainBreaks( force=1 )
+        self.result[ 'chainBreaks' ] = ( 0, time.time() - t0 )
+
+        if self.local:
+            print '\n%i atoms' % len( m )
+            print '%22s %10s %10s' % ( '', 'loop [s]', 'numpy [s]' )
+            for name in sorted( self.result ):
+                print '%22s %10.4f %10.4f' % ( (name,) + self.result[name] )
+
+
 def clock( s, ns=globals() ):
     import cProfile
 
@@ -0,0 +1,398 @@
+##
+## Biskit, a toolkit for the manipulation of macromolecular structures
+## Copyright (C) 2004-2012 Raik Gruenberg & Johan Leckner
+##
+## This program is free software; you can redistribute it and/or
+## modify it under the terms of the GNU General Public License as
+## published by the Free Software Foundation; either version 3 of the
+## License, or any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+## General Public License for more details.
+##
+## You find a copy of the GNU General Public License in the file
+## license.txt along with this program; if not, write to the Free
+## Software Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+##
+##
+## last $Author$
+## last $Date$
+## $Revision$
+"""
+Parse a PDB file into a PDBModel -- vectorized fixed-column variant.
+
+@see L{PDBParseFile}
+@see L{PDBParserFactory}
+"""
+import Scientific.IO.PDB as IO
+import numpy as N
+import re
+from cStringIO import StringIO
+
+import Biskit.tools as T
+from Biskit.PDBParseFile import PDBParseFile
+from Biskit.PDBParser import PDBParserError
+
+
+class PDBParseFastFile( PDBParseFile ):
+    """
+    Drop-in replacement for L{PDBParseFile} that reads all ATOM/HETATM
+    records of a PDB file in one go. The fixed PDB columns are sliced out
+    of a single (lines x 80) character array and converted into numpy
+    arrays without creating one dictionary per atom. HEADER and REMARK
+    records are still handled by the L{PDBParseFile} methods.
+
+    The resulting PDBModel is identical to the one created by
+    PDBParseFile. Files that cannot be converted column-wise (e.g. with
+    '*****' atom numbers) are handed back to the (slower but more
+    tolerant) PDBParseFile implementation.
+
+    Use it via L{PDBParserFactory}::
+      p = PDBParserFactory.getParser( 'my.pdb', fast=True )
+    """
+
+    #: (start, end) of the fixed PDB atom record columns, as defined by
+    #: the Scientific.IO.PDB atom_format
+    COLUMNS = { 'type'              : (0, 6),
+                'serial_number'     : (6, 11),
+                'name_original'     : (12, 16),
+                'alternate'         : (16, 17),
+                'residue_name'      : (17, 21),
+                'chain_id'          : (21, 22),
+                'residue_number'    : (22, 26),
+                'insertion_code'    : (26, 27),
+                'x'                 : (30, 38),
+                'y'                 : (38, 46),
+                'z'                 : (46, 54),
+                'occupancy'         : (54, 60),
+                'temperature_factor': (60, 66),
+                'segment_id'        : (72, 76),
+                'element'           : (76, 78),
+                'charge'            : (78, 80) }
+
+    #: PDB record width
+    WIDTH = 80
+
+    @staticmethod
+    def description():
+        """
+        @return: short free text description of the supported format
+        @rtype: str
+        """
+        return 'PDB file (vectorized parser)'
+
+
+    def __column( self, chars, key ):
+        """
+        Extract one fixed-width column from the character matrix.
+
+        @param chars: N_lines x WIDTH array of single characters
+        @type  chars: array of 'S1'
+        @param key: name of the column, see L{COLUMNS}
+        @type  key: str
+
+        @return: 1-D array of strings (not stripped)
+        @rtype: array of str
+        """
+        start, end = self.COLUMNS[ key ]
+        c = N.ascontiguousarray( chars[:, start:end] )
+
+        return c.view( 'S%i' % (end - start) ).ravel()
+
+
+    def __number( self, column, dtype ):
+        """
+        Convert column of strings into numbers. Empty fields become 0
+        (as in Scientific.IO.FortranFormat).
+
+        @raise ValueError: if any field cannot be converted
+        """
+        column = N.char.strip( column )
+        column[ column == '' ] = '0'
+        return column.astype( dtype )
+
+
+    def __elements( self, names, elements ):
+        """
+        Fill empty element fields with the first non-number letter of the
+        (stripped) atom name.
+
+        @param names: stripped atom names
+        @type  names: array of str
+        @param elements: stripped element column
+        @type  elements: array of str
+
+        @return: completed element column
+        @rtype: array of str
+
+        @raise ValueError: if no letter is found in an atom name
+        """
+        missing = N.flatnonzero( elements == '' )
+        if not len( missing ):
+            return elements
+
+        width = names.dtype.itemsize
+        c = names[ missing ].view( 'S1' ).reshape( len(missing), width )
+
+        digit = (c >= '0') * (c <= '9')
+        first = N.argmax( N.logical_not( digit ), axis=1 )
+
+        letters = c[ N.arange( len(missing) ), first ]
+
+        if N.any( letters == '' ) or N.any( N.alltrue( digit, axis=1 ) ):
+            raise ValueError, 'cannot derive element from atom name'
+
+        elements = elements.astype( 'S%i' % max( 2, width ) )
+        elements[ missing ] = letters
+
+        return elements
+
+
+    def __collectHeader( self, records, headPatterns=[] ):
+        """
+        Parse HEADER and REMARK records preceding the first atom.
+
+        @param records: PDB records before the first ATOM/HETATM line
+        @type  records: [ str ]
+        @param headPatterns: [(putIntoKey, compiled regex)]
+        @type  headPatterns: [(str, re)]
+
+        @return: info dictionary
+        @rtype: dict
+        """
+        info = {}
+        if not records:
+            return info
+
+        f = IO.PDBFile( StringIO( '\n'.join( records ) + '\n' ) )
+
+        line = ('', '')
+        skipLine = False
+
+        while line[0] <> 'END' and line[0] <> 'ENDMDL':
+
+            if not skipLine:
+                try:
+                    line = f.readLine()
+                except ValueError, what:
+                    self.log.add('Warning: Error parsing header line: %s' %
+                                 str( what ) )
+                    continue
+            else:
+                skipLine = False
+
+            if line[0] == 'HEADER':
+                info.update( self._parseHeader( line ) )
+
+            if line[0] == 'REMARK':
+                if line[1].startswith(' 350'):
+                    biomtDict, line = self._parseBiomt( f, line )
+                    info.update( biomtDict )
+                    skipLine = True
+                    continue
+
+                info.update( self._parseRemark( line, headPatterns ) )
+
+        return info
+
+
+    def _collectAll( self, fname, skipRes=None, headPatterns=[] ):
+        """
+        Parse ATOM/HETATM lines from PDB column-wise. Collect coordinates
+        plus profiles with the other pdb records of each atom. See
+        L{PDBParseFile._collectAll} for the exact conventions.
+
+        @param fname: name of pdb file
+        @type  fname: str
+        @param skipRes: list with residue names that should be skipped
+        @type  skipRes: list of str
+
+        @return: tuple of (1) dictionary of profiles
+                 and (2) xyz array N x 3 and (3) info dictionary
+        @rtype: ( dict, array, dict )
+        """
+        headPatterns = headPatterns or self.RE_REMARKS
+        patterns = [ (key, re.compile(ex)) for key,ex in headPatterns ]
+
+        try:
+            f = T.gzopen( fname )
+            records = [ l.rstrip() for l in f.readlines() ]
+            f.close()
+        except IOError, why:
+            raise PDBParserError("Error reading file "+fname+": "+str(why))
+
+        records = [ l for l in records if l ]
+
+        if not records:
+            raise PDBParserError("Error parsing file "+fname+": "+
+                                 "Couldn't find any atoms.")
+
+        W = self.WIDTH
+        text = ''.join( [ l[:W].ljust(W) for l in records ] )
+        chars = N.fromstring( text, 'S1' ).reshape( len(records), W )
+
+        rtype = N.char.strip( self.__column( chars, 'type' ) )
+
+        ## everything after the first END or ENDMDL is ignored
+        stop = N.flatnonzero( (rtype == 'END') + (rtype == 'ENDMDL') )
+        stop = len(stop) and stop[0] or len(records)
+
+        is_atom = (rtype == 'ATOM') + (rtype == 'HETATM')
+        is_atom[ stop: ] = False
+
+        atom_i = N.flatnonzero( is_atom )
+
+        if not len( atom_i ):
+            raise PDBParserError("Error parsing file "+fname+": "+
+                                 "Couldn't find any atoms.")
+
+        info = self.__collectHeader( records[ :atom_i[0] ], patterns )
+
+        ## TER swallows the following record, which is marked 'after_ter'
+        after_ter = N.zeros( len(records), N.int )
+        last = -2
+        for i in N.flatnonzero( rtype[:stop] == 'TER' ):
+            if i != last + 1:
+                after_ter[ i+1: i+2 ] = 1
+                last = i
+
+        chars = chars[ atom_i ]
+        after_ter = after_ter[ atom_i ]
+
+        res_name = N.char.strip( self.__column( chars, 'residue_name' ) )
+
+        if skipRes:
+            keep = N.logical_not( N.in1d( res_name, skipRes ) )
+            chars, res_name, after_ter = chars[keep], res_name[keep], \
+                                         after_ter[keep]
+            if not len( chars ):
+                raise PDBParserError("Error parsing file "+fname+": "+
+                                     "Couldn't find any atoms.")
+
+        try:
+            xyz = N.array( [ self.__number( self.__column( chars, k ), float )
+                             for k in ('x','y','z') ] )
+            xyz = N.transpose( xyz ).astype( N.float32 )
+
+            aProfs = {}
+            aProfs['type'] = N.char.strip(self.__column(chars,'type')).tolist()
+            aProfs['after_ter'] = after_ter
+            aProfs['residue_name'] = res_name.tolist()
+
+            aProfs['name_original'] = self.__column(chars,'name_original')\
+                                      .tolist()
+            names = N.char.strip( self.__column( chars, 'name_original' ) )
+            aProfs['name'] = names.tolist()
+
+            for k in ['serial_number', 'residue_number']:
+                aProfs[k] = self.__number( self.__column( chars, k ), int )
+
+            for k in ['occupancy', 'temperature_factor']:
+                aProfs[k] = self.__number( self.__column( chars, k ), float )
+
+            for k in ['alternate', 'chain_id', 'insertion_code',
+                      'segment_id', 'charge']:
+                aProfs[k] = N.char.strip( self.__column(chars, k) ).tolist()
+
+            elements = N.char.strip( self.__column( chars, 'element' ) )
+            aProfs['element'] = self.__elements( names, elements ).tolist()
+
+        except ValueError, why:
+            ## non-standard columns -- let the record-based parser deal
+            self.log.add('Note: column-wise parsing of %s failed (%s), '\
+                         % (T.stripFilename(fname), str(why)) +\
+                         'falling back to PDBParseFile.')
+            return PDBParseFile._collectAll( self, fname, skipRes=skipRes,
+                                             headPatterns=headPatterns )
+
+        return aProfs, xyz, info
+
+
+#############
+##  TESTING
+#############
+import Biskit.test as BT
+import time, tempfile
+
+class Test(BT.BiskitTest):
+    """Test case"""
+
+    def prepare( self ):
+        import os
+        self.files = []
+        for folder, dirs, files in os.walk( T.testRoot() ):
+            self.files += [ os.path.join( folder, f ) for f in files
+                            if f.endswith( '.pdb' ) ]
+        self.files.sort()
+
+        self.f_out = tempfile.mktemp( '_fast.pdb' )
+
+    def cleanUp( self ):
+        T.tryRemove( self.f_out )
+
+    def compare( self, m1, m2 ):
+        """assert that two models are identical"""
+        self.assert_( N.all( m1.xyz == m2.xyz ) )
+        self.assertEqual( m1.xyz.dtype, m2.xyz.dtype )
+        self.assertEqual( sorted( m1.atoms.keys() ), sorted(m2.atoms.keys()) )
+
+        for k in m1.atoms.keys():
+            p1, p2 = m1.atoms[k], m2.atoms[k]
+            self.assertEqual( type(p1), type(p2), k )
+            if isinstance( p1, N.ndarray ):
+                self.assertEqual( p1.dtype, p2.dtype, k )
+                self.assert_( N.all( p1 == p2 ), k )
+            else:
+                self.assertEqual( p1, p2, k )
+
+        i1, i2 = dict( m1.info ), dict( m2.info )
+        ## without HEADER record, 'date' is the time the model was created
+        if 'pdb_code' not in i1:
+            del i1['date'], i2['date']
+
+        self.assertEqual( i1, i2 )
+
+    def test_PDBParseFastFile( self ):
+        """PDBParseFastFile identical to PDBParseFile test"""
+        self.times = {}
+
+        for f in self.files:
+            t0 = time.time()
+            self.m1 = PDBParseFile().parse2new( f )
+            t1 = time.time()
+            self.m2 = PDBParseFastFile().parse2new( f )
+            t2 = time.time()
+
+            self.times[ T.stripFilename(f) ] = (t1 - t0, t2 - t1)
+            self.compare( self.m1, self.m2 )
+
+        self.assert_( len( self.times ) > 40 )
+
+        f = T.testRoot() + '/com/1BGS_original.pdb'
+        self.m3 = PDBParseFastFile().parse2new( f, skipRes=['HOH','SO4'] )
+        self.m4 = PDBParseFile().parse2new( f, skipRes=['HOH','SO4'] )
+        self.compare( self.m3, self.m4 )
+        self.assert_( 'HOH' not in self.m3.atoms['residue_name'] )
+
+        ## indented records (PDBParseFile strips all lines)
+        lines = open( f ).readlines()
+        lines = [ '  ' + l if l.startswith( ('HEADER', 'REMARK   2') ) or
+                  l.startswith( 'ATOM      5 ' ) else l for l in lines ]
+        open( self.f_out, 'w' ).writelines( lines )
+
+        self.m5 = PDBParseFastFile().parse2new( self.f_out )
+        self.m6 = PDBParseFile().parse2new( self.f_out )
+        self.compare( self.m5, self.m6 )
+        self.assert_( 'resolution' in self.m5.info )
+
+        if self.local:
+            print '\n%-20s %10s %10s' % ('file','PDBParseFile','fast')
+            for f, (t1, t2) in self.times.items():
+                print '%-20s %10.3f %10.3f' % (f, t1, t2)
+
+
+if __name__ == '__main__':
+
+    BT.localTest()
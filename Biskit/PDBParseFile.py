@@ -126,7 +126,7 @@ class PDBParseFile( PDBParser ):
             ## atoms and/or coordinates need to be updated from PDB
             if force or self.needsUpdate( model ):
 
-                atoms, xyz, info = self.__collectAll( source, skipRes, 
+                atoms, xyz, info = self._collectAll( source, skipRes, 
                                                       headPatterns )
 
                 keys = M.union( atoms.keys(),  self.DEFAULTS.keys() )
@@ -214,12 +214,12 @@ REMEDY: run the script fixAtomIndices.py
             return  aName[0]
 
 
-    def __parseHeader( self, line_record ):
+    def _parseHeader( self, line_record ):
         """
         """
         return line_record[1]
 
-    def __parseRemark( self, line_record, headPatterns=[]):
+    def _parseRemark( self, line_record, headPatterns=[]):
         """
         """
         l = line_record[1]
@@ -238,7 +238,7 @@ REMEDY: run the script fixAtomIndices.py
 
         return {}
         
-    def __parseBiomt( self, pdbFile, firstLine):
+    def _parseBiomt( self, pdbFile, firstLine):
         """
         """
         line = firstLine
@@ -299,7 +299,7 @@ REMEDY: run the script fixAtomIndices.py
         # return (indexed transformation dictionary , last line which isn't ours)
         return {'BIOMT': biomtDict}, line
 
-    def __collectAll( self, fname, skipRes=None, headPatterns=[] ):
+    def _collectAll( self, fname, skipRes=None, headPatterns=[] ):
         """
         Parse ATOM/HETATM lines from PDB. Collect coordinates plus
         dictionaries with the other pdb records of each atom.
@@ -361,18 +361,18 @@ REMEDY: run the script fixAtomIndices.py
 
                 ## header handling
                 if in_header and line[0] == 'HEADER':
-                    info.update( self.__parseHeader( line ) )
+                    info.update( self._parseHeader( line ) )
 
                 if in_header and line[0] == 'REMARK':
                     if line[1].startswith(' 350'):
-                        biomtDict, line = self.__parseBiomt( f, line )
+                        biomtDict, line = self._parseBiomt( f, line )
                         info.update( biomtDict )
                         # we've hogged a line beyond REMARK 350 records in 
-                        # __parseBiomt(), now we need to process it here
+                        # _parseBiomt(), now we need to process it here
                         skipLine = True
                         continue
                     else:
-                        info.update( self.__parseRemark( line, patterns ) )
+                        info.update( self._parseRemark( line, patterns ) )
                     
 
                 ## preserve position of TER records
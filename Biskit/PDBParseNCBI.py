@@ -75,7 +75,7 @@ class PDBParseNCBI( PDBParseModel ):
         """
         return 'fetch PDB entry from NCBI'
 
-    def getLocalPDBHandle( self, id, db_path=settings.pdb_path ):
+    def getLocalPDBHandle( self, id, db_path=None ):
         """
         Get the coordinate file from a local pdb database.
 
@@ -90,6 +90,8 @@ class PDBParseNCBI( PDBParseModel ):
 
         @raise PDBParserError: if couldn't find PDB file
         """
+        db_path = db_path or settings.pdb_path
+
         id = str.lower( id )
         filenames = [os.path.join( db_path, '%s.pdb' % id),
                      db_path + '/pdb%s.ent' % id,
@@ -113,7 +115,7 @@ class PDBParseNCBI( PDBParseModel ):
         raise PDBParserError( "Couldn't find PDB file locally.")
 
 
-    def getRemotePDBHandle( self, id, rcsb_url=settings.rcsb_url ):
+    def getRemotePDBHandle( self, id, rcsb_url=None ):
         """
         Get the coordinate file remotely from the RCSB.
 
@@ -134,6 +136,7 @@ class PDBParseNCBI( PDBParseModel ):
             raise PDBParserError('Could not find Biopython - ' + \
                                  'remote fetching of PDBs is not supported.')
 
+        rcsb_url = rcsb_url or settings.rcsb_url
 
         handle = urllib.urlopen( rcsb_url% (id,id) )
 
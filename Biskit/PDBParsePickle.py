@@ -106,9 +106,18 @@ class PDBParsePickle( PDBParseModel ):
 #############
 import Biskit.test as BT
         
+import tempfile, os
+
 class Test(BT.BiskitTest):
     """Test case"""
 
+    def prepare( self ):
+        self.f = tempfile.mktemp( '_test.pickle' )
+
+    def cleanUp( self ):
+        T.tryRemove( self.f )
+        T.tryRemove( self.f + T.ARRAY_FOLDER, tree=1 )
+
     def test_PDBParsePickle( self ):
         """PDBParsePickle test"""
 
@@ -124,6 +133,75 @@ class Test(BT.BiskitTest):
         self.assertAlmostEqual( N.sum( self.m.centerOfMass() ),
                                 114.18037, 5)
 
+    def test_dump( self ):
+        """tools.dump/load formats and throughput test"""
+        import time, cPickle
+        import numpy as N
+        from Biskit.Dock import ComplexList
+
+        m = B.PDBModel( T.testRoot() + '/com/1BGS.pdb' )
+        t = T.load( T.testRoot() + '/lig_pcr_00/traj.dat' )
+        cl = T.load( T.testRoot() + '/dock/hex/complexes.cl' )
+
+        formats = [ ('protocol 1', {'protocol':1}),
+                    ('protocol 2', {}),
+                    ('gzip 1', {'compress':'gzip', 'level':1}),
+                    ('gzip 6', {'gzip':1}),
+                    ('bz2 9', {'compress':'bz2'}),
+                    ('side-car', {'sidecar':2**16}) ]
+
+        if self.local:
+            print '\n%-12s %-12s %10s %9s %9s' % \
+                  ('object', 'format', 'size', 'dump', 'load')
+
+        for o in [ m, t, cl ]:
+            for name, options in formats:
+
+                t0 = time.time()
+                T.dump( o, self.f, **options )
+                t1 = time.time()
+                self.o = T.load( self.f )
+                t2 = time.time()
+
+                if self.local:
+                    size = os.path.getsize( self.f )
+                    print '%-12s %-12s %8.1fkB %7.1fms %7.1fms' % \
+                          ( o.__class__.__name__, name, size / 1e3,
+                            (t1-t0) * 1e3, (t2-t1) * 1e3 )
+
+                self.assertEqual( len( self.o ), len( o ) )
+
+            T.tryRemove( self.f + T.ARRAY_FOLDER, tree=1 )
+
+        ## frames go into the side-car folder and can be memory-mapped
+        T.dump( t, self.f, sidecar=2**16 )
+        self.assert_( os.path.getsize( self.f ) < t.frames.nbytes )
+
+        self.o = T.load( self.f, mmap_mode='r' )
+        self.assert_( isinstance( self.o.frames, N.memmap ) )
+        self.assert_( N.all( self.o.frames == t.frames ) )
+
+        ## an array referenced twice is written and loaded once
+        T.tryRemove( self.f + T.ARRAY_FOLDER, tree=1 )
+        T.dump( ( t.frames, t.frames ), self.f, sidecar=2**16 )
+        self.assertEqual( len( os.listdir( self.f + T.ARRAY_FOLDER ) ), 1 )
+
+        a, b = T.load( self.f )
+        self.assert_( a is b )
+
+        ## old-style pickles and appended objects
+        f = open( self.f, 'w' )
+        cPickle.dump( m, f, 1 )
+        f.close()
+        T.dump( range(3), self.f, mode='a' )
+
+        self.o, l = T.load( self.f )
+        self.assertEqual( l, range(3) )
+        self.assert_( N.all( self.o.xyz == m.xyz ) )
+        self.assertEqual( self.o.sequence(), m.sequence() )
+
+        self.assertRaises( T.PickleError, T.dump, 1, self.f, compress='zip' )
+
 if __name__ == '__main__':
    
     BT.localTest()
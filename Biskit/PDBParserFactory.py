@@ -23,11 +23,13 @@
 """
 @see L{Biskit.PDBParser}
 @see L{Biskit.PDBParseFile}
+@see L{Biskit.PDBParseFastFile}
 @see L{Biskit.PDBParseModel}
 @see L{Biskit.PDBParsePickle}
 """
 
 from PDBParseFile   import PDBParseFile
+from PDBParseFastFile import PDBParseFastFile
 from PDBParseModel  import PDBParseModel
 from PDBParsePickle import PDBParsePickle
 from PDBParseNCBI   import PDBParseNCBI
@@ -38,8 +40,11 @@ class PDBParserFactory:
     Provide the right PDBParser for different structure sources.
     """
 
+    #: use the vectorized L{PDBParseFastFile} for PDB files by default
+    FAST = False
+
     @staticmethod
-    def getParser( source ):
+    def getParser( source, fast=None ):
         """
         getParser( source ) -> PDBParser; Fetch a Parser for the source.
 
@@ -49,6 +54,9 @@ class PDBParserFactory:
 
         @param source: structure source (PDB file, PDBModel, pickled model)
         @type source: str | LocalPath | PDBModel
+        @param fast: parse PDB files with the vectorized PDBParseFastFile
+                     [default: PDBParserFactory.FAST]
+        @type  fast: bool
 
         @return: a parser that should be able to handle the given source
         @rtype: PDBParser (child)
@@ -56,7 +64,12 @@ class PDBParserFactory:
         @raise PDBError: if no compatible parser is found
         """
 
+        if fast is None:
+            fast = PDBParserFactory.FAST
+
         if PDBParseFile.supports( source ):
+            if fast:
+                return PDBParseFastFile()
             return PDBParseFile()
 
         if PDBParseModel.supports( source ):
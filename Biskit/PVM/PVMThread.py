@@ -26,8 +26,8 @@
 Binding incoming pvm-messages to methods.
 """
 
-import pypvm as P
 from Biskit.PVM import pvm
+from Biskit.PVM.pvm import P
 from threading import Thread
 
 MSG_PING = 999999
@@ -80,19 +80,34 @@ class PVMThread(Thread):
     """
 
 
-    def __init__(self, log = None):
+    def __init__(self, log = None, local = 0):
+        """
+        @param log: log messages to file (default: None)
+        @type  log: 1|0
+        @param local: run without PVM, e.g. inside a local worker process
+                      of L{Biskit.PVM.ProcessPool} (default: 0)
+        @type  local: 1|0
+        """
         from threading import Event
+        import os
 
         Thread.__init__(self)
 
-        self.__mytid = P.mytid()
-
-        try:
-            ## get process ID of parent
-            self.__parent = P.parent()
-        except:
+        if local:
+            self.__mytid = os.getpid()
             self.__parent = None
 
+        else:
+            pvm.check()
+
+            self.__mytid = P.mytid()
+
+            try:
+                ## get process ID of parent
+                self.__parent = P.parent()
+            except:
+                self.__parent = None
+
         self.__bindings = {}
         self.__stop = 0
         self.__tasks = {}
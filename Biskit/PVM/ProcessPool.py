@@ -0,0 +1,323 @@
+##
+## Biskit, a toolkit for the manipulation of macromolecular structures
+## Copyright (C) 2004-2012 Raik Gruenberg & Johan Leckner
+##
+## This program is free software; you can redistribute it and/or
+## modify it under the terms of the GNU General Public License as
+## published by the Free Software Foundation; either version 3 of the
+## License, or any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+## General Public License for more details.
+##
+## You find a copy of the GNU General Public License in the file
+## license.txt along with this program; if not, write to the Free
+## Software Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+##
+##
+## last $Author$
+## last $Date$
+## $Revision$
+"""
+Run JobSlaves in local processes instead of PVM tasks.
+"""
+
+import multiprocessing
+import Queue
+import imp, os, sys
+import os.path as osp
+
+import Biskit.tools as T
+
+
+class ProcessPoolError( Exception ):
+    pass
+
+
+def slaveModule( slave_script ):
+    """
+    Import the module defining a slave. Scripts inside the Biskit package
+    are imported under their regular module name (e.g.
+    Biskit/Dock/ContactSlave.py becomes Biskit.Dock.ContactSlave), other
+    scripts are loaded from their file.
+
+    @param slave_script: path to slave script
+    @type  slave_script: str
+
+    @return: module
+    @rtype: module
+    """
+    fname = osp.splitext( T.absfile( slave_script ) )[0]
+    root = T.absfile( T.projectRoot() ) + '/'
+
+    if fname.startswith( root ):
+        name = fname[ len(root): ].replace( '/', '.' )
+        __import__( name )
+        return sys.modules[ name ]
+
+    name = 'slave_' + osp.basename( fname )
+    return imp.load_source( name, fname + '.py' )
+
+
+def slaveClass( slave_script ):
+    """
+    Find the L{Biskit.PVM.dispatcher.JobSlave} sub-class defined in a
+    slave script.
+
+    @param slave_script: path to slave script
+    @type  slave_script: str
+
+    @return: slave class
+    @rtype: class
+
+    @raise ProcessPoolError: if the script defines no or several slaves
+    """
+    from Biskit.PVM.dispatcher import JobSlave
+
+    m = slaveModule( slave_script )
+
+    r = [ c for c in m.__dict__.values()
+          if isinstance( c, type ) and issubclass( c, JobSlave )
+          and c.__module__ == m.__name__ ]
+
+    if len( r ) != 1:
+        raise ProcessPoolError, '%s defines %i JobSlave classes, expected 1'\
+              % ( slave_script, len( r ) )
+
+    return r[0]
+
+
+def _error():
+    """last exception with traceback"""
+    return T.lastError() + '\n' + T.lastErrorTrace()
+
+
+def _slaveLoop( slave_script, tid, params, niceness, show_output,
+                inbox, outbox ):
+    """
+    Main function of a worker process. Create and initialize the slave,
+    then run slave.go() on every job received until a None job arrives.
+    Every job is answered with a (tid, result, error) tuple.
+    """
+    if niceness:
+        os.nice( niceness )
+
+    ## like PVM slaves without xterm, don't print into the master's console
+    if not show_output:
+        sys.stdout = open( os.devnull, 'w' )
+
+    try:
+        slave = slaveClass( slave_script )( local=1 )
+
+        if params is not None:
+            slave.initialize( params )
+
+    except Exception:
+        outbox.put( (tid, None, _error()) )
+        return
+
+    while True:
+        job = inbox.get()
+
+        if job is None:
+            break
+
+        try:
+            outbox.put( (tid, slave.go( job ), None) )
+        except Exception:
+            outbox.put( (tid, None, _error()) )
+
+
+class ProcessPool:
+    """
+    Local worker processes for the 'pool' backend of
+    L{Biskit.PVM.dispatcher.JobMaster}. Each worker runs one instance of
+    the (unchanged) JobSlave class defined in the slave script of the
+    master. It is initialized with the master's getInitParameters() and
+    then calls slave.go() for every chunk of jobs it receives. Workers are
+    identified by a tid, just like PVM tasks.
+
+    Results (and errors) of all workers arrive in a single queue read
+    with L{receive}. Jobs and results are pickled on their way between
+    master and workers, like PVM messages.
+    """
+
+    def __init__( self, slave_script, show_output=0 ):
+        """
+        @param slave_script: absolute path to slave-script
+        @type  slave_script: str
+        @param show_output: let workers print to stdout (default: 0)
+        @type  show_output: 1|0
+        """
+        self.slave_script = slave_script
+        self.show_output = show_output
+
+        self.workers = {}      ## tid -> Process
+        self.inboxes = {}      ## tid -> Queue with jobs for worker
+        self.outbox = multiprocessing.Queue()
+
+        ## tids of workers processing a job
+        self.busy = set()
+
+
+    def spawn( self, tid, params=None, niceness=0 ):
+        """
+        Start new worker process.
+
+        @param tid: id of the new worker
+        @type  tid: int
+        @param params: slave initialization parameters (default: None)
+        @type  params: any
+        @param niceness: nice value of the worker process (default: 0)
+        @type  niceness: int
+        """
+        inbox = multiprocessing.Queue()
+
+        p = multiprocessing.Process( target=_slaveLoop,
+                                     args=( self.slave_script, tid, params,
+                                            niceness, self.show_output,
+                                            inbox, self.outbox ) )
+        p.daemon = True
+        p.start()
+
+        self.workers[ tid ] = p
+        self.inboxes[ tid ] = inbox
+
+
+    def send( self, tid, job ):
+        """
+        Hand one job to a worker.
+
+        @param tid: worker id
+        @type  tid: int
+        @param job: argument for slave.go()
+        @type  job: any
+        """
+        self.busy.add( tid )
+        self.inboxes[ tid ].put( job )
+
+
+    def receive( self, timeout=5 ):
+        """
+        Wait for the next result of any worker. Workers that die are
+        reported with an error.
+
+        @param timeout: max. seconds to wait (default: 5)
+        @type  timeout: float
+
+        @return: worker id, result of slave.go() (or None),
+                 error message (or None); (None, None, None) after timeout
+        @rtype: (int, any, str)
+        """
+        try:
+            tid, result, error = self.outbox.get( timeout=timeout )
+
+            self.busy.discard( tid )
+            return tid, result, error
+
+        except Queue.Empty:
+
+            for tid in list( self.busy ):
+                if not self.workers[ tid ].is_alive():
+                    self.busy.discard( tid )
+                    return tid, None, 'worker process %i died' % tid
+
+        return None, None, None
+
+
+    def remove( self, tid ):
+        """
+        Shut down a single (e.g. failing) worker. The worker is asked to
+        stop rather than killed because killing a process may leave the
+        shared result queue locked.
+
+        @param tid: worker id
+        @type  tid: int
+        """
+        p = self.workers.pop( tid )
+        self.inboxes.pop( tid ).put( None )
+        self.busy.discard( tid )
+
+        p.join( 5 )
+
+
+    def exit( self ):
+        """
+        Stop idle workers and kill workers that are still busy (with
+        redistributed jobs). The result queue must not be used afterwards.
+        """
+        for tid, p in self.workers.items():
+
+            if tid in self.busy:
+                p.terminate()
+            else:
+                self.inboxes[ tid ].put( None )
+
+        for p in self.workers.values():
+            p.join( 5 )
+
+        self.workers, self.inboxes, self.busy = {}, {}, set()
+
+
+#############
+##  TESTING
+#############
+import Biskit.test as BT
+import tempfile
+
+class Test(BT.BiskitTest):
+    """ProcessPool test"""
+
+    def prepare( self ):
+        self.f_rst = tempfile.mktemp( '_test.rst' )
+
+    def cleanUp( self ):
+        T.tryRemove( self.f_rst )
+
+    def test_slaveClass( self ):
+        """PVM.ProcessPool.slaveClass test"""
+        from Biskit.PVM.ExampleSlave import Slave
+
+        self.assert_( slaveClass( T.projectRoot() +
+                                  '/Biskit/PVM/ExampleSlave.py' ) is Slave )
+
+    def test_ProcessPool( self ):
+        """PVM.ProcessPool ExampleMaster with pool backend test"""
+        from Biskit.PVM.ExampleMaster import Master
+        from Biskit.PVM.TrackingJobMaster import restart
+
+        data = dict( [ (i, i+1) for i in range( 12 ) ] )
+
+        self.master = Master( data=data, chunk_size=2,
+                              slave_script=Master.slave_script,
+                              verbose=self.local, backend='pool', ncpu=3 )
+
+        r = self.master.calculateResult()
+
+        self.assertEqual( r, dict( [ (i, i+2) for i in range( 12 ) ] ) )
+        self.assertEqual( len( self.master.progress ), 3 )
+
+        ## restart a master with 4 items already done
+        self.master = Master( data=data, chunk_size=2,
+                              slave_script=Master.slave_script,
+                              verbose=self.local, backend='pool', ncpu=2 )
+        for i in range( 4 ):
+            self.master.status.objects[i] = 0
+            self.master.result[i] = -1
+
+        self.master.saveRst( self.f_rst )
+
+        self.master = restart( T.load( self.f_rst ), verbose=self.local )
+        self.assert_( isinstance( self.master, Master ) )
+
+        r = self.master.calculateResult()
+
+        self.assertEqual( [ r[i] for i in range(4) ], [ -1 ] * 4 )
+        self.assertEqual( [ r[i] for i in range(4,12) ], range( 6, 14 ) )
+
+
+if __name__ == '__main__':
+
+    BT.localTest()
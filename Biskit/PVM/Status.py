@@ -27,17 +27,32 @@ Thread - save job handling for JobMaster (see L{dispatcher}).
 """
 
 from threading import RLock
+import time
 
 class Status:
     """
     Keep track of objects that are processed by JobMaster.
-    
+
+    At the end of a calculation, started but unfinished items can be
+    re-distributed to idle slaves (speculative execution). Only the
+    slowest outstanding items are handed out again, one per request:
+    items whose current run is expected to finish after the requesting
+    slave could finish them, or that are overdue. Expected finishing
+    times come from the per-item durations passed to L{next_chunk}.
+    An item is not running on more than L{MAX_COPIES} slaves at the same
+    time; overdue items may get one extra copy. Each new copy replaces the
+    expected finishing time of the item by its own. If no slave is busy,
+    time estimates are ignored (force option of L{next_chunk}).
+
     Thread-savety:
      - next_chunk() is synchronized.
      - deactivate() must be synchronized to the same Status.lock
      - activate() is not any longer supposed to be called from outside.
     """
 
+    #: max. number of slaves processing the same item (+1 if overdue)
+    MAX_COPIES = 2
+
     def __init__(self, objects, redistribute=1):
         """
         @param objects: e.g. job IDs
@@ -52,10 +67,14 @@ class Status:
 
         self.redistribute = redistribute
 
+        ## time of last activation and expected end of each active item
+        self.started = {}
+        self.finish = {}
+
         self.lock = RLock()
 
 
-    def __activate(self, item):
+    def __activate(self, item, finish=None):
         """
         not thread-save, synchronize on self.lock!
         """
@@ -64,6 +83,15 @@ class Status:
         else:
             self.objects[item] += 1
 
+        self.started[item] = time.time()
+
+        ## expected end of the latest copy; an overdue item is thus only
+        ## overdue again if also this copy takes longer than expected
+        if finish is not None:
+            self.finish[item] = finish
+        else:
+            self.finish.pop( item, None )
+
 
     def deactivate(self, item):
         """
@@ -75,6 +103,32 @@ class Status:
 
         self.objects[item] = 0
 
+        self.started.pop( item, None )
+        self.finish.pop( item, None )
+
+
+    def abort(self, items):
+        """
+        Withdraw one copy of each item, e.g. of the job of a failed slave.
+        Items without any other running copy count as not started again.
+        Remaining copies lose their expected end.
+        not thread-save, synchronize on self.lock!
+
+        @param items: items handed out to the failed slave
+        @type  items: [object]
+        """
+        for item in items:
+
+            if not self.objects.get( item ):
+                continue   ## finished (0) or never started (None)
+
+            self.objects[item] -= 1
+            self.finish.pop( item, None )
+
+            if self.objects[item] == 0:
+                self.objects[item] = None
+                self.started.pop( item, None )
+
 
     def not_done(self):
         """
@@ -128,13 +182,89 @@ class Status:
         return r
 
 
-    def next_chunk(self, nmax ):
+    def nextDeadline(self):
+        """
+        Earliest expected end of a running item that could be handed
+        out again once it is overdue. Re-check idle slaves at this time.
+        not thread-save, synchronize on self.lock!
+
+        @return: time (as time.time()) OR None if there is no such item
+        @rtype: float
+        """
+        now = time.time()
+
+        r = [ self.finish[k] for k in self.activ()
+              if self.finish.get( k, now ) > now and \
+                 self.objects[k] <= self.MAX_COPIES ]
+
+        return r and min( r ) or None
+
+
+    def stragglers(self, duration=None, force=0):
+        """
+        Active items worth re-distributing, slowest first. Overdue items
+        come first (most overdue first), then items by decreasing expected
+        end, then items without time estimate (oldest first). Items that
+        are expected to finish before a slave needing duration seconds
+        could finish them, or that already run on too many slaves (see
+        L{MAX_COPIES}), are skipped.
+        With force, all items are treated like overdue ones.
+        not thread-save, synchronize on self.lock!
+
+        @param duration: expected time (s) per item of the requesting slave
+                         (default: None, unknown)
+        @type  duration: float
+        @param force: ignore time estimates, e.g. if no slave is busy
+                      (default: 0)
+        @type  force: 1|0
+
+        @return: list of active items
+        @rtype: [object]
+        """
+        now = time.time()
+        overdue, late, unknown = [], [], []
+
+        limit = self.MAX_COPIES + ( force and 1 or 0 )
+
+        for k in self.activ():
+
+            finish = self.finish.get( k )
+            copies = self.objects[k]
+
+            if finish is not None and finish < now:
+                if copies <= self.MAX_COPIES:
+                    overdue.append( (finish, k) )
+                continue
+
+            if copies >= limit:
+                continue
+
+            if finish is None:
+                unknown.append( (self.started.get( k, 0 ), k) )
+
+            elif force or duration is None or finish > now + duration:
+                late.append( (-finish, k) )
+
+        overdue.sort(); late.sort(); unknown.sort()
+
+        return [ x[1] for x in overdue + late + unknown ]
+
+
+    def next_chunk(self, nmax, duration=None, force=0 ):
         """
         Get next chunk of at most nmax items that need to be processed.
+        Once all items have been started, single running items are
+        handed out again (see L{stragglers}).
         Thread-save.
 
         @param nmax: size of chunk
         @type  nmax: int        
+        @param duration: expected processing time (s) per item for the
+                         slave asking for the chunk (default: None, unknown)
+        @type  duration: float
+        @param force: re-distribute running items regardless of their
+                      expected end (default: 0)
+        @type  force: 1|0
 
         @return: chunk of items to be processed, number of unproc OR
                    None if all items have been processed
@@ -143,18 +273,24 @@ class Status:
         self.lock.acquire()
 
         queue = self.not_started()
+        n_left = len(queue)
 
-        ## at the end, re-distribute running jobs
+        ## at the end, re-distribute the slowest running job
         if not queue and self.redistribute:
-            queue = self.not_done()
+            queue = self.stragglers( duration, force )
+            n_left = len( self.not_done() )
+            nmax = 1
 
-        n_left = len(queue)
+        queue = queue[:nmax]
+
+        now = time.time()
 
-        if n_left > nmax:
-            queue = queue[:nmax]
+        for i, item in enumerate( queue ):
+            finish = None
+            if duration is not None:
+                finish = now + (i + 1) * duration
 
-        for item in queue:
-           self.__activate(item)
+            self.__activate(item, finish)
 
         self.lock.release()
 
@@ -180,10 +316,68 @@ class Status:
 
     __repr__ = __str__
 
-################
-## empty test ##
+#############
+##  TESTING
+#############
 import Biskit.test as BT
 
 class Test(BT.BiskitTest):
-    """Mock test, Status is tested indirectly in other PVM applications."""
-    pass
+    """Status test"""
+
+    def test_Status(self):
+        """PVM.Status chunks and re-distribution test"""
+        self.s = Status( range(10) )
+
+        q, n = self.s.next_chunk( 4, duration=10. )
+        self.assertEqual( (q, n), ([0,1,2,3], 10) )
+        self.assertAlmostEqual( self.s.nextDeadline(), self.s.finish[0] )
+
+        q, n = self.s.next_chunk( 8 )
+        self.assertEqual( (q, n), ([4,5,6,7,8,9], 6) )
+
+        for i in [0,1,2,4,5,6,7,8]:
+            self.s.deactivate( i )
+
+        ## item 3 (expected in 40 s) is worth re-running for a slave
+        ## needing 5 s per item; item 9 has no estimate
+        q, n = self.s.next_chunk( 5, duration=5. )
+        self.assertEqual( (q, n), ([3], 2) )
+
+        ## ... but not for one needing 60 s; no more copies of 3 allowed
+        q, n = self.s.next_chunk( 5, duration=60. )
+        self.assertEqual( q, [9] )
+        self.assertEqual( self.s.next_chunk( 5 ), ([], 2) )
+
+        ## overdue items get one extra copy
+        self.s.finish[3] -= 100
+        self.assertEqual( self.s.next_chunk( 5, duration=5. )[0], [3] )
+        self.assert_( self.s.finish[3] > time.time() )
+
+        ## ... but no more, even if they stay overdue
+        for i in range( 5 ):
+            self.s.finish[3] = time.time() - 1
+            self.assertEqual( self.s.next_chunk( 5, duration=5. )[0], [] )
+        self.assertEqual( self.s.objects[3], Status.MAX_COPIES + 1 )
+
+        ## ... unless nobody else is working
+        self.assertEqual( self.s.next_chunk( 5, force=1 )[0], [9] )
+        self.assertEqual( self.s.nextDeadline(), None )
+
+        self.s.deactivate( 3 ); self.s.deactivate( 9 )
+        self.assert_( self.s.done() )
+
+        self.s.redistribute = 0
+        self.s.objects[3] = 1
+        self.assertEqual( self.s.next_chunk( 5 ), ([], 0) )
+
+        ## the chunk of a failed slave is handed out again
+        self.s = Status( range(4) )
+        q, n = self.s.next_chunk( 2, duration=10. )
+        self.s.abort( q + [3] )
+        self.assertEqual( self.s.not_started(), [0,1,2,3] )
+        self.assertEqual( self.s.next_chunk( 4 )[0], [0,1,2,3] )
+
+
+if __name__ == '__main__':
+
+    BT.localTest()
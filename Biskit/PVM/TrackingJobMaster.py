@@ -25,7 +25,7 @@
 Add some extra functionality to JobMaster
 """
 
-from Biskit.PVM.dispatcher import JobMaster
+from Biskit.PVM.dispatcher import JobMaster, PVM
 import pvm
 from Biskit.PVM.Status import Status
 import Biskit.tools as T
@@ -39,6 +39,8 @@ class TrackingJobMaster( JobMaster ):
     This class extends JobMaster with the following extras:
       - reporting of the average time each slave spends on a job
       - automatic adding of slave computers to PVM
+      - optional use of local processes instead of PVM (backend='pool')
+      - chunk sizes adapted to the measured speed of each slave
       - different ways to be notified of a completed calculation
       - restarting of interrupted calculations
 
@@ -56,6 +58,13 @@ class TrackingJobMaster( JobMaster ):
 
     Consider overriding cleanup(), done() and getResult().
 
+    With chunk_time, the number of items per job is chosen for each slave
+    so that a job takes about chunk_time seconds, based on the time per
+    item measured for this slave (or the average of all slaves, scaled by
+    the factor given to mark_slow_slaves()). At the end, running items
+    are only re-distributed to slaves that are expected to finish them
+    earlier (see L{Status}).
+
     An interrupted calculation can be restarted from a restart file:
        - during calculation, pickle the result of getRst() to a file
        - call the script Biskit/restartPVM -i |file_name|
@@ -85,7 +94,8 @@ class TrackingJobMaster( JobMaster ):
     def __init__(self, data={}, chunk_size=5,
                  hosts=[], niceness={'default':20},
                  slave_script='', verbose=1,
-                 show_output=0, add_hosts=1, redistribute=1 ):
+                 show_output=0, add_hosts=1, redistribute=1,
+                 backend=None, ncpu=None, chunk_time=None ):
         """
         @param data: dict of items to be processed
         @type  data: {str_id:any}
@@ -106,17 +116,30 @@ class TrackingJobMaster( JobMaster ):
         @param redistribute: at the end, send same job out several times
                              (default: 1)
         @type  redistribute: 1|0
-        """
-        if add_hosts:
+        @param backend: run slaves as PVM tasks ('pvm') or as local
+                        processes ('pool'), see L{JobMaster}
+                        (default: JobMaster.BACKEND)
+        @type  backend: str
+        @param ncpu: number of local processes for the 'pool' backend
+                     (default: all CPUs)
+        @type  ncpu: int
+        @param chunk_time: target duration of a job in seconds, chunk_size
+                           is then only used for the first job of each
+                           slave (default: None, fixed chunk size)
+        @type  chunk_time: float
+        """
+        if add_hosts and (backend or self.BACKEND) == PVM:
             if verbose: T.errWrite('adding %i hosts to pvm...' % len(hosts) )
             pvm.addHosts( hosts=hosts )
             if verbose: T.errWriteln('done')
 
         JobMaster.__init__( self, data, chunk_size, hosts, niceness,
                             slave_script, show_output=show_output,
-                            redistribute=redistribute, verbose=verbose )
+                            redistribute=redistribute, verbose=verbose,
+                            backend=backend, ncpu=ncpu )
 
         self.progress = {}
+        self.chunk_time = chunk_time
 
         self.disabled_hosts = []
         self.slow_hosts = {}
@@ -154,15 +177,75 @@ class TrackingJobMaster( JobMaster ):
 
     def mark_slow_slaves( self, host_list, slow_factor ):
         """
+        Mark hosts as slower than average. Until their own speed has been
+        measured, the time per item of slaves on these hosts is estimated
+        as slow_factor times the average of all slaves (see L{itemTime}).
+
         @param host_list: list of hosts
         @type  host_list: [str]
         @param slow_factor: factor describing the calculation speed of a node
+                            (time per item relative to average, e.g. 2.0
+                            for a node that is half as fast)
         @type  slow_factor: float
         """
         for h in host_list:
             self.slow_hosts[h] = slow_factor
 
 
+    def itemTime( self, slave_tid ):
+        """
+        Overriding JobMaster method. Average time per item measured for
+        this slave, or the average of all slaves scaled by the slow_factor
+        of its host (see L{mark_slow_slaves}).
+
+        @param slave_tid: slave task tid
+        @type  slave_tid: int
+
+        @return: time in seconds or None if nothing has been measured yet
+        @rtype: float
+        """
+        d = self.progress.get( self.nicknameFromTID( slave_tid ), {} )
+
+        if d.get( 'items', 0 ):
+            return d['busy'] / d['items']
+
+        items = sum( [ p.get('items', 0) for p in self.progress.values() ] )
+        busy  = sum( [ p.get('busy', 0.) for p in self.progress.values() ] )
+
+        if not items:
+            return None
+
+        factor = self.slow_hosts.get( self.hostnameFromTID( slave_tid ), 1.)
+
+        return busy / items * factor
+
+
+    def chunkSize( self, slave_tid ):
+        """
+        Overriding JobMaster method. With chunk_time, as many items as the
+        slave is expected to process within chunk_time seconds, but not more
+        than its share of the items left.
+
+        @param slave_tid: slave task tid
+        @type  slave_tid: int
+
+        @return: number of items for the next job of this slave
+        @rtype: int
+        """
+        t = self.itemTime( slave_tid )
+
+        if not self.chunk_time or t is None:
+            return self.chunk_size
+
+        n = int( round( self.chunk_time / max( t, 1e-6 ) ) )
+
+        ## leave some work for the other slaves at the end
+        n_slaves = max( 1, len( getattr( self, 'slaves', {} ) ) )
+        share = (len( self.status.not_started() ) + n_slaves - 1) / n_slaves
+
+        return max( 1, min( n, share ) )
+
+
     def start_job( self, slave_tid ):
         """
         Overriding JobMaster method
@@ -172,7 +255,7 @@ class TrackingJobMaster( JobMaster ):
         """
         host = self.nicknameFromTID( slave_tid )
 
-        d = {'given':0, 'done':0, 'time':0 }
+        d = {'given':0, 'done':0, 'time':0, 'items':0, 'busy':0. }
         if self.progress.has_key( host ):
             d = self.progress[ host ]
 
@@ -192,10 +275,13 @@ class TrackingJobMaster( JobMaster ):
         @type  result: dict
         """
         host = self.nicknameFromTID( slave_tid )
+        d = self.progress[host]
 
-        self.progress[host]['done'] += 1
-        self.progress[host]['time'] = time.time() \
-            - self.progress[host]['timeStart']
+        d['done'] += 1
+        d['time'] = time.time() - d['timeStart']
+
+        d['items'] += len( result )
+        d['busy'] += d['time']
 
 
     def reportProgress( self ):
@@ -203,12 +289,15 @@ class TrackingJobMaster( JobMaster ):
         Report how many jobs were processed in what time per host.
         """
         if self.verbose:
-            print 'host                     \tgiven\tdone\t  time'
+            print 'host                     \tgiven\tdone\t  time\t  items'\
+                  '\t  s/item'
             for host in self.progress:
 
                 d = self.progress[host]
-                print '%-25s\t%i\t%i\t%6.2f s' %\
-                      (host, d['given'], d['done'], d['time'])
+                items = d.get( 'items', 0 )
+                print '%-25s\t%i\t%i\t%6.2f s\t%7i\t%8.3f' %\
+                      (host, d['given'], d['done'], d['time'], items,
+                       d.get( 'busy', 0. ) / (items or 1) )
 
 
     def setCallback( self, funct ):
@@ -290,9 +379,11 @@ class TrackingJobMaster( JobMaster ):
         @return: array( (n_frames, n_frames), 'f'), matrix of pairwise rms
         @rtype: array
         """
+        ## lock before starting so that a quick finish cannot be missed
+        self.lock.acquire()
+
         self.start()
 
-        self.lock.acquire()
         self.lockMsg.wait()
         self.lock.release()
 
@@ -372,6 +463,7 @@ def restart( rst_data, **params ):
     @type  params: {key:value}
     """
     ## create empty master
+    params.setdefault( 'backend', rst_data.get( 'backend' ) )
     master = TrackingJobMaster( **params )
 
     ## switch to required subclass and handle special information
@@ -382,6 +474,45 @@ def restart( rst_data, **params ):
 
     return master
 
+#############
+##  TESTING
+#############
+import Biskit.test as BT
+
+class Test(BT.BiskitTest):
+    """TrackingJobMaster test"""
+
+    def test_chunkSize(self):
+        """PVM.TrackingJobMaster adaptive chunk size test"""
+        data = dict( [ (i, i) for i in range( 100 ) ] )
+
+        self.m = TrackingJobMaster( data, chunk_size=5, chunk_time=10.,
+                                    backend='pool', ncpu=2, verbose=0 )
+
+        self.m.slaves = { 1: 'fast_0', 2: 'slow_0' }
+        self.m.getTasks().update( { 'fast_0': 1, 'slow_0': 2 } )
+
+        self.assertEqual( self.m.itemTime( 1 ), None )
+        self.assertEqual( self.m.chunkSize( 1 ), 5 )
+
+        ## 0.5 s per item measured for fast_0
+        self.m.start_job( 1 )
+        self.m.progress['fast_0']['timeStart'] -= 5
+        self.m.job_done( 1, dict( [ (i, i) for i in range( 10 ) ] ) )
+
+        self.assertAlmostEqual( self.m.itemTime( 1 ), 0.5, 1 )
+        self.assertEqual( self.m.chunkSize( 1 ), 20 )
+
+        ## slow_0 is estimated from the average
+        self.m.mark_slow_slaves( ['slow'], 4. )
+        self.assertAlmostEqual( self.m.itemTime( 2 ), 2.0, 1 )
+        self.assertEqual( self.m.chunkSize( 2 ), 5 )
+
+        ## not more than a fair share of the remaining items
+        self.m.status.next_chunk( 95 )
+        self.assertEqual( self.m.chunkSize( 1 ), 3 )
+
+
 if __name__ == '__main__':
 
     import pypvm
@@ -18,17 +18,20 @@
 ##
 ##
 """
-High-level parallelisation with PVM.
+High-level parallelisation with PVM or local processes.
 
 Python jobs can be distributed from a TrackingJobMaster to many
 JobSlaves running on different machines. The general mechanism is shown in
 ExampleMaster.py and ExampleSlave.py 
 
-The compilation of PVM/pypvm can be tricky on some architectures. In order
-to support installations that don't need parallelisation, only a warning is
-issued if pypvm is missing and the public classes are exported as
-Pseudo-classes. Pseudo classes are empty and raise an ImportError when you
-try to initialize them. See also L{Biskit.tools.tryImport}.
+The compilation of PVM/pypvm can be tricky on some architectures. If pypvm
+is missing, only a warning is issued and masters run their slaves in local
+processes instead (backend 'pool', see L{ProcessPool}). The backend can
+also be chosen for each master with the backend= parameter of
+TrackingJobMaster. If the classes cannot be imported at all, they are
+exported as Pseudo-classes. Pseudo classes are empty and raise an
+ImportError when you try to initialize them. See also
+L{Biskit.tools.tryImport}.
 """
 ## import user  ## ensure that ~/.pythonrc.py is executed
 
@@ -38,17 +41,16 @@ try to initialize them. See also L{Biskit.tools.tryImport}.
 from Biskit import EHandler
 import Biskit.tools as T
 
-pvm_installed = True
+from pvm import installed as pvm_installed
 
-pvm_installed = T.tryImport( 'TrackingJobMaster', 'TrackingJobMaster',
-                             namespace=globals())
-pvm_installed = T.tryImport( 'dispatcher', 'JobSlave',
-                             namespace=globals() ) and pvm_installed
+T.tryImport( 'TrackingJobMaster', 'TrackingJobMaster', namespace=globals())
+T.tryImport( 'dispatcher', 'JobSlave', namespace=globals() )
+T.tryImport( 'ProcessPool', 'ProcessPool', namespace=globals() )
 
 if not pvm_installed:
     EHandler.warning('Could not import PVM (Parallel Virtual Machine) modules.'+
         ' Please check that PVM and pypvm are installed!\n'+
-        '\tParallelisation is not available.')
+        '\tJobs are distributed to local processes instead.')
 
 ##
 ## clean up
@@ -29,17 +29,36 @@ Manage Master/Slave tasks.
 from PVMThread import PVMMasterSlave
 from Biskit import ExeConfigCache
 from Status import Status
+from ProcessPool import ProcessPool
 import Biskit.settings as settings
+import Biskit.tools as T
 import socket, pvm
-import pypvm
+import multiprocessing
+import threading, time
 
 MSG_JOB_START = 1
 MSG_JOB_DONE = 2
 
+#: distribute jobs to PVM tasks
+PVM = 'pvm'
+#: distribute jobs to local processes (see L{ProcessPool})
+POOL = 'pool'
+
 class JobMaster(PVMMasterSlave):
+    """
+    Distribute a dictionary of items in chunks to slaves and collect the
+    results. Slaves are either PVM tasks spawned on the given hosts
+    (backend L{PVM}) or local worker processes (backend L{POOL}). Both run
+    the same JobSlave class from the slave script. The backend is chosen
+    with the backend parameter or by overriding L{BACKEND} in a sub-class.
+    """
+
+    #: default backend -- PVM if pypvm is installed, local processes otherwise
+    BACKEND = pvm.installed and PVM or POOL
 
     def __init__(self, data, chunk_size, hosts, niceness, slave_script,
-                 show_output = 0, result = None, redistribute=1, verbose=1 ):
+                 show_output = 0, result = None, redistribute=1, verbose=1,
+                 backend=None, ncpu=None ):
         """
         @param data: dict of items to be proessed {id:object}.
         @type  data: dict
@@ -60,8 +79,25 @@ class JobMaster(PVMMasterSlave):
         @type  redistribute: 1|0
         @param verbose: verbosity level (default: 1)
         @type  verbose: 1|0
+        @param backend: 'pvm' or 'pool' (default: L{BACKEND})
+        @type  backend: str
+        @param ncpu: number of local worker processes of the 'pool' backend
+                     which ignores hosts (default: all CPUs)
+        @type  ncpu: int
         """
-        PVMMasterSlave.__init__(self, verbose=verbose)
+        self.backend = backend or self.BACKEND
+
+        if self.backend not in (PVM, POOL):
+            raise ValueError, 'unknown backend %r' % self.backend
+
+        if self.backend == POOL:
+            ncpu = ncpu or multiprocessing.cpu_count()
+            hosts = ['localhost'] * ncpu
+
+        self.ncpu = ncpu
+
+        PVMMasterSlave.__init__(self, verbose=verbose,
+                                local=(self.backend == POOL) )
 
         ## change names of multiple hosts
         d = {}
@@ -90,9 +126,12 @@ class JobMaster(PVMMasterSlave):
 
                 unique_list.append(d)
 
-        exe = ExeConfigCache.get('xterm')
-        exe.validate()
-        self.xterm_bin = exe.bin
+        self.xterm_bin = None
+
+        if self.backend == PVM:
+            exe = ExeConfigCache.get('xterm')
+            exe.validate()
+            self.xterm_bin = exe.bin
         
         self.hosts = unique_list
         self.niceness = niceness
@@ -120,6 +159,17 @@ class JobMaster(PVMMasterSlave):
         self.status = Status(items, redistribute=redistribute )
 
         self.__finished = 0
+        self.__pool = None
+
+        ## slaves without job
+        self.__idle = set()
+
+        ## items of the current job of each slave
+        self.__jobs = {}
+
+        ## re-checks idle slaves when a running item becomes overdue
+        self.__timer = None
+        self.__wake_at = None
 
         if verbose: print 'Processing %d items ...' % len(items)
 
@@ -132,12 +182,90 @@ class JobMaster(PVMMasterSlave):
                'Master needs at least 1 pvm node to start calculations.'
         self.finished = 0
 
+        if self.backend == POOL:
+            self.__pool = ProcessPool( self.slave_script, self.show_output )
+            PVMMasterSlave.start(self)
+            return
+
         PVMMasterSlave.start(self)
 
         self.startMessageLoop()
         self.spawnAll(self.niceness, self.show_output)
 
 
+    def run(self):
+        """
+        Thread main loop.
+        """
+        if self.backend == POOL:
+            self.__runPool()
+        else:
+            PVMMasterSlave.run(self)
+
+
+    def __runPool(self):
+        """
+        Message loop of the 'pool' backend. Spawn one local worker process
+        per entry in self.hosts, hand out chunks via Status.next_chunk and
+        collect results until all items are done.
+        """
+        self.slaves = {}
+
+        for i, d in enumerate( self.hosts ):
+
+            tid = i + 1
+            nice = self.niceness.get( d['host'],
+                                      self.niceness.get('default', 0) )
+
+            self.__pool.spawn( tid, self.getInitParameters( tid ), nice )
+
+            self.getTasks()[ d['nickname'] ] = tid
+            self.slaves[ tid ] = d
+
+            if self.verbose: print tid, d['nickname'], 'spawned.'
+
+            self.initializationDone( tid )
+
+        if self.status.done():
+            self.__finish()
+
+        while not self.isStopped() and not self.status.done():
+
+            if not self.__pool.busy:
+                self.__wake_idle( force=1 )
+
+            if not self.__pool.busy:
+                T.errWriteln('No more active slaves -- %i items unprocessed.'
+                             % len( self.status.not_done() ) )
+                self.__finish()
+                break
+
+            tid, result, error = self.__pool.receive()
+
+            ## time-out: running items may have become overdue
+            if tid is None:
+                self.__wake_idle()
+                continue
+
+            if error is not None:
+                T.errWriteln( 'Slave %i (%s) failed and is removed:\n%s' %
+                              (tid, self.slaves[tid]['nickname'], error) )
+                self.__pool.remove( tid )
+                self.__idle.discard( tid )
+
+                ## its items are free for the remaining slaves
+                self.status.lock.acquire()
+                self.status.abort( self.__jobs.pop( tid, [] ) )
+                self.status.lock.release()
+
+                self.__wake_idle()
+                continue
+
+            self.__job_done( tid, result )
+
+        self.__pool.exit()
+
+
     def getInitParameters(self, slave_tid):
         """
         Override to collect slave initiation parameters.
@@ -166,6 +294,9 @@ class JobMaster(PVMMasterSlave):
         """
         self.status.lock.acquire()
 
+        if self.__timer is not None:
+            self.__timer.cancel()
+
         if not self.__finished:
             self.finish()
             self.__finished = 1
@@ -173,6 +304,18 @@ class JobMaster(PVMMasterSlave):
         self.status.lock.release()
 
 
+    def exit(self):
+        """
+        Shut down all slaves.
+        """
+        if self.backend == POOL:
+            if self.__pool:
+                self.__pool.exit()
+            self.stop()
+        else:
+            PVMMasterSlave.exit(self)
+
+
     def bindMessages(self, slave_tid):
         """
         @param slave_tid: slave task tid
@@ -208,7 +351,7 @@ class JobMaster(PVMMasterSlave):
             command = settings.python_bin
             argv = ['-i', self.slave_script, str(niceness)]
 
-        args = (command, argv, pypvm.spawnOpts['TaskHost'], host, 1)
+        args = (command, argv, pvm.P.spawnOpts['TaskHost'], host, 1)
 
         return PVMMasterSlave.spawn(self, args, nickname)
 
@@ -289,28 +432,116 @@ class JobMaster(PVMMasterSlave):
         return chunk
 
 
-    def __start_job(self, slave_tid):
+    def chunkSize(self, slave_tid):
+        """
+        Number of items for the next job of a slave. Override for
+        adaptive chunk sizes (see L{TrackingJobMaster}).
+
+        @param slave_tid: slave task tid
+        @type  slave_tid: int
+
+        @return: chunk size (default: self.chunk_size)
+        @rtype: int
+        """
+        return self.chunk_size
+
+
+    def itemTime(self, slave_tid):
+        """
+        Expected time a slave needs per item. It decides which running
+        items are re-distributed to this slave at the end (see
+        L{Status.stragglers}). Override.
+
+        @param slave_tid: slave task tid
+        @type  slave_tid: int
+
+        @return: time in seconds or None (default: None, unknown)
+        @rtype: float
+        """
+        return None
+
+
+    def __all_idle(self):
+        """
+        @return: 1 if no slave is processing a job
+        @rtype: 1|0
+        """
+        if self.backend == POOL:
+            return not self.__pool.busy
+
+        return self.__idle.issuperset( self.slaves )
+
+
+    def __schedule_wake(self):
+        """
+        Make sure idle slaves are offered work again when the first
+        running item becomes overdue, even if no slave reports back
+        before (PVM backend; the 'pool' loop re-checks on its own).
+        """
+        if self.backend == POOL:
+            return
+
+        t = self.status.nextDeadline()
+
+        if t is None:
+            return
+
+        if self.__timer is not None and self.__timer.isAlive() \
+           and self.__wake_at <= t:
+            return
+
+        if self.__timer is not None:
+            self.__timer.cancel()
+
+        ## stragglers() only takes items that are strictly overdue
+        self.__timer = threading.Timer( max( 0., t - time.time() ) + 0.1,
+                                        self.__wake_idle )
+        self.__timer.setDaemon( True )
+        self.__wake_at = t
+        self.__timer.start()
+
+
+    def __start_job(self, slave_tid, force=0):
         """
         Tasks performed befor the job is launched.
         
         @param slave_tid: slave task tid
         @type  slave_tid: int
+        @param force: hand out running items regardless of their expected
+                      end (default: 0)
+        @type  force: 1|0
         """
-        self.start_job(slave_tid)
-
         ## get items that have not been processed
-        queue, n_left = self.status.next_chunk( self.chunk_size)
+        queue, n_left = self.status.next_chunk( self.chunkSize( slave_tid ),
+                                                self.itemTime( slave_tid ),
+                                                force=force )
 
         if not queue:
+            ## nothing worth doing now, try again after the next result
+            self.__idle.add( slave_tid )
+
+            ## ... unless no other slave could report back
+            if not force and self.__all_idle():
+                return self.__start_job( slave_tid, force=1 )
+
+            self.__schedule_wake()
             return
 
+        self.__idle.discard( slave_tid )
+        self.__jobs[ slave_tid ] = queue
+
+        self.start_job(slave_tid)
+
         nickname = self.slaves[slave_tid]['nickname']
         if self.verbose:
             print '%d (%s) %d items left'%(slave_tid, nickname, n_left)
 
         chunk = self.get_slave_chunk( queue )
 
-        self.send(slave_tid, MSG_JOB_START, (chunk,))
+        if self.backend == POOL:
+            self.__pool.send( slave_tid, chunk )
+        else:
+            self.send(slave_tid, MSG_JOB_START, (chunk,))
 
 
     def is_valid_slave(self, slave_tid):
@@ -351,6 +582,7 @@ class JobMaster(PVMMasterSlave):
         self.job_done(slave_tid, result)
 
         self.result.update(result)
+        self.__jobs.pop( slave_tid, None )
 
         ## mark result as finished.
         for item in result.keys():
@@ -363,17 +595,44 @@ class JobMaster(PVMMasterSlave):
             return
 
         if not self.status.done():
-            self.__start_job(slave_tid)
+            ## the wake-up timer may hand out jobs at the same time
+            self.status.lock.acquire()
+            try:
+                self.__start_job(slave_tid)
+                self.__wake_idle()
+            finally:
+                self.status.lock.release()
         else:
             self.__finish()
 
 
+    def __wake_idle(self, force=0):
+        """
+        Offer work to slaves that were left without job.
+
+        @param force: hand out running items regardless of their expected
+                      end, e.g. if no slave is busy (default: 0)
+        @type  force: 1|0
+        """
+        self.status.lock.acquire()
+        try:
+            for tid in list( self.__idle ):
+                if self.is_valid_slave( tid ) and not self.status.done():
+                    self.__start_job( tid,
+                                      force=force and self.__all_idle() )
+        finally:
+            self.status.lock.release()
+
+
 class JobSlave(PVMMasterSlave):
 
-    def __init__(self):
+    def __init__(self, local=0):
         """
+        @param local: slave runs in a local worker process of
+                      L{ProcessPool} and does not use PVM (default: 0)
+        @type  local: 1|0
         """
-        PVMMasterSlave.__init__(self)
+        PVMMasterSlave.__init__(self, local=local)
         self.setMessageLoopDelay(0.5)
 
 
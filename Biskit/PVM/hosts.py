@@ -28,10 +28,10 @@ to the rest of Biskit:
 """
 import Biskit.tools as T
 import Biskit as B
-import os, user
+import os
 
 __CFG_DEFAULT = T.dataRoot() + '/defaults/hosts.py'
-__CFG_USER    = user.home + '/.biskit/hosts.py'
+__CFG_USER    = os.path.expanduser( '~' ) + '/.biskit/hosts.py'
 
 class HostsError( B.BiskitError ):
     """raised when there is a problem with the hosts.py configuration"""
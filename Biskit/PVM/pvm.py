@@ -25,7 +25,16 @@
 Low-level utility functions for PVM.
 """
 
-import pypvm as P
+#: reason why pypvm could not be imported
+error = None
+
+try:
+    import pypvm as P
+except ImportError, error:
+    P = None
+
+#: True if pypvm could be imported
+installed = P is not None
 
 from cPickle import dumps # as _dumps
 from cPickle import loads # as _loads
@@ -34,6 +43,14 @@ import os
 import hosts as H
 
 
+def check():
+    """
+    @raise ImportError: if pypvm is not available
+    """
+    if P is None:
+        raise ImportError, 'PVM is not available: %s' % str( error )
+
+
 def pack(object):
     return P.pkstr(dumps(object))
 
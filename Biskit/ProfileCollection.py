@@ -46,6 +46,31 @@ except:
 class ProfileError(Exception):
     pass
 
+def objectArray( values ):
+    """
+    Create a 1-D array of python objects. N.array( values, 'O' ) would
+    create a 2-D array from a list of tuples or lists of equal length.
+
+    @param values: any sequence
+    @type  values: [any]
+
+    @return: array with one (unchanged) element per value
+    @rtype: array of object
+    """
+    if isinstance( values, basestring ):
+        values = list( values )
+
+    r = N.empty( len( values ), 'O' )
+
+    try:
+        r[:] = values
+    except ( ValueError, TypeError ):
+        for i, v in enumerate( values ):
+            r[i] = v
+
+    return r
+
+
 class _ViewSignal:
     pass
 
@@ -220,16 +245,17 @@ class ProfileCollection:
     assigned to it. The take() and concat() methods operate on the columns,
     i.e. they are applied to all profiles simultaneously.
 
-    By default, profiles of numbers are stored and returned as Numpy.array and
-    all others are stored and returned as ordinary list. This behaviour can be
-    modified with the option asarray of ProfileCollection.set(). Using both
-    lists and arrays is a compromise between the efficiency of Numeric arrays
-    and two problems of of the old Numeric module -- (1) arrays of objects
-    could not be unpickled (Numeric bug) and (2) arrays of strings would end
-    up as 2-D arrays of char. The 'isarray' entry of a profile's info
-    dictionary tells whether the profile is stored as array or as list. (Since
-    we have now replaced Numeric by numpy, we can probably switch to the
-    exclusive use of numpy arrays.)
+    By default, all profiles are stored and returned as numpy arrays --
+    profiles of numbers as arrays of int or float, all others (atom names,
+    chain ids, ...) as 1-D arrays of python objects (see L{objectArray}).
+    take(), compress() and concat() are therefore single numpy operations
+    on every profile. Object arrays (rather than fixed-width string arrays)
+    keep the values unchanged -- a longer string assigned to a single
+    position is not truncated. Storage as ordinary list can still be
+    requested with the option asarray=0 of ProfileCollection.set().
+    The 'isarray' entry of a profile's info dictionary tells whether the
+    profile is stored as array or as list. List profiles of old pickles
+    are converted to arrays when unpickled.
 
     Acessing profiles
     =================
@@ -330,19 +356,19 @@ class ProfileCollection:
     def __setstate__(self, state ):
         """
         called for unpickling the object.
-        Compability fix: Convert Numeric arrays to numpy arrays 
-                         -- requires old Numeric
+        Compability fix: Convert list profiles of older versions into arrays
+        and Numeric arrays to numpy arrays (the latter requires old Numeric)
         """
         self.__dict__ = state
 
-        try:
-            import Numeric
-        except:
-            return
-
         for k, v in self.profiles.items():
 
-            if getattr( v, 'astype', 0) and not isinstance( v, N.ndarray):
+            if type( v ) is list:
+                self.profiles[k] = self.array_or_list( v, 1 )
+                if k in self.infos:
+                    self.infos[k]['isarray'] = True
+
+            elif getattr( v, 'astype', 0) and not isinstance( v, N.ndarray):
                 self.profiles[k] = N.array( v )
     
 
@@ -560,7 +586,8 @@ class ProfileCollection:
 
         @param prof: profile
         @type  prof: list OR array
-        @param asarray: 1.. autodetect type, 0.. force list, 2.. force array
+        @param asarray: 1.. array of numbers or of objects (autodetect),
+                        0.. force list, 2.. force array (default numpy type)
         @type  asarray: 2|1|0
         
         @return: profile
@@ -573,17 +600,22 @@ class ProfileCollection:
             ## autodetect type
             if asarray == 1:
 
-                if isinstance( prof, N.ndarray ):
-                    return self.__picklesave_array( prof )
-
                 if type( prof ) is str:  # tolerate strings as profiles
-                    return list( prof )
-    
-                p = self.__picklesave_array( N.array( prof ) )
-                if p.dtype.char not in ['O','c','S']: ## no char or object arrays!
-                    return p
+                    return objectArray( prof )
 
-                return list( prof )
+                p = prof
+                if not isinstance( prof, N.ndarray ):
+                    p = N.array( prof )
+
+                ## numbers of any shape, e.g. one row per frame
+                if p.dtype.char not in ['O','c','S','U']:
+                    return self.__picklesave_array( p )
+
+                if isinstance( prof, N.ndarray ) and prof.dtype.char == 'O' \
+                   and prof.ndim == 1:
+                    return prof
+
+                return objectArray( prof )
 
             ## force list
             if asarray == 0:
@@ -600,9 +632,12 @@ class ProfileCollection:
                 
                 return self.__picklesave_array( N.array( prof ) )
 
-        except TypeError, why:
-            ## Numeric bug: N.array(['','','']) raises TypeError
-            if asarray == 1 or asarray == 0:
+        except ( TypeError, ValueError ), why:
+            ## e.g. sequences of different length
+            if asarray == 1:
+                return objectArray( prof )
+
+            if asarray == 0:
                 return list( prof )
 
             raise ProfileError, "Cannot create array from given list. %r"\
@@ -662,8 +697,9 @@ class ProfileCollection:
         @param default: value for items masked.
                         (default: None for lists, 0 for arrays]
         @type  default: any
-        @param asarray: store as list (0), as array (2) or store numbers as
-                        array but everything else as list (1) (default: 1)
+        @param asarray: store as list (0), as array of default numpy type (2)
+                        or store numbers as array of int or float and
+                        everything else as array of objects (1) (default: 1)
         @type  asarray: 0|1|2
         @param comment: goes into info[name]['comment']
         @type  comment: str
@@ -690,8 +726,9 @@ class ProfileCollection:
 
         prof = self.array_or_list( prof, asarray )
 
-        ## use default == 0 for arrays
-        if not default and isinstance( prof, N.ndarray ):
+        ## use default == 0 for arrays of numbers
+        if not default and isinstance( prof, N.ndarray ) \
+           and prof.dtype.char != 'O':
             default = 0
 
         ## expand profile to have a value also for masked positions
@@ -850,7 +887,7 @@ class ProfileCollection:
                 prof = self.get( key )
 
                 if isinstance( prof, N.ndarray ):
-                    result.set( key, N.take( prof, indices ) )
+                    result.set( key, N.take( prof, indices, 0 ) )
                 else:
                     result.set( key, [ prof[i] for i in indices ], asarray=0 )
 
@@ -933,11 +970,12 @@ class ProfileCollection:
         for k, p in self.profiles.items():
 
             try:
-                if isinstance( p, N.ndarray ):
-                    r.set( k, N.concatenate( (p, next.get(k)) ),
-                           **self.infos[k] )
+                q = next.get(k)
+
+                if isinstance( p, N.ndarray ) or isinstance( q, N.ndarray ):
+                    r.set( k, N.concatenate( (p, q) ), **self.infos[k] )
                 else:
-                    r.set( k, p + next.get(k), **self.infos[k] )
+                    r.set( k, p + q, **self.infos[k] )
             except:
                 EHandler.warning("Profile %s skipped during concat." % k, 
                                  error=0)
@@ -1031,7 +1069,7 @@ class ProfileCollection:
         for key, prof in source.items():
 
             ## replace "None" profiles
-            if key in self and self.profiles[ key ] in (None, []):
+            if key in self and self.__isEmpty( key ):
                 self.set( key, prof, changed=setChanged )
 
             ## add profiles that exist in source but not yet in this collection
@@ -1041,15 +1079,20 @@ class ProfileCollection:
 
                 self.set( key, prof, **info )
 
-        if not allowEmpty and ( None in self.profiles.values() \
-                                or [] in self.profiles.values() ):
-            for key, prof in self.profiles.items():
-                if not prof:
+        if not allowEmpty:
+            for key in self.profiles:
+                if self.__isEmpty( key ):
                     raise ProfileError, \
                           ('Trying to update %s profile but cannot find'\
                            + ' it in source.') % key
 
 
+    def __isEmpty( self, key ):
+        """profile is None or an empty list (but not an empty array)"""
+        p = self.profiles[ key ]
+        return p is None or ( type( p ) is list and len( p ) == 0 )
+
+
     def isChanged( self, keys=None ):
         """
         @param keys: only check these profiles (default: None -> means all)
@@ -1349,12 +1392,53 @@ class Test(BT.BiskitTest):
         empty = ProfileCollection()
         double = self.p3.concat( self.p3 )
         self.p5 = empty.concat( self.p3 )
-        self.assertEqual( self.p3['letters'], self.p5['letters'] )
+        self.assert_( N.all( self.p3['letters'] == self.p5['letters'] ) )
         
         self.p5 = self.p3.concat( empty, empty, self.p3 )
-        self.assertEqual( double['letters'], self.p5['letters'] )
+        self.assert_( N.all( double['letters'] == self.p5['letters'] ) )
+        self.assertEqual( ''.join( self.p5['letters'][:3] ), 'abc' )
         
 
+    def test_arrays(self):
+        """ProfileCollection object arrays and legacy list profiles test"""
+        import cPickle
+
+        self.p6 = ProfileCollection()
+        self.p6['names'] = [ 'CA', 'CB', 'N', 'OXT' ]
+        self.p6['tuples'] = [ ('a',2), ('b',4), ('c',6), ('d',8) ]
+        self.p6['numbers'] = range( 4 )
+        self.p6['rows'] = [ [1., 2., 3.] ] * 4
+        self.p6['matrix'] = N.ones( (4, 3) )
+
+        self.assertEqual( self.p6['names'].dtype, N.dtype( 'O' ) )
+        self.assertEqual( self.p6['tuples'].shape, (4,) )
+        self.assertEqual( self.p6['rows'].shape, (4, 3) )
+        self.assert_( self.p6['rows'].dtype.char in 'fd' )
+        self.assert_( N.all( N.sum( self.p6['rows'], 0 ) == [4., 8., 12.] ) )
+        self.assert_( self.p6['matrix'].dtype.char in 'fd' )
+        self.assert_( self.p6.getInfo( 'names' )['isarray'] )
+
+        self.p6['names'][0] = 'CA_long'   ## no fixed-width truncation
+        self.p7 = self.p6.take( [3, 0] )
+        self.assertEqual( list( self.p7['names'] ), [ 'OXT', 'CA_long' ] )
+        self.assertEqual( self.p7['tuples'][1], ('a',2) )
+        self.assertEqual( self.p7['rows'].shape, (2, 3) )
+        self.assertEqual( self.p6.compress( N.array( [1,0,1,0] ) )['matrix'].shape,
+                          (2, 3) )
+
+        ## pickle of older version with list profile
+        state = self.p6.__dict__.copy()
+        state['profiles'] = { 'names' : [ 'CA', 'CB' ] }
+        state['infos'] = { 'names' : { 'isarray' : False } }
+        self.p8 = ProfileCollection()
+        self.p8.__setstate__( state )
+
+        self.assert_( isinstance( self.p8['names'], N.ndarray ) )
+        self.assert_( self.p8.getInfo( 'names' )['isarray'] )
+
+        self.p9 = cPickle.loads( cPickle.dumps( self.p6, 2 ) )
+        self.assertEqual( list( self.p9['names'] ), list( self.p6['names'] ) )
+
     def test_crossvies(self):
         """ProfileCollection.crossviews test"""
         import string
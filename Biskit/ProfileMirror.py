@@ -173,7 +173,7 @@ class ProfileMirror( B.ProfileCollection ):
         ## take array status from existing profile
         if not r is 0:
             if self.pc.get( (name, 'isarray') ):
-                asarray = 2
+                asarray = 1
             else:
                 asarray = 0
 
@@ -300,7 +300,7 @@ if __name__ == '__main__':
     ## mirror looks at every second position
     mirror = ProfileMirror( p, range(0, len(string.letters), 2 ) )
 
-    assert mirror['name'] == list( string.letters[::2] )
+    assert list( mirror['name'] ) == list( string.letters[::2] )
     assert N.all( mirror['id'] == range( 0, p.profLength(), 2 ) )
 
     ## create a new profile
@@ -309,6 +309,6 @@ if __name__ == '__main__':
 
     mirror['name'][2] = '#'  ## does not have any effect
     mirror['name'] = ['#'] * mirror.profLength()
-    assert p['name'][::2] == ['#'] * mirror.profLength()
-    assert p['name'][1::2]== list( string.letters[1::2] )
+    assert list( p['name'][::2] ) == ['#'] * mirror.profLength()
+    assert list( p['name'][1::2] ) == list( string.letters[1::2] )
     
@@ -31,6 +31,7 @@ from Biskit.PDBDope import PDBDope
 from Biskit import EHandler
 
 import Biskit.tools as T
+import Biskit.mathUtils as mathUtils
 
 import numpy.oldnumeric as N
 
@@ -162,42 +163,19 @@ class Ramachandran:
     def phi_and_psi( self, model ):
         """
         Calculate phi and psi torsion angles for all
-        residues in model::
+        residues in model (see L{Biskit.PDBModel.dihedrals})::
         
-          phi - rotation about the N-CA bond
+          phi - rotation about the N-CA bond, C(i-1)-N-CA-C
+              - first position in a chain = None
+          psi - rotation about CA-C, N-CA-C-N(i+1)
               - last position in a chain = None
-          psi - rotation about CA-C
-              - first position in a chain = None          
 
         @param model: PDBModel
         @type  model: PDBModel 
         """
-        for c in range( model.lenChains(breaks=1) ):
-            cModel = model.takeChains( [c], breaks=1 )
-
-            xyz = cModel.xyz
-
-            xyz_CA =  N.compress( cModel.maskCA(), xyz, 0 )
-            xyz_N  =  N.compress( cModel.mask( ['N'] ), xyz, 0 )
-            xyz_C  =  N.compress( cModel.mask( ['C'] ), xyz, 0 )
-
-            ## phi: c1 - N
-            ##      c2 - CA
-            ##      c3 - C
-            ##      c4 - N of next residue
-            for i in range( len(xyz_N)-1 ):
-                self.phi += [self.dihedral( xyz_N[i], xyz_CA[i],
-                                            xyz_C[i], xyz_N[i+1] )]
-            self.phi += [None]
-
-            ## psi: c1 - C of previous residue  
-            ##      c2 - N
-            ##      c3 - CA
-            ##      c4 - C
-            self.psi += [None]
-            for i in range( 1, len(xyz_N) ):
-                self.psi += [self.dihedral( xyz_C[i-1], xyz_N[i],
-                                            xyz_CA[i], xyz_C[i] )]
+        for angles, name in [ ( self.phi, 'phi' ), ( self.psi, 'psi' ) ]:
+            r = model.dihedrals( name )
+            angles += [ None if N.isnan( a ) else a for a in r ]
 
 
     def dihedral( self, coor1, coor2, coor3, coor4 ):
@@ -205,6 +183,7 @@ class Ramachandran:
         Calculates the torsion angle of a set of four atom coordinates.
         The dihedral angle returned is the angle between the projection
         of i1-i2 and the projection of i4-i3 onto a plane normal to i2-i3.
+        (see L{Biskit.mathUtils.dihedral})
 
         @param coor1: coordinates
         @type  coor1: [float]
@@ -215,30 +194,7 @@ class Ramachandran:
         @param coor4: coordinates
         @type  coor4: [float]        
         """
-        vec21 = coor2 - coor1
-        vec32 = coor3 - coor2
-        L = N.cross( vec21, vec32 )
-        L_norm = N.sqrt(sum(L**2))
-
-        vec43 = coor4 - coor3
-        vec23 = coor2 - coor3
-        R = N.cross( vec43, vec23 )
-        R_norm = N.sqrt(sum(R**2))
-
-        S     = N.cross( L, R )
-        angle = sum( L*R ) / ( L_norm * R_norm )
-
-        ## sometimes the value turns out to be ever so little greater than 
-        ## one, to prevent N.arccos errors for this, set angle = 1.0
-        if angle >  1.0: angle = 1.0
-            
-        if angle < -1.0: angle = -1.0
-
-        angle = N.arccos(angle) *180/N.pi
-        if sum(S*vec32) < 0.0:
-            angle = -angle
-
-        return angle
+        return mathUtils.dihedral( coor1, coor2, coor3, coor4 )
 
     
     def ramachandran( self ):
@@ -268,14 +224,14 @@ class Ramachandran:
             ## don't add termini - has missing angles
             if self.phi[i] and self.psi[i]:
                 if i in self.gly:
-                    p += [biggles.Point( self.psi[i], self.phi[i],
+                    p += [biggles.Point( self.phi[i], self.psi[i],
                                          type="star", size=1, color=col[i] )]
                 elif i in self.pro:
-                    p += [biggles.Point( self.psi[i], self.phi[i],
+                    p += [biggles.Point( self.phi[i], self.psi[i],
                                          type="filled square", size=1,
                                          color=col[i] )]
                 else:
-                    p += [biggles.Point( self.psi[i], self.phi[i],
+                    p += [biggles.Point( self.phi[i], self.psi[i],
                                          type="filled circle", size=1,
                                          color=col[i] )]
         return p, inset
@@ -356,13 +312,13 @@ class Test(BT.BiskitTest):
         self.rama = Ramachandran( self.mdl , name='test', profileName='mass',
                                   verbose=self.local)
 
-        self.psi = N.array( self.rama.psi )
+        self.phi = N.array( self.rama.phi )
 
         if self.local:
             self.rama.show()
             
-        r = N.sum( N.compress( N.logical_not(N.equal(self.psi, None)),
-                               self.psi ) )
+        r = N.sum( N.compress( N.logical_not(N.equal(self.phi, None)),
+                               self.phi ) )
         self.assertAlmostEqual( r, -11717.909796797909, 2 )
 
  
@@ -27,6 +27,8 @@
 Create structures with reduced number of atoms.
 """
 
+import copy
+
 from PDBModel import PDBModel
 from DictList import DictList
 import numpy.oldnumeric as N
@@ -34,6 +36,104 @@ import tools as T
 import molUtils as MU
 
 
+class ReductionMatrix:
+    """
+    Sparse (N_rows x N_columns) matrix in compressed row (CSR) layout for
+    weighted sums over groups of atoms. Row i has the entries
+    data[ indptr[i] : indptr[i+1] ] in the columns (atoms)
+    indices[ indptr[i] : indptr[i+1] ]. L{dot} multiplies the matrix with
+    coordinates or profiles along any axis with a single take and
+    add.reduceat instead of one sum per group.
+    """
+
+    def __init__( self, groups, n_columns, weights=None ):
+        """
+        @param groups: column (atom) indices of each row
+        @type  groups: [ [int] ]
+        @param n_columns: number of columns (atoms)
+        @type  n_columns: int
+        @param weights: weight of each column, e.g. atom masses
+                        (default: None -> 1)
+        @type  weights: [float]
+        """
+        lengths = N.array( [ len( g ) for g in groups ], N.Int )
+
+        self.shape = ( len( groups ), n_columns )
+        self.indptr = N.concatenate( ( [0], N.cumsum( lengths ) ) )
+        self.indices = N.concatenate( [ N.array( g, N.Int ) for g in groups ]
+                                      + [ N.zeros( 0, N.Int ) ] )
+
+        if weights is None:
+            self.data = N.ones( len( self.indices ), N.Float )
+        else:
+            self.data = N.take( N.array( weights, N.Float ), self.indices )
+
+
+    def normalized( self ):
+        """
+        @return: copy of the matrix with the entries of each row summing
+                 up to 1 (dot then gives weighted averages)
+        @rtype: ReductionMatrix
+        """
+        totals = self.dot( N.ones( self.shape[1], N.Float ) )
+
+        r = copy.copy( self )
+        r.data = self.data / N.repeat( totals,
+                                       self.indptr[1:] - self.indptr[:-1] )
+        return r
+
+
+    def dot( self, a, axis=0 ):
+        """
+        Multiply the matrix with an array along one of its axes, e.g.
+        reduce (N_frames x N_atoms x 3) to (N_frames x N_rows x 3) along
+        axis 1. Empty rows give 0.
+
+        @param a: array with N_columns items along axis
+        @type  a: array
+        @param axis: axis of a to be reduced (default: 0)
+        @type  axis: int
+
+        @return: array with N_rows items along axis
+        @rtype: array of float
+        """
+        x = N.take( a, self.indices, axis )
+
+        shape = [1] * len( N.shape( x ) )
+        shape[ axis ] = len( self.data )
+        x = x * N.reshape( self.data, shape )
+
+        start, end = self.indptr[:-1], self.indptr[1:]
+        filled = N.greater( end, start )
+
+        if N.alltrue( filled ):
+            return N.add.reduceat( x, start, axis )
+
+        shape = list( N.shape( x ) )
+        shape[ axis ] = self.shape[0]
+        r = N.zeros( shape, x.dtype.char )
+
+        if len( self.data ):
+            r_filled = N.add.reduceat( x, N.compress( filled, start ), axis )
+            sl = [ slice( None ) ] * len( shape )
+            sl[ axis ] = N.flatnonzero( filled )
+            r[ tuple( sl ) ] = r_filled
+
+        return r
+
+
+    def toarray( self ):
+        """
+        @return: dense version of the matrix
+        @rtype: array (N_rows x N_columns) of float
+        """
+        r = N.zeros( self.shape, N.Float )
+        rows = N.repeat( N.arange( self.shape[0] ),
+                         self.indptr[1:] - self.indptr[:-1] )
+        r[ rows, self.indices ] = self.data
+        return r
+
+
 class ReduceCoordinates:
     """
     ReduceCoordinates
@@ -59,10 +159,17 @@ class ReduceCoordinates:
       >>> ## reduce a complete Trajectory
       >>> reducer = ReduceCoordinates( traj.ref )
       >>> red_ref= reducer.reduceToModel()
-      >>> frames = reducer.reduceXyz( traj.frames )
+      >>> frames = reducer.reduceFrames( traj )
       >>> traj_red = Trajectory( ref=red_ref )
       >>> traj_red.frames = frames
+
+    The grouping is calculated once and stored as sparse mass-weighted
+    (N_centers x N_atoms) L{ReductionMatrix} so that each block of
+    frames is reduced in a single step.
     """
+    #: frames reduced at a time by reduceFrames
+    BLOCKSIZE = 256
+
     ## modify order of TYR/PHE ring atoms to move centers away from ring axis
     aaAtoms = MU.aaAtoms
     aaAtoms['TYR'] = ['N','CA','C','O','CB','CG','CD1','CE1','CD2',
@@ -209,6 +316,7 @@ class ReduceCoordinates:
         Calculate mapping between complete and reduced atom list.
         Creates a (list of lists of int, list of atom dictionaries)
         containing groups of atom indices into original model, new center atoms
+        and the reduction matrices built from the groups.
         
         @param maxPerCenter: max number of atoms per side chain center atom
                              (default: 4)
@@ -268,6 +376,13 @@ class ReduceCoordinates:
         self.groups = groups
         self.atoms = atoms
 
+        ## sparse (N_centers x N_atoms) matrices for sums, averages and
+        ## centers of mass over the atom groups
+        mass = self.m.atoms.get('mass')
+        self.sums = ReductionMatrix( groups, len( self.m ) )
+        self.averages = self.sums.normalized()
+        self.matrix = ReductionMatrix( groups, len( self.m ), mass ).normalized()
+
 
     def reduceXyz( self, xyz, axis=0 ):
         """
@@ -281,32 +396,57 @@ class ReduceCoordinates:
         @type  axis: int
         
         @return: coordinate array (N_less_atoms x 3) or
-                 (N_frames x N_less_atoms x 3)
+                 (N_frames x N_less_atoms x 3) of the same float type as xyz
         @rtype: array
         """
-        masses = self.m.atoms.get('mass')
-        r_xyz = None
+        xyz = N.asarray( xyz )
 
-        for atom_indices in self.groups:
+        if axis == 1 and len( xyz ) > self.BLOCKSIZE:
+            return self.reduceFrames( xyz )
 
-            x = N.take( xyz, atom_indices, axis )
-            m = N.take( masses, atom_indices )
+        r = self.matrix.dot( xyz, axis )
 
-            center = N.sum( x * N.transpose([m,]), axis=axis) / N.sum( m )
+        if xyz.dtype.char in N.typecodes['Float']:
+            r = r.astype( xyz.dtype )
 
-            if axis == 0:
-                center = center[N.NewAxis, :]
+        return r
 
-            if axis == 1:
-                center = center[:, N.NewAxis, :]
 
-            if r_xyz == None:
-                r_xyz = center
+    def reduceFrames( self, frames, blocksize=None ):
+        """
+        Reduce many frames block by block, e.g. all frames of a (memory
+        mapped) Trajectory. Only one block of frames is in memory at a
+        time besides the result, which keeps the float type of the frames.
 
-            else:
-                r_xyz = N.concatenate( (r_xyz, center), axis )
+        @param frames: Trajectory or coordinates (N_frames x N_atoms x 3)
+        @type  frames: Trajectory OR array
+        @param blocksize: frames reduced at a time (default: BLOCKSIZE)
+        @type  blocksize: int
+
+        @return: coordinates (N_frames x N_less_atoms x 3)
+        @rtype: array
+        """
+        blocksize = blocksize or self.BLOCKSIZE
+
+        if hasattr( frames, 'frameBlocks' ):
+            blocks = frames.frameBlocks( blocksize=blocksize )
+            shape = ( frames.lenFrames(), self.matrix.shape[0], 3 )
+            dtype = frames.frames.dtype
+        else:
+            blocks = [ ( i, frames[ i : i+blocksize ] )
+                       for i in range( 0, len( frames ), blocksize ) ]
+            shape = ( len( frames ), self.matrix.shape[0], 3 )
+            dtype = frames.dtype
+
+        if dtype.char not in N.typecodes['Float']:
+            dtype = N.Float
+
+        r = N.zeros( shape, dtype )
 
-        return r_xyz
+        for start, block in blocks:
+            r[ start : start+len( block ) ] = self.matrix.dot( block, 1 )
+
+        return r
 
 
     def reduceToModel( self, xyz=None, reduce_profiles=1  ):
@@ -325,7 +465,7 @@ class ReduceCoordinates:
         mass = self.m.atoms.get('mass')
         if xyz is None: xyz = self.m.getXyz()
 
-        mProf = [ N.sum( N.take( mass, group ) ) for group in self.groups ]
+        mProf = self.sums.dot( mass )
         xyz = self.reduceXyz( xyz )
 
         result = PDBModel()
@@ -349,7 +489,8 @@ class ReduceCoordinates:
     def reduceAtomProfiles( self, from_model, to_model ):
         """
         reduce all atom profiles according to the calculated map by calculating
-        the average over the grouped atoms.
+        the average over the grouped atoms. Profiles that are not numbers
+        are skipped.
         
         @param from_model: model
         @type  from_model: PDBModel
@@ -362,7 +503,7 @@ class ReduceCoordinates:
             info = from_model.profileInfo( profname )
 
             try:
-                pr = [ N.average( N.take( p0, group ) ) for group in self.groups ]
+                pr = self.averages.dot( N.array( p0, N.Float ) )
 
                 to_model.atoms.set( profname, pr )
             except:
@@ -380,12 +521,14 @@ import Biskit.test as BT
 class Test(BT.BiskitTest):
     """Test"""
 
-    def test_ReduceCoordinates(self):
-        """ReduceCoordinates test"""
-
+    def prepare( self ):
+        from Biskit import PDBModel   ## same class as Trajectory uses
         self.m = PDBModel( T.testRoot()+'/com/1BGS.pdb' )
         self.m = self.m.compress( N.logical_not( self.m.maskH2O() ) )
 
+    def test_ReduceCoordinates(self):
+        """ReduceCoordinates test"""
+
         self.m.atoms.set('test', range(len(self.m)))
 
         self.red = ReduceCoordinates( self.m, 4 )
@@ -397,6 +540,49 @@ class Test(BT.BiskitTest):
             print 'Atoms After reduction %i'% self.mred.lenAtoms()
 
         self.assertEqual( self.mred.lenAtoms(), 445 )
+        self.assertEqual( self.mred.xyz.dtype, self.m.xyz.dtype )
+
+        ## compare to explicit averages over each group
+        mass = self.m['mass']
+        for i in [0, 1, 100, 444]:
+            g = self.red.groups[i]
+            m = N.take( mass, g )
+            x = N.sum( N.take( self.m.xyz, g ) * m[:,N.NewAxis] ) / N.sum( m )
+
+            self.assert_( N.all( N.absolute( self.mred.xyz[i] - x ) < 1e-4 ) )
+            self.assertAlmostEqual( self.red.sums.dot( mass )[i], N.sum(m), 4 )
+            self.assertAlmostEqual( self.mred['test'][i],
+                                    N.average( N.take( self.m['test'], g ) ), 4 )
+
+    def test_reduceFrames( self ):
+        """ReduceCoordinates.reduceFrames test"""
+        from Biskit import Trajectory
+
+        self.red = ReduceCoordinates( self.m, 4 )
+
+        frames = N.array( [ self.m.xyz + i for i in range( 10 ) ], N.Float32 )
+        self.t = Trajectory( [ self.m ] * 10, verbose=self.local )
+        self.t.frames = frames
+
+        dense = self.red.matrix.toarray()
+        ref = N.array( [ N.dot( dense, f ) for f in frames ] )
+
+        r1 = self.red.reduceXyz( frames, axis=1 )
+        r2 = self.red.reduceFrames( self.t, blocksize=3 )
+
+        self.assertEqual( N.shape( r2 ), ( 10, 445, 3 ) )
+        self.assert_( N.all( N.absolute( r1 - ref ) < 1e-3 ) )
+        self.assert_( N.all( N.absolute( r2 - ref ) < 1e-3 ) )
+        self.assert_( N.all( N.absolute( r2[3] - r2[0] - 3 ) < 1e-3 ) )
+
+        ## same float type with and without blocks
+        self.red.BLOCKSIZE = 4
+        r3 = self.red.reduceXyz( frames, axis=1 )
+
+        self.assert_( N.all( r3 == r2 ) )
+        for r in [ r1, r2, r3, self.red.reduceXyz( frames[0] ) ]:
+            self.assertEqual( r.dtype, frames.dtype )
+
 
 if __name__ == '__main__':
 
@@ -0,0 +1,415 @@
+##
+## Biskit, a toolkit for the manipulation of macromolecular structures
+## Copyright (C) 2004-2012 Raik Gruenberg & Johan Leckner
+##
+## This program is free software; you can redistribute it and/or
+## modify it under the terms of the GNU General Public License as
+## published by the Free Software Foundation; either version 3 of the
+## License, or any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+## General Public License for more details.
+##
+## You find a copy of the GNU General Public License in the file
+## license.txt along with this program; if not, write to the Free
+## Software Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+##
+##
+## last $Author$
+## last $Date$
+## $Revision$
+"""
+On-disk cache for results of external programs.
+"""
+
+import hashlib, os, re, threading, cPickle
+import os.path as osp
+import numpy as N
+
+import Biskit.tools as T
+from Biskit.Errors import BiskitError
+
+
+class ResultCacheError( BiskitError ):
+    pass
+
+
+class ResultCache:
+    """
+    Content-addressed on-disk cache for the results of expensive
+    calculations on a structure, e.g. of the external programs called by
+    L{Biskit.PDBDope}::
+
+      cache = ResultCache()
+      key = cache.key( 'dssp', model )
+      try:
+          ss = cache[ key ]
+      except KeyError:
+          ss = cache[ key ] = Dssp( model ).run()
+
+    or, shorter, C{ss = cache.call( 'dssp', Dssp( model ).run, model )}.
+
+    The key is a hash of the program name, the model's atom content
+    (atom and residue names, see PDBModel.atomkey) and coordinates and
+    any further parameters. Each result is pickled into its own file in
+    the cache folder, so several processes can share a cache. A hit
+    refreshes the time stamp of its file and, once the cache grows beyond
+    its size limit, the least recently used entries are removed.
+
+    The number of hits and misses of this instance is reported by
+    L{stats}.
+    """
+
+    #: file extension of cache entries
+    EXT = '.cache'
+
+    #: memory address in a repr, e.g. <LogFile instance at 0x2b1f...>
+    ADDRESS = re.compile( ' at 0x[0-9a-fA-F]+' )
+
+    def __init__( self, folder=None, maxsize=None ):
+        """
+        @param folder: cache folder, created if needed
+                       (default: settings.cache_folder)
+        @type  folder: str
+        @param maxsize: max. total size of the cache in MB
+                        (default: settings.cache_size)
+        @type  maxsize: float
+        """
+        import Biskit.settings as S
+
+        self.folder = T.absfile( folder or S.cache_folder )
+        if maxsize is None:
+            maxsize = S.cache_size
+        self.maxsize = int( maxsize * 1024 * 1024 )
+
+        if not osp.exists( self.folder ):
+            try:
+                os.makedirs( self.folder )
+            except OSError, why:
+                if not osp.isdir( self.folder ):
+                    raise ResultCacheError, \
+                          'cannot create cache folder %s: %s' \
+                          % ( self.folder, why )
+
+        self.hits = 0
+        self.misses = 0
+
+
+    def __hash( self, h, x ):
+        """
+        add any (nested) parameter to the hash object h
+
+        @raise ResultCacheError: if x is only known by its memory address
+        """
+        if isinstance( x, N.ndarray ):
+            h.update( '%s%r' % ( x.dtype.str, x.shape ) )
+            h.update( N.ascontiguousarray( x ).tostring() )
+
+        elif isinstance( x, ( list, tuple ) ):
+            h.update( '%s%i(' % ( type( x ).__name__, len( x ) ) )
+            for v in x:
+                self.__hash( h, v )
+            h.update( ')' )
+
+        elif isinstance( x, dict ):
+            h.update( 'dict%i(' % len( x ) )
+            for k in sorted( x.keys() ):
+                self.__hash( h, k )
+                self.__hash( h, x[k] )
+            h.update( ')' )
+
+        else:
+            r = repr( x )
+
+            ## would give a new key in every run
+            if self.ADDRESS.search( r ):
+                raise ResultCacheError, \
+                      'cannot use %s in a cache key: %s' % ( type(x), r )
+
+            h.update( r + ';' )
+
+
+    def key( self, name, model=None, *params ):
+        """
+        @param name: name of program or calculation
+        @type  name: str
+        @param model: structure the calculation is done on (default: None)
+        @type  model: PDBModel
+        @param params: any further (picklable) parameters of the calculation
+        @type  params: any
+
+        @return: hex digest identifying the calculation
+        @rtype: str
+
+        @raise ResultCacheError: if a parameter has no stable repr
+        """
+        h = hashlib.sha1()
+        self.__hash( h, name )
+
+        if model is not None:
+            h.update( model.atomkey( compress=False ) )
+            self.__hash( h, list( model.atoms['residue_name'] ) )
+            self.__hash( h, N.array( model.getXyz(), N.float64 ) )
+
+        self.__hash( h, params )
+
+        return h.hexdigest()
+
+
+    def filename( self, key ):
+        """
+        @param key: cache key
+        @type  key: str
+        @return: file of this cache entry
+        @rtype: str
+        """
+        return osp.join( self.folder, key + self.EXT )
+
+
+    def __contains__( self, key ):
+        return osp.exists( self.filename( key ) )
+
+
+    def __getitem__( self, key ):
+        """
+        @raise KeyError: if there is no entry for this key
+        """
+        f = self.filename( key )
+
+        try:
+            r = T.load( f )
+            os.utime( f, None )
+        except ( IOError, OSError, EOFError ):
+            self.misses += 1
+            raise KeyError, key
+        except ( cPickle.UnpicklingError, ValueError, AttributeError,
+                 ImportError, IndexError, TypeError, KeyError ):
+            ## truncated file or class that has moved since
+            self.misses += 1
+            T.tryRemove( f )
+            raise KeyError, key
+
+        self.hits += 1
+        return r
+
+
+    def __setitem__( self, key, value ):
+        f = self.filename( key )
+
+        ## write under a private name first so readers never see half a file
+        tmp = '%s.%i_%i' % ( f, os.getpid(), id( threading.currentThread() ) )
+        T.dump( value, tmp )
+        os.rename( tmp, f )
+
+        self.evict()
+
+
+    def __delitem__( self, key ):
+        T.tryRemove( self.filename( key ) )
+
+
+    def get( self, key, default=None ):
+        """
+        @param key: cache key
+        @type  key: str
+        @param default: value returned if there is no entry (default: None)
+        @type  default: any
+
+        @return: cached value or default
+        @rtype: any
+        """
+        try:
+            return self[ key ]
+        except KeyError:
+            return default
+
+
+    def call( self, name, f, model=None, *params ):
+        """
+        Get the result of a calculation from the cache or calculate and
+        store it.
+
+        @param name: name of program or calculation
+        @type  name: str
+        @param f: function without arguments doing the calculation
+        @type  f: function
+        @param model: structure the calculation is done on (default: None)
+        @type  model: PDBModel
+        @param params: any further parameters of the calculation
+        @type  params: any
+
+        @return: result of f()
+        @rtype: any
+        """
+        key = self.key( name, model, *params )
+
+        try:
+            return self[ key ]
+        except KeyError:
+            r = self[ key ] = f()
+            return r
+
+
+    def entries( self ):
+        """
+        @return: ( last access time, size in bytes, file name ) of each
+                 entry, least recently used first
+        @rtype: [ (float, int, str) ]
+        """
+        r = []
+        for f in os.listdir( self.folder ):
+            if not f.endswith( self.EXT ):
+                continue
+            f = osp.join( self.folder, f )
+            try:
+                s = os.stat( f )
+                r.append( ( s.st_mtime, s.st_size, f ) )
+            except OSError:
+                pass                    ## removed by another process
+
+        r.sort()
+        return r
+
+
+    def size( self ):
+        """
+        @return: total size of all entries in bytes
+        @rtype: int
+        """
+        return sum( [ e[1] for e in self.entries() ] )
+
+
+    def evict( self ):
+        """
+        Remove least recently used entries until the cache fits into
+        its size limit.
+
+        @return: number of removed entries
+        @rtype: int
+        """
+        entries = self.entries()
+        total = sum( [ e[1] for e in entries ] )
+
+        n = 0
+        for t, size, f in entries:
+            if total <= self.maxsize:
+                break
+            T.tryRemove( f )
+            total -= size
+            n += 1
+
+        return n
+
+
+    def clear( self ):
+        """
+        Remove all entries.
+        """
+        for e in self.entries():
+            T.tryRemove( e[2] )
+
+
+    def stats( self ):
+        """
+        @return: hits and misses of this instance, number of entries and
+                 total size of the cache in bytes
+        @rtype: {str:int}
+        """
+        entries = self.entries()
+
+        return { 'hits':self.hits, 'misses':self.misses,
+                 'entries':len( entries ),
+                 'size':sum( [ e[1] for e in entries ] ) }
+
+
+#############
+##  TESTING
+#############
+import Biskit.test as BT
+
+class Test(BT.BiskitTest):
+    """ResultCache test"""
+
+    def prepare( self ):
+        import tempfile
+        from Biskit import PDBModel
+
+        self.folder = tempfile.mktemp( '_resultcache' )
+        self.m = PDBModel( T.testRoot() + '/lig/1A19.pdb' )
+
+    def cleanUp( self ):
+        T.tryRemove( self.folder, tree=True )
+
+    def test_key( self ):
+        """ResultCache.key test"""
+        self.c = ResultCache( self.folder, maxsize=1 )
+
+        k = self.c.key( 'prog', self.m, 1.4, N.ones( 3 ) )
+
+        self.assertEqual( k, self.c.key( 'prog', self.m.clone(), 1.4,
+                                         N.ones( 3 ) ) )
+        self.assertNotEqual( k, self.c.key( 'prog', self.m, 1.4,
+                                            N.zeros( 3 ) ) )
+        self.assertNotEqual( k, self.c.key( 'prog2', self.m, 1.4,
+                                            N.ones( 3 ) ) )
+
+        m = self.m.clone()
+        m.xyz[0,0] += 0.001
+        self.assertNotEqual( k, self.c.key( 'prog', m, 1.4, N.ones( 3 ) ) )
+
+        self.assertRaises( ResultCacheError, self.c.key, 'prog', self.m,
+                           { 'log':ResultCache } )
+
+    def test_cache( self ):
+        """ResultCache hit/miss and LRU eviction test"""
+        import time
+
+        self.c = ResultCache( self.folder, maxsize=0.5 )
+
+        calls = []
+        def f():
+            calls.append( 1 )
+            return N.arange( 1000 )
+
+        r1 = self.c.call( 'prog', f, self.m )
+        r2 = self.c.call( 'prog', f, self.m )
+
+        self.assert_( N.all( r1 == r2 ) )
+        self.assertEqual( len( calls ), 1 )
+        self.assertEqual( ( self.c.stats()['hits'],
+                            self.c.stats()['misses'] ), ( 1, 1 ) )
+
+        ## corrupt entry counts as miss and is calculated again
+        k = self.c.key( 'prog', self.m )
+        for junk in [ 'garbage\x00\x01', 'cBiskit.NoSuchModule\nX\n.' ]:
+            open( self.c.filename( k ), 'wb' ).write( junk )
+            self.assertEqual( self.c.get( k ), None )
+            self.failIf( k in self.c )
+
+        r3 = self.c.call( 'prog', f, self.m )
+        self.assert_( N.all( r1 == r3 ) )
+        self.assertEqual( len( calls ), 2 )
+        self.assertEqual( self.c.stats()['misses'], 4 )
+
+        ## ~ 120 kB per entry, only 4 fit into 0.5 MB
+        big = N.zeros( 15000 )
+        for i in range( 5 ):
+            self.c[ str( i ) ] = big
+            t = time.time() - 100 + i
+            os.utime( self.c.filename( str( i ) ), ( t, t ) )
+            if i == 1:
+                self.c[ '0' ]         ## access makes '0' most recent
+
+        self.assert_( self.c.size() <= self.c.maxsize )
+        self.assert_( '0' in self.c and '4' in self.c )
+        self.assert_( '1' not in self.c )
+
+        self.c.clear()
+        self.assertEqual( self.c.stats()['entries'], 0 )
+
+
+if __name__ == '__main__':
+
+    BT.localTest()
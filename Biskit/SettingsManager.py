@@ -28,7 +28,7 @@ import Biskit as B
 import Biskit.tools as T
 import Biskit.SettingsParser as P
 
-import os
+import os, sys, types
 
 class WriteCfgError( P.SettingsError ):
     pass
@@ -248,6 +248,104 @@ class SettingsManager:
         ns.update( d )
 
 
+class SettingsModule( types.ModuleType ):
+    """
+    Settings module that reads its configuration files only when one of
+    the parameters is first needed. Importing settings is then (almost)
+    free for programs that don't use them. Parameters defined directly in
+    the settings module are never overridden by the configuration files.
+    Use L{install} at the end of a settings module.
+    """
+
+    def __init__( self, original, fdefault, fuser, createmissing=True,
+                  error='Error importing Biskit settings' ):
+        """
+        @param original: original settings module (kept alive because its
+                         functions still use its namespace)
+        @type  original: module
+        @param fdefault: default configuration file
+        @type  fdedault: str
+        @param fuser: user configuration file
+        @type  fuser: str
+        @param createmissing: create user config file if missing
+        @type  createmissing: bool
+        @param error: message for errors while reading the configuration
+        @type  error: str
+        """
+        types.ModuleType.__init__( self, original.__name__ )
+
+        for k, v in original.__dict__.items():
+            if type( v ) is not types.ModuleType:
+                self.__dict__[ k ] = v
+
+        self._settings_original = original
+        self._settings_args = ( fdefault, fuser, createmissing, error )
+        self._settings_loaded = False
+
+
+    def load( self ):
+        """
+        Read configuration files (if not yet done) and add their parameters
+        to the module.
+        """
+        if self._settings_loaded:
+            return
+
+        self._settings_loaded = True
+        fdefault, fuser, createmissing, error = self._settings_args
+
+        try:
+            m = SettingsManager( fdefault, fuser, createmissing=createmissing )
+
+            ns = {}
+            m.updateNamespace( ns )
+
+            for k, v in ns.items():
+                self.__dict__.setdefault( k, v )
+
+        except Exception, why:
+            B.EHandler.fatal( error )
+
+
+    def __getattr__( self, name ):
+        if name.startswith( '__' ) or self._settings_loaded:
+            raise AttributeError, "'module' object %s has no attribute '%s'"\
+                  % ( self.__name__, name )
+
+        self.load()
+        return getattr( self, name )
+
+
+def install( name, fdefault, fuser, createmissing=True,
+             error='Error importing Biskit settings' ):
+    """
+    Replace a settings module by a L{SettingsModule} that reads the
+    configuration files on first access. Call at the end of the settings
+    module::
+
+      SettingsManager.install( __name__, default_cfg, user_cfg )
+
+    @param name: module name (__name__)
+    @type  name: str
+    @param fdefault: default configuration file
+    @type  fdedault: str
+    @param fuser: user configuration file
+    @type  fuser: str
+    @param createmissing: create user config file if missing
+    @type  createmissing: bool
+    @param error: message for errors while reading the configuration
+    @type  error: str
+
+    @return: new settings module
+    @rtype: SettingsModule
+    """
+    m = SettingsModule( sys.modules[ name ], fdefault, fuser,
+                        createmissing=createmissing, error=error )
+    sys.modules[ name ] = m
+
+    return m
+
+
 #############
 ##  TESTING        
 #############
@@ -28,6 +28,7 @@ Memory saving representation of a sparse array.
 """
 
 import numpy.oldnumeric as N
+import numpy as npy
 import types
 import copy
 
@@ -82,6 +83,19 @@ class SparseArray:
 
     A typical application example are atom contact matrices that are
     large (N_atoms x N_atoms) but consist mostly of zeros.
+
+    The positions of non-default values are kept in sorted numpy arrays
+    and are looked up by binary search. 1-D arrays store the positions
+    in L{indices} and the values in L{values}. Arrays with more
+    dimensions use a compressed row (CSR) layout: the entries of row i
+    are values[ indptr[i] : indptr[i+1] ] at the positions
+    indices[ indptr[i] : indptr[i+1] ] of the raveled row. Several
+    values are best set, read or added at once with L{put}, L{take},
+    L{extend} or from a dense array.
+
+    The rows of a multi-dimensional array (this[i]) are SparseArrays of
+    one dimension less that write changes of their values back into the
+    row of this array; they cannot be resized.
     """
 
     def __init__( self, array_or_shape=0, typecode='f', default=0. ):
@@ -99,13 +113,11 @@ class SparseArray:
         @param default: value of majority of array content (default: 0.)
         @type  default: any
         """
-        self.values  = []
-        self.indices = []
         self.__default = default
         self.__typecode= typecode
 
-        self.__last_pos = 0  ## cache last position manipulated
-        self.__last_i = 0    ## cache last index manipulated
+        ## (array, row) that this array is a row of, see L{__row}
+        self.__parent = None
 
         a = array_or_shape
         atype = type( a )
@@ -120,36 +132,248 @@ class SparseArray:
                     raise SparseArrayError, '%s argument not allowed.' %\
                           str(atype)
 
+        self.shape = tuple( self.shape )
         self.is1D = len( self.shape ) == 1
 
-        if not self.is1D:
-            ## multidimensional
-            self.__default = SparseArray( self.shape[1:], typecode, default )
-            self.__typecode = 'SA'
+        self.__setRaveled( npy.zeros( 0, int ), [] )
 
         if atype is N.arraytype or atype is list :
             self.__setAll( a )
 
 
-    def __setAll_1D( self, a ):
+    def __setstate__( self, state ):
+        """
+        Called for unpickling the object. Converts pickles of older
+        versions which kept lists of indices and values (and nested
+        SparseArrays for each row).
         """
-        Replace content of this sparseArray with values from Numeric array
-        or list of numbers -- only for 1-dimensional arrays.
+        self.__dict__.update( state )
+        self.__parent = None
+
+        if isinstance( self.values, list ):
+            self.__convertLists()
+
 
-        @param a: array OR list
-        @type  a: array OR [ number ]
+    def __getstate__( self ):
         """
-        if type( a ) is list:
-            a = N.array( a, self.__typecode )
+        Called for pickling (and copying) the object. A row is stored
+        without the array it belongs to.
+        """
+        state = self.__dict__.copy()
+        state.pop( '_SparseArray__parent', None )
+        return state
 
-        if self.shape != a.shape:
-            raise SparseArrayError, 'dimensions not aligned'
 
-        self.indices = N.nonzero( N.logical_not( N.equal(a, self.__default) ) )
-        self.indices = self.indices.tolist()
+    def __convertLists( self ):
+        """
+        Replace the lists (and row objects) of an old SparseArray by
+        the numpy arrays of this version.
+        """
+        for k in ['_SparseArray__last_pos', '_SparseArray__last_i']:
+            self.__dict__.pop( k, None )
+
+        if self.is1D:
+            self.__setRaveled( npy.array( self.indices, int ), self.values )
+            return
+
+        ## old rows and default are SparseArrays of one dimension less
+        rows = [ self.__default ] + self.values
+        for r in rows:
+            if isinstance( r.values, list ):
+                r.__convertLists()
+
+        self.__typecode = self.__default.typecode()
+        self.__default  = self.__default.default()
+
+        n = self.__rowLength()
+        idx = [ r.nondefault() + n * i
+                for i, r in zip( self.indices, self.values ) ]
+        val = [ r.nondefault_values() for r in self.values ]
+
+        self.__setRaveled( npy.concatenate( [ npy.zeros( 0, int ) ] + idx ),
+                           npy.concatenate( [ self.__values( [] ) ] + val ) )
+
+
+    def __rowLength( self ):
+        """
+        @return: number of elements in each (raveled) row
+        @rtype: int
+        """
+        return int( npy.prod( self.shape[1:] ) )
+
+
+    def __size( self ):
+        """
+        @return: number of elements in the raveled array
+        @rtype: int
+        """
+        return int( npy.prod( self.shape ) )
+
+
+    def __values( self, v ):
+        """
+        @return: values as array of the type of this array
+        @rtype: array
+        """
+        if self.__typecode == 'O':
+            r = npy.empty( len( v ), 'O' )
+            r[:] = list( v )
+            return r
+
+        return npy.array( v, self.__typecode )
+
+
+    def __setRaveled( self, idx, val ):
+        """
+        Replace the content by non-default values at positions of the
+        raveled array.
+
+        @param idx: sorted positions in the raveled array
+        @type  idx: array of int
+        @param val: values for these positions
+        @type  val: array
+        """
+        idx = npy.asarray( idx, int )
+        val = self.__values( val )
+
+        if self.is1D:
+            self.indices, self.values = idx, val
+            return
+
+        n = self.__rowLength()
+        rows = idx // n
+
+        self.indptr  = npy.searchsorted( rows, npy.arange( self.shape[0]+1 ) )
+        self.indices = idx - rows * n
+        self.values  = val
+
+
+    def __putRaveled( self, idx, val ):
+        """
+        Set values at positions of the raveled array. Default values
+        delete an entry. If a position is given several times, the last
+        value is used.
+
+        @param idx: positions in the raveled array
+        @type  idx: array of int
+        @param val: values for these positions
+        @type  val: array
+        """
+        idx = npy.asarray( idx, int )
+        val = self.__values( val )
+
+        ## keep last value of repeated positions
+        idx, last = npy.unique( idx[::-1], return_index=True )
+        val = val[::-1][ last ]
+
+        old = self.nondefault()
+        keep = npy.logical_not( npy.in1d( old, idx ) )
+
+        new = self.__nondefaultMask( val )
+
+        idx = npy.concatenate( ( old[ keep ], idx[ new ] ) )
+        val = npy.concatenate( ( self.values[ keep ], val[ new ] ) )
+
+        order = npy.argsort( idx, kind='mergesort' )
+
+        self.__setRaveled( idx[ order ], val[ order ] )
+
+
+    def __segment( self, row ):
+        """
+        @return: start and end of the entries of a row in indices / values
+        @rtype: int, int
+        """
+        if self.is1D:
+            return 0, len( self.indices )
 
-        self.values = N.take( a, self.indices )
-        self.values = self.values.tolist()
+        return self.indptr[ row ], self.indptr[ row+1 ]
+
+
+    def __splice( self, row, a, b, idx, val ):
+        """
+        Replace the entries a:b (all in one row) by new entries without
+        rebuilding the whole array.
+
+        @param row: row of the replaced entries (ignored for 1-D)
+        @type  row: int
+        @param a: first replaced entry
+        @type  a: int
+        @param b: end of replaced entries
+        @type  b: int
+        @param idx: positions of the new entries within the (raveled) row
+        @type  idx: array of int
+        @param val: values of the new entries
+        @type  val: array
+        """
+        idx = npy.asarray( idx, int )
+
+        self.indices = npy.concatenate( ( self.indices[:a], idx,
+                                          self.indices[b:] ) )
+        self.values = npy.concatenate( ( self.values[:a], val,
+                                         self.values[b:] ) )
+
+        if not self.is1D:
+            self.indptr[ row+1: ] += len( idx ) - ( b - a )
+
+
+    def __putOne( self, row, col, v ):
+        """
+        Set a single element, found by binary search within its row.
+
+        @param row: row (ignored for 1-D)
+        @type  row: int
+        @param col: position within the (raveled) row
+        @type  col: int
+        @param v: value
+        @type  v: any
+        """
+        a, b = self.__segment( row )
+        pos = a + npy.searchsorted( self.indices[ a:b ], col )
+        found = pos < b and self.indices[ pos ] == col
+
+        v = self.__values( [ v ] )
+
+        if not self.__nondefaultMask( v )[0]:
+            if found:
+                self.__splice( row, pos, pos+1, [], v[:0] )
+
+        elif found:
+            self.values[ pos ] = v[0]
+
+        else:
+            self.__splice( row, pos, pos, [ col ], v )
+
+
+    def __putRow( self, i, v ):
+        """
+        Replace a single row of a multi-dimensional array.
+
+        @param i: row
+        @type  i: int
+        @param v: new row
+        @type  v: array OR list OR SparseArray
+        """
+        if isinstance( v, SparseArray ) and v.shape == self.shape[1:]:
+            idx, val = v.nondefault(), self.__values( v.values )
+        else:
+            val = npy.ravel( self.__dense( v, self.shape[1:] ) )
+            idx = npy.flatnonzero( self.__nondefaultMask( val ) )
+            val = val[ idx ]
+
+        a, b = self.__segment( i )
+        self.__splice( i, a, b, idx, val )
+
+
+    def __nondefaultMask( self, val ):
+        """
+        @return: mask of values that are not equal to the default
+        @rtype: array of bool
+        """
+        if self.__typecode == 'O':
+            return npy.array( [ v != self.__default for v in val ], bool )
+
+        return npy.asarray( val ) != self.__default
 
 
     def __setAll( self, a ):
@@ -160,22 +384,110 @@ class SparseArray:
         @param a: array OR  list of lists
         @type  a: array OR [ [ number ] ]
         """
-        if self.is1D:
-            return self.__setAll_1D( a )
+        if self.__typecode == 'O':
+            a = npy.array( a, 'O' )
+        else:
+            a = npy.asarray( a, self.__typecode )
+
+        if self.shape != a.shape:
+            raise SparseArrayError, 'dimensions not aligned'
 
-        if type(a) in [ N.arraytype, list ]:
-            if len(a) != self.shape[0]:
-                raise SparseArrayError, 'dimensions not aligned'
+        a = npy.ravel( a )
+        idx = npy.flatnonzero( self.__nondefaultMask( a ) )
 
-            ## typecode and default value for lowest dimension
-            typecode = self.typecode()
-            default  = self.default()
+        self.__setRaveled( idx, a[ idx ] )
+
+
+    def __dense( self, v, shape ):
+        """
+        @return: v (array, list or SparseArray) as dense array
+        @rtype: array
+
+        @raise SparseArrayError: if the shape of v does not match shape
+        """
+        if isinstance( v, SparseArray ):
+            v = v.toarray()
+        elif self.__typecode == 'O':
+            v = npy.array( v, 'O' )
+        else:
+            v = npy.asarray( v, self.__typecode )
+
+        if npy.shape( v ) != tuple( shape ):
+            raise SparseArrayError, 'dimensions not aligned.'
+
+        return v
+
+
+    def __rowItems( self, rows, v ):
+        """
+        @return: raveled positions and values of whole rows
+        @rtype: array, array
+        """
+        n = self.__rowLength()
+        v = npy.reshape( self.__dense( v, (len(rows),) + self.shape[1:] ),
+                         ( len( rows ), n ) )
+
+        idx = npy.asarray( rows, int )[:, npy.newaxis] * n + npy.arange( n )
+
+        return npy.ravel( idx ), npy.ravel( v )
+
+
+    def __writeBack( self ):
+        """
+        Copy the values of a row (see L{__row}) back into its array.
+        """
+        if self.__parent is not None:
+            parent, i = self.__parent
+            parent.__putRow( i, self )
+            parent.__writeBack()
+
+
+    def __checkResize( self ):
+        """
+        @raise SparseArrayError: if this is a row of another array
+        """
+        if self.__parent is not None:
+            raise SparseArrayError, 'Cannot resize a row of a %i-D array.'\
+                  % ( len( self.__parent[0].shape ) )
+
+
+    def __rowMatches( self, v ):
+        """
+        Compare each row of a multi-dimensional array to v.
+
+        @param v: row
+        @type  v: SparseArray
+
+        @return: mask of rows equal to v
+        @rtype: array of bool
+        """
+        n = npy.diff( self.indptr )
+
+        if not isinstance( v, SparseArray ) or v.shape != self.shape[1:]:
+            return npy.zeros( self.shape[0], bool )
+
+        idx, val = v.nondefault(), v.values
+        rows = npy.flatnonzero( n == len( idx ) )
+
+        items = self.indptr[ rows ][:, npy.newaxis] + npy.arange( len( idx ) )
+        same = npy.all( self.indices[ items ] == idx, 1 ) * \
+               npy.all( self.values[ items ] == val, 1 )
+
+        r = npy.zeros( self.shape[0], bool )
+        r[ rows[ same ] ] = True
+
+        return r
+
+
+    def __checkIndex( self, i ):
+        """
+        @raise IndexError: if any index is out of bounds
+        """
+        i = npy.asarray( i )
+        if len( npy.ravel( i ) ) and \
+           ( npy.any( i < 0 ) or npy.any( i >= self.shape[0] ) ):
+            raise IndexError, "index %r out of bounds" % i
 
-            for i in range( len(a) ):
-                x = SparseArray( a[i], typecode, default )
-                if not x.__eq__( self.__default ):
-                    self.indices.append( i )
-                    self.values.append( x )
 
     def typecode( self ):
         """
@@ -184,9 +496,7 @@ class SparseArray:
         @return: typecode of lowest dimension
         @rtype: str
         """
-        if self.is1D:
-            return self.__typecode
-        return self.__default.typecode()
+        return self.__typecode
 
 
     def default( self ):
@@ -195,52 +505,39 @@ class SparseArray:
 
         @return: default value for array elements (of lowest dimension)
         @rtype: number        """
-        if self.is1D:
-            return self.__default
-        ## multidimensional
-        return self.__default.default()
+        return self.__default
 
 
     def nondefault( self ):
         """
-        Get a 1D list of indices that have a non-default value in a raveled
+        Get a 1D array of indices that have a non-default value in a raveled
         version of this array. If L.default()==0 this would be equivalent to
         nonzero( ravel( L.toarray() ) ) (except that the Numeric array is
         never constructed).
 
-        @return: list of indices with none default values
-        @rtype: [ int ]
+        @return: indices with none default values
+        @rtype: array of int
         """
         if self.is1D:
             return self.indices
 
-        ## multidimensional
-        r = []
-        len_axis_B = self.shape[1]
-        for (i,a) in zip( self.indices, self.values ):
-            r += (N.array( a.nondefault() ) + len_axis_B * i ).tolist()
+        rows = npy.repeat( npy.arange( self.shape[0] ),
+                           npy.diff( self.indptr ) )
 
-        return r
+        return rows * self.__rowLength() + self.indices
 
 
     def nondefault_values( self ):
         """
-        Get a 1D-list of all values != L.default() in the order that they
+        Get a 1D-array of all values != L.default() in the order that they
         would have in a raveled array. If L.default()==0 this would be
         equivalent to take( L.toarray(), nonzero( ravel( L.toarray() ) ) )
         (except that the Numeric array is never constructed).
 
-        @return: list of none default values
-        @rtype: [ number ]
+        @return: none default values
+        @rtype: array
         """
-        if self.is1D:
-            return self.values
-
-        ## multidimensional
-        r = []
-        for a in self.values:
-            r.extend( a.nondefault_values() )
-        return r
+        return self.values
 
 
     def toarray( self ):
@@ -251,14 +548,12 @@ class SparseArray:
         @return: normal dense array
         @rtype: array
         """
-        if self.default() is 0:
-            a = N.zeros( ( self.shape ), self.typecode() )
-        else:
-            a = N.ones( (self.shape ), self.typecode() ) * self.default()
+        a = npy.empty( self.__size(), self.__typecode )
+        a.fill( self.__default )
 
-        N.put( a, self.nondefault(), self.nondefault_values() )
+        a[ self.nondefault() ] = self.values
 
-        return a
+        return npy.reshape( a, self.shape )
 
 
     def tolist( self ):
@@ -274,11 +569,12 @@ class SparseArray:
 
     def put( self, i, v ):
         """
-        Replace one or several values, L.put( i, v )
+        Replace one or several values (or rows of a multi-dimensional
+        array), L.put( i, v )
 
         @param i: indices
         @type  i: int OR [ int ]
-        @param v: values
+        @param v: values (or rows), a single value is used for all indices
         @type  v: any OR [ any ]
         """
         if type( i ) in [ list, N.arraytype ]:
@@ -289,51 +585,102 @@ class SparseArray:
 
     def __setMany( self, indices, values ):
         """
-        Add / replace values of the array.
+        Add / replace values (or rows) of the array.
 
         @param indices: indices, [ int ] OR Numeric.array('i')
         @type  indices: [int]
         @param values: values, [ any ] OR Numeric.array
         @type  values: [any] OR array
         """
+        indices = npy.asarray( indices, int )
+        self.__checkIndex( indices )
+
         if type( values ) not in [ list, N.arraytype ]:
             values = [ values ] * len( indices )
 
-        map( self.__setitem__, indices, values )
+        if len( values ) != len( indices ):
+            raise SparseArrayError, 'dimensions not aligned.'
+
+        if self.is1D:
+            self.__putRaveled( indices, values )
+
+        else:
+            rows = [ self.__dense( v, self.shape[1:] ) for v in values ]
+            idx, val = self.__rowItems( indices, rows )
+
+            self.__putRaveled( idx, val )
+
+        self.__writeBack()
 
 
-    def __pos( self, i ):
+    def take( self, indices ):
         """
-        Target position of given index in index list.
+        Values (or rows of a multi-dimensional array) at several positions::
+          L.take( [ int ] ) -> array
 
-        @param i: index
-        @type  i: int
+        @param indices: indices
+        @type  indices: [ int ]
 
-        @return: target position of given index in index list
-        @rtype: int
+        @return: values (1-D) OR sparse array with the selected rows
+        @rtype: array OR SparseArray
+        """
+        indices = npy.asarray( indices, int )
+        self.__checkIndex( indices )
+
+        if self.is1D:
+            pos = npy.searchsorted( self.indices, indices )
+            pos = npy.minimum( pos, len( self.indices ) - 1 )
+
+            r = npy.empty( len( indices ), self.values.dtype )
+            r.fill( self.__default )
+
+            if len( self.indices ):
+                found = self.indices[ pos ] == indices
+                r[ found ] = self.values[ pos[ found ] ]
+
+            return r
+
+        start, end = self.indptr[ indices ], self.indptr[ indices+1 ]
+        n = end - start
 
-        @raise IndexError: if out of bounds
+        items = npy.repeat( end - npy.cumsum( n ), n ) + npy.arange( n.sum() )
+        rows = npy.repeat( npy.arange( len( indices ) ), n )
+
+        result = self.__class__( ( len(indices), ) + self.shape[1:],
+                                 self.__typecode, self.__default )
+        result.__setRaveled( rows * self.__rowLength() + self.indices[items],
+                             self.values[ items ] )
+        return result
+
+
+    def __row( self, i ):
         """
-        if i > self.shape[0] or i < 0:
-            raise IndexError, "index %i out of bounds" % i
+        Row i of a multi-dimensional array. Values set in the row are
+        written back into row i of this array.
 
-        if i >= self.__last_i:
-            pos = self.__last_pos
-        else:
-            pos = 0
+        @return: row i of a multi-dimensional array
+        @rtype: SparseArray
+        """
+        result = self.__class__( self.shape[1:], self.__typecode,
+                                 self.__default )
 
-        l = len( self.indices )
-        while pos != l and self.indices[ pos ] < i:
-            pos += 1
+        a, b = self.indptr[ i ], self.indptr[ i+1 ]
+        result.__setRaveled( self.indices[ a:b ], self.values[ a:b ] )
+        result.__parent = ( self, i )
 
-        if pos != l:
-            self.__last_i   = self.indices[ pos ]
-            self.__last_pos = pos
-        else:
-            self.__last_i = 0
-            self.__last_pos = 0
+        return result
 
-        return pos
+
+    def __raveledIndex( self, i ):
+        """
+        @return: position of element i (tuple) in the raveled array
+        @rtype: int
+        """
+        for k, n in zip( i, self.shape ):
+            if k < 0 or k >= n:
+                raise IndexError, "index %r out of bounds" % ( i, )
+
+        return int( npy.ravel_multi_index( i, self.shape ) )
 
 
     def __setitem__( self, i, v ):
@@ -348,105 +695,87 @@ class SparseArray:
         @raise SparseArrayError: if dimensions not aligned
         @raise SparseArrayError: if no sequence value
         """
+        self.__setItem( i, v )
+        self.__writeBack()
+
+
+    def __setItem( self, i, v ):
+        """
+        Set position specifyed by the index i to value v, see
+        L{__setitem__}.
+        """
         itype = type( i )
-        vtype = getType( v )
 
         if itype is tuple and len( i ) == 1:
             i = i[0]
             itype = int
 
         if itype is int:
-            try:
-                if not self.is1D:
-                    if len( v ) != self.shape[1]:
-                        raise SparseArrayError, 'dimensions not aligned.'
-                    if vtype is not SparseArray:
-                        v = SparseArray( v, self.typecode(), self.default() )
+            self.__checkIndex( i )
 
-                return self.__setitem_1D( i, v )
+            if self.is1D:
+                return self.__putOne( 0, i, v )
 
+            try:
+                if len( v ) != self.shape[1]:
+                    raise SparseArrayError, 'dimensions not aligned.'
             except TypeError:
                 raise SparseArrayError, 'sequence value required.'
 
-        if itype is tuple:
-            x, y = i[0], i[1:]
-
-            a = self.__getitem__( x )
-            a.__setitem__( y, v )
-            self.__setitem__( x, a )
-
-
-    def __setitem_1D( self, i, v ):
-        """
-        Set position specifyed by the index i to value v in a 1D array.
-
-        @param i: array index
-        @type  i: int
-        @param v: value
-        @type  v: any
-
-        @raise IndexError: if i < 0 or i > len( this )
-        """
-        if i in self.indices:
-            pos = self.indices.index( i )
-
-            if v != self.__default:
-                self.values[ pos ] = v
-            else:
-                del self.values[ pos ]
-                del self.indices[ pos ]
+            return self.__putRow( i, v )
 
-        else:
-            if v != self.__default:
+        if itype is tuple:
+            if len( i ) == len( self.shape ):
+                k = self.__raveledIndex( i )
+                n = self.__rowLength()
+                return self.__putOne( k / n, k % n, v )
 
-                pos = self.__pos( i )
+            self.__checkIndex( i[0] )
 
-                self.indices.insert( pos, i )
-                self.values.insert( pos, v )
+            row = self.__row( i[0] )
+            row.__setItem( i[1:], v )
+            self.__putRow( i[0], row )
 
 
-    def __getitem_1D( self, i ):
+    def __getitem__( self, i ):
         """
         Value for specified position::
           this[ i ] -> number OR SparseArray
 
         @param i: array index
-        @type  i: int         
+        @type  i: int OR (int,int)
 
         @raise IndexError: if i < 0 or i >= len( this )
         """
-        if i >= self.shape[0] or i < 0:
-            raise IndexError, "index %i out of bounds" % i
-
-        if i in self.indices:
-            pos = self.indices.index( i )
-            return self.values[ pos ]
+        itype = type( i )
 
-        if self.is1D:
-            return self.__default
+        if itype is tuple and len( i ) == 1:
+            i = i[0]
+            itype = int
 
-        return copy.deepcopy( self.__default )
+        if itype is tuple and len( i ) == len( self.shape ):
+            k = self.__raveledIndex( i )
+            if self.is1D:
+                i = k
+            else:
+                x = self.__row( i[0] )
+                return x.__getitem__( i[1:] )
 
+        if itype is tuple and len( i ) < len( self.shape ):
+            return self.__getitem__( i[0] ).__getitem__( i[1:] )
 
-    def __getitem__( self, i ):
-        """
-        Value for specified position.
+        if i >= self.shape[0] or i < 0:
+            raise IndexError, "index %i out of bounds" % i
 
-        @param i: array index
-        @type  i: int OR (int,int)
-        """
-        itype = type( i )
+        if not self.is1D:
+            return self.__row( i )
 
-        if itype is tuple and len( i ) == 1:
-            i = i[0]
-            itype = int
+        pos = npy.searchsorted( self.indices, i )
 
-        if itype is int:
-            return self.__getitem_1D( i )
+        if pos < len( self.indices ) and self.indices[ pos ] == i:
+            return self.values[ pos : pos+1 ].tolist()[0]
 
-        if itype is tuple:
-            x, y = i[0], i[1:]
-            return self.__getitem__( x ).__getitem__( y )
+        return self.__default
 
 
     def __len__( self ):
@@ -470,7 +799,8 @@ class SparseArray:
             return 0
         if self.shape != o.shape:
             return 0
-        return self.values == o.values and self.indices == o.indices
+        return npy.array_equal( self.nondefault(), o.nondefault() ) and \
+               npy.array_equal( self.values, o.values )
 
 
     def __ne__( self, o ):
@@ -480,11 +810,7 @@ class SparseArray:
         @return: result of comparison
         @rtype: 0|1        
         """
-        if not isinstance( o, self.__class__ ):
-            return 1
-        if self.shape != o.shape:
-            return 1
-        return self.values != o.values or self.indices != o.indices
+        return not self.__eq__( o )
 
 
     def __getslice__( self, a, b ):
@@ -495,14 +821,17 @@ class SparseArray:
         @return: sliced sparse array
         @rtype: SparseArray
         """
-        shape = ( abs( b - a ), ) + self.shape[1:]
+        a = max( 0, min( a, self.shape[0] ) )
+        b = max( a, min( b, self.shape[0] ) )
+
+        shape = ( b - a, ) + self.shape[1:]
         result = self.__class__( shape, self.__typecode, self.__default )
 
-        pos_low  = self.__pos( a )
-        pos_high = self.__pos( b )
+        n = self.__rowLength()
+        idx = self.nondefault()
+        lo, hi = npy.searchsorted( idx, [ a * n, b * n ] )
 
-        result.put( N.array( self.indices[pos_low : pos_high] ) - a,
-                    self.values[pos_low : pos_high] )
+        result.__setRaveled( idx[ lo:hi ] - a * n, self.values[ lo:hi ] )
         return result
 
 
@@ -510,13 +839,17 @@ class SparseArray:
         """
         Sparse array contains value: supports v in this -> 0|1
 
-        @param v: value
-        @type  v: any      
+        @param v: value (or row of a multi-dimensional array)
+        @type  v: any OR SparseArray
 
         @return: result of comparison
         @rtype: 0|1
         """
-        return ( cmp( v, self.__default ) == 0 ) or (v in self.values)
+        if not self.is1D:
+            return bool( npy.any( self.__rowMatches( v ) ) )
+
+        return ( cmp( v, self.__default ) == 0 ) or \
+               bool( npy.any( self.values == v ) )
 
 
     def count(self, v ):
@@ -524,15 +857,18 @@ class SparseArray:
         Count the occuravces of value in sparse array::
           count( value ) -> int, number of occurences of value.
 
-        @param v: value
-        @type  v: any      
+        @param v: value (or row of a multi-dimensional array)
+        @type  v: any OR SparseArray
 
         @return: number of occurances
         @rtype: int
         """
+        if not self.is1D:
+            return int( npy.sum( self.__rowMatches( v ) ) )
+
         if v == self.__default:
             return len( self ) - len( self.values )
-        return self.values.count( v )
+        return int( npy.sum( self.values == v ) )
 
 
     def index( self, v ):
@@ -540,28 +876,36 @@ class SparseArray:
         position of first occurrence of value::
           index( value ) -> int
 
-        @param v: value to look for
-        @type  v: any
+        @param v: value (or row of a multi-dimensional array) to look for
+        @type  v: any OR SparseArray
 
         @return: index of first occurance
         @rtype: int
 
         @raise ValueError: if value is not contained in this list
         """
-        if v in self.values:
-            return self.indices[ self.values.index( v ) ]
+        if not self.is1D:
+            found = npy.flatnonzero( self.__rowMatches( v ) )
+            if not len( found ):
+                raise ValueError, "SparseArray.index(): value not in list"
+            return int( found[0] )
+
+        found = npy.flatnonzero( self.values == v )
+        if len( found ):
+            return int( self.nondefault()[ found[0] ] )
 
         if v != self.__default:
             raise ValueError, "SparseArray.index(): value not in list"
 
-        i = 0
-        while i in self.indices:
-            i += 1
+        ## first gap in the sorted positions
+        idx = self.nondefault()
+        gaps = npy.flatnonzero( idx != npy.arange( len( idx ) ) )
+        i = gaps[0] if len( gaps ) else len( idx )
 
         if i == len( self ):
             raise ValueError, "SparseArray.index(): value not in list"
 
-        return i
+        return int( i )
 
 
     def empty( self ):
@@ -571,35 +915,32 @@ class SparseArray:
         @return: true if lenght is 0
         @rtype: 1|0
         """
-        return len( self.indices ) is 0
+        return len( self.values ) == 0
 
 
     def __delitem__( self, i ):
         """
-        Delete value at index i: supports del this[i]
+        Delete value (or row) at index i: supports del this[i]
 
         @note: del this[int:int] is not supported
 
         @param i: index
         @type  i: int     
         """
+        self.__checkResize()
+
         if i >= self.shape[0] or i < 0:
             raise IndexError, "index %i out of bounds" % i
 
-        if i in self.indices:
-            pos = self.indices.index( i )
+        n = self.__rowLength()
+        idx = self.nondefault()
+        keep = ( idx < i * n ) | ( idx >= (i+1) * n )
 
-            del self.indices[ pos ]
-            del self.values[ pos ]
-
-        else:
-            pos = self.__pos( i )
-
-        if pos < len( self.indices ) - 1:
-            self.indices = self.indices[:pos] +\
-                [ p-1 for p in self.indices[pos:] ]
+        idx = idx[ keep ]
+        idx[ idx >= i * n ] -= n
 
         self.shape = (self.shape[0] - 1,) + self.shape[1:]
+        self.__setRaveled( idx, self.values[ keep ] )
 
 
 ##     def reverse( self ):
@@ -608,7 +949,7 @@ class SparseArray:
 
     def insert( self, i, v ):
         """
-        Insert value before index::
+        Insert value (or row) before index::
           this.insert(index, value) 
 
         @param v: value to insert
@@ -618,20 +959,19 @@ class SparseArray:
 
         @raise IndexError: if i < 0 or i > len( this )
         """
-        pos = self.__pos( i )
-
-        inc = 0
+        self.__checkResize()
 
-        if v != self.__default:
-            self.indices.insert( pos, i )
-            self.values.insert( pos, v )
-            inc = 1
+        if i > self.shape[0] or i < 0:
+            raise IndexError, "index %i out of bounds" % i
 
-        if pos < len( self.indices ):
-            self.indices = self.indices[:pos+inc] +\
-                [ p+1 for p in self.indices[pos+inc:] ]
+        n = self.__rowLength()
+        idx = npy.array( self.nondefault() )
+        idx[ idx >= i * n ] += n
 
         self.shape = (self.shape[0]+1, ) + self.shape[1:]
+        self.__setRaveled( idx, self.values )
+
+        self.__setitem__( i, v )
 
 
 ##     def pop( self ):
@@ -663,42 +1003,49 @@ class SparseArray:
 
         @raise SparseArrayError: if dimension errors
         """
+        self.__checkResize()
+
         if axis == 0:
 
-            t_default, t_v = getType( self.__default ), getType( v )
-            if t_default == SparseArray and t_v == N.arraytype:
-                v = SparseArray( v, self.typecode(), self.default()  )
+            if not self.is1D and not isinstance( v, SparseArray ) and \
+               type( v ) is not N.arraytype:
+                raise SparseArrayError, 'Cannot append %s to array of %s.' \
+                      % ( str(type(v)), 'SparseArray' )
 
-            if getType(v) != t_default:
+            if self.is1D and isinstance( v, SparseArray ):
                 raise SparseArrayError, 'Cannot append %s to array of %s.' \
-                      % ( str(type(v)), str(t_default) )
+                      % ( str(type(v)), 'values' )
 
-            if v != self.__default:
-                self.indices.append( self.shape[0] )
-                self.values.append( v )
+            return self.insert( self.shape[0], v )
 
-            self.shape = ( self.shape[0]+1, ) + self.shape[1:]
+        if axis >= len( self.shape ):
+            raise SparseArrayError, 'dimensions not aligned'
 
-        else:
-            if len( v ) != self.shape[0]:
-                raise SparseArrayError, 'dimensions not aligned'
+        if len( v ) != self.shape[0]:
+            raise SparseArrayError, 'dimensions not aligned'
+
+        shape_v = self.shape[:axis] + self.shape[axis+1:]
+        v = npy.ravel( self.__dense( v, shape_v ) )
+
+        new_shape = self.shape[:axis] + ( self.shape[axis]+1, ) + \
+                    self.shape[axis+1:]
 
-            for i in range( self.shape[0] ):
-                v_i = v[i]
-                a_i = self.__getitem__( i )
-                is0 = a_i.empty()   ## -> a_i is a copy of self.__default
+        ## old entries at their positions in the enlarged array
+        old = npy.unravel_index( self.nondefault(), self.shape )
+        old = npy.ravel_multi_index( old, new_shape )
 
-                if v_i != self.__default.__default:
-                    a_i.append( v_i, axis=axis-1 )
-                    if is0:         ## otherwise change would be lost
-                        self.__setitem__( i, a_i )
+        ## new entries at the end of the axis
+        i = npy.flatnonzero( self.__nondefaultMask( v ) )
+        new = list( npy.unravel_index( i, shape_v ) )
+        new.insert( axis, npy.ones( len( i ), int ) * self.shape[axis] )
+        new = npy.ravel_multi_index( new, new_shape )
 
-            d = self.__default
-            x = axis - 1
-            d.shape = d.shape[:x] + (d.shape[x]+1,) + d.shape[x+1:]
+        idx = npy.concatenate( ( old, new ) )
+        val = npy.concatenate( ( self.values, self.__values( v[i] ) ) )
+        order = npy.argsort( idx, kind='mergesort' )
 
-            self.shape = self.shape[:axis] + ( self.shape[axis]+1, ) +\
-                self.shape[axis+1:]
+        self.shape = new_shape
+        self.__setRaveled( idx[ order ], val[ order ] )
 
 
     def extend( self, lst ):
@@ -709,22 +1056,20 @@ class SparseArray:
         @param lst: list OR SparseArray with extend values
         @type  lst: [any] OR SparseArray
         """
-        if not isinstance( lst, SparseArray ):
-            lst = SparseArray( lst, default=self.__default )
-
-        l = self.shape[0]
-        self.indices.extend( [ i + l for i in lst.indices ] )
-        self.values.extend( lst.values )
-        self.shape = ( l + lst.shape[0], ) + self.shape[1:]
-
+        self.__checkResize()
 
-##     def __setitem__( self, i, v ):
+        if not isinstance( lst, SparseArray ):
+            lst = SparseArray( lst, self.__typecode, default=self.__default )
 
-##         if getattr( v, 'shape', None ) is None:
-##             return SparseList.__setitem__( i, v )
+        if lst.shape[1:] != self.shape[1:]:
+            raise SparseArrayError, 'dimensions not aligned'
 
-##         pass
+        idx = npy.concatenate( ( self.nondefault(),
+                                 lst.nondefault() + self.__size() ) )
+        val = npy.concatenate( ( self.values, self.__values( lst.values ) ) )
 
+        self.shape = ( self.shape[0] + lst.shape[0], ) + self.shape[1:]
+        self.__setRaveled( idx, val )
 
 
 #############
@@ -760,6 +1105,104 @@ class Test(BT.BiskitTest):
         self.assert_( N.all( self.sb.toarray() == self.EXPECTED) )
 
 
+    def test_bulk(self):
+        """SparseArray bulk operations compared to dense array test"""
+        import numpy.random as R
+        R.seed( 42 )
+
+        d = ( R.random( (20, 4, 3) ) > 0.7 ) * R.random( (20, 4, 3) )
+        d = d.astype( N.Float32 )
+
+        self.sa = SparseArray( d )
+        self.assert_( N.all( self.sa.toarray() == d ) )
+        self.assertEqual( list( self.sa.nondefault() ),
+                          list( npy.flatnonzero( d ) ) )
+
+        rows = npy.array( [ 3, 7, 3, 12 ] )
+        v = R.random( (4, 4, 3) ).astype( N.Float32 )
+        self.sa.put( rows, v )
+        for i, r in zip( rows, v ):
+            d[i] = r
+
+        self.assert_( N.all( self.sa.take( rows ).toarray() == d[ rows ] ) )
+        self.assert_( N.all( self.sa[5:15].toarray() == d[5:15] ) )
+
+        self.sa[ (2, 1, 0) ] = 9.
+        d[2, 1, 0] = 9.
+        self.assertEqual( self.sa[ (2, 1, 0) ], 9. )
+
+        del self.sa[4]
+        d = npy.delete( d, 4, 0 )
+
+        self.sa.insert( 0, SparseArray( d[-1] ) )
+        d = npy.concatenate( ( d[-1:], d ) )
+
+        v = ( R.random( (20, 3) ) > 0.5 ).astype( N.Float32 )
+        self.sa.append( SparseArray( v ), axis=1 )
+        d = npy.concatenate( ( d, v[:, npy.newaxis] ), 1 )
+
+        self.assertEqual( self.sa.shape, d.shape )
+        self.assert_( N.all( self.sa.toarray() == d ) )
+        same = N.all( N.all( d == d[5], 1 ), 1 )
+        self.assertEqual( self.sa.count( SparseArray( d[5] ) ), N.sum( same ) )
+        self.assertEqual( self.sa.index( SparseArray( d[5] ) ),
+                          npy.flatnonzero( same )[0] )
+
+        s1 = SparseArray( d[:, 0, 0] )
+        self.assertEqual( s1.count( 0. ), N.sum( d[:, 0, 0] == 0. ) )
+
+
+    def test_rows(self):
+        """SparseArray rows write back into their array test"""
+        b = N.zeros( (3, 4), N.Float32 )
+        b[1,1] = 3.
+
+        self.sa = SparseArray( b )
+        self.sa[1][2] = 7.
+        self.sa[2][0] = 1.
+
+        self.assertEqual( self.sa[1].tolist(), [0., 3., 7., 0.] )
+        self.assertEqual( self.sa[2].tolist(), [1., 0., 0., 0.] )
+
+        self.s3 = SparseArray( (2, 3, 4) )
+        self.s3[1][2][3] = 5.
+        self.s3[1].put( [0], [ [1., 2., 0., 0.] ] )
+        self.assertEqual( list( self.s3.nondefault() ), [12, 13, 23] )
+
+        self.assert_( SparseArray( b[1] ) not in self.sa )
+        self.assert_( self.sa[1] in self.sa )
+        self.assertEqual( self.sa.count( SparseArray( (4,) ) ), 1 )
+
+        self.assertRaises( SparseArrayError, self.sa[0].append, 1. )
+
+        self.assertRaises( IndexError, self.s3.__setitem__, (-1, 2),
+                           [1., 1., 1., 1.] )
+        self.assertEqual( list( self.s3.nondefault() ), [12, 13, 23] )
+
+
+    def test_oldPickle(self):
+        """SparseArray unpickling of list-based version test"""
+        import pickle
+
+        self.sa = pickle.loads( self.OLD_PICKLE )
+
+        b = N.zeros( (3, 4), N.Float32 )
+        b[0,1] = 3.
+        b[2,3] = 5.
+
+        self.assert_( N.all( self.sa.toarray() == b ) )
+        self.assertEqual( self.sa.typecode(), 'f' )
+        self.assertEqual( self.sa[2][3], 5. )
+
+        self.sa[1] = b[0]
+        self.assertEqual( list( self.sa.nondefault() ), [1, 5, 11] )
+
+
+    #: pickle (protocol 0) of a 3 x 4 array with 2 values as written by
+    #: the list-based SparseArray
+    OLD_PICKLE = "(iBiskit.SparseArray\nSparseArray\np0\n(dp1\nS'_SparseArray__last_pos'\np2\nI0\nsS'_SparseArray__typecode'\np3\nS'SA'\np4\nsS'_SparseArray__default'\np5\n(iBiskit.SparseArray\nSparseArray\np6\n(dp7\ng2\nI0\nsg3\nS'f'\np8\nsg5\nF0.0\nsS'_SparseArray__last_i'\np9\nI0\nsS'shape'\np10\n(I4\ntp11\nsS'values'\np12\n(lp13\nsS'indices'\np14\n(lp15\nsS'is1D'\np16\nI01\nsbsg9\nI0\nsg10\n(I3\nI4\ntp17\nsg12\n(lp18\n(iBiskit.SparseArray\nSparseArray\np19\n(dp20\ng2\nI0\nsg3\ng8\nsg5\nF0.0\nsg9\nI0\nsg10\n(I4\ntp21\nsg12\n(lp22\nF3.0\nasg14\n(lp23\nI1\nasg16\nI01\nsba(iBiskit.SparseArray\nSparseArray\np24\n(dp25\ng2\nI0\nsg3\ng8\nsg5\nF0.0\nsg9\nI0\nsg10\n(I4\ntp26\nsg12\n(lp27\nF5.0\nasg14\n(lp28\nI3\nasg16\nI01\nsbasg14\n(lp29\nI0\naI2\nasg16\nI00\nsb."
+
+
     EXPECTED = N.array([[ 0.,  3.,  4.,  0.,  0.,  0.],
                         [ 0.,  0.,  0.,  0.,  0.,  0.],
                         [ 0.,  0.,  0.,  0.,  0.,  0.],
@@ -768,6 +1211,42 @@ class Test(BT.BiskitTest):
                         [ 0.,  0.,  0.,  1.,  0.,  2.]])
 
 
+class TestBenchmark(BT.BiskitTest):
+    """Benchmark filling a 400 x 1000 SparseArray row by row"""
+
+    TAGS = [ BT.LONG ]
+
+    def test_fillRows(self):
+        """SparseArray row-by-row and element-wise filling benchmark"""
+        import time
+        import numpy.random as R
+
+        R.seed( 1 )
+        d = ( R.random( (400, 1000) ) > 0.9 ).astype( N.Float32 )
+
+        t0 = time.time()
+        self.sa = SparseArray( d.shape )
+        for i in range( len( d ) ):
+            self.sa[i] = d[i]
+        t_rows = time.time() - t0
+
+        t0 = time.time()
+        for k in range( 2000 ):
+            i, j = k % 400, ( k * 7 ) % 1000
+            self.sa[ (i, j) ] = d[i, j] = k % 3
+        t_items = time.time() - t0
+
+        if self.local:
+            print '\n400 rows: %.3f s, 2000 elements: %.3f s' % \
+                  ( t_rows, t_items )
+
+        self.assert_( N.all( self.sa.toarray() == d ) )
+
+        ## a full rebuild on each assignment takes many seconds
+        self.assert_( t_rows < 1., 'row filling took %.2f s' % t_rows )
+        self.assert_( t_items < 1., 'element filling took %.2f s' % t_items )
+
+
 if __name__ == '__main__':
 
     BT.localTest()
@@ -0,0 +1,348 @@
+##
+## Biskit, a toolkit for the manipulation of macromolecular structures
+## Copyright (C) 2004-2012 Raik Gruenberg & Johan Leckner
+##
+## This program is free software; you can redistribute it and/or
+## modify it under the terms of the GNU General Public License as
+## published by the Free Software Foundation; either version 3 of the
+## License, or any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+## General Public License for more details.
+##
+## You find a copy of the GNU General Public License in the file
+## license.txt along with this program; if not, write to the Free
+## Software Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+##
+##
+## last $Author$
+## last $Date$
+## $Revision$
+"""
+Cell list for fast neighbour search in 3-D coordinates.
+"""
+
+import numpy as N
+
+from Biskit.Errors import BiskitError
+
+
+class SpatialIndexError( BiskitError ):
+    pass
+
+
+class SpatialIndex:
+    """
+    Uniform grid (cell list) over a set of 3-D points, e.g. PDBModel.xyz.
+    Points are sorted by cell so that a neighbour query only needs to look
+    at the cells around each query point. Memory and time then scale with
+    the number of close pairs rather than with N x M::
+
+      index = SpatialIndex( rec.xyz, cellsize=4.5 )
+      i_rec, i_lig, dist = index.pairs( lig.xyz, 4.5 )
+
+    All queries are vectorized over the query points. Distances are
+    compared with a strict 'less than' against the cutoff, like the
+    N.less( dist, cutoff ) of the dense calculations they replace.
+    Queries with a cutoff larger than the cell size are allowed but search
+    more cells.
+    """
+
+    #: number of query points handled at a time (limits temporary memory)
+    CHUNK = 5000
+
+    def __init__( self, xyz, cellsize=4.5 ):
+        """
+        @param xyz: coordinates to index (N x 3)
+        @type  xyz: array
+        @param cellsize: edge length of grid cells in \AA, ideally the most
+                         common query cutoff (default: 4.5)
+        @type  cellsize: float
+
+        @raise SpatialIndexError: if cellsize is not positive
+        """
+        if cellsize <= 0:
+            raise SpatialIndexError, 'cell size must be > 0: %r' % cellsize
+
+        self.xyz = N.array( xyz, N.float64 ).reshape( -1, 3 )
+        self.cellsize = float( cellsize )
+
+        if len( self.xyz ):
+            self.origin = N.min( self.xyz, 0 )
+        else:
+            self.origin = N.zeros( 3 )
+
+        cells = self.__cells( self.xyz )
+        self.dims = N.max( cells, 0 ) + 1 if len( cells ) else N.ones(3, int)
+
+        keys = self.__keys( cells )
+
+        #: point indices sorted by cell
+        self.order = N.argsort( keys, kind='mergesort' )
+        keys = keys[ self.order ]
+
+        #: occupied cells, position of their first point and point count
+        self.keys = N.unique( keys )
+        self.start = N.searchsorted( keys, self.keys )
+        self.count = N.searchsorted( keys, self.keys, side='right' ) \
+                     - self.start
+
+
+    def __len__( self ):
+        return len( self.xyz )
+
+
+    def __cells( self, xyz ):
+        """integer cell coordinates (N x 3) of points"""
+        return N.floor( (xyz - self.origin) / self.cellsize ).astype( int )
+
+
+    def __keys( self, cells ):
+        """linear cell index of integer cell coordinates"""
+        return ( cells[:,0] * self.dims[1] + cells[:,1] ) * self.dims[2] \
+               + cells[:,2]
+
+
+    def __offsets( self, cutoff ):
+        """cell offsets (M x 3) to be searched for the given cutoff"""
+        k = int( N.ceil( cutoff / self.cellsize ) )
+        r = N.arange( -k, k+1 )
+
+        return N.array( [ (i,j,l) for i in r for j in r for l in r ] )
+
+
+    def __candidates( self, xyz, cutoff ):
+        """
+        All (index point, query point) pairs in neighbouring cells.
+
+        @return: indices into self.xyz, indices into xyz
+        @rtype: array, array
+        """
+        cells = self.__cells( xyz )
+
+        i_pts, i_query = [], []
+
+        for offset in self.__offsets( cutoff ):
+
+            c = cells + offset
+
+            inside = N.all( (c >= 0) * (c < self.dims), 1 )
+            q = N.flatnonzero( inside )
+
+            keys = self.__keys( c[ q ] )
+            pos = N.searchsorted( self.keys, keys )
+            pos[ pos == len( self.keys ) ] = 0
+
+            found = self.keys[ pos ] == keys
+            q, pos = q[ found ], pos[ found ]
+
+            ## expand each query point into all points of the cell
+            n = self.count[ pos ]
+            total = N.sum( n )
+            if not total:
+                continue
+
+            first = N.repeat( N.cumsum( n ) - n, n )
+            k = N.repeat( self.start[ pos ], n ) + N.arange( total ) - first
+
+            i_pts.append( self.order[ k ] )
+            i_query.append( N.repeat( q, n ) )
+
+        if not i_pts:
+            return N.zeros( 0, int ), N.zeros( 0, int )
+
+        return N.concatenate( i_pts ), N.concatenate( i_query )
+
+
+    def pairs( self, xyz, cutoff=None, sort=True ):
+        """
+        Find all pairs of indexed points and query points that are closer
+        than cutoff.
+
+        @param xyz: query coordinates (M x 3)
+        @type  xyz: array
+        @param cutoff: distance cutoff in \AA (default: cell size)
+        @type  cutoff: float
+        @param sort: sort pairs by indexed point and then query point
+                     (default: True)
+        @type  sort: bool
+
+        @return: indices into indexed points, indices into xyz, distances
+        @rtype: array of int, array of int, array of float
+        """
+        cutoff = cutoff or self.cellsize
+        xyz = N.array( xyz, N.float64 ).reshape( -1, 3 )
+
+        r_i, r_j, r_d = [], [], []
+
+        for start in range( 0, len( xyz ), self.CHUNK ):
+            chunk = xyz[ start : start + self.CHUNK ]
+
+            i, j = self.__candidates( chunk, cutoff )
+
+            d2 = N.sum( (self.xyz[ i ] - chunk[ j ])**2, 1 )
+            close = d2 < cutoff**2
+
+            r_i.append( i[ close ] )
+            r_j.append( j[ close ] + start )
+            r_d.append( N.sqrt( d2[ close ] ) )
+
+        if not r_i:
+            return N.zeros( 0, int ), N.zeros( 0, int ), N.zeros( 0 )
+
+        i, j, d = N.concatenate(r_i), N.concatenate(r_j), N.concatenate(r_d)
+
+        if sort:
+            o = N.lexsort( (j, i) )
+            i, j, d = i[o], j[o], d[o]
+
+        return i, j, d
+
+
+    def selfPairs( self, cutoff=None ):
+        """
+        Find all pairs of indexed points closer than cutoff.
+
+        @param cutoff: distance cutoff in \AA (default: cell size)
+        @type  cutoff: float
+
+        @return: indices i < j of pairs, distances
+        @rtype: array of int, array of int, array of float
+        """
+        i, j, d = self.pairs( self.xyz, cutoff )
+        upper = i < j
+
+        return i[ upper ], j[ upper ], d[ upper ]
+
+
+    def within( self, point, cutoff=None ):
+        """
+        Radius query around a single point.
+
+        @param point: query coordinate (3)
+        @type  point: array
+        @param cutoff: radius in \AA (default: cell size)
+        @type  cutoff: float
+
+        @return: sorted indices of all indexed points within cutoff
+        @rtype: array of int
+        """
+        return self.pairs( [ point ], cutoff )[0]
+
+
+    def countWithin( self, xyz, cutoff=None ):
+        """
+        Number of indexed points closer than cutoff to each query point.
+
+        @param xyz: query coordinates (M x 3)
+        @type  xyz: array
+        @param cutoff: distance cutoff in \AA (default: cell size)
+        @type  cutoff: float
+
+        @return: number of neighbours of each query point
+        @rtype: array of int
+        """
+        xyz = N.array( xyz, N.float64 ).reshape( -1, 3 )
+        j = self.pairs( xyz, cutoff, sort=False )[1]
+
+        return N.bincount( j, minlength=len( xyz ) )
+
+
+    def nearest( self, point, n ):
+        """
+        The n indexed points closest to a point. The search radius is
+        increased until enough points are found.
+
+        @param point: query coordinate (3)
+        @type  point: array
+        @param n: number of points to return
+        @type  n: int
+
+        @return: indices of the n closest points, by increasing distance
+        @rtype: array of int
+        """
+        n = min( n, len( self ) )
+        if n <= 0:
+            return N.zeros( 0, int )
+
+        point = N.array( point, N.float64 )
+        radius = self.cellsize
+
+        ## distance from the point to the farthest corner of the grid
+        top = self.origin + self.dims * self.cellsize
+        r_max = N.sqrt( N.sum( N.maximum( abs( point - self.origin ),
+                                          abs( point - top ) )**2 ) )
+
+        while True:
+            i, j, d = self.pairs( [ point ], radius, sort=False )
+
+            if len( i ) >= n or radius > r_max:
+                break
+
+            radius *= 2
+
+        return i[ N.argsort( d, kind='mergesort' )[:n] ]
+
+
+#############
+##  TESTING
+#############
+import Biskit.test as BT
+
+class Test(BT.BiskitTest):
+    """SpatialIndex test"""
+
+    def prepare( self ):
+        import Biskit.tools as T
+        from Biskit import PDBModel
+
+        self.m = PDBModel( T.testRoot() + '/com/1BGS.pdb' )
+
+    def test_pairs( self ):
+        """SpatialIndex.pairs against full distance matrix test"""
+        import Biskit.mathUtils as MU
+
+        rec = self.m.takeChains( [0] ).xyz
+        lig = self.m.takeChains( [1] ).xyz
+
+        dense = MU.pairwiseDistances( rec, lig )
+
+        for cutoff in [ 3.0, 4.5, 10. ]:
+            self.index = SpatialIndex( rec, cellsize=4.5 )
+            i, j, d = self.index.pairs( lig, cutoff )
+
+            ref_i, ref_j = N.nonzero( dense < cutoff )
+
+            self.assert_( N.all( i == ref_i ) and N.all( j == ref_j ) )
+            self.assert_( N.allclose( d, dense[ i, j ], atol=1e-4 ) )
+
+        self.assertEqual( len( self.index.pairs( lig + 1000., 4.5 )[0] ), 0 )
+
+    def test_queries( self ):
+        """SpatialIndex within/countWithin/nearest test"""
+        xyz = self.m.xyz
+        self.index = SpatialIndex( xyz, cellsize=6 )
+
+        dist = N.sqrt( N.sum( (xyz - xyz[10])**2, 1 ) )
+
+        self.assert_( N.all( self.index.within( xyz[10], 6 ) ==
+                             N.flatnonzero( dist < 6 ) ) )
+
+        self.assertEqual( list( self.index.nearest( xyz[10], 50 ) ),
+                          list( N.argsort( dist, kind='mergesort' )[:50] ) )
+
+        self.assertEqual( len( self.index.nearest( xyz[10], 10**6 ) ),
+                          len( xyz ) )
+
+        counts = self.index.countWithin( xyz[:100], 6 )
+        self.assertEqual( counts[10], N.sum( dist < 6 ) )
+
+        i, j, d = self.index.selfPairs( 3. )
+        self.assert_( N.all( i < j ) and N.all( d < 3. ) )
+
+
+if __name__ == '__main__':
+
+    BT.localTest()
@@ -24,6 +24,7 @@
 import numpy as N
 import copy, random
 
+import Biskit.mathUtils as MU
 import lognormal as L
 try:
     import scipy.stats as stats
@@ -71,28 +72,93 @@ class ROCalyzer( object ):
         self.positives = positives
 
 
-    def random_roccurves(self, score, n=100 ):
+    def random_roccurves(self, score, n=100, seed=None ):
         """
         Generate roc curves for randomized target masks.
         @param score: sequence of score values for target sequence
         @type  score: [ int ] or [ float ]
         @param n: number of curves to generate (100)
         @type  n: int
+        @param seed: seed of the random number generator, None for a
+                     different result on every call (default: None)
+        @type  seed: int
         @return: a set of sensitivity/specifity curves for the given score
         applied to random 'positive' items.
         @rtype: [ (sens, spec), ]
         """
-        N.random.seed()
         r = []
-        for i in range(n):
-            ref = copy.copy( self.positives )
-            N.random.shuffle( ref )
-
-            r += [ self.roccurve( score, ref=ref ) ]
+        for perm in MU.randomPermutations( n, len(score), seed=seed ):
+            spec, sens = self.roccurves( score, N.take( self.positives, perm ) )
+            r += [ zip( x, y ) for x, y in zip( spec, sens ) ]
 
         return r
 
 
+    def random_rocareas( self, score, n=1000, seed=None, blocksize=None ):
+        """
+        Areas under the roc curves of the given score for randomized
+        target masks. Equivalent to, but much faster than::
+          [ a.area( c ) for c in a.random_roccurves( score, n ) ]
+
+        @param score: sequence of score values for target sequence
+        @type  score: [ int ] or [ float ]
+        @param n: number of random masks (default: 1000)
+        @type  n: int
+        @param seed: seed of the random number generator, None for a
+                     different result on every call (default: None)
+        @type  seed: int
+        @param blocksize: number of curves calculated at once
+                          (default: see L{Biskit.mathUtils.randomPermutations})
+        @type  blocksize: int
+        @return: area under each random roc curve
+        @rtype: N.array of float
+        """
+        r = []
+        for perm in MU.randomPermutations( n, len(score), seed=seed,
+                                           blocksize=blocksize ):
+            spec, sens = self.roccurves( score, N.take( self.positives, perm ) )
+
+            ## trapezoids, starting with a flat step from x=0
+            x = N.concatenate( ( N.zeros( (len(spec), 1) ), spec ), 1 )
+            y = N.concatenate( ( sens[:, :1], sens ), 1 )
+
+            r += [ N.sum( N.diff( x ) * ( y[:, 1:] + y[:, :-1] ) / 2., 1 ) ]
+
+        return N.concatenate( r )
+
+
+    def roccurves( self, score, refs ):
+        """
+        Calculate ROC curves of the given score for several masks of
+        positives at once (see L{roccurve}).
+
+        @param score: sequence of score values for target sequence
+        @type  score: [ int ] or [ float ]
+        @param refs: masks of positives, one per row
+        @type  refs: N.array( n x len(score) ) of 1|0
+        @return: 1-specificity and sensitivity, one curve per row
+        @rtype: N.array( n x len(score) ), N.array( n x len(score) )
+        """
+        refs = N.asarray( refs )
+
+        n_ref = N.sum( refs, 1 )
+        if N.any( n_ref == refs.shape[1] ) or N.any( n_ref == 0 ):
+            raise ROCError,\
+                  'Cannot compute Roc curves for all positive or all '+\
+                  'negative target'
+
+        order = N.argsort( score )[::-1]
+        refs = N.take( refs, order, 1 )
+
+        n_pos = N.cumsum( refs, 1 )
+        n_neg = N.cumsum( N.logical_not( refs ), 1 )
+
+        sensitivity = 1. * n_pos / n_pos[:, -1:]
+        specificity = 1. * n_neg / n_neg[:, -1:]
+
+        return specificity, sensitivity
+
+
     def roccurve( self, score, ref=None ):
         """
         Calculate the ROC curve of the given score.
@@ -188,7 +254,7 @@ class ROCalyzer( object ):
         return self.area( self.roccurve( score ) )
 
 
-    def isnoise( self, score, n_samples=1000 ):
+    def isnoise( self, score, n_samples=1000, seed=None ):
         """
         Test sample how a given score performs at predicting items in the
         positive list compared to its 'performance' at  predicting random
@@ -198,6 +264,9 @@ class ROCalyzer( object ):
         @type  score: [ float ]
         @param n_samples: number of random samples
         @type  n_samples: int
+        @param seed: seed of the random number generator, None for a
+                     different result on every call (default: None)
+        @type  seed: int
 
         @return: probability P that the prediction success of score is just
         a random effect (1.0 means it's just perfectly random).
@@ -205,8 +274,7 @@ class ROCalyzer( object ):
         from Biskit import EHandler
 
         ## list of random deviations from diagonal area 0.5
-        a_rand = [ self.area(c)-0.5
-                   for c in self.random_roccurves(score,n_samples) ]
+        a_rand = self.random_rocareas( score, n_samples, seed=seed ) - 0.5
 
         sd_rand = N.std( a_rand )
         av_rand = N.mean(a_rand )
@@ -389,6 +457,18 @@ class Test(BT.BiskitTest):
 ##                       ' isnoise : utest = %f : %f' % (p1, p2))
 
 
+    def test_randomAreas(self):
+        """Statistics.ROCalyzer.random_rocareas test"""
+        a = ROCalyzer( self.hits )
+
+        self.areas = a.random_rocareas( self.score, 200, seed=5, blocksize=30 )
+        loop = [ a.area( c ) for c in a.random_roccurves( self.score, 200,
+                                                          seed=5 ) ]
+
+        self.assert_( N.allclose( self.areas, loop ) )
+        self.assert_( N.all( self.areas == a.random_rocareas( self.score,
+                                                              200, seed=5 ) ) )
+
     def test_area(self):
         """Statistics.ROCalyzer.area test"""
         a = ROCalyzer( self.hits )
@@ -315,8 +315,8 @@ class TrajCluster:
         @rtype: float, float   
         """
         try:
-            rms = self.memberTraj(cluster,threshold).pairwiseRmsd( aMask )
-            rms = aboveDiagonal( rms )
+            rms = self.memberTraj(cluster,threshold).pairwiseRmsd( aMask,
+                                                                condensed=1 )
         except:
             rms = []
 
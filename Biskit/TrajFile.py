@@ -0,0 +1,342 @@
+##
+## Biskit, a toolkit for the manipulation of macromolecular structures
+## Copyright (C) 2004-2012 Raik Gruenberg & Johan Leckner
+##
+## This program is free software; you can redistribute it and/or
+## modify it under the terms of the GNU General Public License as
+## published by the Free Software Foundation; either version 3 of the
+## License, or any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+## General Public License for more details.
+##
+## You find a copy of the GNU General Public License in the file
+## license.txt along with this program; if not, write to the Free
+## Software Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+##
+##
+## last $Author$
+## last $Date$
+## $Revision$
+"""
+On-disk binary trajectory container with memory-mapped frames.
+"""
+
+import numpy as N
+import os.path as osp
+
+import Biskit.tools as T
+from Biskit.Errors import BiskitError
+from Biskit.LocalPath import LocalPath
+
+
+class TrajFileError( BiskitError ):
+    pass
+
+
+def isMapped( a ):
+    """
+    @param a: any array
+    @type  a: array
+
+    @return: True, if a is a memory-mapped array (or a view of one)
+    @rtype: bool
+    """
+    return isinstance( a, N.memmap ) and \
+           getattr( a, 'filename', None ) is not None
+
+
+class TrajFile:
+    """
+    Store the coordinate frames of a L{Biskit.Trajectory} in a binary file
+    that can be opened as numpy.memmap. Only the frames actually used are
+    then read into memory. The file consists of a small header
+    (see L{HEADER}) followed by a frame-major block of float32 coordinates
+    (frames x atoms x 3). All the rest of the trajectory (reference model,
+    profiles, frame names, PCA results, and the fields of Trajectory
+    sub-classes) goes into a pickled side-car file with the extension
+    L{META}.
+
+    Writing and reading a trajectory::
+      TrajFile( 'traj.bin' ).write( traj )
+      t = TrajFile( 'traj.bin' ).read()      ## t.frames is a numpy.memmap
+
+    The frames of a trajectory read with mode='r' are read-only; use
+    mode='r+' for in-place operations like Trajectory.fit (which then
+    modify the file) or mode='c' for copy-on-write.
+
+    A mapped trajectory that is pickled (e.g. with tools.dump) only keeps a
+    reference to its frame file.
+    """
+
+    #: identifies Biskit trajectory files
+    MAGIC = 'BISKTRAJ'
+
+    #: file format version
+    VERSION = 1
+
+    #: header layout, padded to L{OFFSET} bytes
+    HEADER = N.dtype( [ ('magic', 'S8'), ('version', '<i4'),
+                        ('n_frames', '<i8'), ('n_atoms', '<i8') ] )
+
+    #: start of the coordinate block
+    OFFSET = 64
+
+    #: coordinate type on disc
+    DTYPE = N.dtype( '<f4' )
+
+    #: extension of the side-car pickle with everything except the frames
+    META = '.meta'
+
+    #: number of frames copied at a time by L{write}
+    BLOCKSIZE = 256
+
+    def __init__( self, fname ):
+        """
+        @param fname: name of the frame file
+        @type  fname: str
+        """
+        self.fname = T.absfile( fname )
+        self.fmeta = self.fname + self.META
+
+
+    def __repr__( self ):
+        return '[TrajFile %s]' % self.fname
+
+
+    def exists( self ):
+        """
+        @return: True, if the frame file is present
+        @rtype: bool
+        """
+        return osp.exists( self.fname )
+
+
+    def header( self ):
+        """
+        Read header of the frame file.
+
+        @return: dictionary with 'version', 'n_frames', 'n_atoms'
+        @rtype: dict
+
+        @raise TrajFileError: if the file is no Biskit trajectory file
+        """
+        try:
+            f = open( self.fname, 'rb' )
+            h = N.fromfile( f, self.HEADER, 1 )
+            f.close()
+        except IOError, why:
+            raise TrajFileError, 'Cannot read %s: %s' % (self.fname, why)
+
+        if len( h ) != 1 or h['magic'][0] != self.MAGIC:
+            raise TrajFileError, '%s is not a Biskit trajectory file.' \
+                  % self.fname
+
+        return { 'version' : int( h['version'][0] ),
+                 'n_frames': int( h['n_frames'][0] ),
+                 'n_atoms' : int( h['n_atoms'][0] ) }
+
+
+    def create( self, n_frames, n_atoms ):
+        """
+        Create new (empty) frame file of the given size. Existing files are
+        overridden.
+
+        @param n_frames: number of frames
+        @type  n_frames: int
+        @param n_atoms: number of atoms per frame
+        @type  n_atoms: int
+
+        @return: writeable memory-mapped frame array (n_frames x n_atoms x 3)
+        @rtype: numpy.memmap
+        """
+        h = N.zeros( 1, self.HEADER )
+        h['magic'] = self.MAGIC
+        h['version'] = self.VERSION
+        h['n_frames'] = n_frames
+        h['n_atoms'] = n_atoms
+
+        f = open( self.fname, 'wb' )
+        f.write( h.tostring().ljust( self.OFFSET, '\0' ) )
+        f.close()
+
+        return self.frames( mode='r+', header=(n_frames, n_atoms) )
+
+
+    def frames( self, mode='r', header=None ):
+        """
+        Map the frames of this file into memory.
+
+        @param mode: 'r' (read-only), 'r+' (read and write), 'c'
+                     (copy-on-write) ['r']
+        @type  mode: str
+        @param header: (n_frames, n_atoms) if already known [read from file]
+        @type  header: (int, int)
+
+        @return: memory-mapped frame array (n_frames x n_atoms x 3)
+        @rtype: numpy.memmap
+        """
+        if header is None:
+            h = self.header()
+            header = ( h['n_frames'], h['n_atoms'] )
+
+        n_frames, n_atoms = header
+
+        return N.memmap( self.fname, dtype=self.DTYPE, mode=mode,
+                         offset=self.OFFSET, shape=(n_frames, n_atoms, 3) )
+
+
+    def writeFrames( self, frames, blocksize=None ):
+        """
+        Write frames (array or memmap) block by block into a new frame file.
+
+        @param frames: frames x atoms x 3 array of coordinates
+        @type  frames: array
+        @param blocksize: number of frames copied at a time [BLOCKSIZE]
+        @type  blocksize: int
+
+        @return: writeable memory-mapped copy of the frames
+        @rtype: numpy.memmap
+        """
+        blocksize = blocksize or self.BLOCKSIZE
+        n_frames, n_atoms = N.shape( frames )[:2]
+
+        r = self.create( n_frames, n_atoms )
+
+        for start in range( 0, n_frames, blocksize ):
+            r[ start : start+blocksize ] = frames[ start : start+blocksize ]
+
+        r.flush()
+        return r
+
+
+    def writeMeta( self, traj ):
+        """
+        Pickle everything but the frames of a trajectory to the side-car
+        file. The pickled trajectory points to this frame file.
+
+        @param traj: trajectory
+        @type  traj: Trajectory
+        """
+        frames, fname = traj.frames, getattr( traj, 'framesFile', None )
+
+        try:
+            traj.frames = None
+            traj.framesFile = LocalPath( self.fname )
+            T.dump( traj, self.fmeta )
+        finally:
+            traj.frames, traj.framesFile = frames, fname
+
+
+    def write( self, traj, blocksize=None ):
+        """
+        Write a trajectory (or sub-class) to frame file and side-car file.
+
+        @param traj: trajectory
+        @type  traj: Trajectory
+        @param blocksize: number of frames copied at a time [BLOCKSIZE]
+        @type  blocksize: int
+        """
+        if isMapped( traj.frames ) and \
+           osp.abspath( traj.frames.filename ) == self.fname:
+            traj.frames.flush()
+        else:
+            self.writeFrames( traj.frames, blocksize=blocksize )
+
+        self.writeMeta( traj )
+
+
+    def read( self, mode='r' ):
+        """
+        Read trajectory from side-car file and map its frames.
+
+        @param mode: frame access 'r' (read-only), 'r+' (read and write),
+                     'c' (copy-on-write) ['r']
+        @type  mode: str
+
+        @return: trajectory (of the class that was written) with
+                 memory-mapped frames
+        @rtype: Trajectory
+
+        @raise TrajFileError: if frame and side-car files don't match
+        """
+        traj = T.load( self.fmeta )
+
+        traj.framesFile = LocalPath( self.fname )
+        traj.frames = self.frames( mode=mode )
+
+        if traj.ref is not None and \
+               traj.ref.lenAtoms( lookup=False ) != traj.frames.shape[1]:
+            raise TrajFileError, 'Atoms of %s do not match reference model.'\
+                  % self.fname
+
+        return traj
+
+
+#############
+##  TESTING
+#############
+import Biskit.test as BT
+import tempfile
+
+class Test(BT.BiskitTest):
+    """TrajFile test"""
+
+    def prepare( self ):
+        self.f = tempfile.mktemp( '_test.traj' )
+
+    def cleanUp( self ):
+        T.tryRemove( self.f )
+        T.tryRemove( self.f + TrajFile.META )
+
+    def test_TrajFile( self ):
+        """TrajFile write/read/fit test"""
+        import Biskit.tools as T
+        from Biskit import EnsembleTraj
+        from Biskit.EnsembleTraj import traj2ensemble
+
+        self.t = traj2ensemble( T.load( T.testRoot()+'/lig_pcr_00/traj.dat'))
+
+        TrajFile( self.f ).write( self.t, blocksize=7 )
+
+        self.t2 = TrajFile( self.f ).read( mode='r+' )
+
+        self.assert_( isMapped( self.t2.frames ) )
+        self.assert_( isinstance( self.t2, EnsembleTraj ) )
+        self.assert_( N.all( self.t2.frames == self.t.frames ) )
+        self.assertEqual( self.t2.n_members, self.t.n_members )
+
+        ## block-wise operations give the same result as in memory
+        self.t.BLOCKSIZE = self.t2.BLOCKSIZE = 13
+
+        self.assertAlmostEqual( N.sum( self.t2.getFluct_global() ),
+                                N.sum( self.t.getFluct_global() ), 3 )
+
+        self.t.fitMembers( verbose=0 )
+        self.t2.fitMembers( verbose=0 )
+        self.assertAlmostEqual( N.sum( self.t2.profile('rms') ),
+                                N.sum( self.t.profile('rms') ), 4 )
+
+        ## frames were fitted in place and stay mapped
+        self.assert_( isMapped( self.t2.frames ) )
+
+        self.t3 = self.t2.takeFrames( range( 0, 100, 3 ) )
+        self.assert_( not isMapped( self.t3.frames ) )
+        self.assert_( N.all( self.t3.frames == self.t2.frames[::3] ) )
+
+        ## pickled mapped trajectories only keep a reference to the frames
+        f_pickle = self.f + '.pickle'
+        try:
+            T.dump( self.t2, f_pickle )
+            self.assert_( osp.getsize( f_pickle ) < self.t2.frames.nbytes )
+            self.t4 = T.load( f_pickle )
+            self.assert_( N.all( self.t4.frames == self.t2.frames ) )
+        finally:
+            T.tryRemove( f_pickle )
+
+
+if __name__ == '__main__':
+
+    BT.localTest()
@@ -38,6 +38,7 @@ from Biskit.Errors import BiskitError
 from Biskit import EHandler
 from PDBModel import PDBModel, PDBError
 from ProfileCollection import ProfileCollection
+from TrajFile import TrajFile, isMapped
 
 import string
 import re
@@ -75,6 +76,12 @@ class Trajectory:
     ## used by __cmpFileNames()
     ex_numbers = re.compile('\D*([0-9]+)\D*')
 
+    #: number of frames processed at a time by block-wise operations
+    BLOCKSIZE = 256
+
+    #: max. number of atoms x frames in one superposition batch
+    FITBUFFER = 2**21
+
     def __init__( self, pdbs=None, refpdb=None, rmwat=1,
                   castAll=0, verbose=1 ):
         """
@@ -98,6 +105,8 @@ class Trajectory:
         """
         self.ref = None
         self.frames = None
+        #: LocalPath of TrajFile if frames are memory-mapped from disc
+        self.framesFile = None
         self.resIndex = None
         self.frameNames = None
         self.pc = None
@@ -214,8 +223,19 @@ class Trajectory:
         self.pc = getattr( self, 'pc', None )
         self.frameNames = getattr( self, 'frameNames', None)
         self.profiles = getattr( self, 'profiles', TrajProfiles() )
+        self.framesFile = getattr( self, 'framesFile', None )
+
+        ## frames are kept in a separate TrajFile
+        if self.frames is None and self.framesFile is not None:
+            f = TrajFile( self.framesFile.local() )
+            if f.exists():
+                self.frames = f.frames()
+            else:
+                EHandler.warning('Cannot find frame file %s.' \
+                                 % self.framesFile.formatted() )
 
-        if type( self.frames ) is not N.ndarray:
+        if self.frames is not None and \
+               not isinstance( self.frames, N.ndarray ):
             self.frames = N.array( self.frames )
         if type( self.resIndex ) is not N.ndarray:
             self.resIndex = N.array( self.resIndex )
@@ -223,8 +243,17 @@ class Trajectory:
 
     def __getstate__(self):
         """
-        Called before pickling the object.
+        Called before pickling the object. Memory-mapped frames are not
+        pickled but re-mapped from their L{TrajFile} upon unpickling.
         """
+        if self.framesFile is not None and isMapped( self.frames ):
+            state = copy.copy( self.__dict__ )
+            state['frames'] = None
+            return state
+
+        if self.frames is None:
+            return self.__dict__
+
         try:
             if type( self.frames ) == list or self.frames.dtype.char == 'd':
                 EHandler.warning("Converting coordinates to float array.")
@@ -245,11 +274,68 @@ class Trajectory:
         @rtype: PDBModel
         """
         result = PDBModel( self.getRef(), noxyz=1 )
-        result.setXyz( N.average( self.frames ) )
+        result.setXyz( self._avgFrame().astype( self.frames.dtype ) )
 
         return result
 
 
+    def frameBlocks( self, indices=None, blocksize=None ):
+        """
+        Iterate over blocks of frames. Use this rather than self.frames
+        directly in order to avoid loading all frames of a memory-mapped
+        trajectory (see L{Biskit.TrajFile}) into memory at once::
+          for start, block in traj.frameBlocks():
+             ...
+
+        For consecutive frames (indices=None), blocks are views and
+        changes to them go into the trajectory.
+
+        @param indices: frame indices (default: all frames)
+        @type  indices: [int]
+        @param blocksize: number of frames per block (default: BLOCKSIZE)
+        @type  blocksize: int
+
+        @return: position of the block (in indices) and block of frames
+        @rtype: iterator over (int, array)
+        """
+        blocksize = blocksize or self.BLOCKSIZE
+
+        if indices is None:
+            for start in range( 0, self.lenFrames(), blocksize ):
+                yield start, self.frames[ start : start+blocksize ]
+            return
+
+        indices = N.array( indices, N.Int )
+        for start in range( 0, len( indices ), blocksize ):
+            yield start, self.frames[ indices[ start : start+blocksize ] ]
+
+
+    def _avgFrame( self, indices=None, mask=None ):
+        """
+        Average coordinates of all or selected frames, calculated block
+        by block.
+
+        @param indices: frame indices (default: all frames)
+        @type  indices: [int]
+        @param mask: atom mask, atoms to consider (default: all)
+        @type  mask: [1|0]
+
+        @return: average coordinates, N_atoms (or N_masked) x 3
+        @rtype: array of float
+        """
+        r = N.zeros( N.shape( self.frames )[1:], N.Float )
+        n = 0
+
+        for start, block in self.frameBlocks( indices ):
+            r += N.sum( block, 0 )
+            n += len( block )
+
+        if mask is not None:
+            r = N.compress( mask, r, 0 )
+
+        return r / n
+
+
     def __collectFrames( self, pdbs, castAll=0 ):
         """
         Read coordinates from list of pdb files.
@@ -427,6 +513,8 @@ class Trajectory:
         Get atom mask.
 
         @param what: Create the mask using::
+                      - str, selection expression, e.g. 'name CA and
+                        chain A' (see L{Biskit.AtomSelection})
                       - funct( self.ref.atoms[i] ) -> int
                       - list int ( indices )
                       - mask
@@ -472,7 +560,10 @@ class Trajectory:
         r = self.__class__()
 
         ## this step takes some time for large frames !
-        r.frames = N.take( self.frames, indices, 0 )
+        r.frames = N.zeros( (len(indices),) + N.shape( self.frames )[1:],
+                            self.frames.dtype )
+        for start, block in self.frameBlocks( indices ):
+            r.frames[ start : start+len(block) ] = block
 
         ## semi-deep copy of reference model
         r.setRef( self.ref.take( range( self.ref.lenAtoms() )) )
@@ -510,7 +601,7 @@ class Trajectory:
         @return: copy of this Trajectory (fewer frames, semi-deep copy of ref)
         @rtype: Trajectory
         """
-        return self.takeFrames( N.nonzero( mask ) )
+        return self.takeFrames( N.flatnonzero( mask ) )
 
 
     def replaceContent( self, traj ):
@@ -522,6 +613,7 @@ class Trajectory:
         @type  traj: trajectory
         """
         self.frames = traj.frames
+        self.framesFile = traj.framesFile
         self.ref = traj.ref
         self.frameNames = traj.frameNames
         self.pc = traj.pc
@@ -571,6 +663,7 @@ class Trajectory:
         ## copy over everything, so that child classes can preserve own fields
         r.__dict__.update( self.__dict__ )
         r.frames = r.ref = r.frameNames = r.profiles = None
+        r.framesFile = None
 
         r.frames = N.take( self.frames, indices, 1 )
 
@@ -619,6 +712,7 @@ class Trajectory:
         structure.
 
         @param what: Specify what atoms to remove::
+                      - str, selection expression (see L{atomMask})
                       - function( atom_dict ) -> 1 || 0    or (1..remove)
                       - list of int [4, 5, 6, 200, 201..], indices of atoms
                           to remove
@@ -669,8 +763,9 @@ class Trajectory:
         for the fit is put into a profile called |prof|_considered
         (i.e. by default 'rms_considered').
 
-        @param mask: atom mask, atoms to consider default: [all]
-        @type  mask: [1|0]
+        @param mask: atom mask or selection expression (see L{atomMask}),
+                     atoms to consider default: [all]
+        @type  mask: [1|0] OR str
         @param ref: use as reference, default: None, average Structure
         @type  ref: PDBModel
         @param n_it: number of fit iterations, kicking out outliers on the way
@@ -688,62 +783,103 @@ class Trajectory:
         @type profInfos: key=value
         """
         if ref == None:
-            refxyz = N.average( self.frames, 0 )
+            refxyz = self._avgFrame()
         else:
             refxyz = ref.getXyz()
 
         if mask is None:
             mask = N.ones( len( refxyz ), N.int32 )
 
+        if isinstance( mask, str ):
+            mask = self.atomMask( mask )
+
         refxyz = N.compress( mask, refxyz, 0 )
 
+        if fit and not self.frames.flags.writeable:
+            raise TrajError, 'Cannot fit read-only (memory-mapped) frames.'
+
         if verbose: T.errWrite( "rmsd fitting..." )
 
-        rms = []          ## rms value of each frame
-        non_outliers = [] ## fraction of atoms considered for rms and fit
-        iterations = []   ## number of iterations performed on each frame
+        rms, non_outliers = self._fitFrames( refxyz, mask=mask, n_it=n_it,
+                                             fit=fit, verbose=verbose )
 
-        for i in range(0, len( self.frames) ):
+        self.setProfile( prof, rms, n_iterations=n_it, **profInfos )
 
-            xyz = self.frames[i]
+        if non_outliers:
+            self.setProfile( prof+'_considered', non_outliers,
+                             n_iterations=n_it,
+                             comment='fraction of atoms considered for iterative fit' )
 
-            if n_it != 1:
-                (r, t), rmsdList = rmsFit.match( refxyz,
-                                                 N.compress( mask, xyz, 0), n_it)
-                iterations.append( len( rmsdList ) )
-                non_outliers.append( rmsdList[-1][0] )
+        if verbose: T.errWrite( 'done\n' )
 
-                xyz_transformed = N.dot( xyz, N.transpose(r)) + t
 
-                rms += [ rmsdList[-1][1] ]
+    def _fitFrames( self, refxyz, indices=None, mask=None, n_it=1, fit=1,
+                    verbose=0 ):
+        """
+        Superimpose all or selected frames on reference coordinates and
+        return the rms of each frame. Frames are processed block by block.
+        See L{fit}.
 
-            else:
-                r, t = rmsFit.findTransformation( refxyz,
-                                                  N.compress( mask, xyz, 0))
+        @param refxyz: reference coordinates (N_masked x 3)
+        @type  refxyz: array
+        @param indices: frame indices (default: all frames)
+        @type  indices: [int]
+        @param mask: atom mask, atoms to consider default: [all]
+        @type  mask: [1|0]
+        @param n_it: number of fit iterations (default: 1)
+        @type  n_it: int
+        @param fit: transform frames after match, otherwise just calc rms
+                    (default: 1)
+        @type  fit: 1|0
+
+        @return: rms of each frame, fraction of atoms considered for the fit
+        @rtype: [float], [float]
+        """
+        if mask is None:
+            mask = N.ones( self.lenAtoms(), N.int32 )
+
+        atoms = N.flatnonzero( mask )
 
-                xyz_transformed = N.dot( xyz, N.transpose(r)) + t
+        rms = []          ## rms value of each frame
+        non_outliers = [] ## fraction of atoms considered for rms and fit
 
-                d = N.sqrt(N.sum(N.power( N.compress(mask, xyz_transformed,0)\
-                                          - refxyz, 2), 1))
+        ## limit the size of the float64 copies of large frames
+        blocksize = max( 1, min( self.BLOCKSIZE,
+                                 self.FITBUFFER / self.lenAtoms() ) )
 
+        for start, block in self.frameBlocks( indices, blocksize ):
 
-                rms += [ N.sqrt( N.average(d**2) ) ]
+            xyz = N.take( block, atoms, 1 )
 
+            if n_it != 1:
+                (r, t), d, perc, n = rmsFit.matchFrames( refxyz, xyz, n_it )
+                non_outliers += list( perc )
+            else:
+                r, t = rmsFit.findTransformations( refxyz, xyz )
 
             if fit:
-                self.frames[i] = xyz_transformed.astype(N.float32)
+                fitted = rmsFit.transformFrames( block, r, t )
+                block[:] = fitted
 
-            if verbose and i%100 == 0:
-                T.errWrite( '#' )
+                ## blocks of selected frames are copies
+                if indices is not None:
+                    i = N.array( indices )[ start : start+len(block) ]
+                    self.frames[ i ] = block
 
-        self.setProfile( prof, rms, n_iterations=n_it, **profInfos )
+            if n_it == 1:
+                if fit:
+                    d = N.take( fitted, atoms, 1 ) - refxyz
+                else:
+                    d = rmsFit.transformFrames( xyz, r, t ) - refxyz
 
-        if non_outliers:
-            self.setProfile( prof+'_considered', non_outliers,
-                             n_iterations=n_it,
-                             comment='fraction of atoms considered for iterative fit' )
+                d = N.sqrt( N.average( N.sum( d**2, 2 ), 1 ) )
 
-        if verbose: T.errWrite( 'done\n' )
+            rms += list( d )
+
+            if verbose:
+                T.errWrite( '#' )
+
+        return rms, non_outliers
 
 
     def transform( self, *rt ):
@@ -759,15 +895,11 @@ class Trajectory:
             rt = rt[0]
             r, t = (rt[0:3,0:3], rt[0:3, 3])
 
-        r = N.transpose( r )
-        r = r.astype(N.Float32)
-        t = t.astype(N.Float32)
+        r = N.array( r ).astype(N.Float32)
+        t = N.array( t ).astype(N.Float32)
 
-        for i in range( len( self.frames ) ):
-            self.frames[ i ] = N.array( N.dot( self.frames[i], r ) ) + t 
-
-##         self.frames = N.array( [ N.dot( f, r )  for f in self.frames ] )
-##         self.frames += t
+        for start, block in self.frameBlocks():
+            block[:] = rmsFit.transformFrames( block, r, t )
 
 
     def blockFit2ref( self, refModel=None, mask=None, conv=1e-6 ):
@@ -1030,34 +1162,37 @@ class Trajectory:
         return self.profiles.plot( *name, **args )
 
 
-    def pairwiseRmsd( self, aMask=None, noFit=0 ):
+    def pairwiseRmsd( self, aMask=None, noFit=0, condensed=0, ncpu=1 ):
         """
-        Calculate rmsd between each 2 coordinate frames.
+        Calculate rmsd between each 2 coordinate frames. The rmsd matrix is
+        computed in tiles of frames with one batched superposition per tile
+        (see L{rmsFit.pairwiseRmsd}), optionally on several CPUs.
 
         @param aMask: atom mask
         @type  aMask: [1|0]
-        @return: frames x frames array of float
+        @param noFit: don't superimpose the frames (default: 0)
+        @type  noFit: 1|0
+        @param condensed: only return the values above the diagonal
+                          (in the order of L{MU.aboveDiagonal}) (default: 0)
+        @type  condensed: 1|0
+        @param ncpu: number of processes used (default: 1)
+        @type  ncpu: int
+
+        @return: frames x frames array of float OR
+                 frames*(frames-1)/2 array of float if condensed
         @rtype: array
         """
         frames = self.frames
 
-        if aMask != None:
-            frames = N.compress( aMask, frames, 1 )
-
-        result = N.zeros( (len( frames ), len( frames )), N.Float32 )
+        if aMask is not None:
+            i = N.flatnonzero( aMask )
+            frames = N.zeros( (len( self.frames ), len(i), 3), N.Float32 )
 
-        for i in range(0, len( frames ) ):
+            for start, block in self.frameBlocks():
+                frames[ start : start+len(block) ] = N.take( block, i, 1 )
 
-            for j in range( i+1, len( frames ) ):
-                if noFit:
-                    d = N.sqrt(N.sum(N.power(frames[i]-frames[j], 2), 1))
-                    result[i,j] = result[j,i] = N.sqrt( N.average(d**2) )
-
-                else:
-                    rt, rmsdLst = rmsFit.match( frames[i], frames[j], 1 )
-                    result[i,j] = result[j,i] = rmsdLst[0][1]
-
-        return result
+        return rmsFit.pairwiseRmsd( frames, fit=not noFit,
+                                    condensed=condensed, ncpu=ncpu )
 
 
     def getFluct_global( self, mask=None ):
@@ -1072,14 +1207,18 @@ class Trajectory:
         @return: Numpy array ( N_unmasked x 1 ) of float.
         @rtype: array
         """
-        frames = self.frames
-        if mask is not None:
-            frames = N.compress( mask, frames, 1 )
-
         ## mean position of each atom in all frames
-        avg = N.average( frames )
+        avg = self._avgFrame( mask=mask )
+
+        r = N.zeros( len( avg ), N.Float )
+
+        for start, frames in self.frameBlocks():
+            if mask is not None:
+                frames = N.compress( mask, frames, 1 )
+
+            r += N.sum( N.sqrt( N.sum( N.power( frames - avg, 2), 2) ), 0 )
 
-        return N.average(N.sqrt(N.sum(N.power(frames - avg, 2), 2) ))
+        return r / self.lenFrames()
 
 
     def __resWindow( self, res, n_neighbores, rchainMap=None,
@@ -1136,11 +1275,14 @@ class Trajectory:
 
 
     def getFluct_local( self, mask=None, border_res=1,
-                        left_atoms=['C'], right_atoms=['N'], verbose=1 ):
+                        left_atoms=['C'], right_atoms=['N'], verbose=1,
+                        ncpu=1 ):
         """
         Get mean displacement of each atom from it's average position after
         fitting of each residue to the reference backbone coordinates of itself
         and selected atoms of neighboring residues to the right and left.
+        The windows of all residues are superimposed in batches of
+        residues x frames (see L{rmsFit.windowFluct}).
 
         @param mask: N_atoms x 1 array of 0||1, atoms for which fluctuation
                      should be calculated
@@ -1151,6 +1293,8 @@ class Trajectory:
         @type  left_atoms: [str]
         @param right_atoms: atoms (names) to use from these neighbore residues
         @type  right_atoms: [str]
+        @param ncpu: number of processes sharing the residues (default: 1)
+        @type  ncpu: int
 
         @return: Numpy array ( N_unmasked x 1 ) of float
         @rtype: array
@@ -1168,42 +1312,46 @@ class Trajectory:
         ## chain index of each residue
         rchainMap = N.take( self.ref.chainMap(), self.ref.resIndex() )
 
-        result = []
+        mask_BB = self.ref.maskBB() * self.ref.maskHeavy()
+
+        ## atoms of each residue followed by its neighbore atoms
+        windows, n_center = [], []
 
         for res in residues:
 
             i_res, i_border = self.__resWindow(res, border_res, rchainMap,
                                                fit_atoms_left, fit_atoms_right)
 
-            try:
-                if not len( i_res ): raise PDBError, 'empty residue'
-
-                t_res = self.takeAtoms( i_res + i_border )
+            if not len( i_res ): raise PDBError, 'empty residue'
 
-                i_center = range( len( i_res ) )
+            windows += [ i_res + list( i_border ) ]
+            n_center += [ len( i_res ) ]
 
-                mask_BB = t_res.ref.maskBB() * t_res.ref.maskHeavy()
+        n_max = max( [ len( w ) for w in windows ] + [ 1 ] )
+        index = N.zeros( ( len( windows ), n_max ), N.Int )
+        fitmask = N.zeros( ( len( windows ), n_max ), N.Float )
 
-                ## fit with border atoms ..
-                t_res.fit( ref=t_res.ref, mask=mask_BB, verbose=0 )
-                ## .. but calculate only with center residue atoms
-                frames = N.take( t_res.frames, i_center, 1 )
+        for i, w in enumerate( windows ):
+            index[ i, :len( w ) ] = w
+            fitmask[ i, :len( w ) ] = N.take( mask_BB, w )
 
-                avg = N.average( frames )
+            ## nothing to fit, fluctuation is reported as 0
+            if not N.any( fitmask[ i ] ):
+                T.errWrite( '?' + str( residues[i] ) )
 
-                rmsd = N.average(N.sqrt(N.sum(N.power(frames - avg, 2), 2) ))
+        blocksize = max( 1, self.FITBUFFER / ( self.lenFrames() * n_max ) )
+        if ncpu > 1:
+            blocksize = min( blocksize, -( -len( windows ) / ncpu ) )
 
-                result.extend( rmsd )
+        r = rmsFit.windowFluct( self.frames, self.ref.getXyz(), index,
+                                fitmask, blocksize=blocksize, ncpu=ncpu )
 
-                if verbose: T.errWrite('#')
-
-            except ZeroDivisionError:
-                result.extend( N.zeros( len(i_res), N.Float32 ) )
-                T.errWrite('?' + str( res ))
+        ## only keep the center residue atoms
+        center = N.arange( n_max ) < N.array( n_center )[:, N.NewAxis]
 
         if verbose: T.errWriteln( "done" )
 
-        return result
+        return r[ center ]
 
 
     def residusMaximus( self, atomValues, mask=None ):
@@ -1254,7 +1402,7 @@ class Trajectory:
         @return: Numpy array 1 x N of float
         @rtype: [float]
         """
-        if fluctList == None:
+        if fluctList is None:
             fluctList = self.getFluct_local()
 
         ## define mask for gamma atoms in all Amino acids
@@ -1278,7 +1426,7 @@ class Trajectory:
 
         @raise TrajError: if result length <> N_residues: 
         """
-        if atomFluctList == None:
+        if atomFluctList is None:
             atomFluctList = self.getFluct_global()
 
         ## Give all atoms of each res. the same fluct. value
@@ -1298,6 +1446,53 @@ class Trajectory:
         return result
 
 
+    def dihedrals( self, name, indices=None ):
+        """
+        Backbone or side chain torsion of each residue in each frame,
+        calculated block by block (see L{PDBModel.dihedralAtoms})::
+          t.dihedrals( 'psi' ) -> array( N_frames x N_residues )
+
+        @param name: torsion name (phi, psi, omega, chi1 .. chi5)
+        @type  name: str
+        @param indices: frame indices (default: all frames)
+        @type  indices: [int]
+
+        @return: angles in degrees (-180 to 180), NaN where undefined
+        @rtype: array of float
+
+        @raise PDBError: if the torsion name is unknown
+        """
+        i = self.ref.dihedralAtoms( name )
+        undefined = N.flatnonzero( N.less( i[:,0], 0 ) )
+        i = N.ravel( N.maximum( i, 0 ) )
+
+        n = self.lenFrames() if indices is None else len( indices )
+        r = N.zeros( ( n, self.ref.lenResidues() ), N.Float32 )
+
+        for start, block in self.frameBlocks( indices ):
+            x = N.reshape( N.take( block, i, 1 ), ( len( block ), -1, 4, 3 ) )
+            r[ start : start+len( block ) ] = \
+               MU.dihedral( x[:,:,0], x[:,:,1], x[:,:,2], x[:,:,3] )
+
+        r[:, undefined] = N.nan
+
+        return r
+
+
+    def addDihedrals( self, names=[ 'phi', 'psi' ] ):
+        """
+        Store torsions of all frames as profiles (N_frames x N_residues)
+        with the torsion name, e.g. t.profile('phi')[:,10] are the phi
+        angles of residue 10 in all frames (see L{dihedrals}).
+
+        @param names: torsion names (default: ['phi', 'psi'])
+        @type  names: [str]
+        """
+        for name in names:
+            self.setProfile( name, self.dihedrals( name ), asarray=2,
+                             comment='%s torsion of each residue [deg]' % name )
+
+
     def __cmpLists( self, l1, l2 ):
         """
         Compare to lists by their first, then second, etc item.
@@ -1426,7 +1621,8 @@ class Trajectory:
 
             result['p'] = N.take( result['p'], indices, 0 )
 
-            result['u'] = N.take( result['u'], indices, 0 )
+            if result.get( 'n_pc' ) is None:
+                result['u'] = N.take( result['u'], indices, 0 )
 
             if result['fMask'] != None:
                 result['fMask'] = N.take( result['fMask'], indices, 0 )
@@ -1447,41 +1643,48 @@ class Trajectory:
         return self.__takePca( N.nonzero( fMask ) )
 
 
-    def getPca( self, aMask=None, fMask=None, fit=1 ):
+    def getPca( self, aMask=None, fMask=None, fit=1, n_pc=None ):
         """
         Get the results form a principal component analysis.
 
-        @param aMask: 1 x N_atoms of 1|0, atom mask, default: last one used
+        @param aMask: 1 x N_atoms of 1|0, atom mask, default: all
         @type  aMask: [1|0]
         @param fMask: 1 x N_frames of 1|0, frame mask, default: all
         @type  fMask: [1|0]
         @param fit: fit to average structure before doing the PC analysis
                     (default: 1)
         @type  fit: 1|0
+        @param n_pc: only calculate this many components with the
+                     streaming method of L{pca} (default: None, all)
+        @type  n_pc: int
 
         @return: Dictionary with results from the PC analysis::
                    dic {'p': projection of each frame in PC space,
                         'e': list of eigen values,
-                        'fit':.., 'aMask':.., 'fMask':.. parameters used}
+                        'u': eigenvectors (rows),
+                        'fit':.., 'aMask':.., 'fMask':.., 'n_pc':..
+                        parameters used}
         @rtype: dict
         """
-        if aMask == None:
+        if aMask is None:
             aMask = N.ones( self.getRef().lenAtoms(), N.int32 )
 
         pc = getattr(self, 'pc', None)
 
         ## return chached result if parameters haven't changed
-        if pc != None and pc['fMask'] == fMask and pc['fit'] == fit and \
-           aMask == pc['aMask']:
+        if pc is not None and MU.arrayEqual( pc['fMask'], fMask ) and \
+           pc['fit'] == fit and MU.arrayEqual( aMask, pc['aMask'] ) and \
+           pc.get( 'n_pc' ) == n_pc:
 
             return pc
 
-        evectors, proj, evalues = self.pca( aMask, fMask, fit )
+        evectors, proj, evalues = self.pca( aMask, fMask, fit, n_pc=n_pc )
 
         pc = {}
         pc['aMask'] = aMask
         pc['fMask'] = fMask
         pc['fit'] = fit
+        pc['n_pc'] = n_pc
         pc['p'] = proj
         pc['e'] = evalues
         pc['u'] = evectors
@@ -1491,19 +1694,100 @@ class Trajectory:
         return pc
 
 
-    def pca( self, atomMask=None, frameMask=None, fit=1 ):
+    def __pcaBlocks( self, indices, atoms, avg, fitref=None ):
+        """
+        Iterate over blocks of raveled frames for the PCA.
+
+        @param indices: frame indices (None: all frames)
+        @type  indices: [int]
+        @param atoms: atom indices
+        @type  atoms: [int]
+        @param avg: raveled average frame subtracted from each frame
+        @type  avg: array OR 0
+        @param fitref: superimpose each frame onto these coordinates
+                       without changing the trajectory (default: None)
+        @type  fitref: array
+
+        @return: position of the block and block (N_block x 3 N_atoms)
+        @rtype: iterator over (int, array of float)
+        """
+        blocksize = max( 1, min( self.BLOCKSIZE,
+                                 self.FITBUFFER / max( 1, len( atoms ) ) ) )
+
+        for start, block in self.frameBlocks( indices, blocksize ):
+            x = N.take( block, atoms, 1 )
+
+            if fitref is not None:
+                r, t = rmsFit.findTransformations( fitref, x )
+                x = rmsFit.transformFrames( x, r, t )
+
+            x = N.reshape( x, ( len( x ), -1 ) ).astype( N.Float )
+
+            yield start, x - avg
+
+
+    def __pcaPrepare( self, atomMask, fit ):
+        """
+        Superimpose the frames for the PCA and calculate their average.
+        Writeable frames are fitted in place (see L{fit}), read-only
+        (memory-mapped) frames are superimposed on the fly.
+
+        @return: atom indices, raveled average, reference for fit on the fly
+        @rtype: array, array, array OR None
+        """
+        atoms = N.flatnonzero( atomMask )
+        fitref = None
+
+        if fit:
+            if self.frames.flags.writeable:
+                self.fit( atomMask )
+            else:
+                fitref = self._avgFrame( mask=atomMask )
+
+        if fitref is None:
+            avg = N.ravel( self._avgFrame( mask=atomMask ) )
+        else:
+            avg = N.zeros( 3 * len( atoms ), N.Float )
+            for start, x in self.__pcaBlocks( None, atoms, 0, fitref ):
+                avg += N.sum( x, 0 )
+            avg /= self.lenFrames()
+
+        return atoms, avg, fitref
+
+
+    def pca( self, atomMask=None, frameMask=None, fit=1, n_pc=None,
+             n_it=4, seed=0 ):
         """
         Calculate principal components of trajectory frames.
 
+        By default, all components are calculated with a singular value
+        decomposition of the complete N_frames x 3 N_atoms matrix of
+        centered coordinates. With n_pc, only the first n_pc components
+        are calculated from frame blocks that are streamed several times
+        (2 n_it + 2) through a randomized SVD (see L{MU.randomizedSVD}).
+        Memory then scales with (N_frames + 3 N_atoms) x n_pc and
+        memory-mapped frames (see L{Biskit.TrajFile}) are never loaded as a
+        whole. Read-only frames are superimposed on the fly without
+        changing the trajectory.
+
         @param atomMask: 1 x N_atoms, [111001110..] atoms to consider
                          (default: all)
         @type  atomMask: [1|0]
         @param frameMask: 1 x N_frames, [001111..] frames to consider
                           (default all )
         @type  frameMask: [1|0]
+        @param fit: superimpose frames on their average first (default: 1)
+        @type  fit: 1|0
+        @param n_pc: number of components, None for all (default: None)
+        @type  n_pc: int
+        @param n_it: power iterations of the streaming method (default: 4)
+        @type  n_it: int
+        @param seed: seed for the random projection of the streaming
+                     method (default: 0)
+        @type  seed: int
 
-        @return: (N_frames x N_frames), (1 x N_frames),
-                 projection of each frame in PC space, eigenvalue of each PC
+        @return: eigenvectors (N_pc x 3 N_atoms), projection of each frame
+                 in PC space (N_frames x N_pc), eigenvalue of each PC
         @rtype: array, array, array
         """
         if frameMask is None: frameMask = N.ones( len( self.frames ), N.int32 )
@@ -1511,21 +1795,25 @@ class Trajectory:
         if atomMask is None: atomMask = N.ones(self.getRef().lenAtoms(),
                                                N.int32)
 
-        if fit:
-            self.fit( atomMask )
+        atoms, avg, fitref = self.__pcaPrepare( atomMask, fit )
 
-        refxyz = N.average( self.frames, 0 )
+        indices = N.flatnonzero( frameMask )
+        if len( indices ) == self.lenFrames():
+            indices = None              ## consecutive blocks are views
 
-        data = N.compress( frameMask, self.frames, 0 )
+        blocks = lambda: self.__pcaBlocks( indices, atoms, avg, fitref )
 
-        data = data - refxyz
+        if n_pc is None:
+            data = N.concatenate( [ x for start, x in blocks() ] )
 
-        data = N.compress( atomMask, data, 1 )
+            V, L, U = LA.singular_value_decomposition( data )
 
-        ## reduce to 2D array
-        data = N.array( map( N.ravel, data ) )
+        else:
+            shape = ( int( N.sum( N.not_equal( frameMask, 0 ) ) ),
+                      3 * len( atoms ) )
 
-        V, L, U = LA.singular_value_decomposition( data )
+            V, L, U = MU.randomizedSVD( blocks, shape, n_pc, n_it=n_it,
+                                        seed=seed )
 
         return U, V * L, N.power(L, 2)
 
@@ -1550,23 +1838,30 @@ class Trajectory:
         @return: Trajectory with frames visualizing the morphing.
         @rtype: Trajectory
         """
-        fit = 1
+        fit, n_pc = 1, None
         if self.pc is not None:
             fit = self.pc['fit']
-        pc = self.getPca( fit=fit )
+            n_pc = self.pc.get( 'n_pc' )
+        pc = self.getPca( fit=fit, n_pc=n_pc )
 
         ## eigenvectors (rows)
         U = pc['u']
 
-        ## raveled and centered frames
-        x_avg = N.average(self.frames, 0)
-        X = N.array( [N.ravel(x) for x in self.frames - x_avg] )
+        ## raveled and centered frames, streamed block by block
+        ## (writeable frames have already been fitted by getPca)
+        atoms, x_avg, fitref = self.__pcaPrepare( pc['aMask'],
+                                    fit and not self.frames.flags.writeable )
+
+        X = lambda indices: self.__pcaBlocks( indices, atoms, x_avg, fitref )
+
+        X_ref = [ x for start, x in X( [ ref ] ) ][0][0]
 
         ## ev'th eigenvector of reference frame
-        alpha_0 = N.dot( X[ref], U[ev] )
+        alpha_0 = N.dot( X_ref, U[ev] )
 
         ## list of deviations of ev'th eigenvector of each frame from ref
-        alpha_range = N.dot(X, U[ev]) - alpha_0
+        alpha_range = N.concatenate( [ N.dot( x, U[ev] )
+                                       for start, x in X( None ) ] ) - alpha_0
 
         ## get some representative alphas...
         if morph:
@@ -1581,11 +1876,11 @@ class Trajectory:
                             for i in range(0,steps) ]
 
         ## scale ev'th eigenvector of ref with different alphas 
-        Y = N.array( [ X[ref] + alpha * U[ev] for alpha in alpha_range] )
+        Y = N.array( [ X_ref + alpha * U[ev] for alpha in alpha_range] )
 
         ## back convert to N x 3 coordinates
-        Y = N.reshape(Y, (Y.shape[0], -1, 3))
         Y = x_avg + Y
+        Y = N.reshape(Y, (Y.shape[0], -1, 3))
 
         result = self.__class__()
         result.ref = self.ref
@@ -1642,6 +1937,117 @@ class Test(BT.BiskitTest):
         self.assertAlmostEqual( N.sum( self.traj.profile('rms') ),
                                 58.101235746353879, 2 )
 
+    def fluctLocalLoop( self, traj ):
+        """reference: fit a sub-trajectory for each residue"""
+        right = N.nonzero( traj.ref.mask( ['N'] ) )
+        left = N.nonzero( traj.ref.mask( ['C'] ) )
+        rchainMap = N.take( traj.ref.chainMap(), traj.ref.resIndex() )
+
+        result = []
+        for res in range( traj.ref.lenResidues() ):
+            i_res, i_border = traj._Trajectory__resWindow( res, 1, rchainMap,
+                                                           left, right )
+            t_res = traj.takeAtoms( i_res + i_border )
+            t_res.fit( ref=t_res.ref, verbose=0,
+                       mask=t_res.ref.maskBB() * t_res.ref.maskHeavy() )
+
+            frames = N.take( t_res.frames, range( len( i_res ) ), 1 )
+            avg = N.average( frames )
+            result.extend( N.average( N.sqrt( N.sum( N.power( frames - avg,
+                                                              2 ), 2 ) ) ) )
+        return result
+
+    def test_fluctLocal(self):
+        """Trajectory.getFluct_local batched / parallel test"""
+        self.traj = T.load(T.testRoot() + '/lig_pcr_00/traj.dat')
+        self.traj = self.traj.compressAtoms( self.traj.ref.maskProtein() )
+        self.traj.FITBUFFER = 50000
+
+        ref = self.fluctLocalLoop( self.traj.clone() )
+
+        r1 = self.traj.getFluct_local( verbose=0 )
+        r2 = self.traj.getFluct_local( verbose=0, ncpu=2 )
+
+        self.assertEqual( len( r1 ), self.traj.lenAtoms() )
+        self.assert_( N.all( N.absolute( r1 - ref ) < 1e-4 ) )
+        self.assert_( N.all( r1 == r2 ) )
+
+    def test_fluctLocalIon(self):
+        """Trajectory.getFluct_local with residue without fit atoms test"""
+        traj = T.load(T.testRoot() + '/lig_pcr_00/traj.dat')
+        full = traj.getFluct_local( verbose=0 )
+
+        ## turn the side chain of the last residue into an ion of its own
+        i_last, i_prev = traj.ref.resIndex()[-1], traj.ref.resIndex()[-2]
+        keep = N.ones( traj.lenAtoms() )
+        keep[ i_last: ] = N.logical_not( traj.ref.maskBB()[ i_last: ] )
+
+        self.traj = traj.compressAtoms( keep )
+        self.traj.ref['chain_id'][ i_last: ] = 'B'
+        self.traj.ref['residue_name'][ i_last: ] = 'ION'
+        self.traj.ref.chainIndex( force=1, cache=1 )
+
+        self.r = self.traj.getFluct_local( verbose=0 )
+
+        self.assertEqual( len( self.r ), self.traj.lenAtoms() )
+        self.assert_( N.all( self.r[ i_last: ] == 0 ) )
+        self.assert_( N.all( self.r[ :i_prev ] == full[ :i_prev ] ) )
+
+    def test_pca(self):
+        """Trajectory.pca streaming / memory-mapped test"""
+        from Biskit.TrajFile import TrajFile
+
+        self.traj = T.load(T.testRoot() + '/lig_pcr_00/traj.dat')
+        self.traj.BLOCKSIZE = 13
+
+        pc = self.traj.getPca()
+        self.assert_( self.traj.getPca() is pc )         ## cached
+
+        ## first components of the streaming method match the full SVD
+        u, p, e = self.traj.pca( fit=0, n_pc=3 )
+        self.assertEqual( N.shape( p ), ( self.traj.lenFrames(), 3 ) )
+        self.assert_( N.allclose( e, pc['e'][:3], rtol=1e-3 ) )
+        self.assert_( N.allclose( N.absolute( p ),
+                                  N.absolute( pc['p'][:,:3] ), atol=1e-2 ) )
+
+        ## read-only frames are superimposed on the fly
+        self.f = tempfile.mktemp( '_test.traj' )
+        try:
+            traj = T.load(T.testRoot() + '/lig_pcr_00/traj.dat')
+            TrajFile( self.f ).write( traj )
+            self.t2 = TrajFile( self.f ).read( mode='r' )
+            self.t2.BLOCKSIZE = 13
+
+            pc2 = self.t2.getPca( n_pc=3 )
+            self.assert_( N.allclose( pc2['e'], pc['e'][:3], rtol=1e-3 ) )
+            self.assert_( N.all( self.t2.frames == traj.frames ) )
+
+            self.m = self.t2.pcMovie( 0, 5 )
+            self.assertEqual( N.shape( self.m.frames ),
+                              ( 5, self.t2.lenAtoms(), 3 ) )
+        finally:
+            T.tryRemove( self.f )
+            T.tryRemove( self.f + TrajFile.META )
+
+    def test_dihedrals( self ):
+        """Trajectory.dihedrals test"""
+        self.traj = T.load(T.testRoot() + '/lig_pcr_00/traj.dat')
+        self.traj.BLOCKSIZE = 13
+
+        self.traj.addDihedrals( [ 'phi', 'psi', 'chi1' ] )
+        r = self.traj.profile( 'psi' )
+
+        self.assertEqual( N.shape( r ),
+                          ( self.traj.lenFrames(), self.traj.ref.lenResidues() ))
+
+        psi = self.traj[ 42 ].dihedrals( 'psi' )
+        self.assert_( N.all( N.isnan( r[42] ) == N.isnan( psi ) ) )
+        self.assert_( N.all( N.absolute( N.nan_to_num( r[42] - psi ) ) < 1e-3 ))
+
+        t = self.traj.takeFrames( range( 5, 10 ) )
+        self.assertEqual( N.shape( t.profile( 'chi1' ) ),
+                          ( 5, self.traj.ref.lenResidues() ) )
+
 
 if __name__ == '__main__':
 
@@ -20,98 +20,103 @@
 ##
 ##
 
-## execute ~/.pythonrc.py if it exists
-import user
+"""
+Biskit, a toolkit for the manipulation of macromolecular structures.
+
+The public classes of all Biskit modules are exported by the package, e.g.
+C{from Biskit import PDBModel}. They are imported only on first access (see
+L{Biskit.LazyModule}) so that scripts only pay for the modules they use.
+"""
 
 ## default error handler
 from ErrorHandler import ErrorHandler
 EHandler = ErrorHandler()
 
-## public classes
-try:
-    from BisList import BisList, BisListError, ConditionError, AmbiguousMatch,\
-         ItemNotFound
-    from DictList import DictList
-
-    from LogFile import LogFile, StdLog, ErrLog
-    from Errors import BiskitError
-
-    from ExeConfig import ExeConfig, ExeConfigError
-    from ExeConfigCache import ExeConfigCache
-    from Executor import Executor, TemplateError
-
-    from AmberCrdParser import AmberCrdParser, ParseError
-    from AmberRstParser import AmberRstParser
-    from PDBCleaner import PDBCleaner, CleanerError
-    from Blast2Seq import Blast2Seq
-    from ChainCleaner import ChainCleaner
-    from ChainSeparator import ChainSeparator
-    from ChainWriter import ChainWriter
-
-    from EDParser import EZDParser
-
-    from EnsembleTraj import EnsembleTraj
-    from LocalPath import LocalPath, LocalPathError
-
-    from PCRModel import PCRModel
-    from PDBModel import PDBModel, PDBProfiles, PDBError
-
-    from ProfileCollection import ProfileCollection, ProfileError
-    from ProfileMirror import ProfileMirror
-    from Prosa import ProsaII
-    from Pymoler import Pymoler
-
-    from TrajCluster import TrajCluster
-    from Trajectory import Trajectory, TrajError, TrajProfiles
-    from XplorInput import XplorInput, XplorInputError
-    from Xplorer import Xplorer, XplorerError, RunError
-    from ColorSpectrum import ColorSpectrum
-    from MatrixPlot import MatrixPlot
-
-    from AmberLeap import AmberLeap
-    from AmberParmBuilder import AmberParmBuilder
-
-    from Hmmer import Hmmer
-    from Fold_X import Fold_X, Fold_XError
-    from WhatIf import WhatIf, WhatIf_Error
-    from SurfaceRacer import SurfaceRacer, SurfaceRacer_Error
-    from DSSP import Dssp, Dssp_Error
-    from FuzzyCluster import FuzzyCluster
-
-    from tmalign import TMAlign
-    from reduce import Reduce
-
-    from ModelList import ModelList
-    from CommandLine import CommandLine
-    
-    from amberResidues import AmberResidueType, AmberPrepParser
-    from amberResidueLibrary import AmberResidueLibrary,\
-                                    AmberResidueLibraryError
-    from atomCharger import AtomCharger
-    from delphi import Delphi, DelphiError
-
-    from PDBDope import PDBDope
-    from Ramachandran import Ramachandran
+from Errors import BiskitError
 
-## experimental modules
-    from residue import Residue
+import LazyModule
 
-    from Model import Model
-    from Polymer import Polymer
-    from Polymer import Feature
-    
-## PVM-dependent modules
+## public classes and the modules defining them
+__exports = [
+    ('BisList', 'BisList BisListError ConditionError AmbiguousMatch '
+                'ItemNotFound'),
+    ('DictList', 'DictList'),
+    ('ColumnCache', 'ColumnCache'),
+
+    ('LogFile', 'LogFile StdLog ErrLog'),
+
+    ('ExeConfig', 'ExeConfig ExeConfigError'),
+    ('ExeConfigCache', 'ExeConfigCache'),
+    ('Executor', 'Executor TemplateError'),
+    ('ExecutorPool', 'ExecutorPool ExecutorPoolError'),
+
+    ('AmberCrdParser', 'AmberCrdParser ParseError'),
+    ('AmberRstParser', 'AmberRstParser'),
+    ('PDBCleaner', 'PDBCleaner CleanerError'),
+    ('Blast2Seq', 'Blast2Seq'),
+    ('ChainCleaner', 'ChainCleaner'),
+    ('ChainSeparator', 'ChainSeparator'),
+    ('ChainWriter', 'ChainWriter'),
+
+    ('EDParser', 'EZDParser'),
+
+    ('EnsembleTraj', 'EnsembleTraj'),
+    ('LocalPath', 'LocalPath LocalPathError'),
+
+    ('PCRModel', 'PCRModel'),
+    ('PDBModel', 'PDBModel PDBProfiles PDBError'),
+
+    ('ProfileCollection', 'ProfileCollection ProfileError'),
+    ('ProfileMirror', 'ProfileMirror'),
+    ('SpatialIndex', 'SpatialIndex SpatialIndexError'),
+    ('AtomSelection', 'AtomSelection AtomSelectionError'),
+    ('ResultCache', 'ResultCache ResultCacheError'),
+    ('Prosa', 'ProsaII'),
+    ('Pymoler', 'Pymoler'),
 
-    from QualMaster import QualMaster
-    from StructureMaster import StructMaster
-    from StructureSlave import StructureSlave
-    from TrajFlexMaster import TrajFlexMaster, FlexError
+    ('TrajCluster', 'TrajCluster'),
+    ('Trajectory', 'Trajectory TrajError TrajProfiles'),
+    ('TrajFile', 'TrajFile TrajFileError'),
+    ('XplorInput', 'XplorInput XplorInputError'),
+    ('Xplorer', 'Xplorer XplorerError RunError'),
+    ('ColorSpectrum', 'ColorSpectrum'),
+    ('MatrixPlot', 'MatrixPlot'),
 
-except Exception, why:
-    EHandler.warning('Could not import all biskit modules:', trace=1 )
+    ('AmberLeap', 'AmberLeap'),
+    ('AmberParmBuilder', 'AmberParmBuilder'),
+
+    ('Hmmer', 'Hmmer'),
+    ('Fold_X', 'Fold_X Fold_XError'),
+    ('WhatIf', 'WhatIf WhatIf_Error'),
+    ('SurfaceRacer', 'SurfaceRacer SurfaceRacer_Error'),
+    ('DSSP', 'Dssp Dssp_Error'),
+    ('FuzzyCluster', 'FuzzyCluster'),
+
+    ('tmalign', 'TMAlign'),
+    ('reduce', 'Reduce'),
+
+    ('ModelList', 'ModelList'),
+    ('CommandLine', 'CommandLine'),
+
+    ('amberResidues', 'AmberResidueType AmberPrepParser'),
+    ('amberResidueLibrary', 'AmberResidueLibrary AmberResidueLibraryError'),
+    ('atomCharger', 'AtomCharger'),
+    ('delphi', 'Delphi DelphiError'),
+
+    ('PDBDope', 'PDBDope'),
+    ('Ramachandran', 'Ramachandran'),
+
+## experimental modules
+    ('residue', 'Residue'),
+
+    ('Model', 'Model'),
+    ('Polymer', 'Polymer Feature'),
+
+## PVM-dependent modules
+    ('QualMaster', 'QualMaster'),
+    ('StructureMaster', 'StructMaster'),
+    ('StructureSlave', 'StructureSlave'),
+    ('TrajFlexMaster', 'TrajFlexMaster FlexError'),
+    ]
 
-try:
-    import biggles
-    del biggles
-except:
-    EHandler.warning('Could not import biggles module -- plotting is not available.')
+LazyModule.install( __name__, LazyModule.exports( __exports ) )
@@ -235,7 +235,39 @@ def randomMask( nOnes, length ):
     return r
 
 
-def random2DArray( matrix, ranNr=1, mask=None):
+def randomPermutations( n, length, seed=None, blocksize=None ):
+    """
+    Draw n random permutations of range( length ) in blocks of rows::
+
+      for perm in randomPermutations( 1000, len( x ), seed=1 ):
+          shuffled = N.take( x, perm )    ## one shuffled x per row
+
+    @param n: number of permutations
+    @type  n: int
+    @param length: length of each permutation
+    @type  length: int
+    @param seed: seed of the random number generator, None for a
+                 different result on every call (default: None)
+    @type  seed: int
+    @param blocksize: max. number of permutations per block
+                      (default: as many as fit into 2**20 elements)
+    @type  blocksize: int
+
+    @return: iterator over 2-D arrays (<= blocksize x length) of int,
+             each row is one permutation
+    @rtype: iterator of array
+    """
+    import numpy as npy
+
+    rand = npy.random.RandomState( seed )
+    blocksize = blocksize or max( 1, 2**20 / max( length, 1 ) )
+
+    for start in range( 0, n, blocksize ):
+        m = min( blocksize, n - start )
+        yield npy.argsort( rand.random_sample( (m, length) ), 1 )
+
+
+def random2DArray( matrix, ranNr=1, mask=None, seed=None ):
     """
     Create randomized 2D array containing ones and zeros.
 
@@ -245,37 +277,44 @@ def random2DArray( matrix, ranNr=1, mask=None):
     @type  mask: list(1|0)
     @param ranNr: number of matricies to add up (default: 1)
     @type  ranNr: integer
+    @param seed: seed of the random number generator, None for a
+                 different result on every call (default: None)
+    @type  seed: int
 
     @return: 2D array or |ranNr| added contact matricies
     @rtype:2D array
 
     @raise MathUtilError: if mask does not fit matrix
     """
+    import numpy as npy
+
     ## get shape of matrix
     a,b = N.shape( matrix )
+    array = N.ravel( matrix )
 
     ## get array from matrix that is to be randomized
     if mask is not None:
-        if len(mask) == len( N.ravel(matrix) ):
-            array = N.compress( mask, N.ravel(matrix) )
-
-        if len(mask) != len( N.ravel(matrix) ):
+        if len(mask) != len( array ):
             raise MathUtilError(
                 'MatUtils.random2DArray - mask of incorrect length' +
                 '\tMatrix length: %i Mask length: %i'\
-                %(len( N.ravel(matrix) ), len(mask)))
+                %(len( array ), len(mask)))
 
-    if not mask:
-        array = N.ravel(matrix)
+        array = N.compress( mask, array )
 
     ## number of ones and length of array
     nOnes = int( N.sum( array ) )
     lenArray = len( array )
-    ranArray = N.zeros( lenArray )
 
-    ## create random array
-    for n in range(ranNr):
-        ranArray += randomMask( nOnes, lenArray )
+    if nOnes > lenArray:
+        raise MathUtilError( 'MatUtils.random2DArray - more ones (%i) than '\
+                             'positions (%i)' % ( nOnes, lenArray ) )
+
+    ## the first nOnes positions of each permutation become ones
+    ranArray = npy.zeros( lenArray, int )
+    for perm in randomPermutations( ranNr, lenArray, seed=seed ):
+        ranArray += npy.bincount( npy.ravel( perm[:, :nOnes] ),
+                                  minlength=lenArray )
 
     ## blow up to size of original matix
     if mask is not None:
@@ -283,8 +322,7 @@ def random2DArray( matrix, ranNr=1, mask=None):
         N.put( r, N.nonzero(mask), ranArray)
         return N.reshape( r, (a,b) )
 
-    if not mask:
-        return  N.reshape( ranArray, (a,b) )
+    return N.reshape( ranArray, (a,b) )
 
 
 def slidingAverage( y, window=2 ):
@@ -942,8 +980,114 @@ def outliers( a, z=5, it=5 ):
         out = o
     
     return out, me, sd
-        
-    
+
+
+def randomizedSVD( blocks, shape, k, n_it=4, oversample=10, seed=0 ):
+    """
+    Truncated singular value decomposition X ~ V * L * U of a matrix that is
+    only available as a sequence of row blocks, e.g. raveled frames
+    streamed from disc (randomized range finder with power iterations,
+    Halko, Martinsson & Tropp, SIAM Review 53:217, 2011). Only the
+    n_rows x (k+oversample) and (k+oversample) x n_columns intermediates
+    are kept in memory. X is read 2 * n_it + 2 times::
+
+      def blocks():
+          for start in range( 0, len(X), 100 ):
+              yield start, X[ start : start+100 ]
+
+      V, L, U = randomizedSVD( blocks, X.shape, 10 )
+
+    @param blocks: function without arguments returning an iterator over
+                   (first row, 2-D array of consecutive rows) that covers
+                   all rows of X in the same order on each call
+    @type  blocks: function
+    @param shape: shape of X (n_rows, n_columns)
+    @type  shape: (int, int)
+    @param k: number of singular values and vectors
+    @type  k: int
+    @param n_it: number of power iterations, more iterations give better
+                 accuracy for slowly decaying singular values (default: 4)
+    @type  n_it: int
+    @param oversample: additional random vectors (default: 10)
+    @type  oversample: int
+    @param seed: seed of the random number generator, None for a
+                 different result on every call (default: 0)
+    @type  seed: int
+
+    @return: left singular vectors (n_rows x k), singular values (k),
+             right singular vectors (k x n_columns)
+    @rtype: array, array, array
+    """
+    import numpy as npy
+
+    n, m = shape
+    k = min( k, n, m )
+    l = min( k + oversample, n, m )
+
+    rand = npy.random.RandomState( seed )
+
+    q = npy.zeros( (n, l) )
+    omega = rand.normal( size=(m, l) )
+
+    for start, x in blocks():
+        q[ start : start+len(x) ] = npy.dot( x, omega )
+
+    q = npy.linalg.qr( q )[0]
+
+    for i in range( n_it ):
+        z = npy.zeros( (m, l) )
+        for start, x in blocks():
+            z += npy.dot( npy.transpose( x ), q[ start : start+len(x) ] )
+
+        z = npy.linalg.qr( z )[0]
+
+        for start, x in blocks():
+            q[ start : start+len(x) ] = npy.dot( x, z )
+
+        q = npy.linalg.qr( q )[0]
+
+    ## project X into the subspace and decompose the small l x m matrix
+    b = npy.zeros( (l, m) )
+    for start, x in blocks():
+        b += npy.dot( npy.transpose( q[ start : start+len(x) ] ), x )
+
+    v, s, u = npy.linalg.svd( b, full_matrices=0 )
+
+    return npy.dot( q, v[:, :k] ), s[:k], u[:k]
+
+
+def dihedral( a, b, c, d ):
+    """
+    Torsion angle(s) defined by four points (or four arrays of points),
+    i.e. the angle between the planes a-b-c and b-c-d seen along b-c::
+      dihedral( xyz[i1], xyz[i2], xyz[i3], xyz[i4] ) -> float
+      dihedral( x[:,0], x[:,1], x[:,2], x[:,3] )     -> array
+
+    @param a: coordinates (3) or (..., 3)
+    @type  a: array
+    @param b: coordinates (3) or (..., 3)
+    @type  b: array
+    @param c: coordinates (3) or (..., 3)
+    @type  c: array
+    @param d: coordinates (3) or (..., 3)
+    @type  d: array
+
+    @return: angle(s) in degrees between -180 and 180
+    @rtype: float OR array
+    """
+    b1 = N.asarray( b ) - a
+    b2 = N.asarray( c ) - b
+    b3 = N.asarray( d ) - c
+
+    n1 = N.cross( b1, b2 )
+    n2 = N.cross( b2, b3 )
+
+    x = N.sum( n1 * n2, -1 )
+    y = N.sum( b1 * n2, -1 ) * N.sqrt( N.sum( b2**2, -1 ) )
+
+    return N.arctan2( y, x ) * 180. / N.pi
+
+
 #############
 ##  TESTING        
 #############
@@ -963,12 +1107,68 @@ class Test(BT.BiskitTest):
 
         self.assertAlmostEqual( N.sum( SD(self.a) ), self.EXPECT )
 
+    def test_randomizedSVD(self):
+        """mathUtils.randomizedSVD test"""
+        import numpy as npy
+
+        rand = npy.random.RandomState( 1 )
+        x = npy.dot( rand.normal( size=(200, 10) ) * npy.arange( 10, 0, -1 ),
+                     rand.normal( size=(10, 60) ) )
+        x += rand.normal( scale=0.01, size=x.shape )
+
+        def blocks():
+            for start in range( 0, len( x ), 64 ):
+                yield start, x[ start : start+64 ]
+
+        v, l, u = randomizedSVD( blocks, x.shape, 5 )
+        v0, l0, u0 = npy.linalg.svd( x, full_matrices=0 )
+
+        self.assert_( npy.allclose( l, l0[:5] ) )
+        self.assert_( npy.allclose( npy.absolute( N.sum( u * u0[:5], 1 ) ),
+                                    1. ) )
+        self.assert_( npy.allclose( npy.absolute( v ),
+                                    npy.absolute( v0[:,:5] ) ) )
+
     def test_area(self):
         """mathUtils.area test"""
         self.c = zip( N.arange(0,1.01,0.1), N.arange(0,1.01,0.1) )
         self.area = area( self.c )
         self.assertAlmostEqual( self.area, 0.5, 7 )
 
+    def test_dihedral( self ):
+        """mathUtils.dihedral test"""
+        x = N.array( [[1.,0,0], [0,0,0], [0,1,0], [0,1,1]] )
+        self.assertAlmostEqual( dihedral( *x ), -90., 7 )
+
+        x[3] = [0,1,-1]
+        self.assertAlmostEqual( dihedral( *x ), 90., 7 )
+
+        x = N.array( [ x + i for i in range( 5 ) ] )
+        self.r = dihedral( x[:,0], x[:,1], x[:,2], x[:,3] )
+        self.assert_( N.all( N.absolute( self.r - 90. ) < 1e-7 ) )
+
+    def test_random2DArray( self ):
+        """mathUtils.random2DArray test"""
+        import numpy as npy
+
+        m = N.zeros( (10, 8) )
+        m[ 2:5, 3:6 ] = 1
+        mask = N.ravel( N.ones( (10, 8) ) )
+        mask[ :16 ] = 0
+
+        self.r = random2DArray( m, 150, mask=mask, seed=3 )
+
+        self.assertEqual( N.sum( N.ravel( self.r ) ), 150 * 9 )
+        self.assertEqual( N.sum( N.ravel( self.r )[:16] ), 0 )
+        self.assert_( N.all( N.ravel( self.r ) <= 150 ) )
+
+        ## same seed, same result independent of the chunking
+        r = npy.zeros( 64, int )
+        for perm in randomPermutations( 150, 64, seed=3, blocksize=7 ):
+            r += npy.bincount( npy.ravel( perm[:, :9] ), minlength=64 )
+
+        self.assert_( N.all( N.ravel( self.r )[16:] == r ) )
+
     EXPECT = N.sum( N.array([ 2.12132034,  0.70710678,  7.07106781]) )
 
 if __name__ == '__main__':
@@ -28,6 +28,7 @@ Various structure related calculations.
 
 import numpy.oldnumeric as N
 from Biskit import molUtils as molU
+from Biskit.SpatialIndex import SpatialIndex
 import Biskit.tools as T
 
 def hbonds( model ):
@@ -59,42 +60,51 @@ def hbonds( model ):
     for res , aList in accept.items():               
         a_ind += model.filterIndex( residue_name=res, name=aList )
         
-    ## calculate pairwise distances and angles
-    for d in d_ind:
+    if not d_ind or not a_ind:
+        return hbond_lst
+
+    ## donor - acceptor pairs closer than 3 A, ordered by donor and acceptor
+    index = SpatialIndex( N.take( model.xyz, a_ind, 0 ), 3.0 )
+    i_a, i_d = index.pairs( N.take( model.xyz, d_ind, 0 ), 3.0 )[:2]
+    pairs = N.lexsort( (i_a, i_d) )
+
+    ## calculate distances and angles
+    for k in pairs:
+        d, a = d_ind[ i_d[k] ], a_ind[ i_a[k] ]
+
         d_xyz  = model.xyz[d]
         d_nr   = model.atoms['residue_number'][d]
         d_cid  = model.atoms['chain_id'][d]
         d_segi = model.atoms['segment_id'][d]
 
-        for a in a_ind:
-            a_xyz  = model.xyz[a]
-            a_nr   = model.atoms['residue_number'][a]
-            a_cid  = model.atoms['chain_id'][a]
-            a_segi = model.atoms['segment_id'][a]
-            
-            dist = N.sqrt( sum( (d_xyz - a_xyz)**2 ) )
-
-            ## don't calculate angles within the same residue and 
-            ##  for distances definately are not are h-bonds
-            if dist < 3.0 and not\
-                  ( d_nr == a_nr and d_cid == a_cid and d_segi == a_segi ):
-
-                ## calculate angle for potenital hbond
-                d_xyz_cov = xyzOfNearestCovalentNeighbour( d, model )
-                a_xyz_cov = xyzOfNearestCovalentNeighbour( a, model )
-                d_vec = d_xyz_cov - d_xyz
-                a_vec = a_xyz - a_xyz_cov
-                
-                d_len = N.sqrt( sum( (d_vec)**2 ) )
-                a_len = N.sqrt( sum( (a_vec)**2 ) )
-                
-                da_dot = N.dot( d_vec, a_vec)
-                
-                angle = 180 - N.arccos( da_dot / (d_len * a_len) )*180/N.pi
-    
-                if hbondCheck( angle, dist ):
-                    hbond_lst += [[ d, a, dist, angle ]]
-                    
+        a_xyz  = model.xyz[a]
+        a_nr   = model.atoms['residue_number'][a]
+        a_cid  = model.atoms['chain_id'][a]
+        a_segi = model.atoms['segment_id'][a]
+
+        dist = N.sqrt( sum( (d_xyz - a_xyz)**2 ) )
+
+        ## don't calculate angles within the same residue and 
+        ##  for distances definately are not are h-bonds
+        if dist < 3.0 and not\
+              ( d_nr == a_nr and d_cid == a_cid and d_segi == a_segi ):
+
+            ## calculate angle for potenital hbond
+            d_xyz_cov = xyzOfNearestCovalentNeighbour( d, model )
+            a_xyz_cov = xyzOfNearestCovalentNeighbour( a, model )
+            d_vec = d_xyz_cov - d_xyz
+            a_vec = a_xyz - a_xyz_cov
+
+            d_len = N.sqrt( sum( (d_vec)**2 ) )
+            a_len = N.sqrt( sum( (a_vec)**2 ) )
+
+            da_dot = N.dot( d_vec, a_vec)
+
+            angle = 180 - N.arccos( da_dot / (d_len * a_len) )*180/N.pi
+
+            if hbondCheck( angle, dist ):
+                hbond_lst += [[ d, a, dist, angle ]]
+
     return hbond_lst
         
 
@@ -149,15 +159,16 @@ def xyzOfNearestCovalentNeighbour( i, model ):
     @return: coordinates of the nearest atom 
     @rtype: [float, float, float]
     """
-    resModel = model.filter( residue_number=model.atoms['residue_number'][i] )
-    dist = N.sqrt( N.sum( (resModel.xyz - model.xyz[i])**2 , 1) )
+    resNumbers = N.array( model.atoms['residue_number'] )
+    res_xyz = N.compress( resNumbers == resNumbers[i], model.xyz, 0 )
+    dist = N.sqrt( N.sum( (res_xyz - model.xyz[i])**2 , 1) )
 
     ## set distance to self to something high
     dist[ N.argmin(dist) ] = 100.
     
     pos_shortest =  N.nonzero( dist == min(dist) )[0]
  
-    return resModel.xyz[ pos_shortest ]
+    return res_xyz[ pos_shortest ]
 
 
 def fasta( m , start=0, stop=None ):
@@ -157,6 +157,32 @@ aaAtoms={'GLY':['N','CA','C','O', 'OXT' ],
          'ASP':['N','CA','C','O','CB','CG','OD1','OD2', 'OXT'],
          'GLU':['N','CA','C','O','CB','CG','CD','OE1','OE2', 'OXT']}
 
+#: atoms defining the side chain torsions chi1, chi2, .. of amino acids
+chiAtoms={'ARG':[['N','CA','CB','CG'], ['CA','CB','CG','CD'],
+                 ['CB','CG','CD','NE'], ['CG','CD','NE','CZ'],
+                 ['CD','NE','CZ','NH1']],
+          'ASN':[['N','CA','CB','CG'], ['CA','CB','CG','OD1']],
+          'ASP':[['N','CA','CB','CG'], ['CA','CB','CG','OD1']],
+          'CYS':[['N','CA','CB','SG']],
+          'GLN':[['N','CA','CB','CG'], ['CA','CB','CG','CD'],
+                 ['CB','CG','CD','OE1']],
+          'GLU':[['N','CA','CB','CG'], ['CA','CB','CG','CD'],
+                 ['CB','CG','CD','OE1']],
+          'HIS':[['N','CA','CB','CG'], ['CA','CB','CG','ND1']],
+          'ILE':[['N','CA','CB','CG1'], ['CA','CB','CG1','CD1']],
+          'LEU':[['N','CA','CB','CG'], ['CA','CB','CG','CD1']],
+          'LYS':[['N','CA','CB','CG'], ['CA','CB','CG','CD'],
+                 ['CB','CG','CD','CE'], ['CG','CD','CE','NZ']],
+          'MET':[['N','CA','CB','CG'], ['CA','CB','CG','SD'],
+                 ['CB','CG','SD','CE']],
+          'PHE':[['N','CA','CB','CG'], ['CA','CB','CG','CD1']],
+          'PRO':[['N','CA','CB','CG'], ['CA','CB','CG','CD']],
+          'SER':[['N','CA','CB','OG']],
+          'THR':[['N','CA','CB','OG1']],
+          'TRP':[['N','CA','CB','CG'], ['CA','CB','CG','CD1']],
+          'TYR':[['N','CA','CB','CG'], ['CA','CB','CG','CD1']],
+          'VAL':[['N','CA','CB','CG1']] }
+
 #: dictionary of elements
 elements = { 'carbon':['C', 'CD2', 'CZ2', 'CB', 'CA', 'CG', 'CE', 'CD', 'CZ',
                        'CH2', 'CE3', 'CD1', 'CE1', 'CZ3', 'CG1', 'CG2', 'CE2'],
@@ -363,7 +363,7 @@ class Residue(object):
         m = self.model()
         assert m is not None, 'residue is not attached to any PDBModel'
         
-        names = m.atoms['name'][self.from_atom : self.to_atom]
+        names = list( m.atoms['name'][self.from_atom : self.to_atom] )
 
         ## number of occurrences of each atom name
         counts = [ names.count( n ) for n in names ]
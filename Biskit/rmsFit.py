@@ -30,6 +30,8 @@ import Biskit.mathUtils as MU
 import numpy.oldnumeric as N
 from numpy.oldnumeric.linear_algebra import singular_value_decomposition as svd
 
+import numpy as npy
+
 ## def average(x):
 ##     return N.sum(x) / len(x)
 
@@ -167,6 +169,565 @@ def rowDistances( x, y ):
 
 
 
+def transformFrames( y, r, t ):
+    """
+    Apply one rotation and translation per frame.
+    Frame i becomes C{ N.dot( y[i], N.transpose( r[i] ) ) + t[i] }.
+
+    @param y: coordinate frames (N_frames x N_atoms x 3)
+    @type  y: array
+    @param r: rotation matrices (N_frames x 3 x 3) or one rotation (3 x 3)
+    @type  r: array
+    @param t: translation vectors (N_frames x 3) or one translation (3)
+    @type  t: array
+
+    @return: transformed frames (N_frames x N_atoms x 3)
+    @rtype: array('d')
+    """
+    r = npy.asarray( r, npy.float64 )
+    t = npy.asarray( t, npy.float64 )
+    n_frames, n_atoms = npy.shape( y )[:2]
+
+    if r.ndim == 2 and t.ndim == 1:
+        z = npy.dot( npy.reshape( y, (-1, 3) ), npy.transpose( r ) ) + t
+        return z.reshape( n_frames, n_atoms, 3 )
+
+    r = r * npy.ones( (n_frames, 1, 1) )
+    t = t * npy.ones( (n_frames, 1) )
+
+    z = npy.empty( (n_frames, n_atoms, 3), npy.float64 )
+
+    ## one BLAS call per frame beats any broadcast over the whole stack
+    for i in range( n_frames ):
+        z[i] = npy.dot( y[i], npy.transpose( r[i] ) )
+        z[i] += t[i]
+
+    return z
+
+
+def transformCoordinates( x, r, t ):
+    """
+    Apply many rotations and translations to the same coordinates, e.g.
+    the ligand matrices of many docking solutions to one ligand.
+    Frame i is C{ N.dot( x, N.transpose( r[i] ) ) + t[i] }.
+
+    @param x: coordinates (N_atoms x 3)
+    @type  x: array
+    @param r: rotation matrices (N_frames x 3 x 3)
+    @type  r: array
+    @param t: translation vectors (N_frames x 3)
+    @type  t: array
+
+    @return: transformed coordinates (N_frames x N_atoms x 3)
+    @rtype: array('d')
+    """
+    x = npy.asarray( x, npy.float64 )
+    r = npy.asarray( r, npy.float64 )
+    t = npy.asarray( t, npy.float64 )
+
+    ## (N_frames x 3 x 3) . (3 x N_atoms) in a single matrix product
+    z = npy.dot( r.reshape( -1, 3 ), npy.transpose( x ) )
+    z = z.reshape( len( r ), 3, len( x ) ).transpose( 0, 2, 1 )
+
+    return z + t[:, npy.newaxis, :]
+
+
+def findTransformations( x, y, mask=None ):
+    """
+    Batched version of L{findTransformation}: superimpose each frame of
+    y onto the reference coordinates x. The sums over atoms (one matrix
+    product per frame) give all correlation matrices and centers, which
+    are then solved together with one stacked SVD (Kabsch algorithm,
+    without reflection correction as in L{findTransformation}).
+
+    @param x: reference coordinates (N_atoms x 3) or one reference
+              per frame (N_frames x N_atoms x 3)
+    @type  x: array('f')
+    @param y: coordinate frames (N_frames x N_atoms x 3)
+    @type  y: array('f')
+    @param mask: atoms to consider for each frame (N_frames x N_atoms) or
+                 for all frames (N_atoms) (default: None, all atoms)
+    @type  mask: array of 1|0
+
+    @return: rotation matrices (N_frames x 3 x 3) and
+             translation vectors (N_frames x 3)
+    @rtype:  array, array
+    """
+    x = npy.asarray( x, npy.float64 )
+    n_frames, n_atoms = npy.shape( y )[:2]
+
+    if x.ndim == 3:
+        return _findTransformationsPaired( x, y, mask )
+
+    if mask is None:
+        w = npy.ones( (1, n_atoms) )
+    else:
+        w = npy.ones( (n_frames, n_atoms) ) * npy.asarray(mask, npy.float64)
+
+    n = npy.sum( w, 1 ) * npy.ones( n_frames )
+    x_av = npy.dot( w, x ) / n[:, npy.newaxis] * npy.ones( (n_frames, 1) )
+
+    ## per frame: [ sum_a w_a x_a^T y_a ; sum_a w_a y_a ]  (4 x 3)
+    wx = npy.concatenate( (x[npy.newaxis] * w[:,:,npy.newaxis],
+                           w[:,:,npy.newaxis]), 2 )
+    s = npy.empty( (n_frames, 4, 3) )
+
+    for i in range( n_frames ):
+        s[i] = npy.dot( npy.transpose( wx[ i % len(wx) ] ), y[i] )
+
+    y_av = s[:,3] / n[:, npy.newaxis]
+
+    ## correlation matrices of the centered coordinates
+    c = s[:,:3] - n[:,npy.newaxis,npy.newaxis] * \
+        x_av[:,:,npy.newaxis] * y_av[:,npy.newaxis,:]
+
+    u, l, vt = npy.linalg.svd( c )
+
+    r = npy.sum( u[:,:,:,npy.newaxis] * vt[:,npy.newaxis,:,:], 2 )
+    t = x_av - npy.sum( r * y_av[:, npy.newaxis, :], 2 )
+
+    return r, t
+
+
+def _findTransformationsPaired( x, y, mask=None ):
+    """
+    L{findTransformations} with a separate reference for each frame.
+    All sums are done with einsum over the whole stack, which is faster
+    than one matrix product per frame for many frames of few atoms.
+    """
+    n_frames, n_atoms = npy.shape( y )[:2]
+
+    w = npy.ones( (n_frames, n_atoms) )
+    if mask is not None:
+        w = w * npy.asarray( mask, npy.float64 )
+
+    n = npy.sum( w, 1 )[:, npy.newaxis]
+
+    x_av = npy.einsum( 'fa,fak->fk', w, x ) / n
+    y_av = npy.einsum( 'fa,fak->fk', w, y ) / n
+
+    c = npy.einsum( 'fa,fak,fal->fkl', w, x - x_av[:, npy.newaxis],
+                    y - y_av[:, npy.newaxis] )
+
+    u, l, vt = npy.linalg.svd( c )
+
+    r = npy.einsum( 'fkj,fjl->fkl', u, vt )
+    t = x_av - npy.einsum( 'fkl,fl->fk', r, y_av )
+
+    return r, t
+
+
+def matchFrames( x, y, n_iterations=1, z=2, eps_rmsd=0.5, eps_stdv=0.05 ):
+    """
+    Batched version of L{match}: superimpose each frame of y onto x while
+    iteratively removing outliers. All frames that have not yet converged
+    are processed together in each iteration. Each frame follows exactly
+    the same convergence and outlier rules as in L{match}, but the rmsd
+    and fraction of considered atoms are returned unrounded.
+
+    @param x: reference coordinates (N_atoms x 3)
+    @type  x: array('f')
+    @param y: coordinate frames (N_frames x N_atoms x 3)
+    @type  y: array('f')
+    @param n_iterations: number of calculations::
+                           1 .. no iteration 
+                           0 .. until convergence
+    @type  n_iterations: 1|0
+    @param z: number of standard deviations for outlier definition (default: 2)
+    @type  z: float
+    @param eps_rmsd: tolerance in rmsd (default: 0.5)
+    @type  eps_rmsd: float
+    @param eps_stdv: tolerance in standard deviations (default: 0.05)
+    @type  eps_stdv: float
+
+    @return: (r,t), rmsd, fraction of atoms considered, number of
+             iterations -- one value (or matrix) per frame
+    @rtype: (array, array), array, array, array
+    """
+    x = npy.asarray( x, npy.float64 )
+    n_frames, n_atoms = npy.shape( y )[:2]
+
+    r = npy.zeros( (n_frames, 3, 3) )
+    t = npy.zeros( (n_frames, 3) )
+    rmsd = npy.zeros( n_frames )
+    perc = npy.zeros( n_frames )
+    n_it = npy.zeros( n_frames, npy.int32 )
+
+    mask = npy.ones( (n_frames, n_atoms), bool )
+    rmsd_old = npy.zeros( n_frames )
+    stdv_old = npy.zeros( n_frames )
+
+    active = npy.arange( n_frames )  ## frames not yet converged
+    n = 0
+
+    while len( active ):
+
+        m = mask[ active ]
+        ya = y[ active ]
+
+        rt, tt = findTransformations( x, ya, m )
+
+        d = npy.sqrt( npy.sum( (transformFrames( ya, rt, tt ) - x)**2, 2 ) )
+        d = d * m
+
+        n_m = npy.sum( m, 1 )
+        r_i = npy.sqrt( npy.sum( d**2, 1 ) / n_m )
+        av = npy.sum( d, 1 ) / n_m
+
+        ## sample standard deviation of the considered distances, see MU.SD
+        dev = (d - av[:, npy.newaxis]) * m
+        s_i = npy.sqrt( npy.sum( dev**2, 1 ) / npy.maximum( n_m - 1., 1 ) )
+        s_i[ n_m == 1 ] = 0.
+
+        err = npy.seterr( divide='ignore', invalid='ignore' )
+        try:
+            d_stdv = abs( 1 - stdv_old[ active ] / s_i )
+        finally:
+            npy.seterr( **err )
+
+        converged = (abs( r_i - rmsd_old[active] ) < eps_rmsd) * \
+                    (d_stdv < eps_stdv)
+
+        rmsd_old[ active ] = npy.where( converged, rmsd_old[active], r_i )
+        stdv_old[ active ] = npy.where( converged, stdv_old[active], s_i )
+
+        r[ active ], t[ active ], rmsd[ active ] = rt, tt, r_i
+        perc[ active ] = n_m / float( n_atoms )
+
+        ## throw out non-matching rows
+        mask[ active ] = m * (d < (r_i + z * s_i)[:, npy.newaxis])
+
+        n += 1
+        n_it[ active ] = n
+
+        if n_iterations and n >= n_iterations:
+            break
+
+        active = active[ npy.logical_not( converged ) ]
+
+    return (r, t), rmsd, perc, n_it
+
+
+def _centerFrames( frames, center, i0, i1 ):
+    """
+    Frames i0 to i1 as float64, shifted by their center.
+
+    @param frames: coordinate frames (N_frames x N_atoms x 3)
+    @type  frames: array
+    @param center: center of each frame (N_frames x 3)
+    @type  center: array
+
+    @return: centered frames ((i1 - i0) x N_atoms x 3)
+    @rtype: array
+    """
+    x = npy.array( frames[ i0:i1 ], npy.float64 )
+    x -= center[ i0:i1, npy.newaxis, : ]
+
+    return x
+
+
+def _prepareFrames( frames, fit=1, blocksize=256 ):
+    """
+    Center of each frame (fit=1) or of all frames together (fit=0) and
+    squared norm of each centered frame. The frames are converted to
+    float64 one block at a time, they are not copied as a whole.
+
+    @param frames: coordinate frames (N_frames x N_atoms x 3)
+    @type  frames: array
+    @param blocksize: frames converted at a time (default: 256)
+    @type  blocksize: int
+
+    @return: center of each frame (N_frames x 3), sum of squared
+             centered coordinates of each frame
+    @rtype: array, array
+    """
+    n = len( frames )
+    blocks = range( 0, n, blocksize )
+
+    center = npy.zeros( (n, 3) )
+    g = npy.zeros( n )
+
+    for i in blocks:
+        center[ i:i+blocksize ] = npy.mean(
+            npy.asarray( frames[ i:i+blocksize ], npy.float64 ), 1 )
+
+    if not fit:
+        ## only improves numerical precision of the pair distances
+        center[:] = npy.mean( center, 0 )
+
+    for i in blocks:
+        x = _centerFrames( frames, center, i, i+blocksize )
+        g[ i:i+blocksize ] = npy.sum( npy.sum( x * x, 2 ), 1 )
+
+    return center, g
+
+
+def tileRmsd( x, y, gx, gy, fit=1 ):
+    """
+    RMSD between all frames of x and all frames of y, optionally after
+    optimal superposition of each pair. All 3 x 3 correlation matrices
+    are built with a single matrix product and their singular values
+    are calculated in one batched SVD. As in L{findTransformation},
+    reflections are not excluded.
+
+    @param x: centered frames (n x N_atoms x 3), see L{_centerFrames}
+    @type  x: array
+    @param y: centered frames (m x N_atoms x 3)
+    @type  y: array
+    @param gx: sum of squared coordinates of each x frame
+    @type  gx: array
+    @param gy: sum of squared coordinates of each y frame
+    @type  gy: array
+    @param fit: superimpose each pair of frames (default: 1)
+    @type  fit: 1|0
+
+    @return: n x m array of rmsd values
+    @rtype: array
+    """
+    n, n_atoms = npy.shape( x )[:2]
+    m = len( y )
+
+    if fit:
+        ## c[i,j] = x[i]^T * y[j], correlation matrix of each pair
+        c = npy.dot( npy.transpose( x, (0,2,1) ).reshape( n*3, n_atoms ),
+                     npy.transpose( y, (1,0,2) ).reshape( n_atoms, m*3 ) )
+        c = npy.transpose( c.reshape( n, 3, m, 3 ), (0,2,1,3) )
+
+        s = npy.linalg.svd( c.reshape( n*m, 3, 3 ), compute_uv=False )
+        cross = npy.sum( s, 1 ).reshape( n, m )
+
+    else:
+        cross = npy.dot( x.reshape( n, -1 ), npy.transpose(y.reshape(m, -1)) )
+
+    e = gx[:, npy.newaxis] + gy[npy.newaxis, :] - 2 * cross
+
+    return npy.sqrt( npy.maximum( e, 0. ) / n_atoms )
+
+
+## frames shared with the worker processes of pairwiseRmsd
+_tile_data = {}
+
+def _tileWorker( tile ):
+    """
+    Calculate one tile of the pairwise rmsd matrix in a worker process.
+    """
+    i0, i1, j0, j1 = tile
+    d = _tile_data
+    f, c, g = d['frames'], d['center'], d['g']
+
+    x = _centerFrames( f, c, i0, i1 )
+    y = _centerFrames( f, c, j0, j1 )
+
+    r = tileRmsd( x, y, g[i0:i1], g[j0:j1], fit=d['fit'] )
+
+    return tile, r.astype( npy.float32 )
+
+
+def _runBlocks( worker, blocks, collect, ncpu=1 ):
+    """
+    Call collect( *worker( b ) ) for each block b. With ncpu > 1, the
+    worker runs in a pool of processes and results come in any order.
+    The pool is terminated if the calculation fails or is interrupted.
+
+    @param worker: function of one block returning a tuple
+    @type  worker: function
+    @param blocks: arguments of the worker
+    @type  blocks: [any]
+    @param collect: function taking the tuple returned by the worker
+    @type  collect: function
+    @param ncpu: number of processes (default: 1)
+    @type  ncpu: int
+    """
+    if ncpu <= 1 or len( blocks ) <= 1:
+        for b in blocks:
+            collect( *worker( b ) )
+        return
+
+    import multiprocessing
+    pool = multiprocessing.Pool( ncpu )
+    ok = 0
+
+    try:
+        for r in pool.imap_unordered( worker, blocks ):
+            collect( *r )
+        ok = 1
+
+    finally:
+        if ok:
+            pool.close()
+        else:
+            pool.terminate()
+        pool.join()
+
+
+def pairwiseRmsd( frames, fit=1, condensed=0, ncpu=1, tilesize=256 ):
+    """
+    RMSD between all pairs of frames, optionally after optimal
+    superposition of each pair. The matrix is computed in tiles of
+    tilesize x tilesize frames (see L{tileRmsd}), which can be distributed
+    over several processes.
+
+    @param frames: coordinate frames (N_frames x N_atoms x 3)
+    @type  frames: array
+    @param fit: superimpose each pair of frames (default: 1)
+    @type  fit: 1|0
+    @param condensed: return only the values above the diagonal as
+                      1-D array, row by row (see L{MU.aboveDiagonal})
+                      (default: 0)
+    @type  condensed: 1|0
+    @param ncpu: number of processes (default: 1)
+    @type  ncpu: int
+    @param tilesize: number of frames per tile edge (default: 256)
+    @type  tilesize: int
+
+    @return: N_frames x N_frames array of float32 OR
+             N_frames*(N_frames-1)/2 array of float32 if condensed
+    @rtype: array
+    """
+    center, g = _prepareFrames( frames, fit=fit )
+    n = len( frames )
+
+    tiles = [ (i, min(i+tilesize, n), j, min(j+tilesize, n))
+              for i in range( 0, n, tilesize )
+              for j in range( i, n, tilesize ) ]
+
+    if condensed:
+        result = npy.zeros( n * (n-1) / 2, npy.float32 )
+    else:
+        result = npy.zeros( (n, n), npy.float32 )
+
+    def collect( tile, r ):
+        i0, i1, j0, j1 = tile
+
+        if condensed:
+            i, j = npy.mgrid[ i0:i1, j0:j1 ]
+            above = i < j
+            i, j = i[above], j[above]
+            k = i * n - i * (i+1) / 2 + j - i - 1
+            result[ k ] = r[ above ]
+
+        else:
+            result[ i0:i1, j0:j1 ] = r
+            result[ j0:j1, i0:i1 ] = npy.transpose( r )
+
+    _tile_data.update( {'frames':frames, 'center':center, 'g':g, 'fit':fit} )
+
+    try:
+        _runBlocks( _tileWorker, tiles, collect, ncpu=ncpu )
+    finally:
+        _tile_data.clear()
+
+    if not condensed:
+        result[ npy.arange(n), npy.arange(n) ] = 0.
+
+    return result
+
+
+def _windowBlock( frames, ref, index, fitmask ):
+    """
+    Fluctuation of the atoms in a block of windows, see L{windowFluct}.
+    Windows without any atom to fit (e.g. an ion) give 0.
+    """
+    n, n_max = npy.shape( index )
+    n_frames = len( frames )
+
+    empty = npy.sum( fitmask, 1 ) == 0
+
+    if npy.any( empty ):
+        r = npy.zeros( (n, n_max) )
+
+        ok = npy.logical_not( empty )
+        if npy.any( ok ):
+            r[ ok ] = _windowBlock( frames, ref, index[ ok ], fitmask[ ok ] )
+
+        return r
+
+    ## one 'frame' for each pair of window and frame
+    y = npy.take( frames, npy.ravel( index ), 1 )
+    y = npy.transpose( y.reshape( n_frames, n, n_max, 3 ), (1,0,2,3) )
+    y = y.reshape( n * n_frames, n_max, 3 )
+
+    x = npy.repeat( npy.take( ref, index, 0 ), n_frames, 0 )
+    m = npy.repeat( fitmask, n_frames, 0 )
+
+    r, t = findTransformations( x, y, m )
+
+    ## fitted coordinates are rounded to the type of the frames
+    z = npy.einsum( 'fak,flk->fal', y, r ) + t[:, npy.newaxis]
+    z = z.astype( y.dtype ).reshape( n, n_frames, n_max, 3 )
+
+    avg = npy.mean( z, 1 )[:, npy.newaxis]
+
+    return npy.mean( npy.sqrt( npy.sum( (z - avg)**2, 3 ) ), 1 )
+
+
+## data shared with the worker processes of windowFluct
+_window_data = {}
+
+def _windowWorker( block ):
+    """
+    Calculate one block of windows in a worker process.
+    """
+    w0, w1 = block
+    d = _window_data
+
+    return block, _windowBlock( d['frames'], d['ref'], d['index'][w0:w1],
+                                d['fitmask'][w0:w1] )
+
+
+def windowFluct( frames, ref, index, fitmask, blocksize=None, ncpu=1 ):
+    """
+    Fluctuation of atoms within many small groups of atoms (windows,
+    e.g. a residue with some of its neighbors): each window is superimposed
+    separately onto its reference coordinates in every frame, then the
+    mean distance of each window atom from its average position is
+    calculated. The windows are padded to the same length so that a whole
+    block of windows x frames is superimposed in one batch. Blocks can
+    be distributed over several processes.
+
+    @param frames: coordinate frames (N_frames x N_atoms x 3)
+    @type  frames: array
+    @param ref: reference coordinates (N_atoms x 3)
+    @type  ref: array
+    @param index: atom indices of each window, padded with any valid
+                  index (N_windows x N_max)
+    @type  index: array of int
+    @param fitmask: atoms of each window used for the superposition,
+                    0 for padding (N_windows x N_max); windows without
+                    any fit atom give 0
+    @type  fitmask: array of 1|0
+    @param blocksize: windows superimposed at a time (default: all windows
+                      divided by ncpu)
+    @type  blocksize: int
+    @param ncpu: number of processes (default: 1)
+    @type  ncpu: int
+
+    @return: fluctuation of each window atom (N_windows x N_max),
+             undefined for padding
+    @rtype: array of float32
+    """
+    n_win = len( index )
+    blocksize = blocksize or max( 1, -(-n_win / ncpu) )
+
+    blocks = [ (i, min( i+blocksize, n_win ))
+               for i in range( 0, n_win, blocksize ) ]
+
+    r = npy.zeros( npy.shape( index ), npy.float32 )
+
+    _window_data.update( {'frames':frames, 'ref':ref, 'index':index,
+                          'fitmask':fitmask} )
+    def collect( block, f ):
+        w0, w1 = block
+        r[ w0:w1 ] = f
+
+    try:
+        _runBlocks( _windowWorker, blocks, collect, ncpu=ncpu )
+    finally:
+        _window_data.clear()
+
+    return r
+
+
 #############
 ##  TESTING        
 #############
@@ -192,11 +753,105 @@ class Test(BT.BiskitTest):
 
         self.assertAlmostEqual(r, e, 6)
 
+    def test_pairwiseRmsd( self ):
+        """rmsFit.pairwiseRmsd test"""
+        import Biskit.tools as T
+
+        self.traj = T.load( T.testRoot() + '/lig_pcr_00/traj.dat' )
+        f = self.traj.frames[:12]
+
+        ## reference: one rowDistances (superposition) per pair
+        self.ref = npy.zeros( (len(f), len(f)) )
+        for i in range( len( f ) ):
+            for j in range( i+1, len( f ) ):
+                d = rowDistances( f[i], f[j] )
+                self.ref[i,j] = self.ref[j,i] = npy.sqrt( npy.mean( d**2 ) )
+
+        self.pw = pairwiseRmsd( f, tilesize=5 )
+        self.assert_( npy.all( abs( self.pw - self.ref ) < 1e-4 ) )
+
+        self.c = pairwiseRmsd( f, condensed=1, ncpu=2, tilesize=5 )
+        self.assert_( npy.all( self.c == MU.aboveDiagonal( self.pw ) ) )
+
+        nofit = pairwiseRmsd( f, fit=0 )
+        d = npy.sqrt( npy.sum( (f[3] - f[7])**2, 1 ) )
+        self.assertAlmostEqual( nofit[3,7], npy.sqrt( npy.mean(d**2) ), 4 )
+        self.assert_( npy.all( nofit >= self.pw - 1e-4 ) )
+
+
+    def test_matchFrames( self ):
+        """rmsFit.matchFrames identical to match test"""
+        import Biskit.tools as T
+
+        self.traj = T.load( T.testRoot() + '/lig_pcr_00/traj.dat' )
+        f = self.traj.frames[:20]
+        x = self.traj.ref.xyz
+
+        (r, t), rms, perc, n = matchFrames( x, f, n_iterations=0 )
+
+        for i in range( len( f ) ):
+            (r1, t1), trace = match( x, f[i], n_iterations=0 )
+
+            self.assertEqual( len( trace ), n[i] )
+            self.assertEqual( trace[-1][0], round( perc[i], 2 ) )
+            self.assertAlmostEqual( trace[-1][1], rms[i], 3 )
+            self.assert_( npy.allclose( r1, r[i], atol=1e-5 ) )
+
+        r, t = findTransformations( x, f )
+        r1, t1 = findTransformation( x, f[3] )
+        self.assert_( npy.allclose( N.dot( f[3], N.transpose(r1) ) + t1,
+                                    transformFrames( f, r, t )[3],
+                                    atol=1e-3 ) )
+
+
     EXPECT = N.array( [[ 0.9999011,   0.01311352,  0.00508244,],
                        [-0.01310219,  0.99991162, -0.00225578,],
                        [-0.00511157,  0.00218896,  0.99998454 ]] )
 
 
+class TestBenchmark(BT.BiskitTest):
+    """Benchmark batched against frame-by-frame superposition"""
+
+    TAGS = [ BT.LONG ]
+
+    def fitLoop( self, x, frames ):
+        """one findTransformation per frame, as formerly in Trajectory.fit"""
+        for y in frames:
+            r, t = findTransformation( x, y )
+            y_fitted = N.dot( y, N.transpose( r ) ) + t
+
+    def fitBatch( self, x, frames ):
+        r, t = findTransformations( x, frames )
+        y_fitted = transformFrames( frames, r, t )
+
+    def test_benchmark( self ):
+        """rmsFit frames/second benchmark (1k, 10k, 100k atoms)"""
+        import time
+
+        rand = npy.random.RandomState( 42 )
+        self.result = {}
+
+        for n_atoms, n_frames in [ (1000, 500), (10000, 100), (100000, 10) ]:
+
+            x = rand.uniform( -30, 30, (n_atoms, 3) ).astype( npy.float32 )
+            frames = x + rand.normal( 0, 1, (n_frames, n_atoms, 3) )
+            frames = frames.astype( npy.float32 )
+
+            t0 = time.time()
+            self.fitLoop( x, frames )
+            t1 = time.time()
+            self.fitBatch( x, frames )
+            t2 = time.time()
+
+            self.result[ n_atoms ] = ( n_frames / max( t1 - t0, 1e-6 ),
+                                       n_frames / max( t2 - t1, 1e-6 ) )
+
+        if self.local:
+            print '\n%8s %14s %14s' % ('atoms', 'loop frames/s','batch frames/s')
+            for n_atoms in sorted( self.result ):
+                print '%8i %14.1f %14.1f' % ((n_atoms,) + self.result[n_atoms])
+
+
 if __name__ == '__main__':
 
     BT.localTest()
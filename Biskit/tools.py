@@ -29,7 +29,7 @@ import sys, string
 import os.path as osp
 import shutil
 import operator
-import os, cPickle  ## for Load and Dump
+import os, cPickle, cStringIO  ## for Load and Dump
 import tempfile
 import traceback
 from inspect import getframeinfo
@@ -37,7 +37,8 @@ from time import localtime
 import numpy.oldnumeric as Numeric
 import glob
 import subprocess
-import gzip
+import gzip, bz2
+import numpy
 
 class ToolsError( Exception ):
     pass
@@ -469,12 +470,126 @@ def cmdDict( defaultDic={} ):
     return get_cmdDict( sys.argv[1:], defaultDic )
 
 
-def dump(this, filename, gzip = 0, mode = 'w'):
+#: pickle protocol used by L{dump}
+PICKLE_PROTOCOL = cPickle.HIGHEST_PROTOCOL
+
+#: compression codecs supported by L{dump}: name -> (open, default level)
+COMPRESSION = { 'gzip' : ( gzip.open, 6 ),
+                'bz2'  : ( bz2.BZ2File, 9 ) }
+
+#: suffix of the folder with the side-car arrays of a pickle, see L{dump}
+ARRAY_FOLDER = '_arrays'
+
+
+class ArrayStore:
+    """
+    Keep large numpy arrays of a pickle as .npy files in a folder next to
+    the pickle (see L{dump} and L{load}). The pickle only contains the
+    name of each array file. An array referenced several times is
+    written (and loaded) only once.
+    """
+
+    def __init__( self, folder, minsize=0, mmap_mode=None ):
+        """
+        @param folder: folder with array files
+        @type  folder: str
+        @param minsize: store only arrays of at least this many bytes
+        @type  minsize: int
+        @param mmap_mode: memory-map loaded arrays ('r', 'r+', 'c' or None)
+        @type  mmap_mode: str
+        """
+        self.folder = folder
+        self.minsize = minsize
+        self.mmap_mode = mmap_mode
+
+        ## continue numbering when appending to a pickle
+        self.n = len( glob.glob( osp.join( folder, '*.npy' ) ) )
+
+        ## id of written array -> (persistent id, array kept alive)
+        self.written = {}
+        ## persistent id -> loaded array
+        self.loaded = {}
+
+
+    def persistent_id( self, obj ):
+        """
+        Called by the pickler for every object.
+
+        @return: file name of array that was written out or None
+        @rtype: str
+        """
+        if not isinstance( obj, numpy.ndarray ) or obj.dtype.hasobject \
+           or obj.nbytes < self.minsize:
+            return None
+
+        if id( obj ) in self.written:
+            return self.written[ id( obj ) ][0]
+
+        if not osp.exists( self.folder ):
+            os.mkdir( self.folder )
+
+        name = '%i.npy' % self.n
+        self.n += 1
+
+        numpy.save( osp.join( self.folder, name ), obj )
+
+        self.written[ id( obj ) ] = ( 'npy:' + name, obj )
+        return 'npy:' + name
+
+
+    def persistent_load( self, pid ):
+        """
+        Called by the unpickler for every array written out.
+
+        @param pid: reference returned by L{persistent_id}
+        @type  pid: str
+
+        @return: array read from folder
+        @rtype: array
+        """
+        if not pid.startswith( 'npy:' ):
+            raise cPickle.UnpicklingError, 'unknown persistent id %r' % pid
+
+        if pid not in self.loaded:
+            self.loaded[ pid ] = numpy.load( osp.join( self.folder, pid[4:] ),
+                                             mmap_mode=self.mmap_mode )
+
+        return self.loaded[ pid ]
+
+
+def compression( filename ):
+    """
+    Recognize compressed files from their first bytes.
+
+    @param filename: name of existing file
+    @type  filename: str
+
+    @return: codec name (see L{COMPRESSION}) or None
+    @rtype: str
+    """
+    f = open( filename, 'rb' )
+    head = f.read( 3 )
+    f.close()
+
+    if head[:2] == '\x1f\x8b':
+        return 'gzip'
+    if head == 'BZh':
+        return 'bz2'
+    return None
+
+
+def dump(this, filename, gzip = 0, mode = 'w', protocol=None, compress=None,
+         level=None, sidecar=None):
     """
     Dump this::
       dump(this, filename, gzip = 0)
       Supports also '~' or '~user'.
 
+    Large numpy arrays can be kept out of the pickle as raw .npy files
+    (option sidecar). They go into the folder filename + L{ARRAY_FOLDER},
+    which has to stay next to the pickle. L{load} re-reads them
+    automatically and can also memory-map them.
+
     @note : Peter Schmidtke : gzip fixed, works now
     @author: Wolfgang Rieping
 
@@ -482,10 +597,22 @@ def dump(this, filename, gzip = 0, mode = 'w'):
     @type  this: any
     @param filename: name of file
     @type  filename: str
-    @param gzip: gzip dumped object (default 0)
+    @param gzip: gzip dumped object, same as compress='gzip' (default 0)
     @type  gzip: 1|0
     @param mode: file handle mode (default w)
     @type  mode: str
+    @param protocol: pickle protocol (default: L{PICKLE_PROTOCOL})
+    @type  protocol: int
+    @param compress: compression codec, 'gzip' or 'bz2' (default: None)
+    @type  compress: str
+    @param level: compression level 1 (fast) - 9 (small) (default: 6 for
+                  gzip, 9 for bz2)
+    @type  level: int
+    @param sidecar: write numpy arrays of at least this many bytes into
+                    separate .npy files (default: None, all in the pickle)
+    @type  sidecar: int
+
+    @raise PickleError: if mode or compression is not supported
     """
     import Biskit
     
@@ -494,6 +621,7 @@ def dump(this, filename, gzip = 0, mode = 'w'):
     ## special case: do not slim PDBModels that are pickled to override
     ## their own source
     if isinstance( this, Biskit.PDBModel ) and not this.forcePickle \
+       and osp.exists( filename ) \
        and osp.samefile( str(this.source), filename ):
         this.saveAs( filename )
 
@@ -503,30 +631,64 @@ def dump(this, filename, gzip = 0, mode = 'w'):
             raise PickleError, "mode has to be 'w' (write) or 'a' (append)"
 
         if gzip:
-            f = gzopen(filename, "wb")
+            compress = 'gzip'
+
+        if protocol is None:
+            protocol = PICKLE_PROTOCOL
+
+        if compress:
+            if not compress in COMPRESSION:
+                raise PickleError, 'unknown compression %r' % compress
+
+            if compress == 'bz2' and mode == 'a':
+                raise PickleError, 'cannot append to bz2-compressed pickle'
+
+            f_open, default = COMPRESSION[ compress ]
+            f = f_open( filename, mode + 'b', compresslevel=level or default )
+
+            ## cPickle is much faster on real or in-memory files
+            out = cStringIO.StringIO()
         else:
-            f = open(filename, mode)
+            f = out = open(filename, mode + 'b')
+
+        try:
+            p = cPickle.Pickler( out, protocol )
+
+            if sidecar:
+                folder = filename + ARRAY_FOLDER
 
-        cPickle.dump(this, f, 1)
+                if mode == 'w':
+                    tryRemove( folder, tree=1 )
 
-        f.close()
+                p.persistent_id = ArrayStore( folder, sidecar ).persistent_id
+
+            p.dump( this )
+
+            if out is not f:
+                f.write( out.getvalue() )
+        finally:
+            f.close()
 
 
 def Dump( this, filename, gzip = 0, mode = 'w'):
     EHandler.warning('deprecated: tools.Dump has been renamed to tools.dump')
     return dump( this, filename, gzip=gzip, mode=mode )
 
-def load(filename, gzip = 0):
+def load(filename, gzip = 0, mmap_mode=None):
     """
-    Load dumped object from file.
+    Load dumped object from file. Compressed pickles (see L{dump}) are
+    recognized automatically.
 
     @note : Peter Schmidtke : gzip fixed, works now
     @author: Wolfgang Rieping
 
     @param filename: name of file
     @type  filename: str
-    @param gzip: unzip dumped object (default 0)
+    @param gzip: ignored, kept for backwards compatibility (default 0)
     @type  gzip: 1|0
+    @param mmap_mode: memory-map side-car arrays ('r', 'r+', 'c' or None)
+                      instead of reading them (default: None)
+    @type  mmap_mode: str
 
     @return: loaded object
     @rtype: any
@@ -536,24 +698,35 @@ def load(filename, gzip = 0):
     filename = osp.expanduser(filename)
 
     try:
-        if gzip :
-            f=gzopen(filename,"rb")
-        else :            
-            f = open(filename)
+        codec = compression( filename )
+
+        if codec:
+            f = COMPRESSION[ codec ][0]( filename, 'rb' )
 
+            ## cPickle is much faster on real or in-memory files
+            data = f.read()
+            f.close()
+            f = cStringIO.StringIO( data )
+        else :
+            f = open( filename, 'rb' )
+
+        u = cPickle.Unpickler( f )
+        u.persistent_load = ArrayStore( filename + ARRAY_FOLDER,
+                                        mmap_mode=mmap_mode ).persistent_load
         objects = []
         eof = 0
         n = 0
 
-        while not eof:
-            try:
-                this = cPickle.load(f)
-                objects.append(this)
-                n += 1
-            except EOFError:
-                eof = 1
-
-        f.close()
+        try:
+            while not eof:
+                try:
+                    this = u.load()
+                    objects.append(this)
+                    n += 1
+                except EOFError:
+                    eof = 1
+        finally:
+            f.close()
 
         if n == 1:
             return objects[0]
@@ -33,7 +33,7 @@ def _use():
 Convert single amber crd into Trajectory object
 
 amber2traj.py -i sim.crd -o traj_0.dat -r ref.pdb [-b -wat -hyd -rnres
-              -code PDBC ]
+              -code PDBC -start |int| -stop |int| -step |int| ]
 
     -i     input amber trajectory
     -o     output file with pickled biskit Trajectory object
@@ -43,6 +43,9 @@ amber2traj.py -i sim.crd -o traj_0.dat -r ref.pdb [-b -wat -hyd -rnres
     -hyd   delete all hydrogens (after parsing)
     -rnres rename amber residues HIE/HID/HIP, CYX to HIS and CYS
     -code  PDB code of molecule [first 4 letters of ref file name]
+    -start first frame to read [0]
+    -stop  read frames up to (excluding) this one [all]
+    -step  read only every step'th frame [1]
     """
     sys.exit( 0 )
 
@@ -61,9 +64,12 @@ if __name__ == '__main__':
     hyd  = o.has_key('hyd')
     rnres  = o.has_key('rnres')
     code = o.get('code', None)
+    start = int( o.get('start', 0) )
+    stop = int( o['stop'] ) if 'stop' in o else None
+    step = int( o.get('step', 1) )
 
     p = AmberCrdParser( fcrd, fpdb, box, rnres, pdbCode=code )
-    t = p.crd2traj()
+    t = p.crd2traj( start=start, stop=stop, step=step )
 
     if wat:
         t.removeAtoms( lambda a: a['residue_name'] in ['WAT', 'Na+', 'Cl-'] )
@@ -108,7 +108,7 @@ if 'red' in o:
     sys.exit(0)
 
 print "Reducing .. "
-frames = red.reduceXyz( t.frames, axis=1 )
+frames = red.reduceFrames( t )
 
 t.frames = frames
 t.ref = ref
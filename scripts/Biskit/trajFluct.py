@@ -33,11 +33,12 @@ def _use( options ):
 trajFluct.py: Calculate global and side chain fluctuation per atom
               for a trajectory.
 
-Syntax:  trajFluct -i trajectory_file [-o result_trajectory]
+Syntax:  trajFluct -i trajectory_file [-o result_trajectory -ncpu n]
 
                      
 Options:   -i     pickled trajectory
            -o     file name for pickled result Trajectory
+           -ncpu  number of processes for the local fluctuation
            
 """
     for key, value in options.items():
@@ -48,7 +49,7 @@ Options:   -i     pickled trajectory
 
 ### MAIN ###
 
-default = {'o':'traj_fluct.dat' }
+default = {'o':'traj_fluct.dat', 'ncpu':1 }
 
 if len (sys.argv) < 2:
     _use( default )
@@ -62,7 +63,7 @@ traj.fit( prof='rms2avg' )
 
 f_global = traj.getFluct_global()
 
-f_local = traj.getFluct_local()
+f_local = traj.getFluct_local( ncpu=int( options['ncpu'] ) )
 
 ref = traj.getRef()
 